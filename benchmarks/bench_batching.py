@@ -0,0 +1,105 @@
+"""Requests per second and latency of domain classification with and without micro-batching.
+
+Usage:
+    python -m benchmarks.bench_batching [--rates 5,20,50,100,200] [--seconds 3]
+
+Each request is a fresh session running ``DomainClassifyAgent`` through a
+Runner, with requests arriving as a Poisson process at the offered rate. The
+model is a stub that takes ``--latency`` seconds plus ``--per-item`` seconds
+per batched problem, and allows at most ``--in-flight`` concurrent requests
+like a provider rate limit, so no quota is used.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from math_agents import agent, batching
+
+
+class RateLimitedLlm(BaseLlm):
+    """Stub model: fixed latency plus per-item cost, bounded concurrency."""
+
+    latency: float = 0.3
+    per_item: float = 0.005
+    in_flight: int = 8
+    _semaphores: dict = {}
+
+    async def generate_content_async(self, llm_request, stream=False):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.in_flight))
+        prompt = "".join(part.text or "" for content in llm_request.contents for part in content.parts or [])
+        items = len(re.findall(r"^\d+\. ", prompt, re.MULTILINE)) if "numbered problem" in prompt else 0
+        async with semaphore:
+            await asyncio.sleep(self.latency + self.per_item * max(1, items))
+        text = json.dumps(["algebra"] * items) if items else "algebra"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+async def run_load(rate: float, seconds: float) -> dict:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.domain_classify_agent, app_name=agent.APP_NAME, session_service=session_service)
+    latencies = []
+
+    async def one(i: int):
+        start = time.perf_counter()
+        session_id = f"s{i}"
+        await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=session_id,
+                                             state={"topic": f"Solve {i}x + 3 = 11"})
+        content = types.Content(role="user", parts=[types.Part(text="classify")])
+        async for _ in runner.run_async(user_id=agent.USER_ID, session_id=session_id, new_message=content):
+            pass
+        latencies.append(time.perf_counter() - start)
+
+    rng = random.Random(0)
+    tasks, i = [], 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        tasks.append(asyncio.create_task(one(i)))
+        i += 1
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", default="5,20,50,100,200", help="offered requests per second")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--per-item", type=float, default=0.005)
+    parser.add_argument("--in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    agent.domain_classify_agent.model = RateLimitedLlm(
+        model="stub", latency=args.latency, per_item=args.per_item, in_flight=args.in_flight)
+    print(f"{'offered rps':>11} {'batching':>9} {'achieved rps':>13} {'p50 ms':>9} {'p99 ms':>9}")
+    for rate in (float(r) for r in args.rates.split(",")):
+        for enabled in (False, True):
+            batching.BATCHING_ENABLED = enabled
+            result = asyncio.run(run_load(rate, args.seconds))
+            print(f"{rate:>11.0f} {'on' if enabled else 'off':>9} {result['rps']:>13.1f} "
+                  f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Wall time of sectioned, parallel Blender script generation against one monolithic call.
+
+Usage:
+    python -m benchmarks.bench_blender_sections [--runs 3] [--chars-per-second 400] [--first-token 0.5]
+
+Runs ``SectionedBlenderAgent`` on a session whose story schema is already
+parsed. The model is a stub that takes ``--first-token`` seconds plus the
+length of its reply at ``--chars-per-second``, so latency follows output
+size as with a real decoder. Each section reply is one build function. The
+monolithic reply is taken to be just those functions plus a ``main()``,
+a lower bound since a single call also has to write its own helpers, so the
+speedup shown is conservative.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from math_agents import agent, blender_preflight, blender_sections, blender_templates, story
+from math_agents.metrics import get_stats
+
+
+SCHEMA = story.StorySchema.model_validate({
+    "characters": [{"name": "Leo", "type": "human", "traits": ["curious"], "role": "student"}],
+    "setting": {"location": "construction site", "time": "day", "mood": "curious",
+                "environment": ["ladder", "wall", "chalk marks"]},
+    "key_visuals": ["triangle formed by ladder and wall", "hypotenuse highlight"],
+    "camera_style": {"shots": ["wide shot of wall"], "motion": ["pan upward", "dolly-in on hypotenuse"]},
+    "quality_cues": {"lighting": "sunny with soft shadows", "materials": ["metal ladder", "concrete wall"],
+                     "motion_style": ["smooth pans"], "environment_scale": "human-scale"},
+})
+
+SECTION_REPLIES = {
+    "environment": '''```python
+def _place(ctx, name, index):
+    add_object(ctx, "cube", name.title(), location=(index * 3 - 3, 2, 1), scale=(1, 0.2, 1), collection="Environment")
+
+
+def build_environment(ctx):
+    add_object(ctx, "plane", "Ground", scale=(20, 20, 1), collection="Environment")
+    for index, name in enumerate(ctx["schema"]["setting"]["environment"]):
+        _place(ctx, name, index)
+    for index, visual in enumerate(ctx["schema"]["key_visuals"]):
+        add_text(ctx, f"Visual {index}", visual, location=(0, 0, 4 + index), size=0.4, collection="Environment")
+```''',
+    "characters": '''```python
+def build_characters(ctx):
+    for index, character in enumerate(ctx["schema"]["characters"]):
+        x = index * 2 - 1
+        add_object(ctx, "cylinder", character["name"], location=(x, 0, 0.9), scale=(0.3, 0.3, 0.9),
+                          collection="Characters")
+        add_object(ctx, "uv_sphere", f"{character['name']} head", location=(x, 0, 2.0), scale=(0.25, 0.25, 0.25),
+                   collection="Characters")
+        add_armature(ctx, f"{character['name']} rig", location=(x, 0, 0))
+```''',
+    "animation": '''```python
+def build_animation(ctx):
+    for character in ctx["schema"]["characters"]:
+        body = ctx["objects"].get(character["name"])
+        if body is None:
+            continue
+        x = body.location.x
+        for frame, z in ((ctx["frame_start"], 0.9), (ctx["frame_end"] // 2, 1.4), (ctx["frame_end"], 0.9)):
+            keyframe(body, "location", frame, (x, 0, z))
+    for index, visual in enumerate(find_objects(ctx, "visual")):
+        keyframe(visual, "scale", ctx["frame_start"], (0, 0, 0))
+        keyframe(visual, "scale", ctx["frame_start"] + 48 * (index + 1), (1, 1, 1))
+```''',
+    "lighting_materials": '''```python
+def build_lighting_materials(ctx):
+    add_light(ctx, "SUN", "Sun", location=(5, -5, 10), energy=4.0)
+    add_light(ctx, "AREA", "Fill", location=(-4, -4, 6), energy=300.0)
+    for index, name in enumerate(ctx["schema"]["quality_cues"]["materials"]):
+        material = make_material(name.title(), color=(0.3 + 0.1 * index, 0.4, 0.5, 1.0), roughness=0.6)
+        for obj in find_objects(ctx, name.split()[-1]):
+            set_material(obj, material)
+    glow = make_material("Highlight", color=(1.0, 0.8, 0.2, 1.0), emission=3.0)
+    for obj in find_objects(ctx, "visual"):
+        set_material(obj, glow)
+```''',
+    "camera": '''```python
+def build_camera(ctx):
+    targets = find_objects(ctx, "wall") or [(0, 0, 1)]
+    camera = add_camera(ctx, "Camera", location=(0, -12, 3), target=targets[0], lens=35.0)
+    keyframe(camera, "location", ctx["frame_start"], (0, -12, 3))
+    keyframe(camera, "location", ctx["frame_end"] // 2, (4, -8, 6))
+    keyframe(camera, "location", ctx["frame_end"], (2, -5, 4))
+    keyframe(camera.data, "lens", ctx["frame_end"], 50.0)
+```''',
+    "compositing": '''```python
+def build_compositing(ctx):
+    scene = bpy.context.scene
+    scene.render.engine = "BLENDER_EEVEE_NEXT"
+    scene.render.resolution_x, scene.render.resolution_y = 1920, 1080
+    scene.render.fps = FPS
+    scene.view_settings.view_transform = "AgX"
+```''',
+}
+
+
+class DecodeLlm(BaseLlm):
+    """Replies after first-token latency plus reply length at a fixed decode rate."""
+
+    chars_per_second: float = 400.0
+    first_token: float = 0.5
+    output_chars: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        instruction = str(llm_request.config.system_instruction or "")
+        section = next((s for s in blender_sections.SECTIONS if f"Section: **{s}**" in instruction), None)
+        if section is not None:
+            text = SECTION_REPLIES[section]
+        else:
+            bodies = "\n\n".join(reply.strip("`\n").removeprefix("python\n") for reply in SECTION_REPLIES.values())
+            calls = "\n".join(f"    build_{s}(ctx)" for s in blender_sections.SECTIONS)
+            text = f"```python\nimport bpy\n\n{bodies}\n\ndef main():\n    ctx = {{}}\n{calls}\n\nmain()\n```"
+        self.output_chars += len(text)
+        await asyncio.sleep(self.first_token + len(text) / self.chars_per_second)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+async def run(runs: int) -> float:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent.blender_code_agent, app_name=agent.APP_NAME,
+                    session_service=session_service)
+    total = 0.0
+    for i in range(runs):
+        state = dict(agent.INITIAL_STATE, solution="c = 5", story_schema=SCHEMA.model_dump())
+        await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}",
+                                             state=state)
+        start = time.perf_counter()
+        content = types.Content(role="user", parts=[types.Part(text="Generate the blender code.")])
+        async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+            pass
+        total += time.perf_counter() - start
+        session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                    session_id=f"s{i}")
+        script = session.state["blender_code"].removeprefix("```python\n").removesuffix("```")
+        compile(script, "blender_code.py", "exec")
+    return total / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--chars-per-second", type=float, default=400.0, help="stub decode rate")
+    parser.add_argument("--first-token", type=float, default=0.5, help="stub time to first token, seconds")
+    args = parser.parse_args()
+
+    model = DecodeLlm(model="stub", chars_per_second=args.chars_per_second, first_token=args.first_token)
+    for sub_agent in [agent.blender_code_agent, *agent.blender_section_agents]:
+        sub_agent.model = model
+
+    results = {}
+    blender_templates.TEMPLATES_ENABLED = False  # every section is generated, to compare like for like
+    blender_preflight.PREFLIGHT_ENABLED = False  # the stub's monolithic script leaves out the helper API
+    for sectioned in (False, True):
+        blender_sections.SECTIONS_ENABLED = sectioned
+        get_stats("blender_sections").reset()
+        model.output_chars = 0
+        results[sectioned] = asyncio.run(run(args.runs))
+        failed = sum(v for k, v in get_stats("blender_sections").counters.items() if k.startswith("failed:"))
+        print(f"{'sectioned' if sectioned else 'single':>9}: {results[sectioned]:6.2f}s per script, "
+              f"{model.output_chars // args.runs:6d} output chars per script, {failed} stubbed sections")
+    print(f"sectioned generation is {results[False] / results[True]:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Output size and generation time of sectioned Blender scripts with and without scene templates.
+
+Usage:
+    python -m benchmarks.bench_blender_templates [--chars-per-second 400] [--first-token 0.5]
+
+Runs ``SectionedBlenderAgent`` once per story schema: the settings and
+character types of the few-shot examples in ``prompts.py``, plus one setting
+the library does not cover. The model is the decode-rate stub of
+``bench_blender_sections``. Without templates, the environment and character
+sections are as long as the corresponding template, standing in for the
+scene code a model would write; with templates those sections make no model
+call. Output tokens are estimated as characters / 4.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks.bench_blender_sections import SCHEMA, DecodeLlm
+from math_agents import agent, blender_templates, story
+from math_agents.metrics import get_stats
+
+
+def schema(location: str, *types_: str) -> story.StorySchema:
+    characters = [{"name": f"Character {i}", "type": kind} for i, kind in enumerate(types_)]
+    return SCHEMA.model_copy(update={
+        "setting": SCHEMA.setting.model_copy(update={"location": location}),
+        "characters": [story.Character.model_validate(c) for c in characters],
+    })
+
+
+SCHEMAS = [
+    schema("construction site", "human", "fantasy"),
+    schema("racetrack", "human"),
+    schema("stadium", "human"),
+    schema("classroom", "anthropomorphic", "human"),
+    schema("underwater reef", "anthropomorphic"),
+]
+
+
+class SceneSizedLlm(DecodeLlm):
+    """Decode-rate stub whose environment and character replies are full scenes."""
+
+    story_schema: story.StorySchema | None = None
+
+    async def generate_content_async(self, llm_request, stream=False):
+        instruction = str(llm_request.config.system_instruction or "")
+        section = next((s for s in blender_templates.TEMPLATES if f"Section: **{s}**" in instruction), None)
+        code = blender_templates.TEMPLATES[section](self.story_schema) if section else None
+        if code is None:
+            async for response in super().generate_content_async(llm_request, stream):
+                yield response
+            return
+        self.output_chars += len(code)
+        await asyncio.sleep(self.first_token + len(code) / self.chars_per_second)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=code)]))
+
+
+async def run_once(model: SceneSizedLlm, story_schema: story.StorySchema, i: int) -> float:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent.blender_code_agent, app_name=agent.APP_NAME,
+                    session_service=session_service)
+    model.story_schema = story_schema
+    state = dict(agent.INITIAL_STATE, solution="c = 5", story_schema=story_schema.model_dump())
+    await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}",
+                                         state=state)
+    start = time.perf_counter()
+    content = types.Content(role="user", parts=[types.Part(text="Generate the blender code.")])
+    async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+        pass
+    elapsed = time.perf_counter() - start
+    session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}")
+    script = session.state["blender_code"].removeprefix("```python\n").removesuffix("```")
+    compile(script, "blender_code.py", "exec")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars-per-second", type=float, default=400.0, help="stub decode rate")
+    parser.add_argument("--first-token", type=float, default=0.5, help="stub time to first token, seconds")
+    args = parser.parse_args()
+
+    model = SceneSizedLlm(model="stub", chars_per_second=args.chars_per_second, first_token=args.first_token)
+    for sub_agent in [agent.blender_code_agent, *agent.blender_section_agents]:
+        sub_agent.model = model
+
+    print(f"{'setting':<20} {'templates':>9} {'output tokens':>14} {'seconds':>8} {'templated':>10}")
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    for i, story_schema in enumerate(SCHEMAS):
+        for enabled in (False, True):
+            blender_templates.TEMPLATES_ENABLED = enabled
+            model.output_chars = 0
+            get_stats("blender_templates").reset()
+            elapsed = asyncio.run(run_once(model, story_schema, i))
+            totals[enabled][0] += model.output_chars
+            totals[enabled][1] += elapsed
+            print(f"{story_schema.setting.location:<20} {'on' if enabled else 'off':>9} "
+                  f"{model.output_chars // 4:>14d} {elapsed:>8.2f} "
+                  f"{sum(v for k, v in get_stats('blender_templates').counters.items() if k.startswith('templated:')):>10d}")
+    (chars_off, seconds_off), (chars_on, seconds_on) = totals[False], totals[True]
+    print(f"per request: {chars_off // 4 // len(SCHEMAS)} -> {chars_on // 4 // len(SCHEMAS)} output tokens "
+          f"({1 - chars_on / chars_off:.0%} fewer), {seconds_off / len(SCHEMAS):.2f}s -> "
+          f"{seconds_on / len(SCHEMAS):.2f}s ({1 - seconds_on / seconds_off:.0%} faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Upstream model time recovered by cancelling abandoned requests, on the fake model backend.
+
+Usage:
+    python -m benchmarks.bench_cancellation [--requests 96] [--concurrency 16] [--abandon 0.2]
+        [--time-scale 0.05] [--timeout 0] [--seed 0]
+
+Word problems run through ``root_agent`` with artifacts generated eagerly, so
+a request that is abandoned late still has the story and the Blender script
+to generate. Every agent has the ``fake_llm`` model, wrapped to measure the
+time each request spends in model calls, cancelled calls included. At most
+``--concurrency`` requests run at once; the others queue. The benchmark runs
+three phases on the same problems:
+
+1. Baseline: every client waits for its result. Gives the median time from
+   submitting a request to its result.
+2. Ignored: a ``--abandon`` fraction of the clients, chosen at random, leave
+   after a random delay between 10% and 100% of that median. As before
+   ``cancellation``, the server does not notice and runs their requests to
+   completion.
+3. Cancelled: the same clients leave at the same times, and every request
+   runs under ``cancellation.guard``, which cancels it once its client has
+   gone (and after ``--timeout`` seconds, if set).
+
+Model time spent on the requests of clients who left is wasted. The
+benchmark reports it for phases 2 and 3, the share recovered by
+cancelling, and the time cancelled requests took to unwind. It exits
+non-zero if, after phase 3, a ledger hold is still held, a coalesced call is
+still in flight or a batch item is still queued.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import AsyncGenerator
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from benchmarks.bench_cassette import llm_agents
+from math_agents import agent, batching, cancellation, ledger, metering, singleflight
+from math_agents.metrics import get_stats
+
+
+_request: contextvars.ContextVar[int | None] = contextvars.ContextVar("request", default=None)
+model_seconds: Counter = Counter()
+
+
+class TimedLlm(BaseLlm):
+    """Adds the time spent in each call of ``inner``, until it returns or is cancelled, to its request."""
+
+    inner: BaseLlm
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        start = time.perf_counter()
+        try:
+            async for response in self.inner.generate_content_async(llm_request, stream):
+                yield response
+        finally:
+            model_seconds[_request.get()] += time.perf_counter() - start
+
+
+def install_timers(agents: list) -> None:
+    for llm_agent in agents:
+        llm_agent.model = TimedLlm(model=llm_agent.canonical_model.model, inner=llm_agent.canonical_model)
+
+
+async def run(requests: int, concurrency: int, leave_at: dict[int, float], guarded: bool, timeout: float,
+              poll: float) -> list[dict]:
+    """Runs the requests; ``leave_at`` maps a request to the seconds after submitting when its client leaves."""
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def work(i: int) -> None:
+        topic = f"A train travels {i % 83 + 20} miles in {i % 7 + 2} hours. What is its average speed?"
+        state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+        async with semaphore:
+            await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                 session_id=f"r{i}", state=state)
+            content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {topic}")])
+            async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"r{i}", new_message=content):
+                pass
+
+    async def one(i: int) -> dict:
+        _request.set(i)
+        submitted = loop.time()
+        leaves = submitted + leave_at[i] if i in leave_at else None
+
+        async def is_disconnected() -> bool:
+            return leaves is not None and loop.time() >= leaves
+
+        outcome = "done"
+        try:
+            if guarded:
+                await cancellation.guard(work(i), is_disconnected, timeout=timeout, poll=poll)
+            else:
+                await work(i)
+        except cancellation.RequestCancelledError as e:
+            outcome = e.reason
+        finished = loop.time()
+        return {"request": i, "seconds": finished - submitted, "outcome": outcome,
+                "abandoned": leaves is not None and finished > leaves}
+
+    return await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def held_calls(book: ledger.Ledger) -> int:
+    return sum(len(holds) for holds in book._holds.values())
+
+
+def leftovers(book: ledger.Ledger) -> dict:
+    """Work a cancelled request could leave behind: ledger holds, coalesced calls and queued batch items."""
+    return {
+        "ledger_holds": held_calls(book),
+        "singleflight_in_flight": sum(group.in_flight() for group in list(singleflight._groups.values())),
+        "batch_items_queued": sum(len(batcher._pending) for batchers in list(batching._batchers.values())
+                                  for batcher in batchers.values()),
+    }
+
+
+def phase(args, leave_at: dict[int, float], guarded: bool, poll: float) -> tuple[list[dict], float]:
+    model_seconds.clear()
+    start = time.perf_counter()
+    results = asyncio.run(run(args.requests, args.concurrency, leave_at, guarded, args.timeout, poll))
+    return results, time.perf_counter() - start
+
+
+def wasted(results: list[dict]) -> float:
+    """Model seconds spent on requests whose client left before the result."""
+    return sum(model_seconds[r["request"]] for r in results if r["abandoned"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=96)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--abandon", type=float, default=0.2, help="fraction of clients that leave early")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplier on the fake model latencies")
+    parser.add_argument("--timeout", type=float, default=0, help="request deadline in seconds, 0 for none")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    agents = agent.build_agents()
+    fake_llm.install(agents, fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    install_timers(llm_agents(agents))
+    metering.install(llm_agents(agents))
+    # Budgets far above any spend, so every call takes a hold and none is refused.
+    book = ledger.set_ledger(ledger.Ledger(request_budget=1000.0, tenant_budget=1000.0))
+    # Check for a disconnected client at the same rate relative to the model latencies as the API does.
+    poll = cancellation.DISCONNECT_POLL * args.time_scale
+
+    results, elapsed = phase(args, {}, False, poll)
+    median = statistics.median(r["seconds"] for r in results)
+    total = sum(model_seconds.values())
+    print(f"1. baseline: {args.requests} requests in {elapsed:.1f}s at concurrency {args.concurrency}, "
+          f"median {median:.2f}s per request, {total:.1f} model-seconds")
+
+    rng = random.Random(args.seed)
+    leaving = rng.sample(range(args.requests), round(args.abandon * args.requests))
+    leave_at = {i: rng.uniform(0.1, 1.0) * median for i in leaving}
+
+    results, elapsed = phase(args, leave_at, False, poll)
+    lost, total = wasted(results), sum(model_seconds.values())
+    left = sum(r["abandoned"] for r in results)
+    print(f"2. ignored: {len(leave_at)} clients leave, {left} before their result; {elapsed:.1f}s, "
+          f"{total:.1f} model-seconds, {lost:.1f} wasted ({lost / total:.0%})")
+
+    get_stats("cancellation").reset()
+    results, elapsed = phase(args, leave_at, True, poll)
+    kept, total = wasted(results), sum(model_seconds.values())
+    outcomes = Counter(r["outcome"] for r in results)
+    report = cancellation.report()
+    print(f"3. cancelled: {outcomes['disconnected']} cancelled on disconnect, {outcomes['deadline']} at the deadline; "
+          f"{elapsed:.1f}s, {total:.1f} model-seconds, {kept:.1f} wasted ({kept / total:.0%})")
+    recovered = lost - kept
+    print(f"   recovered {recovered:.1f} of {lost:.1f} wasted model-seconds ({recovered / lost if lost else 0:.0%}), "
+          f"{recovered / max(1, len(leave_at)):.2f}s per leaving client")
+    unwind = report["unwind"]
+    if unwind["count"]:
+        print(f"   unwind after cancel: p50 {unwind['p50_ms']:.2f}ms, p95 {unwind['p95_ms']:.2f}ms; "
+              f"{report['batches_abandoned']} batches abandoned")
+
+    failures = []
+    for name, count in leftovers(book).items():
+        if count:
+            failures.append(f"{count} {name.replace('_', ' ')} left after the run")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
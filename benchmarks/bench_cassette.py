@@ -0,0 +1,165 @@
+"""Recording overhead, cassette size and replay fidelity of the model-call cassette.
+
+Usage:
+    python -m benchmarks.bench_cassette [--requests 16] [--concurrency 8] [--time-scale 0.1]
+    python -m benchmarks.bench_cassette --cassette day.jsonl.gz --topics topics.txt [--timing fast]
+
+In the first form, ``--requests`` word problems run through ``root_agent``
+on the ``fake_llm`` backend three times:
+
+1. recording to a temporary cassette;
+2. replaying it with the original timing;
+3. replaying it as fast as possible.
+
+Each replay must give the same session state as the recording. It must hit
+on every call and never reach the backend.
+
+The second form replays a recorded cassette for the topics in
+``--topics``, one per line. It reports hits and misses, and the replayed
+latency against the recorded latency per agent. A miss means a prompt has
+changed since the recording.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from math_agents import agent, batching, cassette
+from math_agents.metrics import get_stats
+
+
+RESULT_KEYS = ["math_domain", "solution", "verification", "animation_story", "blender_code"]
+
+
+def llm_agents(agents: dict) -> list:
+    return [a for name in fake_llm.AGENT_STAGES for a in (agents[name] if isinstance(agents[name], list)
+                                                          else [agents[name]])]
+
+
+async def run(topics: list[str], concurrency: int) -> tuple[float, dict, int]:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+    results, failures = {}, 0
+
+    async def one(i: int, topic: str):
+        nonlocal failures
+        state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+        async with semaphore:
+            await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                 session_id=f"s{i}", state=state)
+            content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+            try:
+                async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+                    pass
+            except* cassette.CassetteMissError:
+                failures += 1
+            session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                        session_id=f"s{i}")
+            results[topic] = {key: session.state.get(key) for key in RESULT_KEYS}
+            results[topic]["verification"] = dict(results[topic]["verification"] or {}, elapsed_ms=None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i, topic) for i, topic in enumerate(topics)))
+    return time.perf_counter() - start, results, failures
+
+
+def replay_latencies() -> dict[str, tuple[float, float]]:
+    """Mean recorded and replayed latency in ms per agent, from the cassette stats."""
+    stats = get_stats("cassette")
+    result = {}
+    for label in stats.snapshot()["latency"]:
+        kind, _, name = label.partition(":")
+        if kind == "replayed":
+            result[name] = stats.latency(label)["mean_ms"]
+    return result
+
+
+def recorded_latencies(tape: cassette.Cassette) -> dict[str, float]:
+    """Mean recorded latency in ms per agent, from the cassette records."""
+    totals = {}
+    for records in tape._records.values():
+        for record in records:
+            end = record["error"]["t"] if "error" in record else record["chunks"][-1]["t"] if record["chunks"] else 0
+            total, count = totals.get(record["agent"], (0.0, 0))
+            totals[record["agent"]] = (total + end, count + 1)
+    return {name: total / count * 1000 for name, (total, count) in totals.items()}
+
+
+def replay_existing(args) -> None:
+    with open(args.topics) as f:
+        topics = [line.strip() for line in f if line.strip()]
+    tape = cassette.Cassette(args.cassette, "replay", args.timing)
+    cassette.install(llm_agents(agent.build_agents()), tape)
+    elapsed, _, failed = asyncio.run(run(topics, args.concurrency))
+    report = cassette.report()
+    print(f"{len(topics)} topics replayed in {elapsed:.2f}s ({args.timing} timing): {report['hits']} hits, "
+          f"{report['misses']} misses, {failed} sessions stopped by a miss")
+    recorded, replayed = recorded_latencies(tape), replay_latencies()
+    print(f"{'agent':<32} {'recorded ms':>12} {'replayed ms':>12}")
+    for name in sorted(replayed):
+        print(f"{name:<32} {recorded.get(name, 0):>12.0f} {replayed[name]:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier on the fake model latencies")
+    parser.add_argument("--cassette", help="replay this recorded cassette instead")
+    parser.add_argument("--topics", help="topics to replay with --cassette, one per line")
+    parser.add_argument("--timing", choices=["original", "fast"], default="fast", help="timing for --cassette")
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.WARNING)
+    batching.BATCHING_ENABLED = False  # batch prompts depend on arrival timing; see cassette.py
+    agents = agent.build_agents()
+    if args.cassette:
+        replay_existing(args)
+        return
+
+    fake_llm.install(agents, fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    topics = [f"A shop sells {i + 2} pens for {2 * i + 4} dollars. How much is one pen?"
+              for i in range(args.requests)]
+    asyncio.run(run([f"warm-up {topic}" for topic in topics[:args.concurrency]], args.concurrency))
+    baseline, _, _ = asyncio.run(run(topics, args.concurrency))
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "cassette.jsonl.gz")
+        runs = {}
+        for mode, timing in [("record", "original"), ("replay", "original"), ("replay", "fast")]:
+            get_stats("cassette").reset()
+            get_stats("fake_llm").reset()
+            tape = cassette.Cassette(path, mode, timing)
+            cassette.install(llm_agents(agents), tape)
+            elapsed, results, failed = asyncio.run(run(topics, args.concurrency))
+            tape.close()
+            backend_calls = sum(v for k, v in get_stats("fake_llm").counters.items() if k.startswith("calls:"))
+            runs[(mode, timing)] = (elapsed, results, cassette.report(), backend_calls, failed)
+        size = os.path.getsize(path)
+
+    recorded_elapsed, recorded, record_report, _, _ = runs[("record", "original")]
+    print(f"{args.requests} requests at concurrency {args.concurrency}, model latency x{args.time_scale:g}")
+    print(f"no cassette: {baseline:.2f}s; recording: {recorded_elapsed:.2f}s "
+          f"({(recorded_elapsed / baseline - 1) * 100:+.1f}%)")
+    print(f"cassette: {record_report['recorded']} calls, {size / 1024:.1f} KiB gzipped, "
+          f"{size / max(1, record_report['recorded']):.0f} bytes per call on disk")
+    for timing in ("original", "fast"):
+        elapsed, results, report, backend_calls, failed = runs[("replay", timing)]
+        same = sum(results[topic] == recorded[topic] for topic in topics)
+        print(f"replay {timing:>8}: {elapsed:6.2f}s, hit rate {report["hit_rate"]:.0%} ({report["loose_hits"]} loose, {report["misses"]} misses), "
+              f"{backend_calls} backend calls, {same}/{len(topics)} sessions identical to the recording")
+
+
+if __name__ == "__main__":
+    main()
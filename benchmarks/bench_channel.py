@@ -0,0 +1,180 @@
+"""Bytes on the wire and serialization CPU of state-delta frames against full state dumps.
+
+Usage:
+    python -m benchmarks.bench_channel [--sessions 16] [--turns 3] [--concurrency 8] [--time-scale 0.02]
+
+Multi-turn sessions run through ``root_agent`` on the ``fake_llm`` backend:
+a problem solved with its story and Blender code, then ``--turns`` - 1 small
+edits of it, each seeded from the turn before (see ``incremental``). The
+events of every turn are fed to five clients:
+
+1. poll: fetches the full state, as ``json.dumps(state, indent=2)`` like
+   ``agent.call_agent_async`` prints it, after every event that changes the
+   state. That is as fresh as the channel, and still gets no streamed text;
+2. deltas: a ``channel.DeltaChannel`` subscribed to every key, without
+   chunks or compression;
+3. compressed: the same, with large values compressed;
+4. + chunks: the same, with streamed text (the channel's defaults);
+5. solution only: subscribed to ``solution`` and ``verification``, without
+   chunks.
+
+It reports bytes and serialization CPU time per session for each client,
+and checks that the state rebuilt from each channel's frames matches the
+session state on the subscribed keys.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from benchmarks.bench_incremental import topics
+from math_agents import agent, channel, incremental
+from math_agents.metrics import get_stats
+
+
+class Poller:
+    """Serializes the full state after every state change."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.cpu = 0.0
+
+    def turn(self, session_id: str, state: dict) -> None:
+        self.changed(state)
+
+    def event(self, session_id: str, event, state: dict) -> None:
+        if not event.partial and event.actions and event.actions.state_delta:
+            self.changed(state)
+
+    def done(self, session_id: str, state: dict) -> None:
+        pass
+
+    def changed(self, state: dict) -> None:
+        start = time.thread_time()
+        text = json.dumps({k: v for k, v in state.items() if not k.startswith("temp:")}, indent=2, default=str)
+        self.cpu += time.thread_time() - start
+        self.bytes += len(text)
+
+
+class Subscriber:
+    """Serializes the frames of a ``DeltaChannel`` and rebuilds the subscribed state from them."""
+
+    def __init__(self, keys: list[str] | None, chunks: bool, compress_min_bytes: int = channel.COMPRESS_MIN_BYTES):
+        self.keys = keys
+        self.channel = channel.DeltaChannel(keys, chunks, compress_min_bytes)
+        self.bytes = 0
+        self.cpu = 0.0
+        self.mirror: dict[str, dict] = {}
+
+    def _send(self, frames: list[str]) -> None:
+        for text in frames:
+            self.bytes += len(text)
+            frame = json.loads(text)
+            if frame["type"] in ("snapshot", "delta"):
+                self.mirror.setdefault(frame["session_id"], {}).update(channel.decode(frame))
+
+    def _timed(self, build) -> list[str]:
+        start = time.thread_time()
+        frames = build()
+        self.cpu += time.thread_time() - start
+        return frames
+
+    def turn(self, session_id: str, state: dict) -> None:
+        self._send(self._timed(lambda: [self.channel.snapshot(session_id, state)]))
+
+    def event(self, session_id: str, event, state: dict) -> None:
+        self._send(self._timed(lambda: self.channel.event(session_id, event)))
+
+    def done(self, session_id: str, state: dict) -> None:
+        self.channel.record_turn(state)  # bookkeeping for the server's report, not part of the protocol
+        self._send(self._timed(lambda: [self.channel.done(session_id, 0.0)]))
+
+
+async def run(sessions: int, turns: int, concurrency: int, clients: dict) -> list[dict]:
+    """Runs the sessions, feeding every event to ``clients``; returns the final state of every turn."""
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> list[dict]:
+        states, previous = [], None
+        async with semaphore:
+            for step, topic in enumerate(topics(i, turns - 1)):
+                session_id = f"c{i}t{step}"
+                state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+                if previous is not None:
+                    state.update(incremental.seed(previous, topic))
+                session = await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                               session_id=session_id, state=state)
+                mirror = dict(session.state)
+                for client in clients.values():
+                    client.turn(session_id, mirror)
+                content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {topic}")])
+                async for event in runner.run_async(user_id=agent.USER_ID, session_id=session_id,
+                                                    new_message=content):
+                    if not event.partial and event.actions:
+                        mirror.update(event.actions.state_delta)
+                    for client in clients.values():
+                        client.event(session_id, event, mirror)
+                session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                            session_id=session_id)
+                for client in clients.values():
+                    client.done(session_id, session.state)
+                previous = session.state
+                states.append({"session_id": session_id, "state": session.state})
+        return states
+
+    return [s for states in await asyncio.gather(*(one(i) for i in range(sessions))) for s in states]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.02, help="multiplier on the fake model latencies")
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    fake_llm.install(agent.build_agents(), fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    solution_keys = ["solution", "verification"]
+    clients = {"poll": Poller(), "deltas": Subscriber(None, False, 0), "compressed": Subscriber(None, False),
+               "+ chunks": Subscriber(None, True), "solution only": Subscriber(solution_keys, False)}
+    results = asyncio.run(run(args.sessions, args.turns, args.concurrency, clients))
+
+    print(f"{args.sessions} sessions of {args.turns} turns, compressing values from {channel.COMPRESS_MIN_BYTES} bytes")
+    print(f"{'client':<14} {'KiB/session':>11} {'CPU ms/session':>14} {'bytes':>8} {'CPU':>8}")
+    poll = clients["poll"]
+    for name, client in clients.items():
+        print(f"{name:<14} {client.bytes / 1024 / args.sessions:>11.1f} {client.cpu * 1000 / args.sessions:>14.2f} "
+              f"{client.bytes / poll.bytes - 1:>+8.1%} {client.cpu / poll.cpu - 1 if poll.cpu else 0:>+8.1%}")
+
+    failures = []
+    for name, client in clients.items():
+        if not isinstance(client, Subscriber):
+            continue
+        for result in results:
+            state, rebuilt = result["state"], client.mirror.get(result["session_id"], {})
+            wanted = [k for k in (client.keys or state) if not k.startswith("temp:")]
+            if any(json.dumps(rebuilt.get(k), default=str) != json.dumps(state.get(k), default=str) for k in wanted):
+                failures.append(f"{name}: state rebuilt from frames differs in session {result['session_id']}")
+    if get_stats("channel").counters["frames:chunk"] == 0:
+        failures.append("no streamed text was sent")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Latency of multi-domain problems with the domain solvers run concurrently or one after another.
+
+Usage:
+    python -m benchmarks.bench_domains [--requests 48] [--concurrency 8] [--time-scale 0.1]
+        [--domains "statistics, probability"]
+
+Word problems run through ``root_agent`` up to the verified solution (artifacts
+are deferred). Every agent has the ``fake_llm`` model. The classifier
+answers ``--domains`` for every problem, so each problem goes to the solver
+of every label, and labels outside ``domains.DOMAINS`` go to the general
+solver. The same problems run three times:
+
+1. single: the classifier names only the first domain, for reference;
+2. sequential: every domain, with ``MATH_AGENTS_CONCURRENT_SOLVERS=0``;
+3. concurrent: every domain, with the solvers run at the same time.
+
+For each run the benchmark reports the request latency percentiles and the
+model calls made by the solvers. It checks that every multi-domain request
+got a merged solution with a section per domain.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from math_agents import agent, domains
+from math_agents.metrics import get_stats
+
+
+async def run(requests: int, concurrency: int, offset: int) -> list[dict]:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> dict:
+        topic = (f"A bag holds {i % 7 + 3} red and {i % 5 + 2} blue marbles. Two are drawn without replacement. "
+                 f"Find the mean and the variance of the number of red marbles drawn.")
+        session_id = f"d{offset + i}"
+        state = dict(agent.INITIAL_STATE, topic=topic)
+        async with semaphore:
+            await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                 session_id=session_id, state=state)
+            content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+            start = time.perf_counter()
+            async for _ in runner.run_async(user_id=agent.USER_ID, session_id=session_id, new_message=content):
+                pass
+            elapsed = time.perf_counter() - start
+        session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                    session_id=session_id)
+        return {"seconds": elapsed, "labels": session.state.get("math_domains") or [],
+                "solution": session.state.get("solution") or ""}
+
+    return await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier on the fake model latencies")
+    parser.add_argument("--domains", default="statistics, probability", help="the classifier's reply")
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    models = fake_llm.install(agent.build_agents(), fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    labels = domains.parse_domains(args.domains)
+    print(f"{args.requests} requests at concurrency {args.concurrency}, classified as {labels}")
+    print(f"{'run':<11} {'labels':>6} {'solver calls':>12} {'mean s':>7} {'p50 s':>7} {'p95 s':>7} {'wall s':>7}")
+
+    means, failures = {}, []
+    for i, (name, reply, concurrent) in enumerate([("single", labels[0], True), ("sequential", args.domains, False),
+                                                   ("concurrent", args.domains, True)]):
+        models["classify"].domains = reply
+        domains.CONCURRENT_SOLVERS = concurrent
+        get_stats("fake_llm").reset()
+        start = time.perf_counter()
+        results = asyncio.run(run(args.requests, args.concurrency, i * args.requests))
+        wall = time.perf_counter() - start
+        seconds = [r["seconds"] for r in results]
+        means[name] = statistics.mean(seconds)
+        calls = get_stats("fake_llm").counters["calls:solve"]
+        print(f"{name:<11} {len(results[0]['labels']):>6} {calls:>12} {means[name]:>7.2f} {_pct(seconds, 0.5):>7.2f} "
+              f"{_pct(seconds, 0.95):>7.2f} {wall:>7.2f}")
+        if name != "single" and len(labels) > 1:
+            merged = sum(all(f"{label.capitalize()} approach:" in r["solution"] for label in labels) for r in results)
+            if merged < len(results):
+                failures.append(f"{name}: {len(results) - merged} requests without a merged solution")
+
+    print(f"concurrent solvers: {means['sequential'] / means['concurrent']:.2f}x faster than sequential, "
+          f"{means['concurrent'] / means['single'] - 1:+.0%} latency against a single domain")
+    report = domains.report()
+    print(f"merged {report['merged']} solutions, {report['disagreed']} with disagreeing answers; "
+          f"labels {dict((k, v) for k, v in report['labels'].items() if v)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+
+if __name__ == "__main__":
+    main()
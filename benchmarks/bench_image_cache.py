@@ -0,0 +1,121 @@
+"""Measure perceptual-hash cache hit rate and lookup latency at scale.
+
+Usage:
+    python -m benchmarks.bench_image_cache [--entries 1000000] [--queries 2000]
+
+The index is filled with random 64-bit hashes standing in for stored pages.
+Queries are an even mix of near-duplicates (a stored hash with up to
+``MAX_DISTANCE`` flipped bits, as a re-photographed page would give) and
+unseen pages. A brute-force scan over a sample is timed for comparison.
+Finally a synthetic photo is re-encoded several ways to show the Hamming
+distances real near-duplicates produce, and re-rendered with one digit
+changed: such edits fall within the hash thresholds, so they must be told
+apart by the ink check. It exits non-zero if a re-encoded photo misses the
+cache or a digit edit hits it.
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+
+from PIL import Image, ImageEnhance
+
+from math_agents import image_cache, imaging
+from math_agents.metrics import get_stats
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(image_cache.HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+DIGIT_EDITS = {
+    "3 -> 8": "Solve 2x + 8 = 11",
+    "11 -> 13": "Solve 2x + 3 = 13",
+    "11 -> 17": "Solve 2x + 3 = 17",
+    "3 -> 5": "Solve 2x + 5 = 11",
+}
+
+
+def near_duplicate_distances() -> list[tuple[str, int, int, bool]]:
+    """``(variant, pHash bits, dHash bits, cache hit)`` for re-encoded photos and digit edits of one page."""
+    from benchmarks.bench_imaging import SYNTHETIC_LINES, synthetic_photo
+
+    original = synthetic_photo()
+    base = imaging.preprocess(original)
+    cache = image_cache.ImageCache()
+    cache.put(base.phash, base.dhash, {"topic": SYNTHETIC_LINES[0]}, base.ink)
+    photo = Image.open(io.BytesIO(original))
+    exif = photo.getexif()
+    variants = {
+        "jpeg q60": lambda im: im,
+        "75% size": lambda im: im.resize((im.width * 3 // 4, im.height * 3 // 4)),
+        "darker": lambda im: ImageEnhance.Brightness(im).enhance(0.8),
+        "shifted crop": lambda im: im.crop((40, 60, im.width, im.height)),
+    }
+    photos = {}
+    for name, change in variants.items():
+        buffer = io.BytesIO()
+        change(photo).save(buffer, "JPEG", quality=60, exif=exif)
+        photos[name] = buffer.getvalue()
+    for name, line in DIGIT_EDITS.items():
+        photos[f"digit {name}"] = synthetic_photo([line, *SYNTHETIC_LINES[1:]])
+    out = []
+    for name, data in photos.items():
+        result = imaging.preprocess(data)
+        out.append((name, image_cache.hamming(base.phash, result.phash), image_cache.hamming(base.dhash, result.dhash),
+                    cache.get(result.phash, result.dhash, result.ink) is not None))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cache = image_cache.ImageCache(max_entries=args.entries)
+    stored = [(rng.getrandbits(64), rng.getrandbits(64)) for _ in range(args.entries)]
+    start = time.perf_counter()
+    for i, (p, d) in enumerate(stored):
+        cache.put(p, d, {"topic": f"problem {i}"})
+    print(f"indexed {args.entries} entries in {time.perf_counter() - start:.1f}s")
+
+    get_stats("image_cache").reset()
+    expected_hits = 0
+    for q in range(args.queries):
+        if q % 2 == 0:
+            p, d = rng.choice(stored)
+            p = flip_bits(p, rng.randint(0, cache.max_distance), rng)
+            expected_hits += 1
+        else:
+            p, d = rng.getrandbits(64), rng.getrandbits(64)
+        cache.get(p, d)
+    report = image_cache.report()
+    print(f"hit rate {report['hit_rate']:.3f} (expected {expected_hits / args.queries:.3f})")
+    print(f"lookup p50 {report['lookup']['p50_ms']:.3f} ms, p99 {report['lookup']['p99_ms']:.3f} ms")
+
+    sample = stored[:100_000]
+    p = sample[0][0]
+    start = time.perf_counter()
+    min(image_cache.hamming(p, q) for q, _ in sample)
+    scan_ms = (time.perf_counter() - start) * 1000 * len(stored) / len(sample)
+    print(f"brute-force scan of {len(stored)} entries: ~{scan_ms:.1f} ms per lookup")
+
+    print("\nnear-duplicate photo       pHash bits  dHash bits  cache")
+    failures = []
+    for name, p_bits, d_bits, hit in near_duplicate_distances():
+        print(f"{name:<26} {p_bits:>10} {d_bits:>11}  {'hit' if hit else 'miss'}")
+        if hit == name.startswith("digit"):
+            failures.append(f"{name}: cache {'hit' if hit else 'miss'}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare bytes sent to the vision model and extraction latency with and without preprocessing.
+
+Usage:
+    python -m benchmarks.bench_imaging [photo.jpg ...] [--llm]
+
+Without paths a synthetic 12 MP phone photo (rotated via EXIF, noisy paper,
+three lines of text) is used. With ``--llm`` (and GOOGLE_API_KEY set) each
+image is also transcribed by the model in both forms, using the
+ProblemExtractAgent instruction, so end-to-end extraction latency can be
+compared.
+"""
+
+import argparse
+import io
+import os
+import random
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+from math_agents import imaging
+
+
+SYNTHETIC_LINES = ["Solve 2x + 3 = 11", "Find the derivative of x^2 sin(x)", "Integral of x e^x dx"]
+
+
+def synthetic_photo(lines: list[str] = SYNTHETIC_LINES) -> bytes:
+    """A 4032x3024 JPEG like a phone photo of a worksheet, stored sideways with EXIF orientation 6."""
+    image = Image.new("RGB", (4032, 3024), (200, 195, 185))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=90)
+    for i, line in enumerate(lines):
+        draw.text((900, 900 + i * 180), line, fill=(40, 40, 50), font=font)
+    rng = random.Random(1)
+    pixels = image.load()
+    for _ in range(20000):
+        pixels[rng.randrange(4032), rng.randrange(3024)] = (rng.randrange(150, 230),) * 3
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    out = io.BytesIO()
+    image.rotate(90, expand=True).save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def time_llm(data: bytes, mime_type: str) -> tuple[float, str]:
+    from google import genai
+    from google.genai import types
+
+    from math_agents.agent import MODEL, problem_extract_agent
+
+    client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+    start = time.perf_counter()
+    response = client.models.generate_content(
+        model=MODEL,
+        contents=[types.Part.from_bytes(data=data, mime_type=mime_type)],
+        config={"system_instruction": problem_extract_agent.instruction},
+    )
+    return (time.perf_counter() - start) * 1000, (response.text or "").strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", type=Path)
+    parser.add_argument("--llm", action="store_true", help="also time model transcription (uses quota)")
+    args = parser.parse_args()
+
+    images = [(p.name, p.read_bytes()) for p in args.paths] or [("synthetic", synthetic_photo())]
+    print(f"{'image':<20} {'original B':>11} {'sent B':>9} {'ratio':>7} {'size':>11} {'prep ms':>8} {'llm raw ms':>11} {'llm prep ms':>12}")
+    for name, data in images:
+        result = imaging.preprocess(data)
+        raw_ms = prep_ms = "-"
+        if args.llm:
+            raw_ms, raw_text = time_llm(data, Image.open(io.BytesIO(data)).get_format_mimetype())
+            prep_ms, prep_text = time_llm(result.data, result.mime_type)
+            raw_ms, prep_ms = f"{raw_ms:.0f}", f"{prep_ms:.0f}"
+            print(f"  raw: {raw_text!r}\n  preprocessed: {prep_text!r}")
+        size = f"{result.width}x{result.height}"
+        print(f"{name:<20} {len(data):>11} {len(result.data):>9} {len(data) / len(result.data):>6.1f}x "
+              f"{size:>11} {result.elapsed_ms:>8.1f} {raw_ms:>11} {prep_ms:>12}")
+
+
+if __name__ == "__main__":
+    main()
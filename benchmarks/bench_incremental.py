@@ -0,0 +1,163 @@
+"""Tokens and latency saved by patching the artifacts of edited problems instead of regenerating them.
+
+Usage:
+    python -m benchmarks.bench_incremental [--problems 24] [--edits 3] [--concurrency 8] [--time-scale 0.1]
+
+An edit-heavy workload on the ``fake_llm`` backend: ``--problems`` word
+problems are solved with their story and Blender code, then each is edited
+``--edits`` times in a row (a changed count, a renamed colour, a changed
+total), every edit building on the one before, as a user refining a
+problem does. Each edit runs through ``root_agent`` with artifacts
+generated eagerly, in two ways:
+
+1. full: a fresh session, as before ``incremental``; the edit is classified,
+   solved and its artifacts generated from scratch;
+2. incremental: a session seeded by ``incremental.seed`` from the one it
+   edits, so the domains are reused and the story and code are patched.
+
+For both it reports model calls, prompt and reply tokens, and the edit
+latency percentiles. It exits non-zero if an incremental edit is missing its
+story or code, or if a patched story lost its schema.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from math_agents import agent, incremental
+from math_agents.metrics import get_stats
+from math_agents.story import SCHEMA_KEY
+
+
+COLOURS = ["red", "green", "yellow", "white"]
+
+
+def topics(i: int, edits: int) -> list[str]:
+    """Problem ``i`` and its edits, each a small change of the one before."""
+    red, blue, colour, draws = i % 7 + 3, i % 5 + 2, "red", 2
+    result = []
+    for step in range(edits + 1):
+        if step % 3 == 1:
+            red += 1
+        elif step % 3 == 2:
+            colour = COLOURS[(i + step) % len(COLOURS)]
+        elif step:
+            draws += 1
+        result.append(f"A bag holds {red} {colour} and {blue} blue marbles. {draws} are drawn without replacement. "
+                      f"Find the probability that every marble drawn is {colour}.")
+    return result
+
+
+async def run(problems: int, edits: int, concurrency: int, seeded: bool) -> tuple[list[dict], dict]:
+    """Solves the problems, then their edits; returns the edits and the model usage of the edits alone."""
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def solve(session_id: str, state: dict) -> tuple[dict, float]:
+        await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                             session_id=session_id, state=state)
+        content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {state['topic']}")])
+        start = time.perf_counter()
+        async for _ in runner.run_async(user_id=agent.USER_ID, session_id=session_id, new_message=content):
+            pass
+        elapsed = time.perf_counter() - start
+        session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                    session_id=session_id)
+        return session.state, elapsed
+
+    async def original(i: int) -> dict:
+        async with semaphore:
+            state, _ = await solve(f"p{i}", dict(agent.INITIAL_STATE, topic=topics(i, 0)[0], lazy_artifacts=False))
+        return state
+
+    async def edited(i: int, previous: dict) -> list[dict]:
+        results = []
+        async with semaphore:
+            for step, topic in enumerate(topics(i, edits)[1:], 1):
+                state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+                if seeded:
+                    state.update(incremental.seed(previous, topic))
+                previous, elapsed = await solve(f"p{i}e{step}", state)
+                results.append({"seconds": elapsed, "state": previous})
+        return results
+
+    originals = await asyncio.gather(*(original(i) for i in range(problems)))
+    start = dict(get_stats("fake_llm").counters)
+    results = await asyncio.gather(*(edited(i, previous) for i, previous in enumerate(originals)))
+    return [r for chain in results for r in chain], _usage(start)
+
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def _usage(before: dict) -> dict:
+    """Model calls and tokens since the ``before`` snapshot of the fake backend's counters."""
+    counters = get_stats("fake_llm").counters
+    total = {"calls": 0, "prompt_tokens": 0, "tokens": 0}
+    for name, value in counters.items():
+        kind = name.split(":", 1)[0]
+        if kind in total:
+            total[kind] += value - before.get(name, 0)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--problems", type=int, default=24)
+    parser.add_argument("--edits", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier on the fake model latencies")
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    fake_llm.install(agent.build_agents(), fake_llm.scaled(fake_llm.PROFILES, args.time_scale), seed=1)
+    print(f"{args.problems} problems, {args.edits} edits each, concurrency {args.concurrency}")
+    print(f"{'run':<12} {'calls':>6} {'prompt tok':>11} {'reply tok':>10} {'mean s':>7} {'p50 s':>7} {'p95 s':>7}")
+
+    runs, failures = {}, []
+    for name, seeded in [("full", False), ("incremental", True)]:
+        results, usage = asyncio.run(run(args.problems, args.edits, args.concurrency, seeded))
+        seconds = [r["seconds"] for r in results]
+        runs[name] = dict(usage, mean=statistics.mean(seconds))
+        print(f"{name:<12} {usage['calls']:>6} {usage['prompt_tokens']:>11} {usage['tokens']:>10} "
+              f"{runs[name]['mean']:>7.2f} {_pct(seconds, 0.5):>7.2f} {_pct(seconds, 0.95):>7.2f}")
+        if seeded:
+            for r in results:
+                state = r["state"]
+                if not state.get("animation_story") or not state.get("blender_code"):
+                    failures.append(f"edit of {state['topic'][:40]!r} has no story or code")
+                elif not state.get(SCHEMA_KEY):
+                    failures.append(f"patched story of {state['topic'][:40]!r} has no schema")
+
+    full, patched = runs["full"], runs["incremental"]
+    saved = {key: 1 - patched[key] / full[key] for key in ("calls", "prompt_tokens", "tokens", "mean")}
+    print(f"incremental: {saved['calls']:.0%} fewer calls, {saved['prompt_tokens']:.0%} fewer prompt tokens, "
+          f"{saved['tokens']:.0%} fewer reply tokens, {full['mean'] / patched['mean']:.2f}x faster per edit")
+    report = incremental.report()
+    for key, figures in report["artifacts"].items():
+        print(f"  {key}: {figures['patched']} patched, {figures['copied']} copied, "
+              f"{figures['unmatched'] + figures['invalid']} rejected, {figures['regenerated']} regenerated; "
+              f"patch p50 {figures['patch'].get('p50_ms', 0.0):.0f}ms")
+    print(f"  {report['edits']} small edits, {report['not_small']} not small, "
+          f"{report['domains_reused']} classifications skipped")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Model time and latency of eager versus lazy animation and Blender generation.
+
+Usage:
+    python -m benchmarks.bench_lazy_artifacts [--requests 40] [--story-share 0.2] [--blender-share 0.05]
+
+Each request solves a distinct algebra word problem in its own session. In
+eager mode ``SupervisorAgent`` generates the story and Blender code before
+responding. In lazy mode it responds after solving, and only the share of
+clients that ask for the story (``--story-share``) or the Blender code
+(``--blender-share``) trigger their generation. The defaults follow the
+request mix where most users only want the solution.
+
+The model is a stub whose delay depends on the stage (``--scale`` times a
+few seconds for the story and Blender code), so no quota is used. Model time
+is the sum of the stub delays.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from math_agents import agent, artifacts, batching, blender_preflight
+from math_agents.metrics import get_stats
+
+
+# Seconds per call at --scale 1, by a phrase of each agent's instruction.
+STAGE_SECONDS = {
+    "domain classifier": ("classify", 0.5),
+    "algebra problem": ("solve", 2.0),
+    "creative story outline": ("animation_story", 6.0),
+    "Blender": ("blender_code", 12.0),
+}
+
+
+class StageLlm(BaseLlm):
+    """Replies after a per-stage delay and adds the delay to ``model_seconds``."""
+
+    scale: float = 0.05
+    model_seconds: dict = {}
+
+    async def generate_content_async(self, llm_request, stream=False):
+        instruction = str(llm_request.config.system_instruction or "")
+        stage, seconds = next(((s, t) for phrase, (s, t) in STAGE_SECONDS.items() if phrase in instruction),
+                              ("other", 1.0))
+        seconds *= self.scale
+        self.model_seconds[stage] = self.model_seconds.get(stage, 0.0) + seconds
+        await asyncio.sleep(seconds)
+        text = "algebra" if stage == "classify" else f"{stage} output\nAnswer: done"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+async def run(count: int, lazy: bool, story_share: float, blender_share: float) -> dict:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    store = artifacts.ArtifactStore(session_service)
+    rng = random.Random(0)
+    solve_latencies, artifact_latencies = [], []
+
+    async def one(i: int):
+        start = time.perf_counter()
+        session_id = f"s{i}"
+        topic = f"A shop sells {i + 2} pens for {2 * i + 4} dollars. How much is one pen?"
+        state = dict(agent.INITIAL_STATE)
+        state.update(topic=topic, lazy_artifacts=lazy)
+        await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                             session_id=session_id, state=state)
+        content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+        async for _ in runner.run_async(user_id=agent.USER_ID, session_id=session_id, new_message=content):
+            pass
+        solve_latencies.append(time.perf_counter() - start)
+        wanted = rng.random()
+        if wanted < blender_share:
+            await store.get(session_id, "blender_code")
+        elif wanted < blender_share + story_share:
+            await store.get(session_id, "animation_story")
+        else:
+            return
+        artifact_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return {
+        "wall": time.perf_counter() - start,
+        "solve_p50": sorted(solve_latencies)[len(solve_latencies) // 2],
+        "artifact_p50": sorted(artifact_latencies)[len(artifact_latencies) // 2] if artifact_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--story-share", type=float, default=0.2, help="share of clients that open the story")
+    parser.add_argument("--blender-share", type=float, default=0.05, help="share that also want Blender code")
+    parser.add_argument("--scale", type=float, default=0.05, help="multiplier on the per-stage model delays")
+    args = parser.parse_args()
+
+    batching.BATCHING_ENABLED = False  # one classifier call per request, to count model time per stage
+    blender_preflight.PREFLIGHT_ENABLED = False  # the stub replies are not Python
+    model = StageLlm(model="stage", scale=args.scale)
+    for sub_agent in [agent.domain_classify_agent, agent.algebra_agent, agent.reviser_agent,
+                      agent.animation_agent, agent.blender_code_agent]:
+        sub_agent.model = model
+
+    print(f"{args.requests} requests, {args.story_share:.0%} open the story, {args.blender_share:.0%} the Blender code")
+    print(f"{'mode':>6} {'model s':>9} {'story s':>9} {'blender s':>10} {'solve p50 ms':>13} {'artifact p50 ms':>16}")
+    totals = {}
+    for lazy in (False, True):
+        model.model_seconds.clear()
+        get_stats("artifacts").reset()
+        result = asyncio.run(run(args.requests, lazy, args.story_share, args.blender_share))
+        seconds = model.model_seconds
+        totals[lazy] = sum(seconds.values()) / args.scale
+        print(f"{'lazy' if lazy else 'eager':>6} {totals[lazy]:>9.1f} {seconds.get('animation_story', 0) / args.scale:>9.1f} "
+              f"{seconds.get('blender_code', 0) / args.scale:>10.1f} {result['solve_p50'] * 1000:>13.1f} "
+              f"{result['artifact_p50'] * 1000:>16.1f}")
+    print(f"model time saved: {1 - totals[True] / totals[False]:.0%} (model seconds at --scale 1)")
+    report = artifacts.report()
+    for name, figures in report["artifacts"].items():
+        print(f"  {name}: deferred {figures['deferred']}, generated on demand {figures['on_demand']}, "
+              f"never generated {figures['never_generated']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Cost per request and budget enforcement of the token ledger, on the fake model backend.
+
+Usage:
+    python -m benchmarks.bench_ledger [--requests 32] [--concurrency 8] [--time-scale 0.05]
+        [--request-budget 0.5] [--tenant-budget 4]
+
+Word problems run through ``root_agent`` with artifacts generated eagerly.
+Every agent has the ``fake_llm`` model, which reports its usage. Costs are
+estimated at the ``config.MODEL`` price. The benchmark runs three phases:
+
+1. No budgets. Reports the mean cost per request of each stage and the
+   request cost percentiles.
+2. A request budget of ``--request-budget`` times the mean request cost.
+   Requests must still be solved. The artifacts are skipped when the budget
+   left would not cover their usual cost, or cut off once the budget is
+   spent. The overrun past the budget is at most the calls already in
+   flight.
+3. A tenant budget of ``--tenant-budget`` times the mean request cost, for
+   two tenants sending ``--requests`` each. Once a tenant has spent its
+   budget its requests are refused, and the other tenant is unaffected.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from benchmarks.bench_cassette import llm_agents
+from math_agents import agent, ledger, metering
+from math_agents.metrics import get_stats
+
+
+async def run(requests: int, concurrency: int, tenants: list[str], offset: int) -> list[dict]:
+    """Runs ``requests`` problems per tenant; returns per request the outcome and its cost."""
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, tenant: str) -> dict:
+        topic = f"A shop sells {i % 89 + 2} pens for {2 * i + 4} dollars. How much is one pen?"
+        session_id = f"{tenant}-{i}"
+        state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False, tenant=tenant)
+        async with semaphore:
+            await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                 session_id=session_id, state=state)
+            content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+            refused = None
+            try:
+                async for _ in runner.run_async(user_id=agent.USER_ID, session_id=session_id, new_message=content):
+                    pass
+            except Exception as e:
+                if (refused := ledger.budget_error(e)) is None:
+                    raise
+            session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                        session_id=session_id)
+        return {"tenant": tenant, "refused": refused is not None, "solved": bool(session.state.get("solution")),
+                "artifacts": bool(session.state.get("blender_code")), "budget": session.state.get("budget"),
+                "cost": ledger.get_ledger().spent(session_id)}
+
+    jobs = [one(offset + i, tenant) for i in range(requests) for tenant in tenants]
+    return await asyncio.gather(*jobs)
+
+
+def _usd(value: float) -> str:
+    return f"${value * 1000:.3f}m"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplier on the fake model latencies")
+    parser.add_argument("--request-budget", type=float, default=0.5, help="fraction of the mean request cost")
+    parser.add_argument("--tenant-budget", type=float, default=4.0, help="multiple of the mean request cost")
+    args = parser.parse_args()
+
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    agents = agent.build_agents()
+    fake_llm.install(agents, fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    metering.install(llm_agents(agents))
+    book = ledger.set_ledger(ledger.Ledger(request_budget=0, tenant_budget=0))
+
+    start = time.perf_counter()
+    results = asyncio.run(run(args.requests, args.concurrency, ["base"], 0))
+    elapsed = time.perf_counter() - start
+    report = book.report()
+    mean = report["request_cost_usd"]["mean"]
+    print(f"1. no budget: {args.requests} requests in {elapsed:.1f}s, {report['calls']} model calls, "
+          f"{sum(r['solved'] for r in results)} solved, {sum(r['artifacts'] for r in results)} with artifacts")
+    print(f"   request cost (thousandths of a dollar): mean {_usd(mean)}, "
+          f"p50 {_usd(report['request_cost_usd']['p50'])}, p95 {_usd(report['request_cost_usd']['p95'])}")
+    print(f"   {'stage':<28} {'calls':>6} {'prompt tok':>10} {'output tok':>10} {'per request':>12}")
+    for stage, totals in sorted(report["by_stage"].items(), key=lambda item: -item[1]["cost_usd"]):
+        print(f"   {stage:<28} {totals['calls']:>6} {totals['prompt_tokens']:>10} {totals['output_tokens']:>10} "
+              f"{_usd(totals['cost_usd'] / args.requests):>12}")
+
+    get_stats("ledger").reset()
+    book.request_budget = mean * args.request_budget
+    results = asyncio.run(run(args.requests, args.concurrency, ["budget"], args.requests))
+    degraded = get_stats("ledger").counters
+    worst = max(r["cost"] for r in results)
+    print(f"2. request budget {_usd(book.request_budget)} ({args.request_budget:g} x mean): "
+          f"{sum(r['solved'] for r in results)}/{args.requests} solved, "
+          f"{sum(r['artifacts'] for r in results)} with artifacts, "
+          f"{degraded['degraded:artifacts']} skipped or cut artifacts, {degraded['degraded:revision']} skipped revisions")
+    print(f"   mean cost {_usd(sum(r['cost'] for r in results) / args.requests)}, max {_usd(worst)} "
+          f"({(worst / book.request_budget - 1) * 100:+.0f}% against the budget)")
+
+    get_stats("ledger").reset()
+    book.request_budget, book.tenant_budget = 0, mean * args.tenant_budget
+    results = asyncio.run(run(args.requests, args.concurrency, ["tenant-a", "tenant-b"], 2 * args.requests))
+    print(f"3. tenant budget {_usd(book.tenant_budget)} ({args.tenant_budget:g} x mean request cost):")
+    for tenant in ("tenant-a", "tenant-b"):
+        mine = [r for r in results if r["tenant"] == tenant]
+        spent = book.tenant_spent(tenant)
+        print(f"   {tenant}: {sum(r['solved'] for r in mine)} solved, {sum(r['refused'] for r in mine)} refused, "
+              f"spent {_usd(spent)} ({(spent / book.tenant_budget - 1) * 100:+.0f}% against the budget)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark the local linear-algebra solver across matrix sizes.
+
+Usage:
+    python -m benchmarks.bench_linear_algebra [--sizes 8 64 256 1024] [--repeat 3]
+
+Each matrix is written to a temporary ``.npy`` file and loaded through the same
+memory-mapped path that uploaded matrices use, so the timings include loading.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from math_agents import linear_algebra
+
+
+OPERATIONS = ["solve", "determinant", "inverse", "eigen", "rank"]
+
+
+def bench(sizes: list[int], repeat: int) -> list[dict]:
+    rng = np.random.default_rng(0)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            # Diagonally dominant, so every operation is well-conditioned.
+            matrix = rng.standard_normal((n, n)) + n * np.eye(n)
+            augmented = np.hstack([matrix, rng.standard_normal((n, 1))])
+            matrix_path = os.path.join(tmp, f"a_{n}.npy")
+            augmented_path = os.path.join(tmp, f"ab_{n}.npy")
+            np.save(matrix_path, matrix)
+            np.save(augmented_path, augmented)
+            for operation in OPERATIONS:
+                path = augmented_path if operation == "solve" else matrix_path
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    result = linear_algebra.solve(f"{operation} A", matrix_path=path)
+                    timings.append(time.perf_counter() - start)
+                assert result and result["status"] == "success", result
+                rows.append({
+                    "n": n,
+                    "operation": operation,
+                    "best_ms": min(timings) * 1000,
+                    "summarized": any("result_path" in r for r in result["results"]),
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 64, 256, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text_start = time.perf_counter()
+    linear_algebra.solve("Solve 2x + 3y = 6 and x - y = 2")
+    print(f"text system (2x2): {(time.perf_counter() - text_start) * 1000:.3f} ms")
+
+    print(f"{'n':>6} {'operation':<12} {'best ms':>10} {'summarized':>10}")
+    for row in bench(args.sizes, args.repeat):
+        print(f"{row['n']:>6} {row['operation']:<12} {row['best_ms']:>10.3f} {str(row['summarized']):>10}")
+
+
+if __name__ == "__main__":
+    main()
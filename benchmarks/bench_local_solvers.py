@@ -0,0 +1,80 @@
+"""Compare local solver latency with the LLM path for geometry, trigonometry and calculus.
+
+Usage:
+    python -m benchmarks.bench_local_solvers [--repeat 200] [--llm]
+
+Without ``--llm`` only the local engines are timed. With ``--llm`` (and
+GOOGLE_API_KEY set) every problem is also sent once to the model, using the
+same prompt the solver tools use, so both latencies can be compared.
+"""
+
+import argparse
+import os
+import time
+
+from math_agents import calculus, geometry, trigonometry
+
+
+PROBLEMS = {
+    "geometry": (geometry.solve, [
+        "Area of circle with radius 3",
+        "Volume of cube with side 4",
+        "Surface area of a cylinder with radius 2 cm and height 50 mm",
+        "Hypotenuse of a right triangle with legs 3 and 4",
+    ]),
+    "trigonometry": (trigonometry.solve, [
+        "sin(30 degrees)",
+        "cos(60 degrees)",
+        "tan(135°) + sec(60°)",
+        "sin(37 degrees)",
+    ]),
+    "calculus": (calculus.solve, [
+        "Derivative of x^2",
+        "Integral of 2x",
+        "Derivative of sin(x^2)",
+        "Limit of sin(x)/x as x -> 0",
+    ]),
+}
+
+
+def time_local(solve, problem: str, repeat: int) -> tuple[float, float]:
+    """Returns (first call ms, mean ms over repeats); later calls may hit memo caches."""
+    start = time.perf_counter()
+    result = solve(problem)
+    first = time.perf_counter() - start
+    assert result is not None, f"local engine did not handle {problem!r}"
+    start = time.perf_counter()
+    for _ in range(repeat):
+        solve(problem)
+    return first * 1000, (time.perf_counter() - start) / repeat * 1000
+
+
+def time_llm(domain: str, problem: str) -> float:
+    from google import genai
+
+    client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+    start = time.perf_counter()
+    client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=f"solve the {domain} problem '{problem}' and explain step by step",
+        config={"max_output_tokens": 10000, "temperature": 0.2, "top_p": 0.8},
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--llm", action="store_true", help="also time the model path (uses quota)")
+    args = parser.parse_args()
+
+    print(f"{'domain':<13} {'problem':<62} {'first ms':>9} {'mean ms':>9} {'llm ms':>9}")
+    for domain, (solve, problems) in PROBLEMS.items():
+        for problem in problems:
+            first, mean = time_local(solve, problem, args.repeat)
+            llm = f"{time_llm(domain, problem):9.1f}" if args.llm else f"{'-':>9}"
+            print(f"{domain:<13} {problem:<62} {first:9.3f} {mean:9.3f} {llm}")
+
+
+if __name__ == "__main__":
+    main()
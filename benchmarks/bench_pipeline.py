@@ -0,0 +1,256 @@
+"""End-to-end throughput and per-stage latency of the full pipeline on the fake model backend.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--concurrency 1,8,32] [--requests 32] [--time-scale 0.1]
+        [--error-rate 0.0] [--profiles profiles.json] [--output pipeline.json] [--baseline old.json]
+
+``root_agent`` runs through a ``Runner`` with every agent on
+``fake_llm.FakeLlm``, so no quota is spent. Artifacts are generated eagerly,
+so one request covers classification, solving, verification, the story and
+the Blender script. At each concurrency level, ``--requests`` word problems
+are run with at most that many in flight.
+
+For each level the benchmark reports:
+
+- throughput;
+- end-to-end p50/p95/p99 latency;
+- wall time per agent, from agent callbacks;
+- model time per stage, as reported by the fake backend;
+- resident memory;
+- event-loop utilization and lag.
+
+Utilization is the CPU time of the loop thread divided by wall time. Lag is
+how late a 10 ms probe timer fires. ``--time-scale`` multiplies every model
+latency, so the default run finishes in about a minute. Compare runs at the
+same scale only.
+
+``--profiles`` is a JSON object of stage -> ``StageProfile`` fields that
+override the defaults in ``fake_llm.PROFILES``. The results, with the commit
+and settings, are written to ``--output``. ``--baseline`` prints the change
+against an earlier output file.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.agents import BaseAgent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from math_agents import agent
+from math_agents.metrics import get_stats
+
+
+PROBE_INTERVAL = 0.01
+
+
+def _walk(root: BaseAgent) -> list[BaseAgent]:
+    """Every agent under ``root``, through sub_agents and agent-valued fields."""
+    seen, stack = {}, [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen[id(node)] = node
+        children = list(node.sub_agents)
+        for name in type(node).model_fields:
+            value = getattr(node, name, None)
+            children += [v for v in (value if isinstance(value, list) else [value]) if isinstance(v, BaseAgent)]
+        stack.extend(children)
+    return list(seen.values())
+
+
+def time_agents(root: BaseAgent) -> None:
+    """Records the wall time of every agent run under ``get_stats("bench_pipeline")`` as ``agent:<name>``."""
+    started = {}
+    stats = get_stats("bench_pipeline")
+
+    def before(callback_context):
+        started[(callback_context.invocation_id, callback_context.agent_name)] = time.perf_counter()
+
+    def after(callback_context):
+        start = started.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if start is not None:
+            stats.observe(f"agent:{callback_context.agent_name}", time.perf_counter() - start)
+
+    for node in _walk(root):
+        node.before_agent_callback = before
+        node.after_agent_callback = after
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _probe(lags: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+def _percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000  # noqa: E731
+    return {"count": len(samples), "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": samples[-1] * 1000}
+
+
+async def run_level(concurrency: int, requests: int, offset: int) -> dict:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+
+    async def one(i: int):
+        topic = f"A shop sells {i + 2} pens for {2 * i + 4} dollars. How much is one pen?"
+        state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                     session_id=f"s{i}", state=state)
+                content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+                async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+                    pass
+                session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID,
+                                                            session_id=f"s{i}")
+                if not (session.state.get("solution") and session.state.get("blender_code")):
+                    failures.append(f"s{i}: incomplete")
+            except Exception as e:
+                failures.append(f"s{i}: {type(e).__name__}: {e}")
+            latencies.append(time.perf_counter() - start)
+
+    lags = []
+    probe = asyncio.create_task(_probe(lags))
+    rss_before, cpu_before = _rss_mb(), time.thread_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(offset + i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    cpu = time.thread_time() - cpu_before
+    probe.cancel()
+
+    pipeline, fake = get_stats("bench_pipeline").snapshot(), get_stats("fake_llm").snapshot()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "failed": len(failures),
+        "failures": failures[:5],
+        "wall_s": wall,
+        "throughput_rps": requests / wall,
+        "end_to_end": _percentiles(latencies),
+        "agents": {label.removeprefix("agent:"): figures for label, figures in pipeline["latency"].items()},
+        "model": {stage: dict(fake["latency"].get(stage, {"count": 0}),
+                              calls=fake["counters"].get(f"calls:{stage}", 0),
+                              tokens=fake["counters"].get(f"tokens:{stage}", 0),
+                              errors=fake["counters"].get(f"errors:{stage}", 0))
+                  for stage in sorted({key.split(":", 1)[1] for key in fake["counters"]})},
+        "memory": {"rss_before_mb": rss_before, "rss_after_mb": _rss_mb(),
+                   "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024},
+        "event_loop": {"utilization": cpu / wall, "lag": _percentiles(lags)},
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"against {baseline_path} (commit {baseline.get('commit', '?')}):")
+    for level in results:
+        old = before.get(level["concurrency"])
+        if old is None:
+            continue
+        change = lambda new, prior: f"{(new / prior - 1) * 100:+.0f}%" if prior else "n/a"  # noqa: E731
+        print(f"  concurrency {level['concurrency']:>3}: throughput "
+              f"{change(level['throughput_rps'], old['throughput_rps'])}, p95 "
+              f"{change(level['end_to_end']['p95_ms'], old['end_to_end']['p95_ms'])}, loop utilization "
+              f"{change(level['event_loop']['utilization'], old['event_loop']['utilization'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier on every model latency")
+    parser.add_argument("--error-rate", type=float, default=None, help="503 rate for every stage")
+    parser.add_argument("--profiles", help="JSON file of stage -> StageProfile overrides")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="pipeline.json", help="machine-readable results")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("math_agents").setLevel(logging.WARNING)
+    profiles = dict(fake_llm.PROFILES)
+    if args.profiles:
+        with open(args.profiles) as f:
+            for stage, fields in json.load(f).items():
+                profiles[stage] = profiles.get(stage, fake_llm.StageProfile()).model_copy(update=fields)
+    profiles = fake_llm.scaled(profiles, args.time_scale, args.error_rate)
+    fake_llm.install(agent.build_agents(), profiles, seed=args.seed)
+    time_agents(agent.root_agent)
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = []
+    print(f"{args.requests} requests per level, model latency x{args.time_scale:g}")
+    print(f"{'conc':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>6} {'rss MB':>7} "
+          f"{'loop util':>9} {'lag p99 ms':>10}")
+    for index, concurrency in enumerate(levels):
+        get_stats("bench_pipeline").reset()
+        get_stats("fake_llm").reset()
+        level = asyncio.run(run_level(concurrency, args.requests, index * args.requests))
+        results.append(level)
+        e2e, loop = level["end_to_end"], level["event_loop"]
+        print(f"{concurrency:>4} {level['throughput_rps']:>7.2f} {e2e['p50_ms']:>8.0f} {e2e['p95_ms']:>8.0f} "
+              f"{e2e['p99_ms']:>8.0f} {level['failed']:>6} {level['memory']['rss_after_mb']:>7.0f} "
+              f"{loop['utilization']:>9.0%} {loop['lag'].get('p99_ms', 0):>10.1f}")
+
+    slowest = sorted(results[-1]["agents"].items(), key=lambda item: -item[1]["p95_ms"])[:6]
+    print(f"slowest agents at concurrency {levels[-1]} (p95 ms): "
+          + ", ".join(f"{name} {figures['p95_ms']:.0f}" for name, figures in slowest))
+
+    report = {
+        "commit": _commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "profiles": {stage: profile.model_dump() for stage, profile in profiles.items()},
+        "levels": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Render makespan and priority latency of the render scheduler, with and without chunking.
+
+Usage:
+    python -m benchmarks.bench_render [--jobs 8] [--workers 4] [--chunk-frames 48]
+
+Runs on ``FakeRenderExecutor``, so Blender is not needed. Each chunk costs
+``--startup`` seconds (Blender start and scene build) plus ``--frame-seconds``
+per frame divided by the job's threads. One job is first rendered alone on
+the idle pool. Then ``--jobs`` scripts of 240 frames are submitted at once.
+After ``--urgent-after`` seconds one more job is submitted at a higher
+priority, like a client waiting on its render. Three
+configurations are compared: one worker with whole jobs, ``--workers``
+workers with whole jobs, and ``--workers`` workers with chunked jobs.
+Chunks pay the startup cost once each, so chunking trades some throughput
+under a full queue for the latency of lone and urgent jobs.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_blender_sections import SCHEMA, SECTION_REPLIES
+from math_agents import blender_sections, render
+from math_agents.metrics import get_stats
+
+
+async def run(args, workers: int, chunk_frames: int, root: str) -> dict:
+    executor = render.FakeRenderExecutor(startup_seconds=args.startup, frame_seconds=args.frame_seconds)
+    scheduler = render.RenderScheduler(executor, workers=workers, chunk_frames=chunk_frames, root=root)
+    script, _ = blender_sections.assemble(SECTION_REPLIES, SCHEMA)
+    start = time.perf_counter()
+    alone = scheduler.submit(script, "alone")
+    await scheduler.wait(alone.job_id)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    jobs = [scheduler.submit(script, f"s{i}") for i in range(args.jobs)]
+    broken = scheduler.submit("def main(:\n", "broken")
+    await asyncio.sleep(args.urgent_after)
+    urgent_start = time.perf_counter()
+    urgent = scheduler.submit(script, "urgent", priority=10)
+    await scheduler.wait(urgent.job_id)
+    urgent_latency = time.perf_counter() - urgent_start
+    latencies = []
+    for job in jobs:
+        await scheduler.wait(job.job_id)
+        latencies.append(job.finished - job.submitted)
+    makespan = time.perf_counter() - start
+    await scheduler.stop()
+    assert all(job.status == "done" and len(job.frames) == 240 for job in jobs + [urgent])
+    assert broken.status == "failed"
+    return {"single": single, "makespan": makespan, "mean": statistics.mean(latencies), "urgent": urgent_latency}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-frames", type=int, default=48)
+    parser.add_argument("--startup", type=float, default=0.2, help="simulated seconds per chunk to start Blender")
+    parser.add_argument("--frame-seconds", type=float, default=0.02, help="simulated seconds per frame and thread")
+    parser.add_argument("--urgent-after", type=float, default=0.5, help="seconds before the urgent job arrives")
+    args = parser.parse_args()
+
+    configurations = [("1 worker, whole jobs", 1, render.FRAME_END),
+                      (f"{args.workers} workers, whole jobs", args.workers, render.FRAME_END),
+                      (f"{args.workers} workers, {args.chunk_frames}-frame chunks", args.workers, args.chunk_frames)]
+    print(f"{args.jobs} jobs of {render.FRAME_END} frames, then 1 urgent job; one broken script fails on its own")
+    print(f"{'configuration':<32} {'job alone s':>12} {'makespan s':>11} {'mean job s':>11} {'urgent job s':>13}")
+    with tempfile.TemporaryDirectory() as root:
+        for label, workers, chunk_frames in configurations:
+            get_stats("render").reset()
+            result = asyncio.run(run(args, workers, chunk_frames, root))
+            print(f"{label:<32} {result['single']:>12.2f} {result['makespan']:>11.2f} {result['mean']:>11.2f} "
+                  f"{result['urgent']:>13.2f}")
+    report = render.report()
+    print(f"last run: {report['chunks']} chunks, {report['frames']} frames, {report['failed']} failed job, "
+          f"queue wait p95 {report['queue_wait'].get('p95_ms', 0):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Lookup latency and hit rate of the shared result cache with 1, 4 and 16 worker processes.
+
+Usage:
+    python -m benchmarks.bench_shared_cache [--workers 1,4,16] [--requests 20000] [--problems 4000]
+                                            [--zipf 1.0] [--budget-mb 16]
+
+A fixed stream of ``--requests`` solve requests, over ``--problems`` distinct
+problems with Zipf-distributed popularity, is spread round-robin over the
+worker processes, as a load balancer would. Each request looks up the
+classifier reply and the solver reply of its problem, keyed as
+``shared_cache.cached_callback`` keys them, and stores a stand-in reply on a
+miss: the domain, and a solution of about 1.4 KB like ``fake_llm``'s. Every
+worker count starts from an empty cache file of ``--budget-mb`` MB (under
+``/dev/shm`` when it exists), smaller than the whole working set, so entries
+are evicted.
+
+It reports the hit rate, lookup latency percentiles and evictions of the
+shared cache against a private per-process cache holding as many entries as
+the shared one (so using that much memory in every worker). It exits
+non-zero if any value read back is not the one stored under its key.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+
+from benchmarks.fake_llm import CHARS_PER_TOKEN, PROFILES
+from benchmarks.bench_story_pipeline import PROSE
+from math_agents import shared_cache
+from math_agents.metrics import get_stats
+
+
+STAGES = {"classify": "DomainClassifyAgent", "solve": "AlgebraAgent"}
+
+
+def _value(stage: str, problem: int) -> bytes:
+    """The stand-in reply of ``stage`` for ``problem``, which names the problem so a mix-up is caught."""
+    if stage == "classify":
+        return f"algebra #{problem}".encode()
+    tokens = PROFILES["solve"].output_tokens
+    head = f"Step 1: Restate problem #{problem}.\nStep 2: Work it through.\nAnswer: {problem % 97}\n"
+    return (head + (PROSE * 8)[:tokens * CHARS_PER_TOKEN - len(head)]).encode()
+
+
+def _stream(requests: int, problems: int, zipf: float, seed: int = 0) -> list[int]:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** zipf for rank in range(problems)]
+    return rng.choices(range(problems), weights, k=requests)
+
+
+class _Lru:
+    """A private per-process cache of ``capacity`` entries."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+def _worker(path: str, budget: int, problems: list[int], barrier, results) -> None:
+    cache = shared_cache.SharedCache(path, budget)
+    private = _Lru(cache.buckets * cache.ways)
+    shared_ns, private_ns = array("q"), array("q")
+    hits = private_hits = corrupt = 0
+    barrier.wait()
+    start = time.perf_counter()
+    for problem in problems:
+        for stage, agent_name in STAGES.items():
+            key = f"fake-{stage}:{agent_name}:{problem}"
+            expected = _value(stage, problem)
+            t0 = time.perf_counter_ns()
+            value = cache.get(key)
+            shared_ns.append(time.perf_counter_ns() - t0)
+            if value is None:
+                cache.put(key, expected)
+            else:
+                hits += 1
+                corrupt += value != expected
+            t0 = time.perf_counter_ns()
+            value = private.get(key)
+            private_ns.append(time.perf_counter_ns() - t0)
+            if value is None:
+                private.put(key, expected)
+            else:
+                private_hits += 1
+    elapsed = time.perf_counter() - start
+    counters = get_stats("shared_cache").counters
+    results.put({"lookups": len(shared_ns), "hits": hits, "private_hits": private_hits, "corrupt": corrupt,
+                 "evictions": counters["evictions"], "torn_reads": counters["torn_reads"],
+                 "busy": counters["busy"], "elapsed": elapsed, "slots": cache.buckets * cache.ways,
+                 "shared_ns": shared_ns.tobytes(), "private_ns": private_ns.tobytes()})
+    cache.close()
+
+
+def _pct(values: list[int], p: float) -> float:
+    return values[min(len(values) - 1, int(p * len(values)))] / 1000
+
+
+def run(workers: int, stream: list[int], budget: int, directory: str) -> dict:
+    """Runs ``stream`` over ``workers`` processes sharing a new cache file; returns the merged figures."""
+    path = os.path.join(directory, f"bench_shared_cache_{os.getpid()}_{workers}.cache")
+    context = multiprocessing.get_context("fork")
+    barrier, results = context.Barrier(workers), context.Queue()
+    processes = [context.Process(target=_worker, args=(path, budget, stream[i::workers], barrier, results))
+                 for i in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        parts = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+    merged = {key: sum(part[key] for part in parts)
+              for key in ("lookups", "hits", "private_hits", "corrupt", "evictions", "torn_reads", "busy")}
+    shared_ns, private_ns = array("q"), array("q")
+    for part in parts:
+        shared_ns.frombytes(part["shared_ns"])
+        private_ns.frombytes(part["private_ns"])
+    merged.update(slots=parts[0]["slots"], shared_ns=sorted(shared_ns), private_ns=sorted(private_ns),
+                  elapsed=max(part["elapsed"] for part in parts))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,4,16", help="comma-separated worker process counts")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--problems", type=int, default=4000)
+    parser.add_argument("--zipf", type=float, default=1.0, help="exponent of the problem popularity")
+    parser.add_argument("--budget-mb", type=float, default=16)
+    args = parser.parse_args()
+
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    stream = _stream(args.requests, args.problems, args.zipf)
+    budget = int(args.budget_mb * (1 << 20))
+    print(f"{args.requests} requests over {args.problems} problems (zipf {args.zipf}), "
+          f"{args.budget_mb:g} MB cache in {directory}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'hit rate':>8} {'private':>8} {'p50 us':>7} {'p99 us':>7} {'mean us':>7} "
+          f"{'private p50':>11} {'evictions':>9} {'torn':>5} {'lookups/s':>10}")
+
+    failures = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        r = run(workers, stream, budget, directory)
+        lookups = r["lookups"]
+        print(f"{workers:>7} {r['hits'] / lookups:>8.1%} {r['private_hits'] / lookups:>8.1%} "
+              f"{_pct(r['shared_ns'], 0.5):>7.2f} {_pct(r['shared_ns'], 0.99):>7.2f} "
+              f"{statistics.mean(r['shared_ns']) / 1000:>7.2f} {_pct(r['private_ns'], 0.5):>11.2f} "
+              f"{r['evictions']:>9} {r['torn_reads']:>5} {lookups / r['elapsed']:>10.0f}")
+        if r["corrupt"]:
+            failures.append(f"{workers} workers: {r['corrupt']} values read back differ from the ones stored")
+        if r["busy"]:
+            print(f"  {workers} workers: {r['busy']} lookups gave up on a slot being written")
+    print(f"slots: {r['slots']} of {shared_cache.SLOT_BYTES} bytes; "
+          f"working set: {args.problems * len(STAGES)} entries")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
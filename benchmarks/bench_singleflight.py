@@ -0,0 +1,94 @@
+"""Upstream model calls and wall time when a class submits the same problem at once.
+
+Usage:
+    python -m benchmarks.bench_singleflight [--students 40] [--latency 0.3] [--cancel 5]
+
+``--students`` sessions run the ``SupervisorAgent`` solve pipeline on the same
+problem, written with small variations in spacing and case, all at the same
+moment. The model is a stub that waits ``--latency`` seconds and counts its
+calls. ``--cancel`` sessions are cancelled part way through to check that the
+other waiters still get their results. Runs with coalescing off and on.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from math_agents import agent, batching, singleflight
+
+
+VARIANTS = ["A shop sells 3 pens for 6 dollars. How much is one pen?",
+            "a shop sells 3 pens for 6 dollars.  How much is one pen?",
+            "A shop sells 3 pens for 6 dollars. How much is one pen"]
+
+
+class CountingLlm(BaseLlm):
+    latency: float = 0.3
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        instruction = str(llm_request.config.system_instruction or "")
+        text = "algebra" if "domain classifier" in instruction else "Step 1: 6 / 3 = 2\nAnswer: 2 dollars"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+async def run(students: int, cancel: int) -> tuple[float, int]:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+
+    async def student(i: int) -> str:
+        state = dict(agent.INITIAL_STATE, topic=VARIANTS[i % len(VARIANTS)])
+        await session_service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}", state=state)
+        content = types.Content(role="user", parts=[types.Part(text="solve")])
+        async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+            pass
+        session = await session_service.get_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}")
+        return session.state["solution"]
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(student(i)) for i in range(students)]
+    await asyncio.sleep(0.05)
+    for task in tasks[:cancel]:
+        task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    completed = sum(1 for r in results if isinstance(r, str) and r)
+    return time.perf_counter() - start, completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--cancel", type=int, default=5)
+    args = parser.parse_args()
+
+    batching.BATCHING_ENABLED = False  # measure coalescing on its own
+    model = CountingLlm(model="stub", latency=args.latency)
+    for sub_agent in [agent.domain_classify_agent, agent.algebra_agent, agent.reviser_agent]:
+        sub_agent.model = model
+
+    for enabled in (False, True):
+        singleflight.SINGLEFLIGHT_ENABLED = enabled
+        model.calls = 0
+        elapsed, completed = asyncio.run(run(args.students, args.cancel))
+        print(f"coalescing {'on ' if enabled else 'off'}: {model.calls:4d} model calls, {elapsed:.2f}s, "
+              f"{completed}/{args.students - args.cancel} uncancelled sessions completed")
+    report = singleflight.report()
+    print(f"coalescing rate {report['coalescing_rate']:.2f}, upstream calls saved {report['upstream_calls_saved']}, "
+          f"shared calls cancelled {report['cancelled']}")
+    for stage, counts in report["stages"].items():
+        print(f"  {stage:<20} upstream {counts['upstream_calls']:3d}  saved {counts['saved']:4d}")
+
+if __name__ == "__main__":
+    main()
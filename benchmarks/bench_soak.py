@@ -0,0 +1,261 @@
+"""Soak test: memory growth and retention limits over thousands of sessions.
+
+Usage:
+    python -m benchmarks.bench_soak [--sessions 2000] [--concurrency 32] [--snapshots 10]
+        [--max-sessions 200] [--ttl 0] [--max-events 200] [--unbounded] [--output soak.json]
+
+``--sessions`` word problems run through ``root_agent`` on the
+``fake_llm`` backend, with artifacts generated eagerly so every session
+stores a story and a Blender script. The sessions run in ``--snapshots``
+waves. After each wave the process is idle; the benchmark collects garbage
+and records:
+
+- memory traced by ``tracemalloc``, and resident memory;
+- sessions and events held by the session service;
+- the size of every in-process cache: the calculus LRU caches, in-flight
+  singleflight calls, batchers and latency windows.
+
+Latency windows are bounded, but at the default size they would keep
+filling for tens of thousands of sessions and read as growth. The benchmark
+sets ``MATH_AGENTS_METRICS_WINDOW`` to 100, unless it is already set, so they
+fill during the warm-up.
+
+The first wave is a warm-up. Over the remaining waves the benchmark fits the
+growth of each figure per session and checks that:
+
+- the session service never holds more than ``--max-sessions`` sessions, or
+  more than ``--max-events`` events in one session;
+- no cache exceeds its size limit, and no call is left in flight;
+- traced memory grows by less than ``--max-growth-kb`` per session.
+
+The top allocation sites by growth, from the first snapshot after the
+warm-up to the last, show where memory goes. ``--unbounded`` uses ADK's
+``InMemorySessionService`` instead of ``BoundedSessionService``, to show the
+growth the limits prevent. The benchmark exits non-zero when a check fails.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+# Latency windows are bounded but fill slowly; a small one fills during the warm-up wave.
+os.environ.setdefault("MATH_AGENTS_METRICS_WINDOW", "100")
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from benchmarks import fake_llm
+from benchmarks.bench_pipeline import _rss_mb
+from math_agents import agent, batching, calculus, metrics, singleflight
+from math_agents.sessions import BoundedSessionService
+
+
+def _lru_caches() -> dict:
+    """The ``functools.lru_cache`` functions of ``calculus``."""
+    return {name: value for name, value in vars(calculus).items() if hasattr(value, "cache_info")}
+
+
+def probe(service: InMemorySessionService) -> dict:
+    """Sizes of the session service and of every in-process cache."""
+    stored = [s for users in service.sessions.values() for sessions in users.values() for s in sessions.values()]
+    caches = {f"calculus.{name}": fn.cache_info().currsize for name, fn in _lru_caches().items()}
+    caches["singleflight.in_flight"] = sum(group.in_flight() for group in list(singleflight._groups.values()))
+    caches["batching.batchers"] = sum(len(batchers) for batchers in list(batching._batchers.values()))
+    with metrics._registry_lock:
+        registry = list(metrics._registry.values())
+    caches["metrics.latency_samples"] = sum(len(window) for stats in registry for window in stats._latencies.values())
+    caches["metrics.labels"] = sum(len(stats._latencies) + len(stats.counters) for stats in registry)
+    return {
+        "sessions": len(stored),
+        "events": sum(len(s.events) for s in stored),
+        "max_events_per_session": max((len(s.events) for s in stored), default=0),
+        "state_bytes": sum(len(json.dumps(s.state, default=str)) for s in stored),
+        "caches": caches,
+    }
+
+
+def limits() -> dict:
+    """The size limit of every cache reported by ``probe``."""
+    result = {f"calculus.{name}": fn.cache_info().maxsize for name, fn in _lru_caches().items()}
+    result["singleflight.in_flight"] = 0  # between waves nothing is in flight
+    with metrics._registry_lock:
+        result["metrics.latency_samples"] = sum(len(stats._latencies) * stats._window
+                                                for stats in metrics._registry.values())
+    return result
+
+
+def _slope(xs: list[float], ys: list[float]) -> float:
+    """Least-squares slope of ``ys`` over ``xs``."""
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mx, my = sum(xs) / n, sum(ys) / n
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+async def run_wave(runner: Runner, service: InMemorySessionService, start: int, count: int,
+                   concurrency: int) -> list[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = []
+
+    async def one(i: int):
+        topic = f"A shop sells {i % 97 + 2} pens for {2 * i + 4} dollars. How much is one pen?"
+        state = dict(agent.INITIAL_STATE, topic=topic, lazy_artifacts=False)
+        async with semaphore:
+            try:
+                await service.create_session(app_name=agent.APP_NAME, user_id=agent.USER_ID, session_id=f"s{i}",
+                                             state=state)
+                content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+                async for _ in runner.run_async(user_id=agent.USER_ID, session_id=f"s{i}", new_message=content):
+                    pass
+            except Exception as e:
+                failures.append(f"s{i}: {type(e).__name__}: {e}")
+
+    await asyncio.gather(*(one(start + i) for i in range(count)))
+    return failures
+
+
+def snapshot(service: InMemorySessionService, done: int) -> tuple[dict, tracemalloc.Snapshot]:
+    """Sizes and traced memory after ``done`` sessions, with the snapshot they were taken from.
+
+    Traced memory is summed from the snapshot, without the memory of the
+    snapshots kept by the benchmark itself.
+    """
+    gc.collect()
+    snap = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    traced = sum(stat.size for stat in snap.statistics("filename"))
+    point = dict(probe(service), sessions_run=done, traced_mb=traced / 2**20, rss_mb=_rss_mb(),
+                 gc_objects=len(gc.get_objects()))
+    return point, snap
+
+
+def top_growth(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, group_by: str, top: int) -> list[dict]:
+    sites = []
+    for stat in after.compare_to(before, group_by)[:top]:
+        frame = stat.traceback[0]
+        sites.append({"site": f"{frame.filename}:{frame.lineno}", "size_diff_kb": stat.size_diff / 1024,
+                      "count_diff": stat.count_diff, "size_kb": stat.size / 1024,
+                      "traceback": stat.traceback.format()[-6:]})
+    return sites
+
+
+def growth(points: list[dict]) -> dict:
+    """Growth per session of traced memory, stored events and each cache, fitted over ``points``."""
+    xs = [p["sessions_run"] for p in points]
+    return {"traced_kb_per_session": _slope(xs, [p["traced_mb"] * 1024 for p in points]),
+            "events_per_session": _slope(xs, [p["events"] for p in points]),
+            "caches_per_session": {name: _slope(xs, [p["caches"][name] for p in points])
+                                   for name in points[-1]["caches"]}}
+
+
+def check(points: list[dict], fitted: dict, args, cache_limits: dict) -> list[str]:
+    """The checks that failed: retention limits and cache limits at every snapshot, and the fitted growth."""
+    failures = []
+    if not args.unbounded:
+        worst = max(p["sessions"] for p in points)
+        if args.max_sessions and worst > args.max_sessions:
+            failures.append(f"session service held {worst} sessions, over the limit of {args.max_sessions}")
+        worst = max(p["max_events_per_session"] for p in points)
+        if args.max_events and worst > args.max_events:
+            failures.append(f"a session held {worst} events, over the limit of {args.max_events}")
+    for name, limit in cache_limits.items():
+        worst = max(p["caches"].get(name, 0) for p in points)
+        if limit is not None and worst > limit:
+            failures.append(f"{name} reached {worst}, over its limit of {limit}")
+    if fitted["traced_kb_per_session"] > args.max_growth_kb:
+        failures.append(f"traced memory grows {fitted['traced_kb_per_session']:.2f} KB per session, "
+                        f"over {args.max_growth_kb} KB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--snapshots", type=int, default=10, help="waves, with a memory snapshot after each")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="multiplier on the fake model latencies")
+    parser.add_argument("--max-sessions", type=int, default=200)
+    parser.add_argument("--ttl", type=float, default=0, help="session idle time limit in seconds, 0 for none")
+    parser.add_argument("--max-events", type=int, default=200)
+    parser.add_argument("--unbounded", action="store_true", help="use InMemorySessionService without limits")
+    parser.add_argument("--max-growth-kb", type=float, default=2.0, help="allowed traced growth per session")
+    parser.add_argument("--frames", type=int, default=1, help="traceback depth recorded by tracemalloc")
+    parser.add_argument("--top", type=int, default=10, help="allocation sites to report")
+    parser.add_argument("--output", default="soak.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("math_agents").setLevel(logging.ERROR)
+    fake_llm.install(agent.build_agents(), fake_llm.scaled(fake_llm.PROFILES, args.time_scale))
+    service = (InMemorySessionService() if args.unbounded
+               else BoundedSessionService(args.max_sessions, args.ttl, args.max_events))
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=service)
+    wave = max(1, args.sessions // args.snapshots)
+
+    tracemalloc.start(args.frames)
+    points, failed = [], []
+    first = last = None
+    start = time.perf_counter()
+    print(f"{args.sessions} sessions in waves of {wave} at concurrency {args.concurrency}, "
+          f"{'unbounded' if args.unbounded else f'max {args.max_sessions} sessions, {args.max_events} events'}")
+    print(f"{'sessions':>8} {'held':>6} {'events':>7} {'state MB':>8} {'traced MB':>9} {'rss MB':>7} "
+          f"{'objects':>9} {'s':>6}")
+    loop = asyncio.new_event_loop()
+    try:
+        for done in range(0, args.sessions, wave):
+            count = min(wave, args.sessions - done)
+            failed += loop.run_until_complete(run_wave(runner, service, done, count, args.concurrency))
+            point, snap = snapshot(service, done + count)
+            points.append(point)
+            # Only the first snapshot after the warm-up and the latest are kept.
+            first, last = (snap if len(points) == 2 else first), snap
+            print(f"{point['sessions_run']:>8} {point['sessions']:>6} {point['events']:>7} "
+                  f"{point['state_bytes'] / 2**20:>8.1f} {point['traced_mb']:>9.1f} {point['rss_mb']:>7.0f} "
+                  f"{point['gc_objects']:>9} {time.perf_counter() - start:>6.0f}")
+    finally:
+        loop.close()
+
+    measured = points[1:] if len(points) > 2 else points
+    cache_limits, fitted = limits(), growth(measured)
+    failures = check(points, fitted, args, cache_limits)
+    if failed:
+        failures.append(f"{len(failed)} sessions failed, e.g. {failed[0]}")
+    sites = top_growth(first or last, last, "lineno", args.top)
+
+    print(f"traced growth after the warm-up: {fitted['traced_kb_per_session']:.2f} KB per session, "
+          f"{fitted['events_per_session']:.2f} stored events per session")
+    print(f"top {args.top} growth sites since the first snapshot after the warm-up:")
+    for site in sites:
+        print(f"  {site['size_diff_kb']:>+9.1f} KiB {site['count_diff']:>+8} blocks  {site['site']}")
+    print("caches at the end: " + ", ".join(f"{name} {size}" for name, size in points[-1]["caches"].items()))
+    if not args.unbounded:
+        print(f"retention: {service.report()}")
+
+    report = {
+        "settings": vars(args),
+        "snapshots": points,
+        "growth": fitted,
+        "cache_limits": cache_limits,
+        "top_growth_sites": sites,
+        "failures": failures,
+        "failed_sessions": failed[:10],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
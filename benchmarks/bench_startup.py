@@ -0,0 +1,88 @@
+"""Import time and time to first request of the API, with lazy and eager agent construction.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 3] [--max-import-ms 0]
+
+Every measurement runs in a fresh interpreter. ``-X importtime`` gives the
+cumulative import time of ``math_agents.api`` and of its heaviest
+dependencies. Then the app is served with ``TestClient``. The first request
+goes to an endpoint that runs no agent. The lazy mode uses the default
+background warm-up. The eager mode builds the ADK runtime before serving,
+as importing the API did before. Both report when the runtime is ready for
+the first solve.
+
+With ``--max-import-ms`` the benchmark exits non-zero when importing the API
+takes longer than that. CI can use this to catch an import that pulls ADK
+back in.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from math_agents import api
+if {eager}:
+    api.build_runtime()
+imported = time.perf_counter()
+with TestClient(api.app) as client:
+    assert client.get("/render/none").status_code == 404
+    first = time.perf_counter()
+    while api._runtime is None:
+        time.sleep(0.005)
+    ready = time.perf_counter()
+print(json.dumps({{"import": imported - start, "first": first - start, "ready": ready - start}}))
+"""
+
+
+def _python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "benchmark"))
+    return subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, env=env, check=True)
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative import time in seconds of every module imported by ``import module``."""
+    times = {}
+    for line in _python(f"import {module}", "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.setdefault(name.strip(), int(cumulative) / 1e6)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-import-ms", type=float, default=0, help="fail when importing the API takes longer")
+    args = parser.parse_args()
+
+    times = import_times("math_agents.api")
+    api_import = times["math_agents.api"]
+    print(f"import math_agents.api: {api_import * 1000:.0f} ms cumulative; google.adk imported: "
+          f"{'google.adk' in times}")
+    heaviest = sorted(((t, name) for name, t in times.items() if "." not in name and name != "math_agents"),
+                      reverse=True)[:5]
+    print("  heaviest top-level packages: " + ", ".join(f"{name} {t * 1000:.0f} ms" for t, name in heaviest))
+    agent_import = import_times("math_agents.agent")["math_agents.agent"]
+    print(f"import math_agents.agent: {agent_import * 1000:.0f} ms cumulative (ADK and its dependencies)")
+
+    print(f"{'mode':<8} {'import s':>9} {'first request s':>16} {'solve ready s':>14}")
+    for mode, eager in [("lazy", False), ("eager", True)]:
+        results = [json.loads(_python(PROBE.format(eager=eager)).stdout.splitlines()[-1]) for _ in range(args.runs)]
+        median = {key: statistics.median(r[key] for r in results) for key in results[0]}
+        print(f"{mode:<8} {median['import']:>9.2f} {median['first']:>16.2f} {median['ready']:>14.2f}")
+
+    if args.max_import_ms and api_import * 1000 > args.max_import_ms:
+        print(f"FAIL: importing math_agents.api took {api_import * 1000:.0f} ms, over {args.max_import_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
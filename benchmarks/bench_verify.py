@@ -0,0 +1,63 @@
+"""Time local answer verification and report the LLM critic calls it avoids.
+
+Usage:
+    python -m benchmarks.bench_verify [--repeat 200]
+
+Each sample is a (topic, solution) pair in the shape the solver agents
+produce; some answers are deliberately wrong so the failure path is timed too.
+The critic-call fraction assumes one re-solve per failed check, as in
+``SupervisorAgent``.
+"""
+
+import argparse
+import time
+
+from math_agents import verify
+from math_agents.metrics import get_stats
+
+
+SAMPLES = [
+    ("Solve (a+b)^2", "Expand using (a+b)(a+b).\n**Answer:** $a^2 + 2ab + b^2$"),
+    ("Solve 2x + 3 = 11", "Subtract 3, divide by 2.\nAnswer: x = 4"),
+    ("Solve x^2 - 5x + 6 = 0", "Factor: (x-2)(x-3) = 0\nAnswer: x = 2 or x = 3"),
+    ("Solve 2x + y = 5 and x - y = 1", "Add the equations.\nAnswer: x = 2, y = 1"),
+    ("Derivative of x^3 sin(x)", "Product rule.\nAnswer: 3x^2 sin(x) + x^3 cos(x)"),
+    ("Integral of x*e^x", "By parts.\nAnswer: $x e^x - e^x + C$"),
+    ("Integral of x^2 from 0 to 3", "Answer: \\boxed{9}"),
+    ("Limit of sin(x)/x as x -> 0", "The limit is 1"),
+    # Wrong answers, which trigger a re-solve.
+    ("Solve 3x - 4 = 8", "Answer: x = 5"),
+    ("Derivative of cos(x^2)", "Answer: -sin(x^2)"),
+    # Word problems have no local check and are kept as-is.
+    ("A train travels 120 km in 2 hours. What is its speed?", "Answer: 60 km/h"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'status':<13} {'method':<20} {'mean ms':>9}  topic")
+    for topic, solution in SAMPLES:
+        result = verify.verify(topic, solution)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            verify.verify(topic, solution)
+        mean = (time.perf_counter() - start) / args.repeat * 1000
+        print(f"{result.status:<13} {result.method or '-':<20} {mean:9.3f}  {topic}")
+
+    # Count one pass over the samples, with a re-solve for every failure.
+    stats = get_stats("verification")
+    stats.reset()
+    for topic, solution in SAMPLES:
+        if verify.verify(topic, solution).status == "failed":
+            stats.incr("resolved")
+            stats.incr("verified")
+    print()
+    for key, value in verify.report().items():
+        print(f"{key:<30} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare worksheet wall time with concurrent fan-out against one-by-one processing.
+
+Usage:
+    python -m benchmarks.bench_worksheet [--problems 12] [--latency 0.4] [--animate]
+
+The agents' model is replaced by a stub that waits ``--latency`` seconds per
+call and returns a canned reply, so only orchestration is measured and no
+quota is used. Problems are algebra word problems, which no local solver
+handles, so every problem makes the classifier and solver calls.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from math_agents import agent, worksheet
+
+
+class DelayLlm(BaseLlm):
+    """Replies after a fixed delay: "algebra" to the classifier, a short text otherwise."""
+
+    delay: float = 0.4
+
+    async def generate_content_async(self, llm_request, stream=False):
+        await asyncio.sleep(self.delay)
+        instruction = str(llm_request.config.system_instruction or "")
+        text = "algebra" if "domain classifier" in instruction else "Step 1: ...\nAnswer: done"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def worksheet_text(count: int) -> str:
+    return "\n".join(f"{i}. A shop sells {i} pens for {2 * i} dollars. How much is one pen?" for i in range(1, count + 1))
+
+
+async def run(topics: list[str], animate: bool, concurrent: bool) -> float:
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent.root_agent, app_name=agent.APP_NAME, session_service=session_service)
+    start = time.perf_counter()
+    result = await worksheet.solve_worksheet(runner, session_service, topics, animate=animate, concurrent=concurrent)
+    assert all("error" not in item for item in result["items"]), result["items"]
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--problems", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds per model call")
+    parser.add_argument("--animate", action="store_true")
+    args = parser.parse_args()
+
+    model = DelayLlm(model="delay", delay=args.latency)
+    for sub_agent in [agent.domain_classify_agent, agent.algebra_agent, agent.reviser_agent,
+                      agent.animation_agent, agent.blender_code_agent]:
+        sub_agent.model = model
+
+    topics = worksheet.split_text(worksheet_text(args.problems))
+    sequential = asyncio.run(run(topics, args.animate, concurrent=False))
+    concurrent = asyncio.run(run(topics, args.animate, concurrent=True))
+    print(f"{len(topics)} problems, {args.latency}s per model call, concurrency limit {worksheet.MAX_CONCURRENCY}")
+    print(f"one by one: {sequential:.2f}s")
+    print(f"concurrent: {concurrent:.2f}s ({sequential / concurrent:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Configurable fake model backend for running the agents offline.
+
+``FakeLlm`` stands in for Gemini on one agent. Each call waits a time to
+first token drawn from a log-normal distribution, then decodes its reply at
+a fixed token rate. Streaming calls yield the reply in partial chunks while
+it decodes. With probability ``error_rate`` a call fails with the same 503
+``ServerError`` that Gemini raises when overloaded, which the supervisor
+retries.
+
+Every stage has a ``StageProfile``. ``install`` gives every agent a fake
+model for its stage. The replies are shaped to pass through the pipeline:
+the classifier names a domain, the solvers give steps and an answer, the
+story is a JSON schema followed by the problem and prose, the Blender agents
+return the section functions of ``bench_blender_sections``, and the edit
+agents replace the previous problem wherever the artifact quotes it.
+``output_tokens`` pads the prose replies; the code replies keep their size.
+
+The final response of a call reports its usage: the prompt and reply
+lengths in tokens. Calls, reply and prompt tokens, errors and model latency
+are counted per stage under ``get_stats("fake_llm")``.
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+
+import google.genai.errors
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import BaseModel
+
+from benchmarks.bench_blender_sections import SECTION_REPLIES
+from benchmarks.bench_story_pipeline import PROSE, SCHEMA
+from math_agents import blender_sections
+from math_agents.metrics import get_stats
+
+
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 16
+
+
+class StageProfile(BaseModel):
+    """Latency, decode rate, reply size and failure rate of one stage's model calls."""
+
+    first_token_median: float = 0.5
+    first_token_sigma: float = 0.3
+    tokens_per_second: float = 150.0
+    output_tokens: int = 0
+    error_rate: float = 0.0
+
+
+# Rough Gemini 2.5 Flash figures; scale them with ``scaled``.
+PROFILES = {
+    "extract": StageProfile(first_token_median=1.2, tokens_per_second=150, output_tokens=40),
+    "classify": StageProfile(first_token_median=0.35, first_token_sigma=0.2, tokens_per_second=200),
+    "solve": StageProfile(first_token_median=0.8, tokens_per_second=150, output_tokens=350),
+    "revise": StageProfile(first_token_median=0.8, tokens_per_second=150, output_tokens=350),
+    "story": StageProfile(first_token_median=0.7, tokens_per_second=180, output_tokens=700),
+    "blender": StageProfile(first_token_median=0.9, tokens_per_second=120),
+    "blender_section": StageProfile(first_token_median=0.6, tokens_per_second=120),
+    "repair": StageProfile(first_token_median=0.6, tokens_per_second=120),
+    "edit": StageProfile(first_token_median=0.6, tokens_per_second=150),
+}
+
+# The stage of each agent returned by ``agent.build_agents``.
+AGENT_STAGES = {
+    "problem_extract_agent": "extract",
+    "domain_classify_agent": "classify",
+    "algebra_agent": "solve",
+    "geometry_agent": "solve",
+    "calculus_agent": "solve",
+    "trigonometry_agent": "solve",
+    "probability_agent": "solve",
+    "statistics_agent": "solve",
+    "general_agent": "solve",
+    "reviser_agent": "revise",
+    "animation_agent": "story",
+    "blender_code_agent": "blender",
+    "blender_section_agents": "blender_section",
+    "blender_repair_agent": "repair",
+    "story_edit_agent": "edit",
+    "code_edit_agent": "edit",
+}
+
+
+def scaled(profiles: dict[str, StageProfile], time_scale: float = 1.0,
+           error_rate: float | None = None) -> dict[str, StageProfile]:
+    """Profiles with latencies multiplied by ``time_scale`` and, if given, one error rate for every stage."""
+    result = {}
+    for stage, profile in profiles.items():
+        update = {"first_token_median": profile.first_token_median * time_scale,
+                  "tokens_per_second": profile.tokens_per_second / time_scale}
+        if error_rate is not None:
+            update["error_rate"] = error_rate
+        result[stage] = profile.model_copy(update=update)
+    return result
+
+
+def _pad(text: str, tokens: int) -> str:
+    missing = tokens * CHARS_PER_TOKEN - len(text)
+    return text if missing <= 0 else text + "\n" + (PROSE * (missing // len(PROSE) + 1))[:missing]
+
+
+def _prompt(llm_request) -> str:
+    parts = [str(llm_request.config.system_instruction or "")]
+    parts += [part.text or "" for content in llm_request.contents for part in content.parts or []]
+    return "\n".join(parts)
+
+
+def _solution(topic_hint: str, tokens: int) -> str:
+    return _pad(f"Step 1: Restate the problem: {topic_hint[:80]}\nStep 2: Work it through.\nAnswer: 2", tokens)
+
+
+def _edit_blocks(prompt: str) -> str:
+    """Search/replace blocks for every line of the artifact in an edit prompt that quotes the previous problem."""
+    previous = re.search(r"^Previous problem: (.*)$", prompt, re.MULTILINE)
+    edited = re.search(r"^Edited problem: (.*)$", prompt, re.MULTILINE)
+    artifact = prompt.rsplit(" to update:\n", 1)[-1]
+    blocks = []
+    if previous and edited and previous.group(1):
+        for line in dict.fromkeys(artifact.splitlines()):
+            if previous.group(1) in line and artifact.count(line) == 1:
+                new = line.replace(previous.group(1), edited.group(1))
+                blocks.append(f"<<<<<<< SEARCH\n{line}\n=======\n{new}\n>>>>>>> REPLACE")
+    return "\n".join(blocks) or "NO CHANGES"
+
+
+class FakeLlm(BaseLlm):
+    """Fake model for one stage, with the latency, size and failure rate of its profile."""
+
+    stage: str = "solve"
+    profile: StageProfile = StageProfile()
+    seed: int = 0
+    domains: str = "algebra"  # the classifier's reply
+    _rng: random.Random | None = None
+
+    def reply(self, prompt: str) -> str:
+        """The text this stage answers ``prompt`` with."""
+        items = re.findall(r"^\d+\. (.*)$", prompt, re.MULTILINE) if "numbered problem" in prompt else []
+        if self.stage == "classify":
+            return json.dumps([self.domains] * len(items)) if items else self.domains
+        if self.stage in ("solve", "revise"):
+            tokens = self.profile.output_tokens
+            if items:
+                return json.dumps([_solution(item, tokens // len(items)) for item in items])
+            return _solution(prompt[-200:], tokens)
+        if self.stage == "extract":
+            return "A shop sells 3 pens for 6 dollars. How much is one pen?"
+        if self.stage == "story":
+            problem = re.findall(r"Please solve and animate: (.*)", prompt)
+            board = f"\nOn the board: {max(problem, key=len)}" if problem else ""
+            return _pad(json.dumps(SCHEMA, indent=2) + board, self.profile.output_tokens)
+        if self.stage == "edit":
+            return _edit_blocks(prompt)
+        if self.stage == "repair":
+            match = re.search(r"Code to fix:\n```python\n(.*?)```", prompt, re.DOTALL)
+            return f"```python\n{match.group(1) if match else ''}```"
+        section = next((s for s in blender_sections.SECTIONS if f"Section: **{s}**" in prompt), None)
+        if section is not None:
+            return SECTION_REPLIES[section]
+        bodies = "\n\n".join(reply.strip("`\n").removeprefix("python\n") for reply in SECTION_REPLIES.values())
+        calls = "\n".join(f"    build_{s}(ctx)" for s in blender_sections.SECTIONS)
+        return f"```python\nimport bpy\n\n{bodies}\n\ndef main():\n    ctx = {{}}\n{calls}\n\nmain()\n```"
+
+    async def generate_content_async(self, llm_request, stream=False):
+        if self._rng is None:
+            self._rng = random.Random(f"{self.seed}:{self.stage}")
+        stats = get_stats("fake_llm")
+        profile = self.profile
+        start = asyncio.get_running_loop().time()
+        prompt = _prompt(llm_request)
+        text = self.reply(prompt)
+        tokens = max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+        prompt_tokens = max(1, math.ceil(len(prompt) / CHARS_PER_TOKEN))
+        stats.incr(f"calls:{self.stage}")
+        await asyncio.sleep(profile.first_token_median * math.exp(self._rng.gauss(0.0, profile.first_token_sigma)))
+        if self._rng.random() < profile.error_rate:
+            stats.incr(f"errors:{self.stage}")
+            raise google.genai.errors.ServerError(
+                503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+        chunk = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+        if stream:
+            for i in range(0, len(text), chunk):
+                await asyncio.sleep(min(chunk, len(text) - i) / CHARS_PER_TOKEN / profile.tokens_per_second)
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text[i:i + chunk])]),
+                                  partial=True)
+        else:
+            await asyncio.sleep(tokens / profile.tokens_per_second)
+        stats.incr(f"tokens:{self.stage}", tokens)
+        stats.incr(f"prompt_tokens:{self.stage}", prompt_tokens)
+        stats.observe(self.stage, asyncio.get_running_loop().time() - start)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]),
+                          usage_metadata=types.GenerateContentResponseUsageMetadata(
+                              prompt_token_count=prompt_tokens, candidates_token_count=tokens,
+                              total_token_count=prompt_tokens + tokens))
+
+
+def install(agents: dict, profiles: dict[str, StageProfile] = PROFILES, seed: int = 0) -> dict[str, FakeLlm]:
+    """Gives every agent in ``agents`` (as from ``agent.build_agents``) the fake model of its stage."""
+    models = {stage: FakeLlm(model=f"fake-{stage}", stage=stage, profile=profile, seed=seed)
+              for stage, profile in profiles.items()}
+    for name, stage in AGENT_STAGES.items():
+        targets = agents[name] if isinstance(agents[name], list) else [agents[name]]
+        for target in targets:
+            target.model = models[stage]
+    return models
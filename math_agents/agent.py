@@ -19,22 +19,53 @@ from typing_extensions import override
 
 from google.adk.agents import LlmAgent, BaseAgent, LoopAgent, SequentialAgent
 from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.genai import types
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
-from google.adk.events import Event
+from google.adk.events import Event, EventActions
 from pydantic import BaseModel, Field
+from math_agents.config import APP_NAME, INITIAL_STATE, MODEL, SESSION_ID, USER_ID
 from math_agents.prompts import animation_prompt, blender_code_prompt
+from math_agents import (calculus, cancellation, cassette, domains, geometry, incremental, ledger, linear_algebra,
+                         metering, shared_cache, trigonometry, verify)
+from math_agents.story import StoryPipelineAgent, schema_from_state
+from math_agents.incremental import ArtifactPatchAgent, make_edit_agent
+from math_agents.blender_preflight import BlenderPreflightAgent, make_repair_agent
+from math_agents.blender_sections import SECTIONS, SectionedBlenderAgent, make_section_agents
+from math_agents.blender_templates import templated_callback
+from math_agents.batching import batched_callback
+from math_agents.singleflight import coalesced_callback
+from math_agents.metrics import get_stats
 import asyncio
+import threading
+import time
 import google.genai.errors
 
 
 # --- Constants ---
-APP_NAME = "math_animation_app"
-USER_ID = "12345"
-SESSION_ID = "123344"
-MODEL = "gemini-2.5-flash"
+# APP_NAME, USER_ID, SESSION_ID, MODEL and INITIAL_STATE live in config.py.
+
+# Deterministic local solvers tried before the domain's LlmAgent. Each takes the
+# topic and returns a tool-style result dict, or None when it cannot handle it.
+LOCAL_SOLVERS = {
+    "algebra": linear_algebra.solve,  # a request to solve a linear system with one solution; None otherwise
+    "calculus": calculus.solve,
+    "geometry": geometry.solve,
+    "trigonometry": trigonometry.solve,
+}
 
+# The solver agent of each domain label, by its attribute on SupervisorAgent.
+# Labels the classifier invents go to the general solver; see domains.py.
+SOLVER_AGENTS = {
+    "algebra": "algebra_agent",
+    "geometry": "geometry_agent",
+    "calculus": "calculus_agent",
+    "trigonometry": "trigonometry_agent",
+    "probability": "probability_agent",
+    "statistics": "statistics_agent",
+    domains.GENERAL: "general_agent",
+}
 
 
 
@@ -43,15 +74,32 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _unavailable(error: BaseException) -> bool:
+    """Whether ``error`` is a 503 UNAVAILABLE, or an exception group of nothing but them.
+
+    Parallel agents (the Blender sections, concurrent solvers) raise their
+    sub-agents' errors in an ``ExceptionGroup``.
+    """
+    if isinstance(error, BaseExceptionGroup):
+        return all(_unavailable(e) for e in error.exceptions)
+    return isinstance(error, google.genai.errors.ServerError) and "UNAVAILABLE" in str(error)
+
+
 # --- Custom Orchestrator Agent ---
 class SupervisorAgent(BaseAgent):
     """
     Custom agent for orchestrating a workflow of math problem solving and animation.
 
     This agent orchestrates a sequence of LLM agents to solve a math problem.
-    It uses a LoopAgent to interatively refine the solution and a SequentialAgent
-    for post-processing steps like formatting and verification.
-    It then delegates the task to generate animation story and blender code based on the final solution.
+    A problem may span several domains; their solvers run concurrently and their
+    solutions are merged (see ``domains``).
+    Solutions from the LLM are checked locally by ``verify`` instead of a critic
+    loop; only a failed check triggers a single targeted re-solve by the reviser.
+    A StoryPipelineAgent handles post-processing steps.
+    It then delegates the task to generate animation story and blender code based on the final solution,
+    unless the session asks for them lazily (see ``artifacts``).
+    A small edit of an earlier problem keeps its domains and patches its story and
+    code instead of regenerating them (see ``incremental``).
 
     """
 
@@ -64,11 +112,16 @@ class SupervisorAgent(BaseAgent):
     probability_agent: LlmAgent
     trigonometry_agent: LlmAgent
     statistics_agent: LlmAgent
+    general_agent: LlmAgent
+    reviser_agent: LlmAgent
     animation_agent: LlmAgent
-    blender_code_agent: LlmAgent
+    blender_code_agent: BaseAgent
+    story_edit_agent: LlmAgent
+    code_edit_agent: LlmAgent
 
     # loop_agent: LoopAgent
-    sequential_agent: SequentialAgent
+    post_processing_agent: StoryPipelineAgent
+    artifact_patch_agent: ArtifactPatchAgent
 
     # model_config allows setting Pydantic configurations if needed, e.g., arbitrary_types_allowed
     model_config = {"arbitrary_types_allowed": True}
@@ -83,8 +136,12 @@ class SupervisorAgent(BaseAgent):
         probability_agent: LlmAgent,
         trigonometry_agent: LlmAgent,
         statistics_agent: LlmAgent,
+        general_agent: LlmAgent,
+        reviser_agent: LlmAgent,
         animation_agent: LlmAgent,
-        blender_code_agent: LlmAgent,
+        blender_code_agent: BaseAgent,
+        story_edit_agent: LlmAgent,
+        code_edit_agent: LlmAgent,
     ):
         """
         Initializes the SupervisorAgent.
@@ -98,15 +155,24 @@ class SupervisorAgent(BaseAgent):
             probability_agent: An LlmAgent for probability problems.
             trigonometry_agent: An LlmAgent for trigonometry problems.
             statistics_agent: An LlmAgent for statistics problems.
+            general_agent: An LlmAgent for problems in a domain without its own solver.
+            reviser_agent: An LlmAgent that re-solves a problem whose solution failed local verification.
             animation_agent: An LlmAgent for animation tasks.
-            blender_code_agent: An LlmAgent for Blender code generation.
+            blender_code_agent: An agent for Blender code generation.
+            story_edit_agent: An LlmAgent that patches the story of an edited problem.
+            code_edit_agent: An LlmAgent that patches the Blender code of an edited problem.
         """
         # Create internal agents *before* calling super().__init__
-        # loop_agent = LoopAgent(
-        #     name="CriticReviserLoop", sub_agents=[critic, reviser], max_iterations=2
-        # )
-        sequential_agent = SequentialAgent(
-            name="PostProcessing", sub_agents=[animation_agent, blender_code_agent]
+        # The critic half of a critic/reviser loop is replaced by verify.verify(),
+        # so the reviser only runs after a failed local check.
+        # Blender code generation starts while the story is still streaming; see story.py.
+        post_processing_agent = StoryPipelineAgent(
+            name="PostProcessing", story_agent=animation_agent, code_agent=blender_code_agent
+        )
+        # An edited problem patches the previous artifacts; what fails to patch is regenerated by the pipeline.
+        artifact_patch_agent = ArtifactPatchAgent(
+            name="ArtifactPatch", story_edit_agent=story_edit_agent, code_edit_agent=code_edit_agent,
+            pipeline=post_processing_agent,
         )
 
         # Define the sub_agents list for the framework
@@ -118,9 +184,12 @@ class SupervisorAgent(BaseAgent):
             probability_agent,
             trigonometry_agent,
             statistics_agent,
+            general_agent,
+            reviser_agent,
             # animation_agent,
             # blender_code_agent,
-            sequential_agent,
+            post_processing_agent,
+            artifact_patch_agent,
         ]
 
         # Pydantic will validate and assign them based on the class annotations.
@@ -133,9 +202,14 @@ class SupervisorAgent(BaseAgent):
             probability_agent=probability_agent,
             trigonometry_agent=trigonometry_agent,
             statistics_agent=statistics_agent,
+            general_agent=general_agent,
+            reviser_agent=reviser_agent,
             animation_agent=animation_agent,
             blender_code_agent=blender_code_agent,
-            sequential_agent=sequential_agent,
+            story_edit_agent=story_edit_agent,
+            code_edit_agent=code_edit_agent,
+            post_processing_agent=post_processing_agent,
+            artifact_patch_agent=artifact_patch_agent,
             sub_agents=sub_agents_list, # Pass the sub_agents list directly
         )
 
@@ -143,15 +217,26 @@ class SupervisorAgent(BaseAgent):
     
 
     async def run_with_retry(agent, ctx, max_retries=5, base_delay=2):
-        """Run an agent with retries on 503 UNAVAILABLE errors."""
+        """Run an agent with retries on 503 UNAVAILABLE errors.
+
+        A parallel agent's 503s arrive in an exception group, which is retried
+        when every error in it is a 503. A retry whose backoff would end past
+        the request deadline is not attempted (see ``cancellation``);
+        cancelling the request interrupts the backoff.
+        """
         for attempt in range(max_retries):
             try:
                 async for event in agent.run_async(ctx):
                     yield event
                 return  # success, exit
-            except google.genai.errors.ServerError as e:
-                if "UNAVAILABLE" in str(e):
+            except (google.genai.errors.ServerError, ExceptionGroup) as e:
+                if _unavailable(e):
                     wait = base_delay * (2 ** attempt)
+                    left = cancellation.remaining()
+                    if left is not None and wait >= left:
+                        get_stats("cancellation").incr("retry_skipped")
+                        logger.error(f"{agent.name} overloaded; a retry in {wait}s would pass the request deadline.")
+                        raise
                     logger.warning(f"{agent.name} overloaded, retrying in {wait}s (attempt {attempt+1}/{max_retries})")
                     await asyncio.sleep(wait)
                 else:
@@ -160,6 +245,156 @@ class SupervisorAgent(BaseAgent):
         logger.error(f"{agent.name} failed after {max_retries} retries.")
 
 
+    def _state_event(self, ctx: InvocationContext, state_delta: dict, text: str | None = None) -> Event:
+        """Builds an event that writes ``state_delta`` into the session state."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    def _degraded_event(self, ctx: InvocationContext, skipped: str, reason: str) -> Event:
+        """Records in the session that ``skipped`` was left out to stay within budget; see ledger.py."""
+        get_stats("ledger").incr(f"degraded:{skipped}")
+        logger.warning(f"[{self.name}] Skipping {skipped} to stay within budget: {reason}")
+        return self._state_event(ctx, {"budget": {"skipped": skipped, "reason": reason}})
+
+    def _artifact_stages(self, root: BaseAgent | None = None) -> list[str]:
+        """Names of the LLM agents under ``root`` (the post-processing agent by default)."""
+        names, stack = [], [root or self.post_processing_agent]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, LlmAgent):
+                names.append(node.name)
+            stack.extend(node.sub_agents)
+        return names
+
+    def _solve_locally(self, ctx: InvocationContext, domain: str) -> dict | None:
+        """Runs the local solver for ``domain`` if there is one, recording hit/fallback stats."""
+        local_solver = LOCAL_SOLVERS.get(domain)
+        if local_solver is None:
+            return None
+        stats = get_stats(domain)
+        with stats.timer("local"):
+            result = local_solver(ctx.session.state["topic"])
+        if result and result.get("status") == "success":
+            stats.incr("local")
+            logger.info(f"[{self.name}] Solved {domain} problem locally.")
+            return result
+        stats.incr("fallback")
+        logger.info(f"[{self.name}] Local {domain} solver does not support this input; falling back to the LLM.")
+        return None
+
+    async def _verify_and_revise(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Checks the LLM solution locally and re-solves once if the check fails."""
+        topic = ctx.session.state["topic"]
+        result = verify.verify(topic, ctx.session.state.get("solution", ""))
+        logger.info(f"[{self.name}] Verification {result.status} ({result.method or 'none'}): {result.reason}")
+        if result.status == "verified":
+            # Only a verified solution's replies are shared with other requests.
+            shared_cache.commit(ctx.session.state)
+        if result.status != "failed":
+            yield self._state_event(ctx, {"verification": result.to_state()})
+            return
+
+        feedback = f"The final answer '{result.answer}' failed an automatic check: {result.reason}."
+        yield self._state_event(ctx, {"verification": result.to_state(), "verification_feedback": feedback})
+        get_stats("verification").incr("resolved")
+        try:
+            async for event in SupervisorAgent.run_with_retry(self.reviser_agent, ctx):
+                logger.info(f"[{self.name}] Event from ReviserAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
+                yield event
+        except ledger.BudgetExceededError as e:
+            # The unverified solution stands.
+            yield self._degraded_event(ctx, "revision", str(e))
+            return
+        # Record the outcome of the re-solve; there is no second retry.
+        result = verify.verify(topic, ctx.session.state.get("solution", ""))
+        logger.info(f"[{self.name}] Re-solve verification {result.status}: {result.reason}")
+        yield self._state_event(ctx, {"verification": result.to_state()})
+
+    def _solver(self, domain: str) -> LlmAgent:
+        """The solver agent of ``domain``; a label without one gets the general solver."""
+        return getattr(self, SOLVER_AGENTS.get(domain, SOLVER_AGENTS[domains.GENERAL]))
+
+    async def _run_solvers(self, ctx: InvocationContext, solvers: list[LlmAgent]) -> AsyncGenerator[Event, None]:
+        """Runs the solvers of a problem's domains, concurrently unless MATH_AGENTS_CONCURRENT_SOLVERS=0."""
+        if len(solvers) == 1:
+            async for event in SupervisorAgent.run_with_retry(solvers[0], ctx):
+                logger.info(f"[{self.name}] Event from {event.author}: {event.model_dump_json(indent=2, exclude_none=True)}")
+                yield event
+            return
+        # Each solver gets its own branch, as in ParallelAgent, so none sees another's reply.
+        streams = [
+            SupervisorAgent.run_with_retry(solver, ctx.model_copy(
+                update={"branch": f"{ctx.branch}.{solver.name}" if ctx.branch else solver.name}))
+            for solver in solvers
+        ]
+        if domains.CONCURRENT_SOLVERS:
+            events = _interleave(streams)
+        else:
+            events = _chain(streams)
+        async for event in events:
+            logger.info(f"[{self.name}] Event from {event.author}: {event.model_dump_json(indent=2, exclude_none=True)}")
+            yield event
+
+    async def _classify_and_solve(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Classifies the topic into one or more domains and solves it, locally when possible.
+
+        A small edit of an earlier problem keeps its domains; see ``incremental``.
+        """
+        if ctx.session.state.get(incremental.EDIT_KEY) and ctx.session.state.get("math_domains"):
+            labels = list(ctx.session.state["math_domains"])
+            get_stats("incremental").incr("domains_reused")
+            logger.info(f"[{self.name}] Edited problem; reusing math domains {labels}")
+        else:
+            # use the run_with_retry method to call domain_classify_agent
+            async for event in SupervisorAgent.run_with_retry(self.domain_classify_agent, ctx):
+                logger.info(f"[{self.name}] Event from DomainClassifyAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
+                yield event
+
+            labels = domains.parse_domains(ctx.session.state.get("math_domain") or "")
+            if not labels:
+                logger.error(f"[{self.name}] Math domain classification failed. Aborting.")
+                return
+            stats = get_stats("domains")
+            stats.incr("problems")
+            if len(labels) > 1:
+                stats.incr("multi_domain")
+            for label in labels:
+                stats.incr(f"label:{label}")
+            # math_domain keeps the main domain alone, as the image cache and clients expect.
+            yield self._state_event(ctx, {"math_domain": labels[0], "math_domains": labels})
+            logger.info(f"[{self.name}] Classified math domains: {labels}")
+
+        # The main domain's local solver answers alone; the other domains' solvers would only repeat it.
+        # Its answer is checked like the model's, so a misread problem is re-solved rather than returned.
+        local_result = self._solve_locally(ctx, labels[0])
+        if local_result is not None:
+            yield self._state_event(ctx, {"solution": local_result["steps"]}, text=local_result["steps"])
+            async for event in self._verify_and_revise(ctx):
+                yield event
+            return
+        local = {}
+        for label in labels[1:]:
+            result = self._solve_locally(ctx, label)
+            if result is not None:
+                local[label] = result["steps"]
+
+        llm_start = time.perf_counter()
+        async for event in self._run_solvers(ctx, [self._solver(label) for label in labels if label not in local]):
+            yield event
+        if labels[0] in LOCAL_SOLVERS:
+            get_stats(labels[0]).observe("fallback", time.perf_counter() - llm_start)
+        solution = domains.merge({label: local.get(label) or ctx.session.state.get(domains.solution_key(label), "")
+                                  for label in labels})
+        if solution:
+            yield self._state_event(ctx, {"solution": solution})
+            async for event in self._verify_and_revise(ctx):
+                yield event
+
     @override
     async def _run_async_impl(
         self, ctx: InvocationContext
@@ -191,45 +426,11 @@ class SupervisorAgent(BaseAgent):
 
        
 
-        # use the run_with_retry method to call domain_classify_agent
-        async for event in SupervisorAgent.run_with_retry(self.domain_classify_agent, ctx):
-            logger.info(f"[{self.name}] Event from DomainClassifyAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-            yield event
-
-        if "math_domain" not in ctx.session.state or not ctx.session.state["math_domain"]:
-            logger.error(f"[{self.name}] Math domain classification failed. Aborting.")
-            return
-        
-        logger.info(f"[{self.name}] Classified math domain: {ctx.session.state['math_domain']}")
-        
-        # 2. if the domain is algebra, call the algebra agent
-        # if domain is geometry, call the geometry agent, and so on.
-        domain = ctx.session.state.get("math_domain")
-
-        logger.info(f"[{self.name}] Running SupervisorAgent...")
-        if domain == "algebra":
-            async for event in SupervisorAgent.run_with_retry(self.algebra_agent, ctx):
-                logger.info(f"[{self.name}] Event from AlgebraAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-                yield event
-        elif domain == "geometry":
-            async for event in SupervisorAgent.run_with_retry(self.geometry_agent, ctx):
-                logger.info(f"[{self.name}] Event from GeometryAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-                yield event
-        elif domain == "calculus":
-            async for event in SupervisorAgent.run_with_retry(self.calculus_agent, ctx):
-                logger.info(f"[{self.name}] Event from CalculusAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-                yield event
-        elif domain == "probability":
-            async for event in SupervisorAgent.run_with_retry(self.probability_agent, ctx):
-                logger.info(f"[{self.name}] Event from ProbabilityAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-                yield event
-        elif domain == "trigonometry" or "Trigonometry":
-            async for event in SupervisorAgent.run_with_retry(self.trigonometry_agent, ctx):
-                logger.info(f"[{self.name}] Event from TrigonometryAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-                yield event
-        elif domain == "statistics":
-            async for event in SupervisorAgent.run_with_retry(self.statistics_agent, ctx):
-                logger.info(f"[{self.name}] Event from StatisticsAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
+        if ctx.session.state.get("math_domain") and ctx.session.state.get("solution"):
+            # The caller supplied a solution already (e.g. from the image cache).
+            logger.info(f"[{self.name}] Reusing the solution already in session state.")
+        else:
+            async for event in self._classify_and_solve(ctx):
                 yield event
 
         # 3. Once the solution is obtained, proceed to animation and blender code generation. The solution is expected to be in ctx.session.state["solution"]
@@ -239,127 +440,295 @@ class SupervisorAgent(BaseAgent):
         if not solution:
             logger.error(f"[{self.name}] No solution found. Skipping animation/blender.")
             return
+        if not ctx.session.state.get("animate", True):
+            logger.info(f"[{self.name}] Animation not requested. Skipping animation/blender.")
+            return
+        if ctx.session.state.get("lazy_artifacts", False):
+            # Generated on first request instead; see artifacts.py.
+            stats = get_stats("artifacts")
+            for key in ("animation_story", "blender_code"):
+                stats.incr(f"deferred:{key}")
+            logger.info(f"[{self.name}] Deferring animation/blender until requested.")
+            return
 
+        # An edited problem patches the artifacts of the problem it edits; see incremental.py.
+        post_processing_agent = self.post_processing_agent
+        if incremental.can_patch(ctx.session.state):
+            post_processing_agent = self.artifact_patch_agent
+
+        # The artifacts are optional: skip them when the budget left would not cover their usual cost.
+        charge = ledger.charge_for(ctx.session.state, ctx.session.id)
+        remaining = ledger.get_ledger().remaining(charge)
+        estimate = ledger.get_ledger().estimate(self._artifact_stages(post_processing_agent))
+        if remaining <= 0 or remaining < estimate:
+            yield self._degraded_event(ctx, "artifacts", f"${remaining:.4f} left, artifacts usually cost ${estimate:.4f}")
+            return
 
-        # 4. call animation agent and blender code agent, These agents run sequentially. they take the solution as input and generate animation story and blender code respectively.
-        async for event in SupervisorAgent.run_with_retry(self.animation_agent, ctx):
-            logger.info(f"[{self.name}] Event from AnimationAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
+        # 4. run the post-processing agent: the animation agent and the blender code agent.
+        # They take the solution as input and generate animation story and blender code respectively.
+        try:
+            async for event in SupervisorAgent.run_with_retry(post_processing_agent, ctx):
+                if not event.partial:
+                    logger.info(f"[{self.name}] Event from PostProcessing: {event.model_dump_json(indent=2, exclude_none=True)}")
+                yield event
+        except* ledger.BudgetExceededError as group:
+            # Parallel section agents raise it in an exception group.
+            yield self._degraded_event(ctx, "artifacts", str(group.exceptions[0]))
+
+async def _interleave(streams: list[AsyncGenerator[Event, None]]) -> AsyncGenerator[Event, None]:
+    """Runs ``streams`` concurrently and yields their events as they arrive."""
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump(stream: AsyncGenerator[Event, None]) -> None:
+        try:
+            async for event in stream:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.create_task(pump(stream)) for stream in streams]
+    running = len(tasks)
+    try:
+        while running:
+            item = await queue.get()
+            if item is done:
+                running -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _chain(streams: list[AsyncGenerator[Event, None]]) -> AsyncGenerator[Event, None]:
+    """Yields the events of ``streams`` one stream after another."""
+    for stream in streams:
+        async for event in stream:
             yield event
 
-        async for event in SupervisorAgent.run_with_retry(self.blender_code_agent, ctx):
-            logger.info(f"[{self.name}] Event from BlenderCodeAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-            yield event
-        # 5. Finally, run the sequential post-processing agent
-        async for event in SupervisorAgent.run_with_retry(self.sequential_agent, ctx):
-            logger.info(f"[{self.name}] Event from SequentialAgent: {event.model_dump_json(indent=2, exclude_none=True)}")
-            yield event
 
-# --- Define the individual LLM agents ---
-
-domain_classify_agent = LlmAgent(
-    name="DomainClassifyAgent",
-    model=MODEL,
-    instruction="""You are a math domain classifier. Given the following problem statement: {{topic}}, classify it into one of the following domains: algebra, geometry, calculus, trigonometry, probability, statistics. Respond with only the domain name.""",
-    input_schema=None,
-    output_key="math_domain",  # Key for storing output in session state
-)
-
-algebra_agent = LlmAgent(
-    name="AlgebraAgent",
-    model=MODEL,
-    instruction="""You are a math problem solver. Solve the following algebra problem: {{topic}}. Provide a step-by-step solution.""",
-    input_schema=None,
-    output_key="solution",  # Key for storing output in session state
-)
-
-geometry_agent = LlmAgent(
-    name="GeometryAgent",
-    model=MODEL,
-    instruction="""You are a geometry problem solver. Solve the following geometry problem: {{topic}}. Provide a step-by-step solution.""",
-    input_schema=None,
-    output_key="solution",  # Key for storing output in session state
-)
-
-calculus_agent = LlmAgent(
-    name="CalculusAgent",
-    model=MODEL,
-    instruction="""You are a calculus problem solver. Solve the following calculus problem: {{topic}}. Provide a step-by-step solution. Respond only with the solution text.""",
-    input_schema=None,
-    output_key="solution",  # Key for storing output in session state
-)
-
-trigonometry_agent = LlmAgent(
-    name="TrigonometryAgent",
-    model=MODEL,
-    instruction="""You are a trigonometry problem solver. Solve the following trigonometry problem: {{topic}}. Provide a step-by-step solution.""",
-    input_schema=None,
-    output_key="solution",
-)
-
-probability_agent = LlmAgent(
-    name="ProbabilityAgent",
-    model=MODEL,
-    instruction="""You are a probability problem solver. Solve the following probability problem: {{topic}}. Provide a step-by-step solution.""",
-    input_schema=None,
-    output_key="solution", # Key for storing output in session state
-)
-
-statistics_agent = LlmAgent(
-    name="StatisticsAgent",
-    model=MODEL,
-    instruction="""You are a statistics problem solver. Solve the following statistics problem: {{topic}}. Provide a step-by-step solution.""",
-    input_schema=None,
-    output_key="solution",  # Key for storing output in session state
-)
-
-animation_agent = LlmAgent(
-    name="AnimationAgent",
-    model=MODEL,
-    instruction=animation_prompt(),
-    input_schema=None,
-    output_key="animation_story",  # Key for storing output in session state
-)
-
-blender_code_agent = LlmAgent(
-    name="BlenderCodeAgent",
-    model=MODEL,
-    instruction=blender_code_prompt(),
-    input_schema=None,
-    output_key="blender_code",
-)
-
-
-
-
-
-# --- Create the custom agent instance ---
-root_agent = SupervisorAgent(
-    name="SupervisorAgent",
-    domain_classify_agent=domain_classify_agent,
-    algebra_agent=algebra_agent,
-    geometry_agent=geometry_agent,
-    calculus_agent=calculus_agent,
-    trigonometry_agent=trigonometry_agent,
-    probability_agent=probability_agent,
-    statistics_agent=statistics_agent,
-    animation_agent=animation_agent,
-    blender_code_agent=blender_code_agent,
-)
-
-
-
-INITIAL_STATE = {
-    "topic": "",
-    "math_domain": "",
-    "solution": "",
-    "animation_story": "",
-    "blender_code": "",
-}
+def blender_code_instruction(context: ReadonlyContext) -> str:
+    """The Blender prompt, with the story schema parsed by the pipeline when there is one."""
+    return blender_code_prompt(schema_from_state(context.state))
+
+
+# Agent instances are built on first use (see __getattr__ below), so importing
+# this module does not construct them or evaluate the large prompts.
+AGENT_NAMES = [
+    "problem_extract_agent", "domain_classify_agent", "algebra_agent", "geometry_agent", "calculus_agent",
+    "trigonometry_agent", "probability_agent", "statistics_agent", "general_agent", "reviser_agent", "animation_agent",
+    "blender_code_agent", "blender_section_agents", "blender_repair_agent", "story_edit_agent", "code_edit_agent",
+    "post_processing_agent", "artifact_patch_agent", "root_agent",
+]
+_agents: dict | None = None
+_agents_lock = threading.Lock()
+
+
+def build_agents() -> dict:
+    """Builds every agent once and returns them by module attribute name."""
+    global _agents
+    with _agents_lock:
+        if _agents is None:
+            _agents = _build_agents()
+    return _agents
+
+
+def _build_agents() -> dict:
+    # --- Define the individual LLM agents ---
+
+    problem_extract_agent = LlmAgent(
+        name="ProblemExtractAgent",
+        model=MODEL,
+        instruction="""You read photos of math problems. Transcribe the math problem shown in the image as plain text, writing powers with ^ and fractions with /. Respond with only the problem statement.""",
+        input_schema=None,
+        output_key="topic",  # The extracted problem becomes the topic for SupervisorAgent
+    )
+
+    domain_classify_agent = LlmAgent(
+        name="DomainClassifyAgent",
+        model=MODEL,
+        instruction="""You are a math domain classifier. Given the following problem statement: {{topic}}, classify it into one or more of the following domains: algebra, geometry, calculus, trigonometry, probability, statistics. Name a second or third domain only when the problem needs its methods too. Respond with only the domain names separated by commas, main domain first.""",
+        input_schema=None,
+        output_key="math_domain",  # The supervisor splits it into math_domains; see domains.py
+    )
+
+    algebra_agent = LlmAgent(
+        name="AlgebraAgent",
+        model=MODEL,
+        instruction="""You are a math problem solver. Solve the following algebra problem: {{topic}}. Provide a step-by-step solution.""",
+        input_schema=None,
+        output_key=domains.solution_key("algebra"),  # merged into "solution" by SupervisorAgent
+    )
+
+    geometry_agent = LlmAgent(
+        name="GeometryAgent",
+        model=MODEL,
+        instruction="""You are a geometry problem solver. Solve the following geometry problem: {{topic}}. Provide a step-by-step solution.""",
+        input_schema=None,
+        output_key=domains.solution_key("geometry"),  # merged into "solution" by SupervisorAgent
+    )
+
+    calculus_agent = LlmAgent(
+        name="CalculusAgent",
+        model=MODEL,
+        instruction="""You are a calculus problem solver. Solve the following calculus problem: {{topic}}. Provide a step-by-step solution. Respond only with the solution text.""",
+        input_schema=None,
+        output_key=domains.solution_key("calculus"),  # merged into "solution" by SupervisorAgent
+    )
+
+    trigonometry_agent = LlmAgent(
+        name="TrigonometryAgent",
+        model=MODEL,
+        instruction="""You are a trigonometry problem solver. Solve the following trigonometry problem: {{topic}}. Provide a step-by-step solution.""",
+        input_schema=None,
+        output_key=domains.solution_key("trigonometry"),  # merged into "solution" by SupervisorAgent
+    )
+
+    probability_agent = LlmAgent(
+        name="ProbabilityAgent",
+        model=MODEL,
+        instruction="""You are a probability problem solver. Solve the following probability problem: {{topic}}. Provide a step-by-step solution.""",
+        input_schema=None,
+        output_key=domains.solution_key("probability"),  # merged into "solution" by SupervisorAgent
+    )
+
+    statistics_agent = LlmAgent(
+        name="StatisticsAgent",
+        model=MODEL,
+        instruction="""You are a statistics problem solver. Solve the following statistics problem: {{topic}}. Provide a step-by-step solution.""",
+        input_schema=None,
+        output_key=domains.solution_key("statistics"),  # merged into "solution" by SupervisorAgent
+    )
+
+    general_agent = LlmAgent(
+        name="GeneralSolverAgent",
+        model=MODEL,
+        instruction="""You are a math problem solver. Solve the following problem: {{topic}}. Provide a step-by-step solution ending with a line of the form 'Answer: ...'.""",
+        input_schema=None,
+        output_key=domains.solution_key(domains.GENERAL),  # merged into "solution" by SupervisorAgent
+    )
+
+    reviser_agent = LlmAgent(
+        name="ReviserAgent",
+        model=MODEL,
+        instruction="""You are a math problem solver. A previous solution to the problem {{topic}} was checked automatically. {{verification_feedback}} Previous solution: {{solution}}. Find the mistake and provide a corrected step-by-step solution ending with a line of the form 'Answer: ...'.""",
+        input_schema=None,
+        output_key="solution",  # Overwrites the rejected solution
+    )
+
+    animation_agent = LlmAgent(
+        name="AnimationAgent",
+        model=MODEL,
+        instruction=animation_prompt(),
+        input_schema=None,
+        output_key="animation_story",  # Key for storing output in session state
+    )
+
+    blender_code_agent = LlmAgent(
+        name="BlenderCodeAgent",
+        model=MODEL,
+        instruction=blender_code_instruction,
+        input_schema=None,
+        output_key="blender_code",
+    )
+
+    blender_section_agents = make_section_agents(MODEL)
+    blender_repair_agent = make_repair_agent(MODEL)
+    # Patch the story and code of an edited problem; see incremental.py.
+    story_edit_agent = make_edit_agent("StoryEditAgent", MODEL, "animation_story")
+    code_edit_agent = make_edit_agent("CodeEditAgent", MODEL, "blender_code")
+
+    # Concurrent sessions share batched classifier calls (and, if enabled, short
+    # solver calls); see batching.py.
+    domain_classify_agent.before_model_callback = batched_callback(domain_classify_agent, "classify")
+    for _domain, _solver in [("algebra", algebra_agent), ("geometry", geometry_agent), ("calculus", calculus_agent),
+                             ("trigonometry", trigonometry_agent), ("probability", probability_agent),
+                             ("statistics", statistics_agent), ("math", general_agent)]:
+        _solver.before_model_callback = batched_callback(_solver, "solve", _domain)
+
+    # Identical concurrent calls at every stage share one in-flight model call; see
+    # singleflight.py. The leader still goes through the batching callback above.
+    llm_agents = [problem_extract_agent, domain_classify_agent, algebra_agent, geometry_agent, calculus_agent,
+                  trigonometry_agent, probability_agent, statistics_agent, general_agent, reviser_agent,
+                  animation_agent, blender_code_agent, *blender_section_agents, blender_repair_agent,
+                  story_edit_agent, code_edit_agent]
+    for _agent in llm_agents:
+        _agent.before_model_callback = coalesced_callback(_agent, inner=_agent.before_model_callback)
+
+    # With MATH_AGENTS_CASSETTE set, model calls are recorded to or replayed from disk; see cassette.py.
+    if cassette.get_cassette() is not None:
+        cassette.install(llm_agents, cassette.get_cassette())
+
+    # Every model call is recorded in the ledger and refused once its request or
+    # tenant budget is spent; see ledger.py and metering.py.
+    for _agent in llm_agents:
+        _agent.before_model_callback = metering.budgeted_callback(_agent, inner=_agent.before_model_callback)
+    metering.install(llm_agents)
+
+    # With MATH_AGENTS_SHARED_CACHE set, classifier and solver replies are shared by
+    # every worker process on the host; a hit holds no budget. Solver replies are
+    # stored only once their solution is verified. See shared_cache.py.
+    if shared_cache.get_cache() is not None:
+        domain_classify_agent.before_model_callback = shared_cache.cached_callback(
+            domain_classify_agent, shared_cache.get_cache(), inner=domain_classify_agent.before_model_callback)
+        for _agent in [algebra_agent, geometry_agent, calculus_agent, trigonometry_agent, probability_agent,
+                       statistics_agent, general_agent]:
+            _agent.before_model_callback = shared_cache.cached_callback(
+                _agent, shared_cache.get_cache(), inner=_agent.before_model_callback, verified=True)
+
+    # Environment and character sections come from the template library when the
+    # story schema matches; see blender_templates.py.
+    for _section, _agent in zip(SECTIONS, blender_section_agents):
+        _agent.before_model_callback = templated_callback(_section, inner=_agent.before_model_callback)
+
+    # --- Create the custom agent instance ---
+    root_agent = SupervisorAgent(
+        name="SupervisorAgent",
+        domain_classify_agent=domain_classify_agent,
+        algebra_agent=algebra_agent,
+        geometry_agent=geometry_agent,
+        calculus_agent=calculus_agent,
+        trigonometry_agent=trigonometry_agent,
+        probability_agent=probability_agent,
+        statistics_agent=statistics_agent,
+        general_agent=general_agent,
+        reviser_agent=reviser_agent,
+        animation_agent=animation_agent,
+        # Parallel sections stitched into one script, or one BlenderCodeAgent call; see blender_sections.py.
+        # The script is checked statically and repaired once if needed; see blender_preflight.py.
+        blender_code_agent=BlenderPreflightAgent(
+            name="BlenderPreflight",
+            code_agent=SectionedBlenderAgent(
+                name="SectionedBlenderCode", section_agents=blender_section_agents, single_agent=blender_code_agent
+            ),
+            repair_agent=blender_repair_agent,
+        ),
+        story_edit_agent=story_edit_agent,
+        code_edit_agent=code_edit_agent,
+    )
+
+    post_processing_agent = root_agent.post_processing_agent
+    artifact_patch_agent = root_agent.artifact_patch_agent
+    agents = locals()
+    return {name: agents[name] for name in AGENT_NAMES}
+
+
+def __getattr__(name: str):
+    if name in AGENT_NAMES:
+        return build_agents()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 async def setup_session_and_runner(initial_topic: str = ""):
     session_service = InMemorySessionService()
     initial_state = dict(INITIAL_STATE)
     initial_state["topic"] = initial_topic or ""
+    initial_state["lazy_artifacts"] = False  # the script prints the full state, artifacts included
     session = await session_service.create_session(
         app_name=APP_NAME,
         user_id=USER_ID,
@@ -367,7 +736,7 @@ async def setup_session_and_runner(initial_topic: str = ""):
         state=initial_state,
     )
     logger.info(f"Initial session state: {session.state}")
-    runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+    runner = Runner(agent=build_agents()["root_agent"], app_name=APP_NAME, session_service=session_service)
     return session_service, runner
 
 # --- Function to Interact with the Agent ---
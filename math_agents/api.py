@@ -0,0 +1,634 @@
+"""HTTP API for submitting a photo of a math problem.
+
+Run with:
+    uvicorn math_agents.api:app
+
+``POST /solve/image`` takes a multipart ``file`` upload. The image is
+preprocessed locally (see ``imaging``) in a worker pool, transcribed by
+``ProblemExtractAgent`` in its own session, and the transcription is fed to
+``SupervisorAgent`` as the topic. The extraction session is separate so the
+image is sent to the model once rather than with every later agent call.
+
+Preprocessed images are looked up in a perceptual-hash cache first; a
+near-duplicate photo reuses the earlier topic, domain and solution with no
+vision-model call.
+
+``POST /solve/worksheet`` takes worksheet ``text`` or an image ``file``,
+splits it into problems (see ``worksheet``) and solves them concurrently.
+
+Solve responses return as soon as the solution is verified, with handles for
+``animation_story`` and ``blender_code``. ``GET
+/sessions/{session_id}/artifacts/{name}`` generates an artifact on first
+request and serves the stored copy afterwards (see ``artifacts``).
+
+``POST /sessions/{session_id}/edit`` solves an edited version of a
+session's problem in a new session. A small edit keeps the domains and
+patches the earlier story and Blender code instead of regenerating them
+(see ``incremental``).
+
+The ``/ws`` WebSocket runs multi-turn sessions and pushes state deltas and
+streamed text as they happen, for the keys the client subscribed to,
+instead of the full state (see ``channel``).
+
+``POST /sessions/{session_id}/render`` queues the session's Blender code for
+a headless render (see ``render``); ``GET /render/{job_id}`` reports the
+job's progress and frame URLs.
+
+Sessions are kept in memory within the limits of ``sessions`` (count,
+idle time and events per session); an evicted session's artifacts answer
+404.
+
+Every model call is recorded in the ``ledger`` with its tokens and estimated
+cost, charged to the request and to the caller's tenant. Set
+``MATH_AGENTS_API_KEYS`` to a JSON object of API key -> tenant; requests then
+authenticate with the ``X-API-Key`` header and one without a known key gets
+401. Without it every request is charged to ``ledger.DEFAULT_TENANT``. The
+tenant is never taken from the request itself, so a client cannot move to a
+fresh budget by naming a new one. ``GET /ledger`` and ``GET
+/ledger/{tenants,requests}/{id}`` return the aggregates; a tenant sees only
+its own. A request or tenant over its budget gets 429; near the budget, a
+solve skips the re-solve or the artifacts (``budget`` in the result).
+
+Solve and artifact requests are cancelled when their client disconnects
+or after ``MATH_AGENTS_REQUEST_TIMEOUT`` seconds (see ``cancellation``). The
+pipeline stops its model calls and releases its permits and budget holds; a
+request past its deadline gets 504.
+
+Pass ``preprocess=false`` to send the original upload, for comparing bytes
+sent to the model and end-to-end latency; ``GET /metrics`` returns the
+collected figures.
+
+Importing this module does not import ADK, which takes seconds (it pulls in
+Vertex AI). The agents, runners and session service are built by
+``runtime()`` on first use. On startup a background thread builds them ahead
+of the first solve; set ``MATH_AGENTS_WARMUP=0`` to build them on demand
+only. Endpoints that do not run agents (render status, frames, metrics)
+answer while the warm-up is still running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
+from fastapi import (Depends, FastAPI, File, Form, Header, HTTPException, Request, UploadFile, WebSocket,
+                     WebSocketDisconnect)
+from fastapi.responses import FileResponse, JSONResponse
+
+from math_agents import artifacts, cancellation, channel, imaging, ledger, render, shared_cache, worksheet
+from math_agents.config import APP_NAME, INITIAL_STATE, USER_ID
+from math_agents.image_cache import ImageCache
+from math_agents.metrics import get_stats, snapshot_all
+
+if TYPE_CHECKING:
+    from google.adk.runners import Runner
+    from google.genai import types
+
+
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+RESULT_KEYS = ["topic", "math_domain", "math_domains", "solution", "verification", "budget"]
+CACHED_KEYS = ["topic", "math_domain", "math_domains", "solution", "verification"]
+
+# Set MATH_AGENTS_WARMUP=0 to skip building the runtime in the background at startup.
+WARMUP_ENABLED = os.environ.get("MATH_AGENTS_WARMUP", "1") != "0"
+# API key -> tenant; empty charges every request to the default tenant.
+API_KEYS: dict[str, str] = json.loads(os.environ.get("MATH_AGENTS_API_KEYS", "{}"))
+
+
+class Runtime:
+    """The session service, runners and artifact store, which need ADK and the agents."""
+
+    def __init__(self):
+        from google.adk.runners import Runner
+        from math_agents.agent import build_agents
+        from math_agents.sessions import BoundedSessionService
+
+        agents = build_agents()
+        self.session_service = BoundedSessionService()
+        self.extract_runner = Runner(agent=agents["problem_extract_agent"], app_name=APP_NAME,
+                                     session_service=self.session_service)
+        self.solve_runner = Runner(agent=agents["root_agent"], app_name=APP_NAME,
+                                   session_service=self.session_service)
+        self.artifact_store = artifacts.ArtifactStore(self.session_service)
+
+
+_runtime: Runtime | None = None
+_runtime_lock = threading.Lock()
+
+
+def build_runtime() -> Runtime:
+    """Builds the runtime once; the first call imports ADK and constructs the agents."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            with get_stats("startup").timer("runtime"):
+                _runtime = Runtime()
+        return _runtime
+
+
+async def runtime() -> Runtime:
+    """The runtime, built in a worker thread if the warm-up has not finished, so the loop keeps serving."""
+    if _runtime is not None:
+        return _runtime
+    return await asyncio.to_thread(build_runtime)
+
+
+def __getattr__(name: str):
+    if name in ("session_service", "extract_runner", "solve_runner", "artifact_store"):
+        return getattr(build_runtime(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ENABLED:
+        threading.Thread(target=build_runtime, name="runtime-warmup", daemon=True).start()
+    yield
+    if _runtime is not None:
+        await _runtime.artifact_store.stop()
+    await render_scheduler.stop()
+    imaging.shutdown()
+
+
+app = FastAPI(title="Math Vision", lifespan=lifespan)
+image_cache = ImageCache()
+render_scheduler = render.RenderScheduler()
+
+
+async def _run(runner: Runner, session_id: str, content: types.Content) -> dict:
+    """Runs ``runner`` to completion and returns the session state."""
+    async for _ in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+        pass
+    session = await runner.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    return session.state
+
+
+async def extract_problem(data: bytes, mime_type: str, tenant: str = "", request_id: str = "") -> str:
+    """Transcribes the problem in an image with ProblemExtractAgent, charged to ``request_id`` of ``tenant``."""
+    from google.genai import types
+
+    rt = await runtime()
+    session_id = uuid.uuid4().hex
+    await rt.session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id,
+                                            state={"topic": "", "tenant": tenant, "request_id": request_id})
+    try:
+        content = types.Content(role="user", parts=[types.Part.from_bytes(data=data, mime_type=mime_type)])
+        state = await _run(rt.extract_runner, session_id, content)
+        return (state.get("topic") or "").strip()
+    finally:
+        await rt.session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+
+
+def tenant_for(api_key: str | None) -> str | None:
+    """The tenant of ``api_key``, or None when API keys are configured and it is not one of them."""
+    if not API_KEYS:
+        return ledger.DEFAULT_TENANT
+    if not api_key:
+        return None
+    return next((tenant for key, tenant in API_KEYS.items()
+                 if hmac.compare_digest(key.encode(), api_key.encode())), None)
+
+
+async def caller_tenant(x_api_key: str | None = Header(None)) -> str:
+    """The tenant authenticated by the ``X-API-Key`` header; 401 when the key is missing or unknown."""
+    tenant = tenant_for(x_api_key)
+    if tenant is None:
+        get_stats("api").incr("unauthorized")
+        raise HTTPException(status_code=401, detail="Send a valid API key in the X-API-Key header.")
+    return tenant
+
+
+@app.post("/solve/image")
+async def solve_image(request: Request, file: UploadFile = File(...), preprocess: bool = True,
+                      tenant: str = Depends(caller_tenant)) -> dict:
+    """Solves the math problem in an uploaded photo, charged to the caller's tenant."""
+    rt = await runtime()
+    async with rt.artifact_store.foreground():
+        return await cancellation.guard(_solve_image(rt, file, preprocess, tenant),
+                                        request.is_disconnected)
+
+
+async def _solve_image(rt: Runtime, file: UploadFile, preprocess: bool, tenant: str) -> dict:
+    from google.genai import types
+
+    stats = get_stats("vision")
+    start = time.perf_counter()
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty upload.")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image larger than {MAX_UPLOAD_BYTES} bytes.")
+
+    label = "preprocessed" if preprocess else "original"
+    if preprocess:
+        try:
+            image = await imaging.preprocess_async(data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stats.observe("preprocess", image.elapsed_ms / 1000)
+        payload, mime_type, image_info = image.data, image.mime_type, image.summary()
+    else:
+        payload, mime_type = data, file.content_type or "image/jpeg"
+        image_info = {"original_bytes": len(data), "uploaded_bytes": len(data), "mime_type": mime_type}
+    stats.incr(f"{label}_requests")
+    stats.incr(f"{label}_bytes_original", len(data))
+    stats.incr(f"{label}_bytes_uploaded", len(payload))
+
+    # The solve session's id is the request id; the extraction is charged to it too.
+    session_id = uuid.uuid4().hex
+    cached = image_cache.get(image.phash, image.dhash, image.ink) if preprocess else None
+    if cached:
+        topic = cached["topic"]
+    else:
+        with stats.timer(f"{label}_extract"):
+            topic = await extract_problem(payload, mime_type, tenant, session_id)
+        if not topic:
+            raise HTTPException(status_code=422, detail="No math problem found in the image.")
+
+    state = dict(INITIAL_STATE, tenant=tenant, request_id=session_id)
+    state.update(cached or {"topic": topic})
+    await rt.session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id, state=state)
+    content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {topic}")])
+    state = await _run(rt.solve_runner, session_id, content)
+    if preprocess and not cached and state.get("solution"):
+        image_cache.put(image.phash, image.dhash, {key: state.get(key) for key in CACHED_KEYS}, image.ink)
+
+    elapsed = time.perf_counter() - start
+    stats.observe(f"{label}_end_to_end", elapsed)
+    result = {key: state.get(key) for key in RESULT_KEYS}
+    result.update(session_id=session_id, artifacts=artifacts.handles(session_id, state), image=image_info,
+                  cache="hit" if cached else "miss", cost=_cost(session_id), elapsed_ms=round(elapsed * 1000, 3))
+    if state.get("solution"):
+        rt.artifact_store.prefetch(session_id)
+    return result
+
+
+@app.post("/solve/worksheet")
+async def solve_worksheet(request: Request, text: str | None = Form(None), file: UploadFile | None = File(None),
+                          animate: bool = False, concurrent: bool = True,
+                          tenant: str = Depends(caller_tenant)) -> dict:
+    """Splits a worksheet into problems and solves them as separate child sessions of one request."""
+    rt = await runtime()
+    worksheet_id = uuid.uuid4().hex
+    async with rt.artifact_store.foreground():
+        result = await cancellation.guard(
+            _solve_worksheet(rt, text, file, animate, concurrent, tenant, worksheet_id),
+            request.is_disconnected)
+    result["cost"] = _cost(worksheet_id)
+    if animate:
+        for item in result["items"]:
+            if item.get("solution"):
+                item["artifacts"] = artifacts.handles(item["session_id"], item)
+                rt.artifact_store.prefetch(item["session_id"])
+    return result
+
+
+async def _solve_worksheet(rt: Runtime, text: str | None, file: UploadFile | None, animate: bool,
+                           concurrent: bool, tenant: str, worksheet_id: str) -> dict:
+    if file is not None:
+        data = await file.read()
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image larger than {MAX_UPLOAD_BYTES} bytes.")
+        try:
+            regions = await imaging.preprocess_regions_async(data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        transcripts = await asyncio.gather(*(worksheet.bounded(extract_problem(r.data, r.mime_type, tenant, worksheet_id))
+                                             for r in regions))
+        if len(regions) > 1:
+            topics = [t for t in transcripts if t]
+        else:
+            # One block of evenly spaced lines: split the transcription instead.
+            topics = worksheet.split_text(transcripts[0])
+    elif text:
+        topics = worksheet.split_text(text)
+    else:
+        raise HTTPException(status_code=400, detail="Send worksheet text or an image file.")
+    if not topics:
+        raise HTTPException(status_code=422, detail="No problems found in the worksheet.")
+    return await worksheet.solve_worksheet(rt.solve_runner, rt.session_service, topics, animate=animate,
+                                           concurrent=concurrent, tenant=tenant, worksheet_id=worksheet_id)
+
+
+async def _owned_session(rt: Runtime, session_id: str, tenant: str):
+    """The session if it belongs to ``tenant``, else None; another tenant's session looks missing."""
+    session = await rt.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    if session is None or (session.state.get("tenant") or ledger.DEFAULT_TENANT) != tenant:
+        return None
+    return session
+
+
+@app.get("/sessions/{session_id}/artifacts/{name}")
+async def get_artifact(request: Request, session_id: str, name: str, tenant: str = Depends(caller_tenant)) -> dict:
+    """Returns an artifact of one of the caller's solve sessions, generating it on first request."""
+    rt = await runtime()
+    if await _owned_session(rt, session_id, tenant) is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+    async with rt.artifact_store.foreground():
+        try:
+            return await cancellation.guard(rt.artifact_store.get(session_id, name), request.is_disconnected)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+        except ValueError as e:
+            raise HTTPException(status_code=404 if name not in artifacts.ARTIFACTS else 409, detail=str(e))
+
+
+@app.post("/sessions/{session_id}/edit")
+async def edit_session(request: Request, session_id: str, text: str = Form(...),
+                       tenant: str = Depends(caller_tenant)) -> dict:
+    """Solves an edited version of a session's problem, reusing what the edit leaves valid."""
+    rt = await runtime()
+    async with rt.artifact_store.foreground():
+        return await cancellation.guard(_edit_session(rt, session_id, text.strip(), tenant),
+                                        request.is_disconnected)
+
+
+async def _edit_session(rt: Runtime, session_id: str, topic: str, tenant: str) -> dict:
+    from google.genai import types
+
+    from math_agents import incremental
+
+    if not topic:
+        raise HTTPException(status_code=400, detail="Send the edited problem as text.")
+    previous = await _owned_session(rt, session_id, tenant)
+    if previous is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+    start = time.perf_counter()
+    # A new session, so the edit's model calls do not carry the earlier problem's history.
+    edit_session_id = uuid.uuid4().hex
+    state = dict(INITIAL_STATE, topic=topic, tenant=tenant, request_id=edit_session_id)
+    state.update(incremental.seed(previous.state, topic))
+    await rt.session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=edit_session_id,
+                                            state=state)
+    content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {topic}")])
+    state = await _run(rt.solve_runner, edit_session_id, content)
+
+    elapsed = time.perf_counter() - start
+    get_stats("incremental").observe("edit_end_to_end" if state.get("edit") else "full_end_to_end", elapsed)
+    result = {key: state.get(key) for key in RESULT_KEYS}
+    result.update(session_id=edit_session_id, edited_session_id=session_id, edit=state.get("edit") or None,
+                  artifacts=artifacts.handles(edit_session_id, state), cost=_cost(edit_session_id),
+                  elapsed_ms=round(elapsed * 1000, 3))
+    if state.get("solution"):
+        rt.artifact_store.prefetch(edit_session_id)
+    return result
+
+
+@app.websocket("/ws")
+async def session_channel(websocket: WebSocket, session_id: str | None = None, keys: str | None = None,
+                          chunks: bool = True):
+    """Multi-turn solve channel that pushes state deltas for the subscribed keys.
+
+    Query parameters: ``session_id`` to continue an existing session, ``keys``
+    as a comma-separated subscription (every key when absent) and ``chunks``
+    for streamed text. Client messages:
+
+    - ``{"type": "solve", "text": ..., "animate": false}``: solves a problem; a
+      later turn that edits the previous one reuses its results (see ``incremental``);
+    - ``{"type": "artifact", "name": ...}``: generates an artifact of the current session;
+    - ``{"type": "subscribe", "keys": [...] | null, "chunks": ...}``: changes the subscription.
+
+    A turn ends with a ``done`` or ``error`` frame. Closing the socket cancels the running turn.
+    The ``X-API-Key`` header authenticates the tenant as for the HTTP endpoints.
+    """
+    await websocket.accept()
+    tenant = tenant_for(websocket.headers.get("x-api-key"))
+    if tenant is None:
+        get_stats("api").incr("unauthorized")
+        await websocket.close(code=4401, reason="Send a valid API key in the X-API-Key header.")
+        return
+    rt = await runtime()
+    stats = get_stats("channel")
+    stats.incr("connections")
+    subscriber = channel.DeltaChannel(keys.split(",") if keys else None, chunks)
+    if session_id is not None:
+        session = await _owned_session(rt, session_id, tenant)
+        if session is None:
+            await websocket.close(code=4404, reason=f"Session {session_id} not found.")
+            return
+        await websocket.send_text(subscriber.snapshot(session_id, session.state))
+    turn: asyncio.Task | None = None
+
+    async def run_turn(work) -> None:
+        try:
+            async with rt.artifact_store.foreground():
+                await cancellation.guard(work)
+        except Exception as e:
+            # The turn failed (bad input, budget, deadline); the channel stays open for the next one.
+            await websocket.send_text(subscriber.error(getattr(e, "detail", None) or str(e), session_id))
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get("type")
+            if kind == "subscribe":
+                subscriber.subscribe(message.get("keys"), message.get("chunks"))
+                if session_id is not None:
+                    session = await rt.session_service.get_session(app_name=APP_NAME, user_id=USER_ID,
+                                                                   session_id=session_id)
+                    if session is not None:
+                        await websocket.send_text(subscriber.snapshot(session_id, session.state))
+            elif kind not in ("solve", "artifact"):
+                await websocket.send_text(subscriber.error(f"Unknown message type {kind!r}.", session_id))
+            elif turn is not None and not turn.done():
+                await websocket.send_text(subscriber.error("A turn is still running.", session_id))
+            elif kind == "solve" and not (message.get("text") or "").strip():
+                await websocket.send_text(subscriber.error("Send the problem as text.", session_id))
+            elif kind == "solve":
+                previous, session_id = session_id, uuid.uuid4().hex
+                turn = asyncio.create_task(run_turn(_channel_solve(
+                    rt, websocket, subscriber, previous, session_id, message["text"].strip(), tenant,
+                    bool(message.get("animate", False)))))
+            elif session_id is None:
+                await websocket.send_text(subscriber.error("No session yet; send a problem to solve first."))
+            else:
+                turn = asyncio.create_task(run_turn(_channel_artifact(
+                    rt, websocket, subscriber, session_id, message.get("name") or "")))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if turn is not None:
+            turn.cancel()
+            await asyncio.wait([turn])
+
+
+async def _channel_solve(rt: Runtime, websocket: WebSocket, subscriber: channel.DeltaChannel, previous: str | None,
+                         session_id: str, topic: str, tenant: str, animate: bool) -> None:
+    """One solve turn of the channel in a new session, seeded from the previous turn's session if it edits it."""
+    from google.genai import types
+
+    from math_agents import incremental
+
+    start = time.perf_counter()
+    state = dict(INITIAL_STATE, topic=topic, tenant=tenant, request_id=session_id, lazy_artifacts=not animate)
+    if previous is not None:
+        session = await _owned_session(rt, previous, tenant)
+        if session is not None:
+            state.update(incremental.seed(session.state, topic))
+    session = await rt.session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id,
+                                                      state=state)
+    await websocket.send_text(subscriber.snapshot(session_id, session.state))
+    content = types.Content(role="user", parts=[types.Part(text=f"Please solve and animate: {topic}")])
+    async for event in rt.solve_runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+        for frame in subscriber.event(session_id, event):
+            await websocket.send_text(frame)
+    session = await rt.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    subscriber.record_turn(session.state)
+    await websocket.send_text(subscriber.done(session_id, time.perf_counter() - start))
+
+
+async def _channel_artifact(rt: Runtime, websocket: WebSocket, subscriber: channel.DeltaChannel, session_id: str,
+                            name: str) -> None:
+    """Generates an artifact of the channel's session and sends the state it changed."""
+    start = time.perf_counter()
+    session = await rt.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    before = dict(session.state) if session is not None else {}
+    await rt.artifact_store.get(session_id, name)
+    session = await rt.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    changed = {key: value for key, value in session.state.items() if before.get(key) != value}
+    frame = subscriber.changes(session_id, "ArtifactStore", changed)
+    if frame is not None:
+        await websocket.send_text(frame)
+    subscriber.record_turn(session.state)
+    await websocket.send_text(subscriber.done(session_id, time.perf_counter() - start))
+
+
+@app.post("/sessions/{session_id}/render")
+async def render_session(request: Request, session_id: str, priority: int = 0, frame_start: int = render.FRAME_START,
+                         frame_end: int = render.FRAME_END, tenant: str = Depends(caller_tenant)) -> dict:
+    """Queues the Blender code of one of the caller's solve sessions for rendering, generating the code first if needed."""
+    from math_agents import blender_preflight
+
+    rt = await runtime()
+    if await _owned_session(rt, session_id, tenant) is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+    async with rt.artifact_store.foreground():
+        try:
+            blender_code = await cancellation.guard(rt.artifact_store.get(session_id, "blender_code"),
+                                                    request.is_disconnected)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    script = blender_preflight.script_code(blender_code["content"])
+    try:
+        job = render_scheduler.submit(script, session_id, priority, frame_start, frame_end)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return job.to_dict()
+
+
+def _render_job(job_id: str) -> render.RenderJob:
+    try:
+        return render_scheduler.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Render job {job_id} not found.")
+
+
+@app.get("/render/{job_id}")
+async def get_render_job(job_id: str) -> dict:
+    """Returns the status, progress and frame URLs of a render job."""
+    return _render_job(job_id).to_dict()
+
+
+@app.delete("/render/{job_id}")
+async def cancel_render_job(job_id: str) -> dict:
+    """Cancels the chunks of a render job that have not started."""
+    _render_job(job_id)
+    return render_scheduler.cancel(job_id).to_dict()
+
+
+@app.get("/render/{job_id}/frames/{name}")
+async def get_render_frame(job_id: str, name: str) -> FileResponse:
+    """Serves one rendered frame of a job."""
+    frame = next((path for path in _render_job(job_id).frames if path.name == name), None)
+    if frame is None:
+        raise HTTPException(status_code=404, detail=f"Frame {name} not rendered.")
+    return FileResponse(frame)
+
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    """Returns latency and counter snapshots for every component."""
+    snapshot = snapshot_all()
+    snapshot["artifacts_report"] = artifacts.report()
+    if _runtime is not None:
+        from math_agents import blender_preflight, cassette, domains, incremental
+
+        snapshot["blender_preflight_report"] = blender_preflight.report()
+        snapshot["cassette_report"] = cassette.report()
+        snapshot["domains_report"] = domains.report()
+        snapshot["incremental_report"] = incremental.report()
+        snapshot["sessions_report"] = _runtime.session_service.report()
+    snapshot["cancellation_report"] = cancellation.report()
+    snapshot["channel_report"] = channel.report()
+    snapshot["ledger_report"] = ledger.report()
+    del snapshot["ledger_report"]["by_tenant"]  # per tenant only through /ledger, to the tenant itself
+    snapshot["render_report"] = render.report()
+    snapshot["shared_cache_report"] = shared_cache.report()
+    return snapshot
+
+
+def _cost(request_id: str) -> dict | None:
+    """Tokens and estimated cost of a request so far, per stage."""
+    summary = ledger.get_ledger().request(request_id)
+    if summary is not None:
+        del summary["entries"]
+    return summary
+
+
+@app.exception_handler(ledger.BudgetExceededError)
+@app.exception_handler(ExceptionGroup)
+async def budget_exceeded(request: Request, error: Exception) -> JSONResponse:
+    """Answers 429 when a request or tenant budget is spent; other exception groups stay server errors."""
+    found = ledger.budget_error(error)
+    if found is None:
+        raise error
+    return JSONResponse(status_code=429, content={"detail": str(found), "scope": found.scope, "key": found.key,
+                                                  "spent_usd": found.spent, "budget_usd": found.budget})
+
+
+@app.exception_handler(artifacts.ArtifactUnavailableError)
+async def artifact_unavailable(request: Request, error: artifacts.ArtifactUnavailableError) -> JSONResponse:
+    """Answers 503 when generating an artifact produced nothing; asking again retries it."""
+    return JSONResponse(status_code=503, content={"detail": str(error), "name": error.name, "reason": error.reason})
+
+
+@app.exception_handler(cancellation.RequestCancelledError)
+async def request_cancelled(request: Request, error: cancellation.RequestCancelledError) -> JSONResponse:
+    """Answers 504 past the deadline; a disconnected client gets 499, which nobody reads."""
+    return JSONResponse(status_code=504 if error.reason == "deadline" else 499,
+                        content={"detail": str(error), "reason": error.reason})
+
+
+@app.get("/ledger")
+async def get_ledger_report(tenant: str = Depends(caller_tenant)) -> dict:
+    """Model calls, tokens and estimated cost by stage and model, with the budgets; by tenant only the caller's."""
+    report = ledger.report()
+    report["by_tenant"] = {key: totals for key, totals in report["by_tenant"].items() if key == tenant}
+    return report
+
+
+@app.get("/ledger/tenants/{name}")
+async def get_tenant_cost(name: str, tenant: str = Depends(caller_tenant)) -> dict:
+    """Totals of the caller's tenant and its spend in the current budget window; another tenant answers 404."""
+    summary = ledger.get_ledger().tenant(name) if name == tenant else None
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No model calls charged to tenant {name}.")
+    return summary
+
+
+@app.get("/ledger/requests/{request_id}")
+async def get_request_cost(request_id: str, tenant: str = Depends(caller_tenant)) -> dict:
+    """Totals of a request (a solve session id or worksheet id) per stage, with its calls; the caller's only."""
+    summary = ledger.get_ledger().request(request_id)
+    if summary is None or summary["tenant"] != tenant:
+        raise HTTPException(status_code=404, detail=f"No model calls charged to request {request_id}.")
+    return summary
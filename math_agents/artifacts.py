@@ -0,0 +1,252 @@
+"""Lazy, on-demand generation of the post-solution artifacts.
+
+Most clients only want the solution. With ``lazy_artifacts`` set in the
+session state, ``SupervisorAgent`` stops after solving and verifying, and the
+response carries handles for ``animation_story`` and ``blender_code``
+instead. ``ArtifactStore.get`` generates an artifact the first time a client
+asks for it. It runs the artifact's agent in the solve session, so the
+agent's ``output_key`` stores the result in session state and later requests
+read it from there. ``blender_code`` is built from the story's schema. If
+the story has not been generated yet, both come from one pipelined run (see
+``story.StoryPipelineAgent``).
+
+A session that edits an earlier problem patches that problem's artifacts
+instead, both in one run (see ``incremental.ArtifactPatchAgent``).
+
+Concurrent requests for the same artifact of a session share one generation
+(see ``singleflight.SingleFlight``). A generation that leaves the artifact
+empty, for instance because ``SupervisorAgent`` skipped it to stay within
+budget, raises ``ArtifactUnavailableError``; the next request tries again.
+
+Set MATH_AGENTS_PREFETCH=1 to also generate queued artifacts in the
+background. A background generation only starts once no foreground request
+has been active for ``IDLE_SECONDS``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
+from math_agents.config import APP_NAME, USER_ID
+from math_agents.metrics import get_stats
+from math_agents.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from google.adk.sessions import BaseSessionService
+
+
+logger = logging.getLogger(__name__)
+
+# The agent that generates each artifact, by its name in ``agent``. The
+# post-processing pipeline also generates the story when it is missing.
+ARTIFACTS = {
+    "animation_story": "animation_agent",
+    "blender_code": "post_processing_agent",
+}
+PATCH_AGENT = "artifact_patch_agent"  # patches the artifacts of an edited problem; see incremental.py
+IDLE_SECONDS = 0.5
+PREFETCH_QUEUE = 256
+
+# Background prefetch is off by default; set MATH_AGENTS_PREFETCH=1 to enable it.
+PREFETCH_ENABLED = os.environ.get("MATH_AGENTS_PREFETCH", "0") == "1"
+
+
+class ArtifactUnavailableError(RuntimeError):
+    """Generating an artifact produced nothing."""
+
+    def __init__(self, name: str, reason: str = ""):
+        super().__init__(f"Generating {name} produced nothing" + (f": {reason}." if reason else "."))
+        self.name = name
+        self.reason = reason
+
+
+def handles(session_id: str, state: dict) -> dict:
+    """Status and URL of each artifact of a solved session, for API responses."""
+    return {
+        name: {
+            "status": "ready" if state.get(name) else "pending",
+            "url": f"/sessions/{session_id}/artifacts/{name}",
+        }
+        for name in ARTIFACTS
+    }
+
+
+class ArtifactStore:
+    """Generates and serves the artifacts of solve sessions held by ``session_service``."""
+
+    def __init__(self, session_service: "BaseSessionService"):
+        from google.adk.runners import Runner
+
+        from math_agents import agent
+
+        self.session_service = session_service
+        self._runners = {
+            name: Runner(agent=getattr(agent, agent_name), app_name=APP_NAME, session_service=session_service)
+            for name, agent_name in ARTIFACTS.items()
+        }
+        self._patch_runner = Runner(agent=getattr(agent, PATCH_AGENT), app_name=APP_NAME,
+                                    session_service=session_service)
+        self._flights = SingleFlight("artifacts:singleflight")
+        self._stats = get_stats("artifacts")
+        self._active = 0
+        self._last_active = 0.0
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def _state(self, session_id: str) -> dict:
+        session = await self.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session.state
+
+    async def get(self, session_id: str, name: str, prefetch: bool = False) -> dict:
+        """Returns artifact ``name`` of a session, generating it on first request.
+
+        Args:
+            session_id (str): The solve session.
+            name (str): One of ``ARTIFACTS``.
+            prefetch (bool): Whether this is a background generation (for the counters).
+
+        Returns:
+            dict: ``{"name", "content", "generated", "elapsed_ms"}``; ``generated`` is False
+            when the artifact was already stored.
+
+        Raises:
+            KeyError: If the session does not exist.
+            ValueError: If ``name`` is unknown or the session has no solution.
+            ArtifactUnavailableError: If generation left the artifact empty.
+        """
+        if name not in ARTIFACTS:
+            raise ValueError(f"Unknown artifact {name!r}; expected one of {list(ARTIFACTS)}.")
+        start = time.perf_counter()
+        state = await self._state(session_id)
+        if not state.get("solution"):
+            raise ValueError("The session has no solution to animate.")
+        generated = False
+        if not state.get(name):
+            await self._flights.do(f"{session_id}:{name}", lambda: self._generate(session_id, name, prefetch),
+                                   label=name)
+            generated = True
+            state = await self._state(session_id)
+            if not state.get(name):
+                self._stats.incr(f"unavailable:{name}")
+                raise ArtifactUnavailableError(name, (state.get("budget") or {}).get("reason", ""))
+        else:
+            self._stats.incr(f"served:{name}")
+        return {"name": name, "content": state.get(name, ""), "generated": generated,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    async def _generate(self, session_id: str, name: str, prefetch: bool) -> None:
+        from google.genai import types
+
+        from math_agents import incremental
+
+        before = await self._state(session_id)
+        patch = incremental.can_patch(before)
+
+        async def run():
+            start = time.perf_counter()
+            runner = self._patch_runner if patch else self._runners[name]
+            content = types.Content(role="user", parts=[types.Part(text=f"Generate the {name.replace('_', ' ')}.")])
+            async for _ in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+                pass
+            self._stats.observe(f"{'patch' if patch else 'generate'}:{name}", time.perf_counter() - start)
+
+        if patch:
+            # One run patches both artifacts; a request for the other one meanwhile waits on it.
+            await self._flights.do(f"{session_id}:patch", run, label="patch")
+        elif name == "blender_code" and not before.get("animation_story"):
+            # The pipeline writes the story too; requests for the story meanwhile wait on it.
+            await self._flights.do(f"{session_id}:animation_story", run, label="animation_story")
+        else:
+            await run()
+        after = await self._state(session_id)
+        for generated in ARTIFACTS:
+            if after.get(generated) and not before.get(generated):
+                self._stats.incr(f"{'prefetched' if prefetch else 'on_demand'}:{generated}")
+        logger.info(f"Generated {name} for session {session_id} ({'prefetch' if prefetch else 'on demand'}).")
+
+    @asynccontextmanager
+    async def foreground(self):
+        """Marks a client request as active; background prefetch waits until none are."""
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._last_active = asyncio.get_running_loop().time()
+
+    def prefetch(self, session_id: str) -> None:
+        """Queues the artifacts of a session for generation when the system is idle."""
+        if not PREFETCH_ENABLED:
+            return
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(PREFETCH_QUEUE)
+            self._worker = asyncio.get_running_loop().create_task(self._prefetch_loop())
+        try:
+            self._queue.put_nowait(session_id)
+        except asyncio.QueueFull:
+            self._stats.incr("prefetch_dropped")
+
+    async def _wait_idle(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._active or loop.time() - self._last_active < IDLE_SECONDS:
+            await asyncio.sleep(IDLE_SECONDS)
+
+    async def _prefetch_loop(self) -> None:
+        while True:
+            session_id = await self._queue.get()
+            await self._wait_idle()
+            try:
+                # The last artifact's pipeline generates the others along with it.
+                await self.get(session_id, list(ARTIFACTS)[-1], prefetch=True)
+            except Exception as e:
+                logger.warning(f"Prefetching artifacts for session {session_id} failed: {e}")
+
+    async def stop(self) -> None:
+        """Cancels the background prefetch worker."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._worker = None
+
+    def report(self) -> dict:
+        return report()
+
+
+def report() -> dict:
+    """Per artifact: solves that deferred it, generations, and model time saved by not generating the rest.
+
+    Model time saved is estimated as the artifacts never generated times the
+    mean generation time of the ones that were.
+    """
+    stats = get_stats("artifacts")
+    counters = stats.counters
+    per_artifact, saved_seconds = {}, 0.0
+    for name in ARTIFACTS:
+        deferred = counters[f"deferred:{name}"]
+        generated = counters[f"on_demand:{name}"] + counters[f"prefetched:{name}"]
+        latency = stats.latency(f"generate:{name}")
+        skipped = max(0, deferred - generated)
+        saved = skipped * latency.get("mean_ms", 0.0) / 1000
+        saved_seconds += saved
+        per_artifact[name] = {
+            "deferred": deferred,
+            "on_demand": counters[f"on_demand:{name}"],
+            "prefetched": counters[f"prefetched:{name}"],
+            "served_stored": counters[f"served:{name}"],
+            "unavailable": counters[f"unavailable:{name}"],
+            "never_generated": skipped,
+            "request_rate": counters[f"on_demand:{name}"] / deferred if deferred else 0.0,
+            "generate": latency,
+            "patch": stats.latency(f"patch:{name}"),
+            "model_seconds_saved": saved,
+        }
+    return {"artifacts": per_artifact, "model_seconds_saved": saved_seconds,
+            "prefetch_dropped": counters["prefetch_dropped"]}
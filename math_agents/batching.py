@@ -0,0 +1,291 @@
+"""Micro-batching of small model calls made by many concurrent sessions.
+
+Under load, many sessions send a tiny ``DomainClassifyAgent`` request at the
+same moment, and each request pays its own prefill and round-trip overhead.
+``MicroBatcher`` collects the pending requests and sends them as one
+numbered, multi-item prompt. The reply is a JSON array, and each element is
+handed back to the session that asked.
+
+A batch is flushed when it reaches ``max_batch`` items or when its window
+closes. The window adapts to load. It tracks an exponential moving average of
+the gap between arrivals, and waits just long enough to fill a batch at that
+rate, up to ``max_window``. When arrivals are further apart than
+``max_window``, requests are sent immediately, so a lone request waits for
+nothing. While ``max_in_flight`` batches are already waiting on the model,
+new items keep accumulating and go out together as soon as one returns. This
+is what lets batch size grow with load once the model is the bottleneck.
+
+The batchers attach to agents as ``before_model_callback`` (see
+``batched_callback``). There is one batcher per agent and tenant (the
+``tenant`` state key): a batched prompt carries every item's text, so one
+tenant's problem could otherwise steer the answers given to another. A callback that returns a response replaces that
+agent's model call. If a batch fails, the callback returns None and the agent
+makes its normal call.
+
+A caller that is cancelled (its client disconnected, see ``cancellation``)
+leaves its batch. Items cancelled before their batch is sent are dropped,
+and a batch whose callers have all gone is cancelled mid-call.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from math_agents.domains import DOMAINS, parse_domains
+from math_agents.ledger import DEFAULT_TENANT
+from math_agents.metrics import get_stats
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 16
+MAX_WINDOW = 0.02  # seconds
+MAX_IN_FLIGHT = 4  # batches outstanding per batcher before new items are held back
+EWMA_ALPHA = 0.2
+SHORT_PROBLEM_CHARS = 160  # solver requests longer than this are never batched
+MAX_BATCHERS = 1000  # batchers kept per event loop; the least recently used is dropped beyond this
+
+# Classification is batched by default; set MATH_AGENTS_BATCHING=0 to disable.
+# Short solver requests are batched only with MATH_AGENTS_BATCH_SOLVERS=1.
+BATCHING_ENABLED = os.environ.get("MATH_AGENTS_BATCHING", "1") != "0"
+BATCH_SOLVERS = os.environ.get("MATH_AGENTS_BATCH_SOLVERS", "0") == "1"
+
+CLASSIFY_PROMPT = """You are a math domain classifier. Classify each numbered problem below into one or more of the following domains: {domains}.
+Respond with only a JSON array with one string per problem, in the same order. Each string names the problem's domains separated by commas, main domain first.
+
+{items}"""
+
+SOLVE_PROMPT = """You are a {domain} problem solver. Solve each numbered problem below and provide a step-by-step solution for each.
+Respond with only a JSON array of solution texts, one per problem, in the same order.
+
+{items}"""
+
+
+class MicroBatcher:
+    """Groups concurrent ``submit`` calls into batched ``handler`` calls.
+
+    Args:
+        name (str): Used for the metrics component ``batch:<name>``.
+        handler: ``async (list[item]) -> list[result]`` returning results in order.
+        max_batch (int): Flush as soon as this many items are pending.
+        max_window (float): Longest time in seconds an item waits for others.
+        max_in_flight (int): Outstanding batches before new items are held back.
+    """
+
+    def __init__(self, name: str, handler, max_batch: int = MAX_BATCH, max_window: float = MAX_WINDOW,
+                 max_in_flight: int = MAX_IN_FLIGHT):
+        self.name = name
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_window = max_window
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._pending: list[tuple[object, asyncio.Future, float]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._last_arrival: float | None = None
+        self._gap = max_window  # EWMA of the time between arrivals
+        self._stats = get_stats(f"batch:{name}")
+
+    def window(self) -> float:
+        """Current batching window: time to fill a batch at the observed arrival rate."""
+        if self._gap >= self.max_window:
+            return 0.0
+        return min(self.max_window, self._gap * (self.max_batch - 1))
+
+    async def submit(self, item):
+        """Queues ``item`` and waits for its result from the next batch."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._last_arrival is not None:
+            self._gap += EWMA_ALPHA * ((now - self._last_arrival) - self._gap)
+        self._last_arrival = now
+
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None and self._in_flight < self.max_in_flight:
+            window = self.window()
+            if window <= 0:
+                self._flush()
+            else:
+                self._timer = loop.call_later(window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Busy: hold the items; _run flushes them when a batch returns.
+        if self._in_flight >= self.max_in_flight:
+            return
+        live = [entry for entry in self._pending if not entry[1].cancelled()]
+        if len(live) < len(self._pending):
+            self._stats.incr("cancelled_items", len(self._pending) - len(live))
+            self._pending = live
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if batch:
+            self._in_flight += 1
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list[tuple[object, asyncio.Future, float]]) -> None:
+        try:
+            await self._call(batch)
+        finally:
+            self._in_flight -= 1
+            if self._pending:
+                self._flush()
+
+    async def _call(self, batch: list[tuple[object, asyncio.Future, float]]) -> None:
+        self._stats.incr("batches")
+        self._stats.incr("items", len(batch))
+        start = time.perf_counter()
+        for _, _, queued in batch:
+            self._stats.observe("wait", start - queued)
+        call = asyncio.ensure_future(self.handler([item for item, _, _ in batch]))
+
+        def abandon(_):
+            if all(future.cancelled() for _, future, _ in batch):
+                call.cancel()
+
+        for _, future, _ in batch:
+            future.add_done_callback(abandon)
+        try:
+            results = await call
+            if len(results) != len(batch):
+                raise ValueError(f"expected {len(batch)} results, got {len(results)}")
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # Every caller has gone; nobody needs the results.
+            self._stats.incr("abandoned_batches")
+            get_stats("cancellation").incr("batch_abandoned")
+            return
+        except Exception as e:
+            self._stats.incr("failed_batches")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._stats.observe("call", time.perf_counter() - start)
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def report(self) -> dict:
+        items, batches = self._stats.counters["items"], self._stats.counters["batches"]
+        return {
+            "items": items,
+            "batches": batches,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "window_ms": self.window() * 1000,
+            "cancelled_items": self._stats.counters["cancelled_items"],
+            "abandoned_batches": self._stats.counters["abandoned_batches"],
+            "wait": self._stats.latency("wait"),
+            "call": self._stats.latency("call"),
+        }
+
+
+# Batchers hold futures of one event loop, so there is one set per loop.
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OrderedDict]" = weakref.WeakKeyDictionary()
+
+
+def get_batcher(name: str, handler) -> MicroBatcher:
+    """Returns the batcher called ``name`` for the running loop, creating it with ``handler``.
+
+    Names carry the tenant, so at most ``MAX_BATCHERS`` are kept per loop. A
+    dropped batcher still finishes the batches it has pending or in flight:
+    its timer and tasks hold it, only new items go to a fresh one.
+    """
+    per_loop = _batchers.setdefault(asyncio.get_running_loop(), OrderedDict())
+    if name in per_loop:
+        per_loop.move_to_end(name)
+        return per_loop[name]
+    batcher = per_loop[name] = MicroBatcher(name, handler)
+    if len(per_loop) > MAX_BATCHERS:
+        per_loop.popitem(last=False)
+        get_stats("batching").incr("dropped_batchers")
+    return batcher
+
+
+def _numbered(items: list[str]) -> str:
+    return "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+
+
+def _parse_array(text: str) -> list[str]:
+    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    values = json.loads(text)
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError("batch reply is not a JSON array of strings")
+    return values
+
+
+async def _generate(agent: LlmAgent, prompt: str) -> str:
+    """Sends one prompt through the agent's own model, asking for a JSON array of strings."""
+    request = LlmRequest(
+        model=agent.canonical_model.model,
+        contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema={"type": "ARRAY", "items": {"type": "STRING"}},
+        ),
+    )
+    text = ""
+    async for response in agent.canonical_model.generate_content_async(request):
+        if response.content and response.content.parts:
+            text += "".join(part.text or "" for part in response.content.parts)
+    return text
+
+
+def _classify_handler(agent: LlmAgent):
+    async def handler(topics: list[str]) -> list[str]:
+        prompt = CLASSIFY_PROMPT.format(domains=", ".join(DOMAINS), items=_numbered(topics))
+        domains = [d.strip().lower() for d in _parse_array(await _generate(agent, prompt))]
+        if not all(parse_domains(d) for d in domains):
+            raise ValueError("a problem has no domain in the batch reply")
+        return domains
+    return handler
+
+
+def _solve_handler(agent: LlmAgent, domain: str):
+    async def handler(topics: list[str]) -> list[str]:
+        prompt = SOLVE_PROMPT.format(domain=domain, items=_numbered(topics))
+        return _parse_array(await _generate(agent, prompt))
+    return handler
+
+
+def batched_callback(agent: LlmAgent, kind: str, domain: str = ""):
+    """Builds a ``before_model_callback`` that answers ``agent``'s call from a shared batch.
+
+    Args:
+        agent (LlmAgent): The agent whose model serves the batched prompt.
+        kind (str): "classify" for the domain classifier, "solve" for a solver agent.
+        domain (str): The solver's domain, used in the batched solve prompt.
+    """
+    async def callback(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+        if not BATCHING_ENABLED or (kind == "solve" and not BATCH_SOLVERS):
+            return None
+        topic = (callback_context.state.get("topic") or "").strip()
+        if not topic or (kind == "solve" and len(topic) > SHORT_PROBLEM_CHARS):
+            return None
+        handler = _classify_handler(agent) if kind == "classify" else _solve_handler(agent, domain)
+        tenant = callback_context.state.get("tenant") or DEFAULT_TENANT
+        try:
+            text = await get_batcher(f"{kind}:{agent.name}:{tenant}", handler).submit(topic)
+        except Exception as e:
+            logger.warning(f"Batched {kind} call for {agent.name} failed ({e}); making a single call.")
+            return None
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    return callback
@@ -0,0 +1,531 @@
+"""Static pre-flight check of generated Blender scripts, with one targeted repair.
+
+The Blender prompts forbid a list of API mistakes. Examples are ``bpy.ops``
+calls and selection state, ``scene.eevee_next``, ``'BLENDER_EEVEE'``,
+keyframing a text body, and ``material.use_shadow``. A script that breaks one
+of these rules used to fail only in a Blender run, which then meant
+regenerating the whole script. ``check`` finds these mistakes without Blender.
+It parses the script once and walks the AST, and also reports syntax errors
+and names that are never defined. Each diagnostic gives its line, rule and
+fix.
+
+Scripts run on the render hosts, so the check also enforces what a scene
+script may touch, as allowlists rather than lists of known tricks. These are
+``SECURITY_RULES`` violations:
+
+- imports outside ``ALLOWED_IMPORTS``;
+- any ``bpy.ops`` use but the mesh ``primitive_*_add`` operators;
+- calls that run code or programs, and Blender hooks that load other Python
+  (``as_module``, ``driver_namespace``);
+- dunder names and attributes, and ``getattr``/``setattr`` with a name that
+  is not a plain constant;
+- file paths (``open``, ``*.load``, ``filepath`` and the like) that are not
+  plain relative paths inside the render's job directory.
+
+``unsafe`` returns only those, for callers such as ``render`` that must refuse
+the script rather than repair it.
+
+``BlenderPreflightAgent`` runs the check after the Blender code is generated.
+On diagnostics it makes a single repair call that covers only the top-level
+functions containing them, and splices the replies back into the script. A
+mistake outside any function, or a syntax error, sends the whole script.
+The helper functions of ``blender_sections.HELPER_API`` are checked like
+any other code.
+
+Set MATH_AGENTS_BLENDER_PREFLIGHT=0 to store scripts unchecked.
+"""
+
+import ast
+import builtins
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator
+from typing_extensions import override
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.events import Event, EventActions
+
+from math_agents.metrics import get_stats
+from math_agents.prompts import blender_repair_prompt
+
+
+logger = logging.getLogger(__name__)
+
+REPAIR_KEY = "temp:blender_repair"  # the code and diagnostics sent to the repair agent
+REPLY_KEY = "blender_repair"
+
+# The check is on by default; set MATH_AGENTS_BLENDER_PREFLIGHT=0 to disable it.
+PREFLIGHT_ENABLED = os.environ.get("MATH_AGENTS_BLENDER_PREFLIGHT", "1") != "0"
+
+# Rule -> how to fix it, as shown to the repair agent.
+RULES = {
+    "syntax": "the script does not parse",
+    "undefined-name": "define or import the name before using it",
+    "bpy-ops": "create datablocks with bpy.data.*.new() and link them; only mesh primitive_*_add operators are allowed",
+    "selection": "reference objects through variables or bpy.data.objects[name], not UI selection",
+    "eevee-next": "use scene.eevee; Scene has no attribute eevee_next",
+    "render-engine": "use 'BLENDER_EEVEE_NEXT', 'BLENDER_WORKBENCH' or 'CYCLES'",
+    "collection-contains": "use bpy.data.<collection>.get(name) is not None; `in` expects a datablock",
+    "shadow-method": "shadow_method was removed in Blender 4.x; set blend_method",
+    "material-use-shadow": "material.use_shadow was removed in Blender 4.x; drop it",
+    "keyframe-property": "keyframe only animatable properties (location, rotation_euler, scale, energy, lens, default_value)",
+    "keyframe-socket-path": 'call socket.keyframe_insert("default_value") on the node socket itself',
+    "keyframe-bool": 'call obj.keyframe_insert("hide_render") on the object, not on the boolean',
+    "import": "import only bpy, bmesh, mathutils, math, json, random, colorsys, itertools and functools",
+    "dangerous-call": "build the scene only; do not run code, programs or shell commands",
+    "dunder-attribute": "use the public API by name: no dunder names or attributes, no getattr/setattr with a computed name",
+    "file-access": "use only plain relative paths, which stay inside the render's job directory",
+}
+SECURITY_RULES = {"import", "bpy-ops", "dangerous-call", "dunder-attribute", "file-access"}
+
+ALLOWED_IMPORTS = {"bpy", "bmesh", "mathutils", "math", "json", "random", "colorsys", "itertools", "functools"}
+_DANGEROUS_CALLS = {"eval", "exec", "compile", "__import__", "globals", "locals", "vars", "breakpoint", "input"}
+_DANGEROUS_MODULES = {"os", "subprocess", "socket", "sys", "shutil"}
+_ATTRIBUTE_CALLS = {"getattr", "setattr", "delattr", "hasattr"}
+# bpy hooks that load or run other Python.
+_CODE_RUNNERS = {"driver_namespace", "execfile", "script_paths", "as_module", "python_file_run"}
+# Attributes and keyword arguments that name a file, and methods that read one.
+_PATH_NAMES = {"filepath", "filepath_raw", "filename", "directory", "path"}
+_PATH_METHODS = {"load", "save", "save_render", "save_as_mainfile"}
+_ALLOWED_DUNDERS = {"__name__", "__doc__", "__init__"}
+
+_ALLOWED_OPS = re.compile(r"bpy\.ops\.mesh\.primitive_\w+_add$")
+_UNANIMATABLE = {"body", "name", "active_material_index"}
+_BOOLEAN_PROPERTIES = {"hide_render", "hide_viewport", "hide_select"}
+_BUILTINS = set(dir(builtins)) | {"__name__", "__file__", "__doc__"}
+_CODE_BLOCK_RE = re.compile(r"```(?:python|py)?\s*\n(.*?)```", re.DOTALL)
+_UNITS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class Diagnostic:
+    """One rule violation in a script."""
+
+    rule: str
+    line: int
+    message: str
+    unit: str = ""  # the enclosing top-level function or class; "" for module-level code
+
+    def __str__(self) -> str:
+        return f"line {self.line}: [{self.rule}] {self.message}; fix: {RULES[self.rule]}"
+
+
+def script_code(text: str) -> str:
+    """The Python code of a model reply: its code blocks, or the text itself."""
+    blocks = _CODE_BLOCK_RE.findall(text or "")
+    return "\n".join(blocks) if blocks else (text or "")
+
+
+def _dotted(node: ast.AST) -> str:
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return ""
+
+
+def _data_path(call: ast.Call, position: int) -> str | None:
+    for keyword in call.keywords:
+        if keyword.arg == "data_path" and isinstance(keyword.value, ast.Constant):
+            return keyword.value.value if isinstance(keyword.value.value, str) else None
+    if len(call.args) > position and isinstance(call.args[position], ast.Constant):
+        value = call.args[position].value
+        return value if isinstance(value, str) else None
+    return None
+
+
+def _is_material(node: ast.AST) -> bool:
+    """Whether an expression evidently yields a material: a lookup in ``materials`` or a ``.material``."""
+    if isinstance(node, ast.BoolOp):
+        return any(_is_material(value) for value in node.values)
+    if isinstance(node, ast.Call):
+        func = _dotted(node.func)
+        return func.endswith(("materials.new", "materials.get")) or func == "make_material"
+    if isinstance(node, ast.Subscript):
+        return _dotted(node.value).endswith("materials")
+    return isinstance(node, ast.Attribute) and node.attr in ("material", "active_material")
+
+
+def _relative_path(node: ast.AST) -> bool:
+    """Whether ``node`` is a constant relative path that stays below the working directory.
+
+    Blender's ``//`` prefix (relative to the .blend file) counts as relative.
+    """
+    if not isinstance(node, ast.Constant) or not isinstance(node.value, str):
+        return False
+    path = node.value.removeprefix("//")
+    return not os.path.isabs(path) and ".." not in path.replace("\\", "/").split("/") \
+        and not path.startswith("~") and ":" not in path
+
+
+def _span(node: ast.AST) -> tuple[int, int]:
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+
+class _Checker(ast.NodeVisitor):
+    """One pass over the tree: rule violations, plus the names bound and loaded for the undefined-name check."""
+
+    def __init__(self):
+        self.unit = ""
+        self.diagnostics: list[Diagnostic] = []
+        self.bound: set[str] = set()
+        self.loaded: list[tuple[str, str, int]] = []
+        self.star_import = False
+        self.materials: set[tuple[str, str]] = set()  # (unit, name) of variables holding a material
+        self.modules: dict[str, str] = {}  # name bound by an import -> the module it names
+
+    def report(self, rule: str, node: ast.AST, message: str) -> None:
+        self.diagnostics.append(Diagnostic(rule, getattr(node, "lineno", 0), message, self.unit))
+
+    def undefined(self) -> list[Diagnostic]:
+        if self.star_import:
+            return []
+        seen, diagnostics = set(), []
+        for unit, name, line in self.loaded:
+            if name not in self.bound and name not in _BUILTINS and (unit, name) not in seen:
+                seen.add((unit, name))
+                diagnostics.append(Diagnostic("undefined-name", line, f"{name!r} is never defined", unit))
+        return diagnostics
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if node.id.startswith("__") and node.id.endswith("__") and node.id not in _ALLOWED_DUNDERS:
+            self.report("dunder-attribute", node, f"{node.id} reaches interpreter internals")
+        if isinstance(node.ctx, ast.Load):
+            self.loaded.append((self.unit, node.id, node.lineno))
+        else:
+            self.bound.add(node.id)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_arg(self, node: ast.arg) -> None:
+        self.bound.add(node.arg)
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        modules = [node.module or ""] if isinstance(node, ast.ImportFrom) else [alias.name for alias in node.names]
+        for module in modules:
+            if node.__dict__.get("level") or module.split(".")[0] not in ALLOWED_IMPORTS:
+                self.report("import", node, f"module {module or '.'!r} is not allowed in a scene script")
+        for alias in node.names:
+            self.star_import = self.star_import or alias.name == "*"
+            self.bound.add(alias.asname or alias.name.split(".")[0])
+            if isinstance(node, ast.ImportFrom):
+                module = f"{node.module}.{alias.name}"
+            else:
+                module = alias.name if alias.asname else alias.name.split(".")[0]
+            self.modules[alias.asname or alias.name.split(".")[0]] = module
+            if module.split(".")[:2] == ["bpy", "ops"]:
+                self.report("bpy-ops", node, f"importing {module} reaches every operator")
+
+    visit_ImportFrom = visit_Import
+
+    def _resolved(self, dotted: str) -> str:
+        """``dotted`` with its first name replaced by the module an import bound it to."""
+        head, _, rest = dotted.partition(".")
+        module = self.modules.get(head, head)
+        return f"{module}.{rest}" if rest else module
+
+    def _track_materials(self, targets: list[ast.AST]) -> None:
+        for target in targets:
+            if isinstance(target, ast.Name):
+                self.materials.add((self.unit, target.id))
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        if _is_material(node.value):
+            self._track_materials(node.targets)
+        for target in node.targets:
+            if isinstance(target, ast.Attribute) and target.attr in _PATH_NAMES and not _relative_path(node.value):
+                self.report("file-access", node, f"{ast.unparse(target)} may point outside the job directory")
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node: ast.AugAssign) -> None:
+        if isinstance(node.target, ast.Attribute) and node.target.attr in _PATH_NAMES:
+            self.report("file-access", node, f"{ast.unparse(node.target)} may point outside the job directory")
+        self.generic_visit(node)
+
+    def visit_For(self, node: ast.For) -> None:
+        if _dotted(node.iter).endswith("materials"):
+            self._track_materials([node.target])
+        self.generic_visit(node)
+
+    def _holds_material(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Name):
+            return (self.unit, node.id) in self.materials or "material" in node.id.lower()
+        return _is_material(node)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node: ast.Global) -> None:
+        self.bound.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        dotted = self._resolved(_dotted(node))
+        if dotted == "bpy.ops" or dotted.startswith("bpy.ops."):
+            if not _ALLOWED_OPS.match(dotted):
+                self.report("bpy-ops", node, f"{ast.unparse(node)} is an operator outside the mesh primitives")
+            return
+        if node.attr in ("active_object", "selected_objects"):
+            self.report("selection", node, f"{ast.unparse(node)} depends on UI selection")
+        elif node.attr == "eevee_next":
+            self.report("eevee-next", node, f"{ast.unparse(node)} does not exist")
+        elif node.attr == "shadow_method":
+            self.report("shadow-method", node, f"{ast.unparse(node)} does not exist")
+        elif node.attr == "use_shadow" and self._holds_material(node.value):
+            self.report("material-use-shadow", node, f"{ast.unparse(node)} does not exist")
+        elif node.attr.startswith("__") and node.attr.endswith("__") and node.attr not in _ALLOWED_DUNDERS:
+            self.report("dunder-attribute", node, f"{ast.unparse(node)} reaches interpreter internals")
+        elif node.attr in _CODE_RUNNERS:
+            self.report("dangerous-call", node, f"{ast.unparse(node)} runs Python outside the script")
+            return
+        elif dotted and self.modules.get(dotted.split(".")[0], "").split(".")[0] in _DANGEROUS_MODULES:
+            self.report("dangerous-call", node, f"{dotted} is outside what a scene script may use")
+        self.generic_visit(node)
+
+    @staticmethod
+    def _plain_attribute(node: ast.Call) -> bool:
+        """Whether a getattr-style call names a constant attribute that is safe to reach."""
+        if len(node.args) < 2 or not isinstance(node.args[1], ast.Constant) or not isinstance(node.args[1].value, str):
+            return False
+        name = node.args[1].value
+        return not name.startswith("__") and name not in _CODE_RUNNERS | _PATH_NAMES | {"ops"}
+
+    def visit_Constant(self, node: ast.Constant) -> None:
+        if node.value == "BLENDER_EEVEE":
+            self.report("render-engine", node, "'BLENDER_EEVEE' is not a valid render engine")
+
+    def visit_Compare(self, node: ast.Compare) -> None:
+        for op, comparator in zip(node.ops, node.comparators):
+            if (isinstance(op, (ast.In, ast.NotIn)) and _dotted(comparator).startswith("bpy.data.")
+                    and isinstance(node.left, ast.Constant) and isinstance(node.left.value, str)):
+                self.report("collection-contains", node, f"{ast.unparse(node)} tests a name against datablocks")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in _DANGEROUS_CALLS:
+            self.report("dangerous-call", node, f"{func.id}() can run arbitrary code")
+        elif isinstance(func, ast.Name) and func.id in _ATTRIBUTE_CALLS and not self._plain_attribute(node):
+            self.report("dunder-attribute", node, f"{ast.unparse(node)} may reach any attribute")
+        elif isinstance(func, ast.Name) and func.id == "open" and not (node.args and _relative_path(node.args[0])):
+            self.report("file-access", node, f"{ast.unparse(node)} may reach files outside the job directory")
+        elif (isinstance(func, ast.Attribute) and func.attr in _PATH_METHODS and node.args
+              and not _relative_path(node.args[0]) and not self._resolved(_dotted(func)).startswith("json.")):
+            self.report("file-access", node, f"{ast.unparse(node)} may reach files outside the job directory")
+        elif isinstance(func, ast.Name) and self.modules.get(func.id, "").split(".")[0] in _DANGEROUS_MODULES:
+            self.report("dangerous-call", node, f"{self.modules[func.id]} is outside what a scene script may use")
+        for keyword in node.keywords:
+            if keyword.arg in _PATH_NAMES and not _relative_path(keyword.value):
+                self.report("file-access", node, f"{keyword.arg}= may point outside the job directory")
+        path = None
+        if isinstance(func, ast.Attribute) and func.attr == "keyframe_insert":
+            path = _data_path(node, 0)
+            if isinstance(func.value, ast.Attribute) and func.value.attr in _BOOLEAN_PROPERTIES:
+                self.report("keyframe-bool", node, f"keyframe_insert called on the boolean {ast.unparse(func.value)}")
+        elif isinstance(func, ast.Name) and func.id == "keyframe":
+            path = _data_path(node, 1)
+        if path in _UNANIMATABLE:
+            self.report("keyframe-property", node, f"{path!r} is not animatable")
+        elif path and path.startswith(("inputs[", "nodes[")):
+            self.report("keyframe-socket-path", node, f"data path {path!r} is a string path to a socket")
+        self.generic_visit(node)
+
+
+def check(text: str) -> list[Diagnostic]:
+    """Statically checks a generated Blender script (or a model reply containing one).
+
+    Returns:
+        list[Diagnostic]: The violations in source order; empty when the script passes.
+    """
+    source = script_code(text)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return [Diagnostic("syntax", e.lineno or 0, e.msg)]
+    checker = _Checker()
+    for node in tree.body:
+        checker.unit = node.name if isinstance(node, _UNITS) else ""
+        checker.visit(node)
+    return sorted(checker.diagnostics + checker.undefined(), key=lambda d: d.line)
+
+
+def unsafe(text: str) -> list[Diagnostic]:
+    """The ``SECURITY_RULES`` violations of a script; none for a script that does not parse, as it cannot run."""
+    return [d for d in check(text) if d.rule in SECURITY_RULES]
+
+
+def _unit_nodes(tree: ast.Module) -> dict[str, ast.AST]:
+    return {node.name: node for node in tree.body if isinstance(node, _UNITS)}
+
+
+def repair_request(text: str, diagnostics: list[Diagnostic]) -> tuple[str, bool]:
+    """The code to send for repair: the flagged top-level functions, or the whole script.
+
+    Returns:
+        tuple[str, bool]: The code, and whether it is the whole script.
+    """
+    source = script_code(text)
+    if any(not d.unit for d in diagnostics):
+        return source, True
+    lines = source.splitlines()
+    nodes = _unit_nodes(ast.parse(source))
+    parts = []
+    for name in dict.fromkeys(d.unit for d in diagnostics):
+        start, end = _span(nodes[name])
+        parts.append("\n".join(lines[start - 1:end]))
+    return "\n\n\n".join(parts), False
+
+
+def splice(text: str, reply: str, whole_script: bool) -> str | None:
+    """Puts the repaired code of ``reply`` into the script ``text``; None if the reply is unusable.
+
+    Functions of the reply replace the top-level functions of the same name.
+    New helper functions go in front of the first replaced function.
+    """
+    code = script_code(reply)
+    try:
+        replies = _unit_nodes(ast.parse(code))
+    except SyntaxError:
+        return None
+    if whole_script:
+        return code
+    source = script_code(text)
+    lines = source.splitlines()
+    originals = _unit_nodes(ast.parse(source))
+    code_lines = code.splitlines()
+    replaced = [name for name in replies if name in originals]
+    if not replaced:
+        return None
+    added = [name for name in replies if name not in originals]
+    first = min(replaced, key=lambda name: originals[name].lineno)
+    for name in sorted(replaced, key=lambda name: originals[name].lineno, reverse=True):
+        start, end = _span(originals[name])
+        new_start, new_end = _span(replies[name])
+        new = code_lines[new_start - 1:new_end]
+        if name == first:
+            for extra in reversed(added):
+                extra_start, extra_end = _span(replies[extra])
+                new = code_lines[extra_start - 1:extra_end] + ["", ""] + new
+        lines[start - 1:end] = new
+    return "\n".join(lines) + "\n"
+
+
+def repair_instruction(context: ReadonlyContext) -> str:
+    """Instruction provider for the repair agent: the flagged code and its diagnostics."""
+    request = context.state.get(REPAIR_KEY) or {}
+    return blender_repair_prompt(request.get("code", ""), request.get("diagnostics", ""),
+                                 request.get("whole_script", False))
+
+
+def make_repair_agent(model) -> LlmAgent:
+    return LlmAgent(
+        name="BlenderRepairAgent",
+        model=model,
+        instruction=repair_instruction,
+        include_contents="none",  # the flagged code is in the instruction
+        output_key=REPLY_KEY,
+    )
+
+
+class BlenderPreflightAgent(BaseAgent):
+    """Runs ``code_agent``, checks the script it stores in ``blender_code``, and repairs it once if needed."""
+
+    code_agent: BaseAgent
+    repair_agent: LlmAgent
+
+    def __init__(self, name: str, code_agent: BaseAgent, repair_agent: LlmAgent):
+        super().__init__(name=name, code_agent=code_agent, repair_agent=repair_agent,
+                         sub_agents=[code_agent, repair_agent])
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    @override
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        async for event in self.code_agent.run_async(ctx):
+            yield event
+        script = ctx.session.state.get("blender_code") or ""
+        if not PREFLIGHT_ENABLED or not script:
+            return
+
+        stats = get_stats("blender_preflight")
+        stats.incr("scripts")
+        with stats.timer("check"):
+            diagnostics = check(script)
+        if not diagnostics:
+            stats.incr("clean")
+            yield self._state_event(ctx, {"blender_preflight": {"status": "clean", "diagnostics": []}})
+            return
+
+        stats.incr("flagged")
+        for diagnostic in diagnostics:
+            stats.incr(f"rule:{diagnostic.rule}")
+        logger.warning(f"[{self.name}] {len(diagnostics)} pre-flight diagnostics; repairing.")
+        code, whole_script = repair_request(script, diagnostics)
+        stats.incr("repair_whole" if whole_script else "repair_functions")
+        ctx.session.state[REPAIR_KEY] = {"code": code, "whole_script": whole_script,
+                                         "diagnostics": "\n".join(str(d) for d in diagnostics)}
+        start = time.perf_counter()
+        async for event in self.repair_agent.run_async(ctx):
+            yield event
+        stats.observe("repair", time.perf_counter() - start)
+
+        repaired = splice(script, ctx.session.state.get(REPLY_KEY) or "", whole_script)
+        remaining = check(repaired) if repaired is not None else diagnostics
+        if repaired is None or len(remaining) >= len(diagnostics):
+            stats.incr("unrepaired")
+            repaired, remaining = script, diagnostics
+        else:
+            stats.incr("repaired" if not remaining else "improved")
+            if script.lstrip().startswith("```"):
+                repaired = f"```python\n{repaired}```"
+        yield self._state_event(ctx, {
+            "blender_code": repaired,
+            "blender_preflight": {
+                "status": "clean" if not remaining else "flagged",
+                "repaired": repaired is not script,
+                "diagnostics": [str(d) for d in diagnostics],
+                "remaining": [str(d) for d in remaining],
+            },
+        })
+
+
+def report() -> dict:
+    """Scripts checked, diagnostics by rule, and the full regenerations avoided by targeted repair."""
+    stats = get_stats("blender_preflight")
+    counters = stats.counters
+    return {
+        "scripts": counters["scripts"],
+        "clean": counters["clean"],
+        "flagged": counters["flagged"],
+        "rules": {key.removeprefix("rule:"): value for key, value in counters.items() if key.startswith("rule:")},
+        "repaired": counters["repaired"],
+        "improved": counters["improved"],
+        "unrepaired": counters["unrepaired"],
+        "regenerations_avoided": counters["repaired"],
+        "regeneration_rate_avoided": stats.ratio("repaired", "scripts"),
+        "check": stats.latency("check"),
+        "repair": stats.latency("repair"),
+    }
@@ -0,0 +1,425 @@
+"""Blender scripts generated as parallel sections and stitched together locally.
+
+A monolithic Blender script is the longest single generation in the
+pipeline. ``SectionedBlenderAgent`` instead asks for six short sections
+concurrently (environment, characters, animation, lighting/materials, camera,
+compositing). Each section is written against the fixed ``HELPER_API``. Each
+section agent returns one function, ``build_<section>(ctx)``.
+
+``assemble`` stitches the sections into one script deterministically, with
+no model call:
+- the helper API,
+- the story schema as data,
+- each section's functions, with private helpers renamed per section so
+  names cannot collide,
+- a ``main()`` that runs the sections in a fixed order.
+
+A section that is missing or does not parse is replaced by a stub, so the
+script always runs.
+
+Without a story schema, with every section failed, or with
+MATH_AGENTS_BLENDER_SECTIONS=0, the single ``BlenderCodeAgent`` call is made
+instead.
+"""
+
+import ast
+import json
+import logging
+import os
+import re
+import time
+from typing import AsyncGenerator
+from typing_extensions import override
+
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.events import Event, EventActions
+
+from math_agents.metrics import get_stats
+from math_agents.prompts import blender_section_prompt
+from math_agents.story import StorySchema, schema_from_state
+
+
+logger = logging.getLogger(__name__)
+
+# Sections in script order, with the collection each one builds into.
+SECTIONS = {
+    "environment": "Environment",
+    "characters": "Characters",
+    "animation": "Characters",
+    "lighting_materials": "Lighting",
+    "camera": "Cameras",
+    "compositing": "Compositing",
+}
+STATE_PREFIX = "temp:blender_section_"  # replies only live for the invocation; see SectionedBlenderAgent
+
+# Sectioned generation is on by default; set MATH_AGENTS_BLENDER_SECTIONS=0 for one call.
+SECTIONS_ENABLED = os.environ.get("MATH_AGENTS_BLENDER_SECTIONS", "1") != "0"
+
+HELPER_API = '''import json
+import math
+
+import bmesh
+import bpy
+import mathutils
+
+FPS = 24
+
+
+def new_context(schema):
+    """Shared state passed to every build_<section>(ctx): the schema, objects by name, frame range."""
+    return {"schema": schema, "objects": {}, "frame_start": 1, "frame_end": 10 * FPS}
+
+
+def get_collection(name):
+    """Returns the collection called name, linked to the scene, creating it if needed."""
+    collection = bpy.data.collections.get(name)
+    if collection is None:
+        collection = bpy.data.collections.new(name)
+        bpy.context.scene.collection.children.link(collection)
+    return collection
+
+
+def clear_scene():
+    """Removes every object from the scene."""
+    for obj in list(bpy.context.view_layer.objects):
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+
+def _link(ctx, obj, collection):
+    for users in list(obj.users_collection):
+        users.objects.unlink(obj)
+    get_collection(collection).objects.link(obj)
+    ctx["objects"][obj.name] = obj
+    return obj
+
+
+def _primitive(kind, name):
+    """A new mesh of the given primitive kind, built with bmesh at the operators' default sizes."""
+    mesh = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    if kind == "plane":
+        bmesh.ops.create_grid(bm, x_segments=1, y_segments=1, size=2.0)
+    elif kind == "uv_sphere":
+        bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, radius=1.0)
+    elif kind == "cylinder":
+        bmesh.ops.create_cone(bm, cap_ends=True, segments=32, radius1=1.0, radius2=1.0, depth=2.0)
+    elif kind == "cone":
+        bmesh.ops.create_cone(bm, cap_ends=True, segments=32, radius1=1.0, radius2=0.0, depth=2.0)
+    elif kind == "torus":
+        ring = mathutils.Matrix.Translation((1.0, 0.0, 0.0)) @ mathutils.Matrix.Rotation(math.pi / 2, 4, "X")
+        verts = bmesh.ops.create_circle(bm, cap_ends=False, segments=12, radius=0.25, matrix=ring)["verts"]
+        edges = list({edge for vert in verts for edge in vert.link_edges})
+        bmesh.ops.spin(bm, geom=verts + edges, cent=(0, 0, 0), axis=(0, 0, 1), angle=2 * math.pi, steps=48,
+                       use_merge=True)
+    else:
+        bmesh.ops.create_cube(bm, size=2.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+
+def add_object(ctx, kind, name, location=(0, 0, 0), scale=(1, 1, 1), rotation=(0, 0, 0), collection="Props"):
+    """Adds a mesh primitive: kind is cube, plane, uv_sphere, cylinder, cone or torus."""
+    obj = bpy.data.objects.new(name, _primitive(kind, name))
+    obj.location = location
+    obj.rotation_euler = rotation
+    obj.scale = scale
+    return _link(ctx, obj, collection)
+
+
+def add_text(ctx, name, body, location=(0, 0, 0), size=1.0, collection="Props"):
+    """Adds a text object; animate its transform or material, never its body."""
+    curve = bpy.data.curves.new(name, type="FONT")
+    curve.body = body
+    curve.size = size
+    obj = bpy.data.objects.new(name, curve)
+    obj.location = location
+    return _link(ctx, obj, collection)
+
+
+def add_armature(ctx, name, location=(0, 0, 0), height=1.8, collection="Characters"):
+    """Adds a placeholder armature for a character of the given height, to parent its parts to."""
+    # Bones can only be added in edit mode, which needs operators; the rig keeps its height for later.
+    armature = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(name, armature)
+    obj.location = location
+    obj["height"] = height
+    return _link(ctx, obj, collection)
+
+
+def make_material(name, color=(0.8, 0.8, 0.8, 1.0), roughness=0.5, metallic=0.0, emission=0.0, alpha=1.0):
+    """Returns a Principled BSDF material; emission glows in the base color, alpha < 1 blends."""
+    material = bpy.data.materials.get(name) or bpy.data.materials.new(name)
+    material.use_nodes = True
+    bsdf = material.node_tree.nodes.get("Principled BSDF")
+    bsdf.inputs["Base Color"].default_value = color
+    bsdf.inputs["Roughness"].default_value = roughness
+    bsdf.inputs["Metallic"].default_value = metallic
+    bsdf.inputs["Emission Color"].default_value = color
+    bsdf.inputs["Emission Strength"].default_value = emission
+    bsdf.inputs["Alpha"].default_value = alpha
+    if alpha < 1.0:
+        material.blend_method = "BLEND"
+    return material
+
+
+def set_material(obj, material):
+    """Replaces the materials of a mesh or text object with material."""
+    if obj.data is not None and hasattr(obj.data, "materials"):
+        obj.data.materials.clear()
+        obj.data.materials.append(material)
+
+
+def find_objects(ctx, keyword):
+    """Objects built so far whose name contains keyword, case-insensitively."""
+    return [obj for name, obj in ctx["objects"].items() if keyword.lower() in name.lower()]
+
+
+def add_light(ctx, kind, name, location=(0, 0, 5), energy=1000.0, color=(1.0, 1.0, 1.0), collection="Lighting"):
+    """Adds a light: kind is SUN, AREA, SPOT or POINT."""
+    light = bpy.data.lights.new(name, type=kind)
+    light.energy = energy
+    light.color = color
+    obj = bpy.data.objects.new(name, light)
+    obj.location = location
+    return _link(ctx, obj, collection)
+
+
+def look_at(obj, target):
+    """Rotates obj so its -Z axis points at target (a location or an object)."""
+    location = target.location if hasattr(target, "location") else mathutils.Vector(target)
+    direction = location - obj.location
+    obj.rotation_euler = direction.to_track_quat("-Z", "Y").to_euler()
+
+
+def add_camera(ctx, name, location=(0, -10, 5), target=(0, 0, 0), lens=50.0, collection="Cameras"):
+    """Adds a camera looking at target and makes it the scene camera."""
+    camera = bpy.data.cameras.new(name)
+    camera.lens = lens
+    obj = bpy.data.objects.new(name, camera)
+    obj.location = location
+    _link(ctx, obj, collection)
+    look_at(obj, target)
+    bpy.context.scene.camera = obj
+    return obj
+
+
+def _assign(target, data_path, value):
+    """Sets one of the properties keyframe() animates; named explicitly, as render scripts may not setattr."""
+    if data_path == "location":
+        target.location = value
+    elif data_path == "rotation_euler":
+        target.rotation_euler = value
+    elif data_path == "scale":
+        target.scale = value
+    elif data_path == "energy":
+        target.energy = value
+    elif data_path == "lens":
+        target.lens = value
+    elif data_path == "default_value":
+        target.default_value = value
+    elif data_path == "hide_render":
+        target.hide_render = value
+    elif data_path == "hide_viewport":
+        target.hide_viewport = value
+    else:
+        raise AttributeError(f"{data_path!r} is not a property keyframe() animates")
+
+
+def keyframe(target, data_path, frame, value=None):
+    """Sets data_path to value (if given) and keys it at frame; unanimatable paths are skipped."""
+    try:
+        if value is not None:
+            _assign(target, data_path, value)
+        target.keyframe_insert(data_path=data_path, frame=frame)
+    except (TypeError, RuntimeError, AttributeError) as e:
+        print(f"Skipping keyframe {data_path} at {frame}: {e}")
+
+
+def keyframe_socket(socket, frame, value=None):
+    """Keys a material node socket's default_value at frame."""
+    try:
+        if value is not None:
+            socket.default_value = value
+        socket.keyframe_insert("default_value", frame=frame)
+    except (TypeError, RuntimeError) as e:
+        print(f"Skipping socket keyframe at {frame}: {e}")
+'''
+
+_HELPER_NAMES = {node.name for node in ast.parse(HELPER_API).body if isinstance(node, ast.FunctionDef)}
+_CODE_BLOCK_RE = re.compile(r"```(?:python|py)?\s*\n(.*?)```", re.DOTALL)
+
+
+def helper_reference() -> str:
+    """Signatures and first docstring lines of the public helpers, for the section prompts."""
+    lines = ["FPS = 24"]
+    for node in ast.parse(HELPER_API).body:
+        if isinstance(node, ast.FunctionDef) and not node.name.startswith("_"):
+            doc = (ast.get_docstring(node) or "").splitlines()[0]
+            lines.append(f"def {node.name}({ast.unparse(node.args)}):  # {doc}")
+    return "\n".join(lines)
+
+
+class _Rename(ast.NodeTransformer):
+    def __init__(self, names: dict[str, str]):
+        self.names = names
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        if node.id in self.names:
+            node.id = self.names[node.id]
+        return node
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
+        node.name = self.names.get(node.name, node.name)
+        self.generic_visit(node)
+        return node
+
+
+def _stub(section: str, reason: str) -> str:
+    return f"def build_{section}(ctx):\n    print({f'{section} section unavailable: {reason}'!r})\n"
+
+
+def section_code(section: str, text: str) -> tuple[str, str | None]:
+    """Extracts ``build_<section>`` and its helpers from a model reply.
+
+    Only top-level imports and function definitions are kept. Private helpers
+    are renamed to ``_<section>_<name>``.
+
+    Returns:
+        tuple[str, str | None]: The code, and the reason it was replaced by a stub (None if it was not).
+    """
+    blocks = _CODE_BLOCK_RE.findall(text or "")
+    source = "\n".join(blocks) if blocks else (text or "")
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return _stub(section, "syntax error"), f"syntax error: {e.msg} (line {e.lineno})"
+    entry = f"build_{section}"
+    body = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef))]
+    functions = {node.name for node in body if isinstance(node, ast.FunctionDef)}
+    if entry not in functions:
+        return _stub(section, f"no {entry}"), f"no {entry} function"
+    # A redefined helper would replace the shared one for every section.
+    body = [node for node in body if not (isinstance(node, ast.FunctionDef) and node.name in _HELPER_NAMES)]
+    renames = {name: f"_{section}_{name.lstrip('_')}" for name in functions - {entry} - _HELPER_NAMES}
+    module = _Rename(renames).visit(ast.Module(body=body, type_ignores=[]))
+    return ast.unparse(module) + "\n", None
+
+
+def assemble(sections: dict[str, str], schema: StorySchema) -> tuple[str, dict[str, str]]:
+    """Stitches section replies into one Blender script with a ``main()``.
+
+    Returns:
+        tuple[str, dict[str, str]]: The script, and the sections replaced by stubs with the reason.
+    """
+    parts, failed = [], {}
+    for section in SECTIONS:
+        code, error = section_code(section, sections.get(section, ""))
+        if error:
+            failed[section] = error
+        parts.append(f"# --- {section} ---\n{code}")
+    calls = "\n".join(f"    run_section(build_{section}, ctx)" for section in SECTIONS)
+    script = f'''"""Math animation scene, assembled from {len(SECTIONS)} generated sections."""
+
+{HELPER_API}
+
+SCHEMA = json.loads({json.dumps(schema.model_dump())!r})
+
+
+{chr(10).join(parts)}
+
+def run_section(build, ctx):
+    try:
+        build(ctx)
+    except Exception as e:
+        print(f"{{build.__name__}} failed: {{e}}")
+
+
+def main():
+    ctx = new_context(SCHEMA)
+    clear_scene()
+{calls}
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = ctx["frame_start"], ctx["frame_end"]
+
+
+if __name__ == "__main__":
+    main()
+'''
+    return script, failed
+
+
+def section_instruction(section: str):
+    """Instruction provider for one section agent: the section's task, the helper API and the schema."""
+    def instruction(context: ReadonlyContext) -> str:
+        return blender_section_prompt(section, SECTIONS[section], helper_reference(),
+                                      schema_from_state(context.state))
+    return instruction
+
+
+def make_section_agents(model) -> list[LlmAgent]:
+    """One LlmAgent per section, each writing its reply to ``temp:blender_section_<section>``."""
+    return [
+        LlmAgent(
+            name=f"Blender{''.join(word.title() for word in section.split('_'))}Agent",
+            model=model,
+            instruction=section_instruction(section),
+            include_contents="none",  # everything the section needs is in the instruction
+            output_key=STATE_PREFIX + section,
+        )
+        for section in SECTIONS
+    ]
+
+
+class SectionedBlenderAgent(BaseAgent):
+    """Generates the Blender script as parallel sections, falling back to ``single_agent``."""
+
+    sections_agent: ParallelAgent
+    single_agent: LlmAgent
+
+    def __init__(self, name: str, section_agents: list[LlmAgent], single_agent: LlmAgent):
+        sections_agent = ParallelAgent(name="BlenderSections", sub_agents=section_agents)
+        super().__init__(name=name, sections_agent=sections_agent, single_agent=single_agent,
+                         sub_agents=[sections_agent, single_agent])
+
+    @override
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        stats = get_stats("blender_sections")
+        schema = schema_from_state(ctx.session.state)
+        if not SECTIONS_ENABLED or schema is None:
+            with stats.timer("single"):
+                async for event in self.single_agent.run_async(ctx):
+                    yield event
+            return
+
+        start = time.perf_counter()
+        replies = dict.fromkeys(SECTIONS, "")
+        async for event in self.sections_agent.run_async(ctx):
+            # The session drops temp: keys when it appends the event, so the replies are read off the events.
+            for key, value in (event.actions.state_delta if event.actions else {}).items():
+                if key.startswith(STATE_PREFIX) and key.removeprefix(STATE_PREFIX) in replies:
+                    replies[key.removeprefix(STATE_PREFIX)] = value or ""
+            yield event
+        stats.observe("sections", time.perf_counter() - start)
+        if not any(replies.values()):
+            stats.incr("fallback")
+            logger.warning(f"[{self.name}] No section was generated; making a single Blender call.")
+            async for event in self.single_agent.run_async(ctx):
+                yield event
+            return
+
+        with stats.timer("assemble"):
+            script, failed = assemble(replies, schema)
+        for section, reason in failed.items():
+            stats.incr(f"failed:{section}")
+            logger.warning(f"[{self.name}] Section {section} replaced by a stub: {reason}")
+        stats.incr("scripts")
+        stats.observe("end_to_end", time.perf_counter() - start)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={"blender_code": script}),
+        )
@@ -0,0 +1,286 @@
+"""Pre-built Blender scene and character sections, keyed by story schema fields.
+
+Most stories reuse a handful of settings (stadium, classroom, racetrack,
+construction site) and character types (human, fantasy, anthropomorphic,
+object). For those, the ``environment`` and ``characters`` sections of a
+sectioned Blender script (see ``blender_sections``) come from this library
+instead of the model.
+
+The templates are parameterized at run time through ``ctx["schema"]``:
+- names, props and scale come from the story;
+- the code itself is fixed and written against ``blender_sections.HELPER_API``.
+
+The model still writes the problem-specific sections: animation, lighting,
+camera and compositing.
+
+``templated_callback`` answers a section agent's model call with the template
+when the schema matches. Set MATH_AGENTS_BLENDER_TEMPLATES=0 to always
+generate.
+"""
+
+import asyncio
+import logging
+import os
+import re
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from math_agents.metrics import get_stats
+from math_agents.story import StorySchema, schema_from_state
+
+
+logger = logging.getLogger(__name__)
+
+# Templates are used by default; set MATH_AGENTS_BLENDER_TEMPLATES=0 to disable.
+TEMPLATES_ENABLED = os.environ.get("MATH_AGENTS_BLENDER_TEMPLATES", "1") != "0"
+
+# Props named in setting.environment that a template does not build are added as labelled blocks.
+_PROPS = '''
+def _props(ctx, built, origin=(-8, 8, 0)):
+    for index, prop in enumerate(ctx["schema"]["setting"]["environment"]):
+        if any(word in prop.lower() for word in built):
+            continue
+        x, y, _ = origin
+        add_object(ctx, "cube", prop.title(), location=(x + 2.5 * index, y, 0.5), scale=(0.8, 0.8, 0.5),
+                   collection="Environment")
+
+
+def _visuals(ctx, height=4.0):
+    for index, visual in enumerate(ctx["schema"]["key_visuals"]):
+        add_text(ctx, f"Visual {index + 1}", visual, location=(-4, 0, height + 0.8 * index), size=0.45,
+                 collection="Environment")
+
+
+def _scale(ctx):
+    return {"stadium-scale": 3.0, "human-scale": 1.0}.get(ctx["schema"]["quality_cues"]["environment_scale"], 1.5)
+'''
+
+SETTING_TEMPLATES = {
+    "stadium": _PROPS + '''
+
+def build_environment(ctx):
+    s = _scale(ctx)
+    pitch = add_object(ctx, "plane", "Pitch Grass", scale=(30 * s, 20 * s, 1), collection="Environment")
+    set_material(pitch, make_material("Grass", color=(0.12, 0.45, 0.12, 1.0), roughness=0.9))
+    stands = make_material("Stands Concrete", color=(0.55, 0.55, 0.58, 1.0))
+    for side in (-1, 1):
+        for row in range(4):
+            stand = add_object(ctx, "cube", f"Stand {side} {row}", location=(0, side * (22 + 2 * row) * s, 1 + row * 1.5),
+                               scale=(30 * s, 1.0, 0.75 + row * 0.75), collection="Environment")
+            set_material(stand, stands)
+    for corner, (x, y) in enumerate(((-1, -1), (-1, 1), (1, -1), (1, 1))):
+        add_object(ctx, "cylinder", f"Floodlight Pole {corner}", location=(x * 32 * s, y * 24 * s, 12),
+                   scale=(0.3, 0.3, 12), collection="Environment")
+    board = add_object(ctx, "cube", "Scoreboard", location=(0, 26 * s, 10), scale=(8, 0.3, 3), collection="Environment")
+    set_material(board, make_material("Scoreboard LED", color=(0.05, 0.05, 0.08, 1.0), emission=0.5))
+    _props(ctx, ("pitch", "stand", "crowd", "scoreboard", "floodlight", "grass"))
+    _visuals(ctx, height=6.0)
+''',
+    "classroom": _PROPS + '''
+
+def build_environment(ctx):
+    floor = add_object(ctx, "plane", "Classroom Floor", scale=(10, 8, 1), collection="Environment")
+    set_material(floor, make_material("Wood Floor", color=(0.45, 0.3, 0.18, 1.0), roughness=0.7))
+    walls = make_material("Classroom Wall", color=(0.85, 0.82, 0.75, 1.0))
+    for name, location, scale in (("Back Wall", (0, 8, 3), (10, 0.1, 3)), ("Left Wall", (-10, 0, 3), (0.1, 8, 3)),
+                                  ("Right Wall", (10, 0, 3), (0.1, 8, 3))):
+        set_material(add_object(ctx, "cube", name, location=location, scale=scale, collection="Environment"), walls)
+    board = add_object(ctx, "cube", "Blackboard", location=(0, 7.85, 3), scale=(5, 0.05, 1.5), collection="Environment")
+    set_material(board, make_material("Chalkboard", color=(0.05, 0.15, 0.08, 1.0), roughness=0.95))
+    desk = make_material("Desk Wood", color=(0.6, 0.42, 0.25, 1.0))
+    for row in range(3):
+        for column in range(4):
+            top = add_object(ctx, "cube", f"Desk {row} {column}", location=(-6 + 4 * column, -1 - 3 * row, 0.75),
+                             scale=(0.8, 0.5, 0.05), collection="Environment")
+            set_material(top, desk)
+    _props(ctx, ("board", "desk", "wall", "floor", "chalk"))
+    _visuals(ctx, height=3.0)
+''',
+    "racetrack": _PROPS + '''
+
+def build_environment(ctx):
+    s = _scale(ctx)
+    track = add_object(ctx, "torus", "Track Asphalt", scale=(25 * s, 15 * s, 0.05), collection="Environment")
+    set_material(track, make_material("Asphalt", color=(0.08, 0.08, 0.09, 1.0), roughness=0.85))
+    infield = add_object(ctx, "plane", "Infield Grass", scale=(60 * s, 40 * s, 1), location=(0, 0, -0.05),
+                         collection="Environment")
+    set_material(infield, make_material("Grass", color=(0.15, 0.42, 0.14, 1.0), roughness=0.9))
+    line = add_object(ctx, "plane", "Start Line", location=(25 * s, 0, 0.06), scale=(1.2, 0.2, 1), collection="Environment")
+    set_material(line, make_material("Painted Lines", color=(0.95, 0.95, 0.95, 1.0)))
+    stand = add_object(ctx, "cube", "Grandstand", location=(0, -22 * s, 2), scale=(20 * s, 2, 2), collection="Environment")
+    set_material(stand, make_material("Grandstand Metal", color=(0.6, 0.6, 0.65, 1.0), metallic=0.6))
+    _props(ctx, ("track", "asphalt", "grass", "line", "stand"))
+    _visuals(ctx, height=5.0)
+''',
+    "construction site": _PROPS + '''
+
+def build_environment(ctx):
+    ground = add_object(ctx, "plane", "Site Ground", scale=(15, 15, 1), collection="Environment")
+    set_material(ground, make_material("Dirt", color=(0.35, 0.27, 0.18, 1.0), roughness=1.0))
+    wall = add_object(ctx, "cube", "Wall", location=(0, 3, 2.5), scale=(4, 0.25, 2.5), collection="Environment")
+    set_material(wall, make_material("Concrete Wall", color=(0.6, 0.6, 0.58, 1.0), roughness=0.8))
+    metal = make_material("Metal Ladder", color=(0.7, 0.7, 0.72, 1.0), metallic=0.9, roughness=0.3)
+    tilt = 0.35
+    for side in (-0.3, 0.3):
+        rail = add_object(ctx, "cylinder", f"Ladder Rail {side}", location=(side, 1.9, 2.2), rotation=(tilt, 0, 0),
+                          scale=(0.04, 0.04, 2.4), collection="Environment")
+        set_material(rail, metal)
+    for rung in range(8):
+        step = add_object(ctx, "cylinder", f"Ladder Rung {rung}", location=(0, 1.1 + 0.19 * rung, 0.4 + 0.55 * rung),
+                          rotation=(0, 1.5708, 0), scale=(0.03, 0.03, 0.3), collection="Environment")
+        set_material(step, metal)
+    for level in range(3):
+        add_object(ctx, "cube", f"Scaffold {level}", location=(6, 3, 1 + 2 * level), scale=(1.5, 1, 0.05),
+                   collection="Environment")
+    _props(ctx, ("ladder", "wall", "scaffold", "ground", "dirt"))
+    _visuals(ctx, height=5.5)
+''',
+}
+
+# Words in setting.location that select each setting template.
+SETTING_ALIASES = {
+    "stadium": ("stadium", "pitch", "arena", "cricket ground", "football field", "court"),
+    "classroom": ("classroom", "class room", "school", "lecture hall"),
+    "racetrack": ("racetrack", "race track", "circuit", "speedway", "track"),
+    "construction site": ("construction", "building site", "site", "scaffold"),
+}
+
+CHARACTER_TEMPLATES = {
+    "human": '''
+def _build_human(ctx, character, x):
+    name = character["name"]
+    skin = make_material(f"{name} Skin", color=(0.85, 0.65, 0.5, 1.0), roughness=0.6)
+    cloth = make_material(f"{name} Clothes", color=(0.2, 0.35, 0.7, 1.0), roughness=0.8)
+    set_material(add_object(ctx, "cylinder", name, location=(x, 0, 0.95), scale=(0.28, 0.2, 0.5),
+                            collection="Characters"), cloth)
+    set_material(add_object(ctx, "uv_sphere", f"{name} head", location=(x, 0, 1.7), scale=(0.2, 0.2, 0.22),
+                            collection="Characters"), skin)
+    for side in (-1, 1):
+        set_material(add_object(ctx, "cylinder", f"{name} leg {side}", location=(x + 0.12 * side, 0, 0.35),
+                                scale=(0.08, 0.08, 0.35), collection="Characters"), cloth)
+        set_material(add_object(ctx, "cylinder", f"{name} arm {side}", location=(x + 0.38 * side, 0, 1.05),
+                                scale=(0.06, 0.06, 0.35), collection="Characters"), skin)
+    add_armature(ctx, f"{name} rig", location=(x, 0, 0), height=1.8)
+''',
+    "fantasy": '''
+def _build_fantasy(ctx, character, x):
+    name = character["name"]
+    glow = make_material(f"{name} Glow", color=(0.55, 0.7, 1.0, 1.0), emission=4.0)
+    robe = make_material(f"{name} Robe", color=(0.3, 0.15, 0.5, 1.0), roughness=0.5)
+    set_material(add_object(ctx, "cone", name, location=(x, 0, 1.4), scale=(0.45, 0.45, 0.8),
+                            collection="Characters"), robe)
+    set_material(add_object(ctx, "uv_sphere", f"{name} head", location=(x, 0, 2.35), scale=(0.22, 0.22, 0.22),
+                            collection="Characters"), robe)
+    set_material(add_object(ctx, "torus", f"{name} aura", location=(x, 0, 2.7), scale=(0.3, 0.3, 0.05),
+                            collection="Characters"), glow)
+    add_armature(ctx, f"{name} rig", location=(x, 0, 0.6), height=2.0)
+''',
+    "anthropomorphic": '''
+def _build_anthropomorphic(ctx, character, x):
+    name = character["name"]
+    body = make_material(f"{name} Body", color=(0.9, 0.55, 0.15, 1.0), roughness=0.4)
+    eye = make_material(f"{name} Eyes", color=(0.02, 0.02, 0.02, 1.0), roughness=0.2)
+    set_material(add_object(ctx, "cube", name, location=(x, 0, 0.8), scale=(0.45, 0.35, 0.6),
+                            collection="Characters"), body)
+    for side in (-1, 1):
+        set_material(add_object(ctx, "uv_sphere", f"{name} eye {side}", location=(x + 0.17 * side, -0.36, 1.1),
+                                scale=(0.08, 0.04, 0.08), collection="Characters"), eye)
+        set_material(add_object(ctx, "cylinder", f"{name} leg {side}", location=(x + 0.2 * side, 0, 0.1),
+                                scale=(0.07, 0.07, 0.12), collection="Characters"), body)
+    add_armature(ctx, f"{name} rig", location=(x, 0, 0), height=1.4)
+''',
+    "object": '''
+def _build_object(ctx, character, x):
+    name = character["name"]
+    shell = make_material(f"{name} Finish", color=(0.75, 0.75, 0.8, 1.0), metallic=0.7, roughness=0.3)
+    set_material(add_object(ctx, "cube", name, location=(x, 0, 0.5), scale=(0.5, 0.5, 0.5),
+                            collection="Characters"), shell)
+''',
+}
+
+# Character types the model may use for the same template.
+CHARACTER_ALIASES = {
+    "human": ("human", "person", "student", "athlete"),
+    "fantasy": ("fantasy", "wizard", "spirit", "mentor"),
+    "anthropomorphic": ("anthropomorphic", "animal", "creature", "robot"),
+    "object": ("object", "vehicle", "car", "prop"),
+}
+
+_CHARACTERS_ENTRY = '''
+
+def build_characters(ctx):
+    builders = {builders}
+    characters = ctx["schema"]["characters"]
+    for index, character in enumerate(characters):
+        x = (index - (len(characters) - 1) / 2) * 2.0
+        builders[character["type"].strip().lower()](ctx, character, x)
+'''
+
+
+def _lookup(value: str, aliases: dict[str, tuple[str, ...]]) -> str | None:
+    """The key whose alias appears in ``value`` as a whole word (or its plural), or None."""
+    value = value.strip().lower()
+    if value in aliases:
+        return value
+    for key, words in aliases.items():
+        if any(re.search(rf"\b{re.escape(word)}s?\b", value) for word in words):
+            return key
+    return None
+
+
+def environment_template(schema: StorySchema) -> str | None:
+    """The environment section for the schema's setting, or None when no template matches."""
+    key = _lookup(schema.setting.location, SETTING_ALIASES)
+    return SETTING_TEMPLATES[key] if key else None
+
+
+def characters_template(schema: StorySchema) -> str | None:
+    """The characters section when every character's type has a template, else None."""
+    if not schema.characters:
+        return None
+    types_ = {character.type.strip().lower(): _lookup(character.type, CHARACTER_ALIASES)
+              for character in schema.characters}
+    if None in types_.values():
+        return None
+    kinds = sorted(set(types_.values()))
+    builders = "{" + ", ".join(f"{given!r}: _build_{kind}" for given, kind in sorted(types_.items())) + "}"
+    return "".join(CHARACTER_TEMPLATES[kind] for kind in kinds) + _CHARACTERS_ENTRY.format(builders=builders)
+
+
+TEMPLATES = {
+    "environment": environment_template,
+    "characters": characters_template,
+}
+
+
+def template_for(section: str, schema: StorySchema | None) -> str | None:
+    """The pre-built code for ``section`` under ``schema``, or None when it must be generated."""
+    if not TEMPLATES_ENABLED or schema is None or section not in TEMPLATES:
+        return None
+    return TEMPLATES[section](schema)
+
+
+def templated_callback(section: str, inner=None):
+    """Builds a ``before_model_callback`` that answers a section agent from the template library.
+
+    Args:
+        section (str): The section the agent writes.
+        inner: The agent's previous ``before_model_callback``, used when no template matches.
+    """
+    async def callback(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+        code = template_for(section, schema_from_state(callback_context.state))
+        stats = get_stats("blender_templates")
+        if code is None:
+            stats.incr(f"generated:{section}")
+            if inner is None:
+                return None
+            response = inner(callback_context=callback_context, llm_request=llm_request)
+            return await response if asyncio.iscoroutine(response) else response
+        stats.incr(f"templated:{section}")
+        stats.incr("templated_chars", len(code))
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=code)]))
+
+    return callback
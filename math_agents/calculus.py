@@ -0,0 +1,555 @@
+"""Local symbolic calculus engine with an expression-level memo cache.
+
+Derivatives, antiderivatives, definite integrals and limits of standard
+expressions are computed on canonical expression trees (see ``expr``). Every
+rule application is memoized on ``(tree, variable)``, so a sub-expression that
+was already differentiated or integrated for an earlier request is reused, not
+recomputed. Results carry the rule applications as numbered steps, in the same
+``{"status", "steps", "answer"}`` shape the solver tools return.
+
+``solve`` returns None for inputs the engine does not support; callers then
+fall back to the LLM and record the fallback in ``metrics.get_stats("calculus")``.
+"""
+
+import math
+import re
+from fractions import Fraction
+from functools import lru_cache
+
+from math_agents import expr as E
+from math_agents.expr import ONE, ZERO, MINUS_ONE, ParseError
+
+
+CACHE_SIZE = 16384
+# Grid intervals on which a definite integral's integrand is checked (even, for Simpson's rule).
+INTERVAL_SAMPLES = 256
+
+_DERIVATIVE_RE = re.compile(
+    r"^(?:find\s+|compute\s+|what\s+is\s+)?(?:the\s+)?(?:(?:first\s+)?derivative\s+of|differentiate|d/d(?P<dvar>[a-z]))\s*(?:of\s+)?"
+    r"(?P<expr>.+?)(?:\s+(?:with\s+respect\s+to|w\.?r\.?t\.?)\s+(?P<var>[a-z]))?\s*[.?]?$",
+    re.IGNORECASE,
+)
+_INTEGRAL_RE = re.compile(
+    r"^(?:find\s+|compute\s+|evaluate\s+|what\s+is\s+)?(?:the\s+)?(?:(?:indefinite|definite)\s+)?(?:integral\s+of|integrate|antiderivative\s+of|∫)\s*"
+    r"(?P<expr>.+?)(?:\s*d(?P<dvar>[a-z]))?(?:\s+(?:from|between)\s+(?P<lo>\S+)\s+(?:to|and)\s+(?P<hi>[^\s?]+?))?"
+    r"(?:\s+(?:with\s+respect\s+to|w\.?r\.?t\.?)\s+(?P<var>[a-z]))?\s*[.?]?$",
+    re.IGNORECASE,
+)
+_LIMIT_RE = re.compile(
+    r"^(?:find\s+|compute\s+|evaluate\s+|what\s+is\s+)?(?:the\s+)?(?:limit\s+of|lim)\s*(?P<expr>.+?)\s+as\s+(?P<var>[a-z])\s*"
+    r"(?:->|→|approaches|tends\s+to|goes\s+to)\s*(?P<point>[^\s?]+?)\s*[.?]?$",
+    re.IGNORECASE,
+)
+_LIMIT_PREFIX_RE = re.compile(
+    r"^(?:lim(?:it)?)\s*\(?\s*(?P<var>[a-z])\s*(?:->|→)\s*(?P<point>[^\s)]+)\s*\)?\s*(?:of\s+)?(?P<expr>.+?)\s*[.?]?$",
+    re.IGNORECASE,
+)
+
+
+class Unsupported(Exception):
+    """Raised internally when an expression is outside what the engine handles."""
+
+
+def _s(tree) -> str:
+    return E.to_str(tree)
+
+
+def _dedupe(steps) -> tuple:
+    seen, out = set(), []
+    for step in steps:
+        if step not in seen:
+            seen.add(step)
+            out.append(step)
+    return tuple(out)
+
+
+# --- Differentiation ---
+
+def _fn_derivative(name: str, u) -> tuple:
+    """Returns d/du of ``name(u)``."""
+    table = {
+        "sin": lambda: E.fn("cos", u),
+        "cos": lambda: E.neg(E.fn("sin", u)),
+        "tan": lambda: E.power(E.fn("cos", u), E.num(-2)),
+        "sec": lambda: E.mul(E.fn("sec", u), E.fn("tan", u)),
+        "csc": lambda: E.neg(E.mul(E.fn("csc", u), E.fn("cot", u))),
+        "cot": lambda: E.neg(E.power(E.fn("sin", u), E.num(-2))),
+        "arcsin": lambda: E.power(E.sub(ONE, E.power(u, E.num(2))), E.num(Fraction(-1, 2))),
+        "arccos": lambda: E.neg(E.power(E.sub(ONE, E.power(u, E.num(2))), E.num(Fraction(-1, 2)))),
+        "arctan": lambda: E.power(E.add(ONE, E.power(u, E.num(2))), MINUS_ONE),
+        "sinh": lambda: E.fn("cosh", u),
+        "cosh": lambda: E.fn("sinh", u),
+        "tanh": lambda: E.power(E.fn("cosh", u), E.num(-2)),
+        "exp": lambda: E.fn("exp", u),
+        "ln": lambda: E.power(u, MINUS_ONE),
+        "log": lambda: E.power(E.mul(u, E.fn("ln", E.num(10))), MINUS_ONE),
+    }
+    if name not in table:
+        raise Unsupported(f"no derivative rule for {name}")
+    return table[name]()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def differentiate(tree, var: str) -> tuple[tuple, tuple]:
+    """Returns ``(derivative, steps)`` of ``tree`` with respect to ``var``.
+
+    Memoized on the canonical tree, so shared sub-expressions across requests
+    are differentiated once.
+
+    Raises:
+        Unsupported: If a function has no derivative rule.
+    """
+    kind = tree[0]
+    d = f"d/d{var}"
+    if not E.depends_on(tree, var):
+        return ZERO, ()
+    if kind == "var":
+        return ONE, ()
+
+    if kind == "add":
+        results = [differentiate(term, var) for term in tree[1]]
+        derivative = E.add(*(r[0] for r in results))
+        steps = [f"Sum rule: {d}[{_s(tree)}] is the sum of the derivatives of each term."]
+        for r in results:
+            steps.extend(r[1])
+        return derivative, _dedupe(steps)
+
+    if kind == "mul":
+        constants = [f for f in tree[1] if not E.depends_on(f, var)]
+        if constants:
+            rest = E.mul(*(f for f in tree[1] if E.depends_on(f, var)))
+            constant = E.mul(*constants)
+            inner, inner_steps = differentiate(rest, var)
+            derivative = E.mul(constant, inner)
+            step = f"Constant multiple rule: {d}[{_s(tree)}] = {_s(constant)} * {d}[{_s(rest)}] = {_s(derivative)}"
+            return derivative, _dedupe(inner_steps + (step,))
+        factors = tree[1]
+        first, second = factors[0], E.mul(*factors[1:])
+        d_first, s_first = differentiate(first, var)
+        d_second, s_second = differentiate(second, var)
+        derivative = E.add(E.mul(d_first, second), E.mul(first, d_second))
+        top, bottom = E.numer_denom(tree)
+        if not E.is_num(bottom, 1) and E.depends_on(bottom, var):
+            rule = f"Quotient rule (as a product with {_s(bottom)}^-1)"
+        else:
+            rule = "Product rule"
+        step = (f"{rule}: {d}[{_s(first)} * {_s(second)}] = ({_s(d_first)})*({_s(second)}) + "
+                f"({_s(first)})*({_s(d_second)}) = {_s(derivative)}")
+        return derivative, _dedupe(s_first + s_second + (step,))
+
+    if kind == "pow":
+        base, exponent = tree[1], tree[2]
+        if not E.depends_on(exponent, var):
+            outer = E.mul(exponent, E.power(base, E.sub(exponent, ONE)))
+            if base == ("var", var):
+                step = f"Power rule: {d}[{_s(tree)}] = {_s(exponent)}*{var}^{E._wrap(E.sub(exponent, ONE))} = {_s(outer)}"
+                return outer, (step,)
+            d_base, base_steps = differentiate(base, var)
+            derivative = E.mul(outer, d_base)
+            step = (f"Chain rule with the power rule: let u = {_s(base)}, so {d}[u^{E._wrap(exponent)}] = "
+                    f"{_s(exponent)}*u^{E._wrap(E.sub(exponent, ONE))} * u' = {_s(derivative)}")
+            return derivative, _dedupe(base_steps + (step,))
+        if not E.depends_on(base, var):
+            d_exponent, exp_steps = differentiate(exponent, var)
+            derivative = E.mul(tree, E.fn("ln", base), d_exponent)
+            step = f"Exponential rule: {d}[a^u] = a^u * ln(a) * u', so {d}[{_s(tree)}] = {_s(derivative)}"
+            return derivative, _dedupe(exp_steps + (step,))
+        # f^g = e^(g ln f), so (f^g)' = f^g * (g ln f)'
+        log_form = E.mul(exponent, E.fn("ln", base))
+        d_log, steps = differentiate(log_form, var)
+        derivative = E.mul(tree, d_log)
+        step = (f"Logarithmic differentiation: ln(y) = {_s(log_form)}, so y' = y * {d}[{_s(log_form)}] = {_s(derivative)}")
+        return derivative, _dedupe(steps + (step,))
+
+    if kind == "fn":
+        name, argument = tree[1], tree[2]
+        if name == "ln" and argument[0] == "fn" and argument[1] == "abs":
+            argument = argument[2]
+            outer = E.power(argument, MINUS_ONE)
+        elif name == "abs":
+            raise Unsupported("|u| is not differentiable everywhere")
+        else:
+            outer = _fn_derivative(name, argument)
+        if argument == ("var", var):
+            step = f"Derivative of {name}: {d}[{_s(tree)}] = {_s(outer)}"
+            return outer, (step,)
+        d_argument, arg_steps = differentiate(argument, var)
+        derivative = E.mul(outer, d_argument)
+        step = (f"Chain rule: let u = {_s(argument)}, so {d}[{name}(u)] = "
+                f"{_s(_fn_derivative(name, ('var', 'u')))} * u' = {_s(derivative)}")
+        return derivative, _dedupe(arg_steps + (step,))
+
+    raise Unsupported(f"cannot differentiate {kind}")
+
+
+# --- Integration ---
+
+def _linear_coefficients(tree, var: str) -> tuple[Fraction, tuple] | None:
+    """Returns (a, b) if ``tree`` is a*var + b with numeric a, otherwise None."""
+    derivative, _ = differentiate(tree, var)
+    if derivative[0] != "num" or derivative[1] == 0:
+        return None
+    return derivative[1], E.substitute(tree, var, ZERO)
+
+
+_FN_ANTIDERIVATIVES = {
+    "sin": lambda u: E.neg(E.fn("cos", u)),
+    "cos": lambda u: E.fn("sin", u),
+    "exp": lambda u: E.fn("exp", u),
+    "sinh": lambda u: E.fn("cosh", u),
+    "cosh": lambda u: E.fn("sinh", u),
+    "tan": lambda u: E.neg(E.fn("ln", E.fn("abs", E.fn("cos", u)))),
+    "sec": lambda u: E.fn("ln", E.fn("abs", E.add(E.fn("sec", u), E.fn("tan", u)))),
+    "ln": lambda u: E.sub(E.mul(u, E.fn("ln", u)), u),
+}
+
+
+def _integrate_in_u(tree, var: str, inner) -> tuple | None:
+    """Integrates f(u) du where ``tree`` = f(inner) with ``inner`` linear in ``var``."""
+    kind = tree[0]
+    u = ("var", "u")
+    if kind == "fn" and tree[1] in _FN_ANTIDERIVATIVES:
+        return _FN_ANTIDERIVATIVES[tree[1]](u)
+    if kind == "pow":
+        base, exponent = tree[1], tree[2]
+        if base == inner and not E.depends_on(exponent, var):
+            if E.is_num(exponent, -1):
+                return E.fn("ln", E.fn("abs", u))
+            return E.div(E.power(u, E.add(exponent, ONE)), E.add(exponent, ONE))
+        if exponent == inner and not E.depends_on(base, var):
+            return E.div(E.power(base, u), E.fn("ln", base))
+        if base[0] == "fn" and base[1] == "cos" and base[2] == inner and E.is_num(exponent, -2):
+            return E.fn("tan", u)
+        if base[0] == "fn" and base[1] == "sin" and base[2] == inner and E.is_num(exponent, -2):
+            return E.neg(E.fn("cot", u))
+    return None
+
+
+def _inner_argument(tree):
+    if tree[0] == "fn":
+        return tree[2]
+    if tree[0] == "pow":
+        base, exponent = tree[1], tree[2]
+        if base[0] == "fn":
+            return base[2]
+        return base if not E.free_vars(exponent) else exponent
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def integrate(tree, var: str) -> tuple[tuple, tuple]:
+    """Returns ``(antiderivative, steps)`` of ``tree`` with respect to ``var``.
+
+    The constant of integration is left out of the tree and added when the
+    answer is formatted. Memoized on the canonical tree.
+
+    Raises:
+        Unsupported: If no supported rule applies.
+    """
+    kind = tree[0]
+    x = ("var", var)
+    integral = f"∫ {{}} d{var}"
+
+    if not E.depends_on(tree, var):
+        result = E.mul(tree, x)
+        return result, (f"Constant rule: {integral.format(_s(tree))} = {_s(result)}",)
+
+    if kind == "add":
+        results = [integrate(term, var) for term in tree[1]]
+        result = E.add(*(r[0] for r in results))
+        steps = [f"Sum rule: integrate {_s(tree)} term by term."]
+        for r in results:
+            steps.extend(r[1])
+        return result, _dedupe(steps)
+
+    if kind == "mul":
+        constants = [f for f in tree[1] if not E.depends_on(f, var)]
+        if constants:
+            constant = E.mul(*constants)
+            rest = E.mul(*(f for f in tree[1] if E.depends_on(f, var)))
+            inner, inner_steps = integrate(rest, var)
+            result = E.mul(constant, inner)
+            step = f"Constant multiple rule: {integral.format(_s(tree))} = {_s(constant)} * {integral.format(_s(rest))} = {_s(result)}"
+            return result, _dedupe(inner_steps + (step,))
+
+    if kind == "var":
+        result = E.div(E.power(x, E.num(2)), E.num(2))
+        return result, (f"Power rule: {integral.format(var)} = {var}^2/2",)
+
+    if kind == "pow" and tree[1] == x and not E.depends_on(tree[2], var):
+        exponent = tree[2]
+        if E.is_num(exponent, -1):
+            result = E.fn("ln", E.fn("abs", x))
+            return result, (f"Reciprocal rule: {integral.format(_s(tree))} = ln|{var}|",)
+        result = E.div(E.power(x, E.add(exponent, ONE)), E.add(exponent, ONE))
+        step = f"Power rule: {integral.format(_s(tree))} = {var}^{E._wrap(E.add(exponent, ONE))}/{E._wrap(E.add(exponent, ONE))} = {_s(result)}"
+        return result, (step,)
+
+    if tree[0] == "pow" and tree[1][0] == "add" and E.is_num(tree[2], -1):
+        # 1/(a^2 + x^2) -> arctan
+        expanded = tree[1]
+        quadratic = E.substitute(expanded, var, ZERO)
+        if E.is_num(quadratic) and quadratic[1] > 0 and E.sub(expanded, quadratic) == E.power(x, E.num(2)):
+            a2 = quadratic[1]
+            a = math.isqrt(a2.numerator) if a2.denominator == 1 and math.isqrt(a2.numerator) ** 2 == a2.numerator else None
+            if a:
+                result = E.mul(E.num(Fraction(1, a)), E.fn("arctan", E.mul(E.num(Fraction(1, a)), x)))
+                return result, (f"Arctangent rule: ∫ 1/({var}^2 + a^2) d{var} = (1/a)*arctan({var}/a) with a = {a}, giving {_s(result)}",)
+
+    inner = _inner_argument(tree)
+    if inner is not None and inner != x and E.depends_on(inner, var):
+        linear = _linear_coefficients(inner, var)
+        if linear is not None:
+            antiderivative_u = _integrate_in_u(tree, var, inner)
+            if antiderivative_u is not None:
+                a, _ = linear
+                result = E.mul(E.num(1 / a), E.substitute(antiderivative_u, "u", inner))
+                step = (f"Substitution: let u = {_s(inner)}, du = {E.to_str(E.num(a))} d{var}, so "
+                        f"{integral.format(_s(tree))} = (1/{E.to_str(E.num(a))}) * ∫ {_s(E.substitute(tree, var, E.div(E.sub(('var', 'u'), linear[1]), E.num(a))))} du = {_s(result)}")
+                return result, (step,)
+    elif inner == x:
+        antiderivative = _integrate_in_u(tree, var, x)
+        if antiderivative is not None:
+            result = E.substitute(antiderivative, "u", x)
+            return result, (f"Standard integral: {integral.format(_s(tree))} = {_s(result)}",)
+
+    if kind == "mul":
+        # u-substitution: f(g(x)) * g'(x) up to a constant factor.
+        for i, factor in enumerate(tree[1]):
+            g = _inner_argument(factor)
+            if g is None or not E.depends_on(g, var) or _linear_coefficients(g, var) is not None:
+                continue
+            others = tree[1][:i] + tree[1][i + 1:]
+            dg, _ = differentiate(g, var)
+            ratio = E.mul(*others, E.power(dg, MINUS_ONE))
+            if E.depends_on(ratio, var):
+                continue
+            u = ("var", "u")
+            in_u = _integrate_in_u(_replace(factor, g, u), "u", u)
+            if in_u is None:
+                continue
+            result = E.mul(ratio, E.substitute(in_u, "u", g))
+            step = (f"Substitution: let u = {_s(g)}, du = {_s(dg)} d{var}, so "
+                    f"{integral.format(_s(tree))} = {_s(ratio)} * ∫ {_s(_replace(factor, g, u))} du = {_s(result)}")
+            return result, (step,)
+
+    expanded = E.expand(tree)
+    if expanded != tree and expanded[0] == "add":
+        result, steps = integrate(expanded, var)
+        return result, _dedupe((f"Expand the integrand: {_s(tree)} = {_s(expanded)}",) + steps)
+
+    raise Unsupported(f"no integration rule for {_s(tree)}")
+
+
+def _replace(tree, target, replacement) -> tuple:
+    """Replaces every occurrence of the subtree ``target`` with ``replacement``."""
+    if tree == target:
+        return replacement
+    kind = tree[0]
+    if kind in ("num", "const", "var"):
+        return tree
+    if kind == "add":
+        return E.add(*(_replace(t, target, replacement) for t in tree[1]))
+    if kind == "mul":
+        return E.mul(*(_replace(t, target, replacement) for t in tree[1]))
+    if kind == "pow":
+        return E.power(_replace(tree[1], target, replacement), _replace(tree[2], target, replacement))
+    return E.fn(tree[1], _replace(tree[2], target, replacement))
+
+
+# --- Limits ---
+
+def _parse_point(text: str):
+    text = text.strip().lower().rstrip(".")
+    if text in ("inf", "infinity", "∞", "+inf", "+infinity", "-inf", "-infinity", "-∞"):
+        raise Unsupported("limits at infinity are not supported locally")
+    return E.parse(text, frozenset())
+
+
+def _finite(tree, var, point) -> tuple | None:
+    """Substitutes the point and returns the exact tree if it evaluates to a finite number."""
+    try:
+        value = E.substitute(tree, var, point)
+        numeric = E.evaluate(value)
+    except (ZeroDivisionError, ValueError, OverflowError):
+        return None
+    if math.isnan(numeric) or math.isinf(numeric):
+        return None
+    return value
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def limit(tree, var: str, point) -> tuple[tuple, tuple]:
+    """Returns ``(value, steps)`` for the limit of ``tree`` as ``var`` -> ``point``.
+
+    Tries direct substitution, then L'Hôpital's rule on 0/0 quotients.
+
+    Raises:
+        Unsupported: If neither applies.
+    """
+    value = _finite(tree, var, point)
+    if value is not None:
+        return value, (f"Direct substitution: the expression is continuous at {var} = {_s(point)}, so the limit is {_s(value)}.",)
+
+    steps = []
+    top, bottom = E.numer_denom(tree)
+    for _ in range(4):
+        top_value, bottom_value = _finite(top, var, point), _finite(bottom, var, point)
+        if top_value is None or bottom_value is None:
+            break
+        if not (abs(E.evaluate(top_value)) < 1e-12 and abs(E.evaluate(bottom_value)) < 1e-12):
+            break
+        d_top, _ = differentiate(top, var)
+        d_bottom, _ = differentiate(bottom, var)
+        steps.append(f"Substitution gives 0/0, so apply L'Hôpital's rule: differentiate the numerator to {_s(d_top)} "
+                     f"and the denominator to {_s(d_bottom)}.")
+        top, bottom = d_top, d_bottom
+        value = _finite(E.div(top, bottom), var, point)
+        if value is not None:
+            steps.append(f"Substitute {var} = {_s(point)}: the limit is {_s(value)}.")
+            return value, tuple(steps)
+    raise Unsupported("limit needs more than direct substitution or L'Hôpital's rule")
+
+
+# --- Problem parsing and formatting ---
+
+def _parse_in(text: str, explicit: str | None) -> tuple[tuple, str]:
+    """Parses an expression in one variable; returns the tree and the variable.
+
+    Any other name, such as a stray word ("x^2 step by step") read as a
+    product of letters, makes the problem unsupported.
+    """
+    if explicit:
+        var = explicit.lower()
+        return E.parse(text, frozenset([var])), var
+    names = E.variables(text)
+    if len(names) > 1:
+        raise Unsupported(f"more than one variable: {', '.join(sorted(names))}")
+    var = next(iter(names), "x")
+    return E.parse(text, frozenset([var])), var
+
+
+def _clean_expression(text: str) -> str:
+    text = text.strip().strip("'\"")
+    text = re.sub(r"^(?:f\s*\(\s*[a-z]\s*\)|y)\s*=\s*", "", text, flags=re.IGNORECASE)
+    return text
+
+
+def _approx(tree) -> str:
+    if tree[0] == "num":
+        return ""
+    try:
+        return f" ≈ {E.evaluate(tree):.6g}"
+    except (ZeroDivisionError, ValueError, OverflowError, KeyError):
+        return ""
+
+
+def _check_interval(tree, var: str, lo, hi, value) -> None:
+    """Checks that the fundamental theorem applies to the integral of ``tree`` over [lo, hi].
+
+    Across a pole or a break in the domain it gives a finite value for a
+    divergent integral (1/x^2 from -1 to 1 is not -2). The integrand must be
+    finite and real on a grid over the interval, its denominator must keep its
+    sign, and Simpson's rule on the grid must agree with ``value``.
+
+    Raises:
+        Unsupported: If any of these fails.
+    """
+    try:
+        a, b, expected = E.evaluate(lo), E.evaluate(hi), E.evaluate(value)
+    except (ZeroDivisionError, ValueError, OverflowError, KeyError):
+        raise Unsupported("the bounds or the value are not numbers")
+    _, bottom = E.numer_denom(tree)
+    width = (b - a) / INTERVAL_SAMPLES
+    signs, simpson = set(), 0.0
+    for i in range(INTERVAL_SAMPLES + 1):
+        env = {var: a + width * i}
+        try:
+            y, denominator = E.evaluate(tree, env), E.evaluate(bottom, env)
+        except (ZeroDivisionError, ValueError, OverflowError):
+            raise Unsupported(f"the integrand is undefined at {var} = {env[var]:.6g}")
+        if not math.isfinite(y) or denominator == 0:
+            raise Unsupported(f"the integrand is not finite at {var} = {env[var]:.6g}")
+        signs.add(denominator > 0)
+        simpson += y * (1 if i in (0, INTERVAL_SAMPLES) else 4 if i % 2 else 2)
+    if len(signs) > 1:
+        raise Unsupported("the integrand's denominator changes sign on the interval")
+    if not math.isclose(simpson * width / 3, expected, rel_tol=1e-3, abs_tol=1e-6):
+        raise Unsupported("the antiderivative does not match the integrand numerically on the interval")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _solve_parsed(kind: str, tree, var: str, extra) -> dict:
+    if kind == "derivative":
+        derivative, steps = differentiate(tree, var)
+        return E.result(steps, f"d/d{var}[{_s(tree)}] = {_s(derivative)}")
+    if kind == "integral":
+        antiderivative, steps = integrate(tree, var)
+        if extra is None:
+            return E.result(steps, f"∫ {_s(tree)} d{var} = {_s(antiderivative)} + C")
+        lo, hi = extra
+        upper, lower = E.substitute(antiderivative, var, hi), E.substitute(antiderivative, var, lo)
+        value = E.sub(upper, lower)
+        _check_interval(tree, var, lo, hi, value)
+        evaluate_step = (f"Fundamental theorem of calculus: F({_s(hi)}) - F({_s(lo)}) = "
+                         f"{_s(upper)} - ({_s(lower)}) = {_s(value)}")
+        return E.result(steps + (evaluate_step,), f"∫ from {_s(lo)} to {_s(hi)} of {_s(tree)} d{var} = {_s(value)}{_approx(value)}")
+    value, steps = limit(tree, var, extra)
+    return E.result(steps, f"lim {var}→{_s(extra)} {_s(tree)} = {_s(value)}{_approx(value)}")
+
+
+def parse_problem(problem: str) -> tuple[str, tuple, str, object] | None:
+    """Parses a calculus request into ``(kind, tree, var, extra)`` or returns None.
+
+    ``extra`` is the ``(lower, upper)`` bounds for definite integrals and the
+    approach point for limits.
+    """
+    text = problem.strip()
+    try:
+        match = _LIMIT_RE.match(text) or _LIMIT_PREFIX_RE.match(text)
+        if match:
+            tree, var = _parse_in(_clean_expression(match["expr"]), match["var"])
+            return "limit", tree, var, _parse_point(match["point"])
+        match = _INTEGRAL_RE.match(text)
+        if match:
+            tree, var = _parse_in(_clean_expression(match["expr"]), match["var"] or match["dvar"])
+            bounds = None
+            if match["lo"] is not None:
+                bounds = (E.parse(match["lo"], frozenset()), E.parse(match["hi"], frozenset()))
+            return "integral", tree, var, bounds
+        match = _DERIVATIVE_RE.match(text)
+        if match:
+            tree, var = _parse_in(_clean_expression(match["expr"]), match["var"] or match["dvar"])
+            return "derivative", tree, var, None
+    except (ParseError, Unsupported, ZeroDivisionError):
+        return None
+    return None
+
+
+def solve(problem: str) -> dict | None:
+    """Solves a derivative, integral or limit problem locally.
+
+    Args:
+        problem (str): e.g. "Derivative of x^2", "Integral of 2x", "Limit of sin(x)/x as x -> 0".
+
+    Returns:
+        dict | None: ``{"status", "steps", "answer"}``, or None if the input is
+        not supported and the caller should fall back to the LLM.
+    """
+    parsed = parse_problem(problem)
+    if parsed is None:
+        return None
+    try:
+        return dict(_solve_parsed(*parsed))
+    except (Unsupported, RecursionError, ZeroDivisionError, OverflowError, KeyError):
+        return None
+
+
+def cache_info() -> dict:
+    """Returns hit/miss counts for the memo caches."""
+    return {
+        "problems": _solve_parsed.cache_info()._asdict(),
+        "differentiate": differentiate.cache_info()._asdict(),
+        "integrate": integrate.cache_info()._asdict(),
+        "limit": limit.cache_info()._asdict(),
+    }
@@ -0,0 +1,134 @@
+"""Cooperative cancellation of a request's work on disconnect or deadline.
+
+Starlette keeps running an endpoint after its client disconnects, so a user
+who closes the tab still pays for the story and the Blender script, and a
+request stuck in retries runs for as long as they allow. ``guard`` runs the
+request's work as a task and cancels it when the client disconnects or the
+request deadline passes.
+
+Cancelling the task unwinds everything it awaits: the runner and the
+``SupervisorAgent`` stages, retry sleeps, model streams (closing their
+connections), worksheet permits (see ``worksheet.bounded``) and ledger holds.
+Work shared with other requests outlives a cancelled caller only while
+someone still waits for it: a coalesced call is cancelled with its last
+waiter (see ``singleflight``), and a batch with its last caller (see
+``batching``). ``guard`` waits for the task to unwind before it raises, so
+all of it is released by the time the response is sent.
+
+The deadline is ``MATH_AGENTS_REQUEST_TIMEOUT`` seconds after the request
+starts (120 by default, 0 for none). ``remaining`` gives the time left to
+code running under a guard; ``SupervisorAgent.run_with_retry`` does not
+start a backoff that would end past it.
+
+Cancellations are counted by reason under ``get_stats("cancellation")``,
+with how long the work had run and how long it took to unwind.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+
+from math_agents.metrics import get_stats
+
+
+REQUEST_TIMEOUT = float(os.environ.get("MATH_AGENTS_REQUEST_TIMEOUT", "120"))  # seconds
+DISCONNECT_POLL = 0.25  # seconds between checks for a disconnected client
+
+REASONS = {
+    "disconnected": "the client disconnected",
+    "deadline": "the request deadline passed",
+}
+
+# Monotonic time by which the current request must finish, None for no deadline.
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+class RequestCancelledError(Exception):
+    """The work of a request was cancelled because its client left or its deadline passed."""
+
+    def __init__(self, reason: str, elapsed: float):
+        super().__init__(f"Request cancelled after {elapsed:.2f}s: {REASONS[reason]}.")
+        self.reason = reason
+        self.elapsed = elapsed
+
+
+def remaining() -> float | None:
+    """Seconds left before the current request's deadline, or None when it has none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def _watch(task: asyncio.Task, is_disconnected, deadline: float | None, poll: float) -> str | None:
+    """Waits for ``task``; returns why it must be cancelled, or None once it is done."""
+    while not task.done():
+        wait = poll if is_disconnected is not None else None
+        if deadline is not None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return "deadline"
+            wait = left if wait is None else min(wait, left)
+        await asyncio.wait([task], timeout=wait)
+        if not task.done() and is_disconnected is not None and await is_disconnected():
+            return "disconnected"
+    return None
+
+
+async def guard(coro, is_disconnected=None, timeout: float = REQUEST_TIMEOUT, poll: float = DISCONNECT_POLL):
+    """Returns ``await coro``, cancelling it when the client disconnects or the deadline passes.
+
+    Args:
+        coro: The request's work.
+        is_disconnected: Async callable that tells whether the client has gone, such as
+            ``Request.is_disconnected``; None to enforce the deadline only.
+        timeout (float): Seconds the work may run, 0 for no limit. An earlier deadline
+            of an enclosing guard still applies.
+        poll (float): Seconds between calls to ``is_disconnected``.
+
+    Raises:
+        RequestCancelledError: Once the work has been cancelled and has unwound.
+    """
+    stats = get_stats("cancellation")
+    start = time.monotonic()
+    deadline, outer = start + timeout if timeout else None, _deadline.get()
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        # The task copies the context, deadline included.
+        task = asyncio.ensure_future(coro)
+    finally:
+        _deadline.reset(token)
+    try:
+        reason = await _watch(task, is_disconnected, deadline, poll)
+        if reason is None:
+            stats.incr("finished")
+            return task.result()
+        stopped = time.monotonic()
+        task.cancel()
+        await asyncio.wait([task])
+    finally:
+        # Cancelled itself (e.g. at shutdown): take the work along.
+        task.cancel()
+    if not task.cancelled() and task.exception() is not None:
+        # The work failed while unwinding; the cancellation is what the caller needs to know.
+        stats.incr("failed_unwinding")
+    stats.incr(f"cancelled:{reason}")
+    stats.observe(f"ran:{reason}", stopped - start)
+    stats.observe("unwind", time.monotonic() - stopped)
+    raise RequestCancelledError(reason, stopped - start)
+
+
+def report() -> dict:
+    """Requests finished and cancelled by reason, how long cancelled work ran, and how fast it unwound."""
+    stats = get_stats("cancellation")
+    counters = stats.counters
+    return {
+        "request_timeout_seconds": REQUEST_TIMEOUT,
+        "finished": counters["finished"],
+        "cancelled": {reason: counters[f"cancelled:{reason}"] for reason in REASONS},
+        "ran_before_cancel": {reason: stats.latency(f"ran:{reason}") for reason in REASONS},
+        "unwind": stats.latency("unwind"),
+        "retries_skipped": counters["retry_skipped"],
+        "batches_abandoned": counters["batch_abandoned"],
+    }
@@ -0,0 +1,335 @@
+"""Record and replay of model traffic through on-disk cassettes.
+
+A cassette is a gzipped JSON Lines file with one record per model call. A
+record holds:
+
+- the calling agent;
+- the request fingerprint;
+- the request: model, config and contents, with inline images reduced to
+  their hash and size;
+- every response chunk, with its offset from the start of the call;
+- or the API error the call raised.
+
+The fingerprint is a hash of the request, so a changed prompt no longer
+matches exactly. ADK adds the replies other agents gave earlier in the turn
+to the contents ("For context: ..."). Which replies are there depends on
+timing, for example whether the story had finished when the Blender sections
+started. A request with no exact match therefore falls back to a recording
+with the same model, instruction and config. These loose hits are counted
+separately.
+
+``CassetteLlm`` wraps an agent's model. In record mode it forwards each call
+and appends the record. In replay mode it makes no call. It serves the
+recorded chunks for a fingerprint in the order they were recorded, with
+their original timing or as fast as possible. A request with no recording,
+or whose recordings have all been served, raises ``CassetteMissError``. ``wrap_client`` does the same for the genai
+client used by ``tools``.
+
+Set ``MATH_AGENTS_CASSETTE`` to the cassette path and
+``MATH_AGENTS_CASSETTE_MODE`` to ``record`` or ``replay``.
+``MATH_AGENTS_CASSETTE_TIMING=fast`` replays without the recorded delays.
+
+Concurrent classifier calls are batched into one prompt whose contents
+depend on timing (see ``batching``). For exact replays, record and replay
+with ``MATH_AGENTS_BATCHING=0``.
+"""
+
+import asyncio
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import AsyncGenerator
+
+import google.genai.errors
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+
+from math_agents.metrics import get_stats
+
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_PATH = os.environ.get("MATH_AGENTS_CASSETTE", "")
+# off, record or replay.
+CASSETTE_MODE = os.environ.get("MATH_AGENTS_CASSETTE_MODE", "off")
+# original or fast.
+CASSETTE_TIMING = os.environ.get("MATH_AGENTS_CASSETTE_TIMING", "original")
+FLUSH_SECONDS = 1.0
+
+
+class CassetteMissError(LookupError):
+    """A replayed request has no recording left in the cassette."""
+
+
+def _compact(value):
+    """``value`` as JSON with inline bytes replaced by their hash and size."""
+    if isinstance(value, dict):
+        if "data" in value and "mime_type" in value:
+            data = value["data"]
+            raw = base64.b64decode(data) if isinstance(data, str) else bytes(data or b"")
+            return {"mime_type": value["mime_type"], "sha256": hashlib.sha256(raw).hexdigest(), "bytes": len(raw)}
+        return {key: _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def _dump(value):
+    return value.model_dump(mode="json", exclude_none=True) if hasattr(value, "model_dump") else value
+
+
+def describe_request(llm_request: LlmRequest) -> dict:
+    """The model, config and contents of a request, as stored in a cassette."""
+    config = _dump(llm_request.config) if llm_request.config else {}
+    config.pop("http_options", None)
+    return _compact({"model": llm_request.model, "config": config,
+                     "contents": [_dump(content) for content in llm_request.contents]})
+
+
+def fingerprint(agent: str, request: dict) -> str:
+    """Key of a described request; equal requests from the same agent match."""
+    blob = json.dumps({"agent": agent, "request": request}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+def loose_fingerprint(agent: str, request: dict) -> str:
+    """Key of a described request without its contents: the model, instruction and config."""
+    return fingerprint(agent, {"model": request["model"], "config": request["config"]})
+
+
+class Cassette:
+    """One cassette file, opened for recording or loaded for replay."""
+
+    def __init__(self, path: str, mode: str, timing: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', not {mode!r}.")
+        if timing not in ("original", "fast"):
+            raise ValueError(f"Cassette timing must be 'original' or 'fast', not {timing!r}.")
+        self.path, self.mode, self.timing = path, mode, timing
+        self._lock = threading.Lock()
+        self._stats = get_stats("cassette")
+        self._records: dict[str, list[dict]] = defaultdict(list)
+        self._loose: dict[str, list[dict]] = defaultdict(list)
+        self._served: set[int] = set()  # ids of the records already replayed
+        self._file = None
+        self._timer: threading.Timer | None = None
+        if mode == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+            logger.info("Loaded %d recorded calls from %s.", sum(map(len, self._records.values())), path)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = gzip.open(path, "at", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return sum(map(len, self._records.values()))
+
+    def _add(self, record: dict) -> None:
+        self._records[record["key"]].append(record)
+        self._loose[record["loose_key"]].append(record)
+
+    def append(self, record: dict) -> None:
+        """Writes one record; it reaches the disk within ``FLUSH_SECONDS``, or on close if that is sooner."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._add(record)
+            self._file.write(line)
+            if self._timer is None:
+                self._timer = threading.Timer(FLUSH_SECONDS, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        self._stats.incr("recorded")
+        self._stats.incr("recorded_bytes", len(line))
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._file is not None:
+                self._file.flush()
+
+    def lookup(self, key: str, loose_key: str, agent: str) -> dict:
+        """The first recording of ``key`` not served yet, else the first such of ``loose_key``.
+
+        Raises:
+            CassetteMissError: If neither has a recording left.
+        """
+        with self._lock:
+            exact, loose = self._records.get(key) or [], self._loose.get(loose_key) or []
+            record = next((r for r in exact if id(r) not in self._served), None)
+            if record is None:
+                record = next((r for r in loose if id(r) not in self._served), None)
+                if record is None:
+                    self._stats.incr("exhausted" if loose else "misses")
+                    raise CassetteMissError(
+                        f"All {len(loose)} recorded calls from {agent} like request {key} in {self.path} were "
+                        f"already served." if loose else
+                        f"No recorded call from {agent} matches request {key} in {self.path}.")
+                self._stats.incr("loose_hits")
+            self._served.add(id(record))
+        self._stats.incr("hits")
+        return record
+
+    async def pace(self, offset: float, start: float) -> None:
+        """Waits until ``offset`` seconds after ``start`` when replaying with the original timing."""
+        if self.timing == "original":
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _api_error(error: dict) -> google.genai.errors.APIError:
+    cls = google.genai.errors.ServerError if error["code"] >= 500 else google.genai.errors.ClientError
+    return cls(error["code"], error["details"])
+
+
+class CassetteLlm(BaseLlm):
+    """Records or replays the model calls of one agent."""
+
+    inner: BaseLlm
+    cassette: Cassette
+    agent_name: str
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        request = describe_request(llm_request)
+        key, loose_key = fingerprint(self.agent_name, request), loose_fingerprint(self.agent_name, request)
+        start = time.perf_counter()
+        if self.cassette.mode == "replay":
+            record = self.cassette.lookup(key, loose_key, self.agent_name)
+            for chunk in record["chunks"]:
+                response = LlmResponse.model_validate(chunk["response"])
+                if response.partial and not stream:
+                    continue
+                await self.cassette.pace(chunk["t"], start)
+                yield response
+            if "error" in record:
+                await self.cassette.pace(record["error"]["t"], start)
+                raise _api_error(record["error"])
+            get_stats("cassette").observe(f"replayed:{self.agent_name}", time.perf_counter() - start)
+            return
+
+        record = {"key": key, "loose_key": loose_key, "agent": self.agent_name, "stream": stream,
+                  "recorded_at": time.time(), "request": request, "chunks": []}
+        try:
+            async for response in self.inner.generate_content_async(llm_request, stream):
+                record["chunks"].append({"t": round(time.perf_counter() - start, 4), "response": _dump(response)})
+                yield response
+        except google.genai.errors.APIError as e:
+            record["error"] = {"t": round(time.perf_counter() - start, 4), "code": e.code, "details": e.details}
+            raise
+        finally:
+            self.cassette.append(record)
+            get_stats("cassette").observe(f"recorded:{self.agent_name}", time.perf_counter() - start)
+
+
+def install(agents: list[LlmAgent], cassette: Cassette) -> None:
+    """Routes the model calls of ``agents`` through ``cassette``, replacing any cassette already installed."""
+    for llm_agent in agents:
+        inner = llm_agent.canonical_model
+        if isinstance(inner, CassetteLlm):
+            inner = inner.inner
+        llm_agent.model = CassetteLlm(model=inner.model, inner=inner, cassette=cassette, agent_name=llm_agent.name)
+
+
+class _Models:
+    """The ``models.generate_content`` surface of a genai client, through a cassette."""
+
+    def __init__(self, client, cassette: Cassette):
+        self._client, self._cassette = client, cassette
+
+    def generate_content(self, *, model: str, contents, config=None):
+        from google.genai import types
+
+        request = _compact({"model": model, "config": _dump(config) if config else {},
+                            "contents": _dump(contents) if not isinstance(contents, list)
+                            else [_dump(content) for content in contents]})
+        key, loose_key = fingerprint("tools", request), loose_fingerprint("tools", request)
+        start = time.perf_counter()
+        if self._cassette.mode == "replay":
+            record = self._cassette.lookup(key, loose_key, "tools")
+            if self._cassette.timing == "original":
+                time.sleep(max(0.0, record["error"]["t"] if "error" in record else record["chunks"][-1]["t"]))
+            if "error" in record:
+                raise _api_error(record["error"])
+            return types.GenerateContentResponse.model_validate(record["chunks"][-1]["response"])
+        record = {"key": key, "loose_key": loose_key, "agent": "tools", "stream": False,
+                  "recorded_at": time.time(), "request": request, "chunks": []}
+        try:
+            response = self._client.models.generate_content(model=model, contents=contents, config=config)
+            record["chunks"].append({"t": round(time.perf_counter() - start, 4), "response": _dump(response)})
+            return response
+        except google.genai.errors.APIError as e:
+            record["error"] = {"t": round(time.perf_counter() - start, 4), "code": e.code, "details": e.details}
+            raise
+        finally:
+            self._cassette.append(record)
+
+
+class _Client:
+    def __init__(self, client, cassette: Cassette):
+        self.models = _Models(client, cassette)
+
+
+def wrap_client(client, cassette: "Cassette | None" = None):
+    """``client`` with its ``models.generate_content`` calls recorded or replayed, if a cassette is set.
+
+    In replay mode ``client`` may be None, since no call is made.
+    """
+    cassette = cassette if cassette is not None else get_cassette()
+    return client if cassette is None else _Client(client, cassette)
+
+
+_cassette: Cassette | None = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette | None:
+    """The cassette configured by the environment, or None when recording and replay are off."""
+    global _cassette
+    if CASSETTE_MODE == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            if not CASSETTE_PATH:
+                raise ValueError("Set MATH_AGENTS_CASSETTE to the cassette path to record or replay.")
+            _cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_TIMING)
+            atexit.register(_cassette.close)
+        return _cassette
+
+
+def report() -> dict:
+    """Recorded calls and bytes, and replay hits, misses and requests past their recordings."""
+    stats = get_stats("cassette")
+    counters = stats.counters
+    recorded = counters["recorded"]
+    return {
+        "mode": CASSETTE_MODE,
+        "path": CASSETTE_PATH,
+        "recorded": recorded,
+        "bytes_per_call": counters["recorded_bytes"] / recorded if recorded else 0.0,
+        "hits": counters["hits"],
+        "loose_hits": counters["loose_hits"],
+        "misses": counters["misses"],
+        "exhausted": counters["exhausted"],
+        "hit_rate": stats.ratio("hits", "hits", "misses", "exhausted"),
+    }
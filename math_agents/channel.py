@@ -0,0 +1,163 @@
+"""Frames of the session WebSocket channel: state deltas and streamed text instead of full state dumps.
+
+A client that polls a session gets its whole state every time, Blender
+script included, though usually one key has changed. The channel (the
+``/ws`` WebSocket in ``api``) sends one snapshot of the session instead,
+then a frame for each event:
+
+- ``snapshot``: the subscribed keys of a session's state, when the client
+  connects to it or a turn starts a new session;
+- ``delta``: the keys an event's ``state_delta`` changed;
+- ``chunk``: the text of a partial (streamed) event, such as the story while
+  it is written;
+- ``done`` and ``error``: the end of a turn.
+
+``temp:`` keys are never sent; they are not part of the stored state. A
+client subscribes to the keys it wants, or to all of them, and to chunks
+or not. Values whose JSON is at least ``COMPRESS_MIN_BYTES`` long
+(``MATH_AGENTS_CHANNEL_COMPRESS_BYTES``, 1024 by default; 0 to never
+compress) are sent zlib-compressed and base64-encoded, and listed under the
+frame's ``compressed``.
+
+Frames and bytes sent, the bytes before compression, and the size of the
+full state dump a polling client would have fetched at the end of each turn
+are counted under ``get_stats("channel")``, with the serialization time.
+"""
+
+import base64
+import json
+import os
+import zlib
+
+from math_agents.metrics import get_stats
+
+
+COMPRESS_MIN_BYTES = int(os.environ.get("MATH_AGENTS_CHANNEL_COMPRESS_BYTES", "1024"))
+COMPRESS_LEVEL = 1  # zlib's fastest; stories and scripts still shrink about 2x
+FRAME_TYPES = ["snapshot", "delta", "chunk", "done", "error"]
+TEMP_PREFIX = "temp:"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def decode(frame: dict) -> dict:
+    """The state values of a ``snapshot`` or ``delta`` frame, decompressed; for clients and benchmarks."""
+    values = dict(frame.get("state") or frame.get("changes") or {})
+    for key in frame.get("compressed", []):
+        values[key] = json.loads(zlib.decompress(base64.b64decode(values[key])))
+    return values
+
+
+class DeltaChannel:
+    """Turns session state and ADK events into the frames one client subscribed to."""
+
+    def __init__(self, keys: list[str] | None = None, chunks: bool = True,
+                 compress_min_bytes: int = COMPRESS_MIN_BYTES):
+        """
+        Args:
+            keys (list[str] | None): State keys to send; None for every key.
+            chunks (bool): Whether to send the text of partial events.
+            compress_min_bytes (int): JSON size from which a value is compressed; 0 to never compress.
+        """
+        self.keys = set(keys) if keys is not None else None
+        self.chunks = chunks
+        self.compress_min_bytes = compress_min_bytes
+        self._stats = get_stats("channel")
+
+    def subscribe(self, keys: list[str] | None, chunks: bool | None = None) -> None:
+        """Changes the subscription; ``chunks`` None keeps the current choice."""
+        self.keys = set(keys) if keys is not None else None
+        if chunks is not None:
+            self.chunks = chunks
+
+    def wants(self, key: str) -> bool:
+        return not key.startswith(TEMP_PREFIX) and (self.keys is None or key in self.keys)
+
+    def _frame(self, frame: dict, values: dict | None = None, field: str = "") -> str:
+        """Serializes ``frame`` with ``values`` under ``field``, compressing the large ones.
+
+        Each value is serialized once: its JSON is spliced into the frame's.
+        """
+        saved = 0  # bytes compression took off the frame
+        with self._stats.timer("serialize"):
+            if values is None:
+                text = _dumps(frame)
+            else:
+                members, compressed = [], []
+                for key, value in values.items():
+                    encoded = _dumps(value)
+                    if self.compress_min_bytes and len(encoded) >= self.compress_min_bytes:
+                        packed = base64.b64encode(zlib.compress(encoded.encode(), COMPRESS_LEVEL)).decode("ascii")
+                        saved += len(encoded) - len(packed) - 2
+                        encoded = f'"{packed}"'
+                        compressed.append(key)
+                    members.append(f"{_dumps(key)}:{encoded}")
+                if compressed:
+                    frame = dict(frame, compressed=compressed)
+                    self._stats.incr("compressed_values", len(compressed))
+                text = f'{_dumps(frame)[:-1]},"{field}":{{{",".join(members)}}}}}'
+        self._stats.incr(f"frames:{frame['type']}")
+        self._stats.incr("bytes", len(text))
+        self._stats.incr("bytes_uncompressed", len(text) + saved)
+        return text
+
+    def snapshot(self, session_id: str, state: dict) -> str:
+        """The subscribed keys of ``state``."""
+        values = {key: value for key, value in state.items() if self.wants(key)}
+        return self._frame({"type": "snapshot", "session_id": session_id}, values, "state")
+
+    def changes(self, session_id: str, author: str, changes: dict) -> str | None:
+        """A ``delta`` frame with the subscribed keys of ``changes``, or None when it has none."""
+        values = {key: value for key, value in changes.items() if self.wants(key)}
+        if not values:
+            return None
+        return self._frame({"type": "delta", "session_id": session_id, "author": author}, values, "changes")
+
+    def event(self, session_id: str, event) -> list[str]:
+        """The frames for an ADK event: its streamed text, then its state changes."""
+        frames = []
+        if event.partial:
+            text = "".join(part.text or "" for part in event.content.parts or []) if event.content else ""
+            if self.chunks and text:
+                frames.append(self._frame({"type": "chunk", "session_id": session_id, "author": event.author,
+                                           "text": text}))
+            return frames
+        delta = self.changes(session_id, event.author, event.actions.state_delta if event.actions else {})
+        if delta is not None:
+            frames.append(delta)
+        return frames
+
+    def record_turn(self, state: dict) -> None:
+        """Counts a finished turn and the full state dump a polling client would have fetched for it."""
+        self._stats.incr("turns")
+        self._stats.incr("full_state_bytes", len(json.dumps(
+            {key: value for key, value in state.items() if not key.startswith(TEMP_PREFIX)}, indent=2, default=str)))
+
+    def done(self, session_id: str, elapsed: float) -> str:
+        """The end of a turn."""
+        return self._frame({"type": "done", "session_id": session_id, "elapsed_ms": round(elapsed * 1000, 3)})
+
+    def error(self, detail: str, session_id: str | None = None) -> str:
+        return self._frame({"type": "error", "session_id": session_id, "detail": detail})
+
+
+def report() -> dict:
+    """Frames by type, bytes sent against uncompressed and full-dump sizes, and serialization time."""
+    stats = get_stats("channel")
+    counters = stats.counters
+    sent, full = counters["bytes"], counters["full_state_bytes"]
+    return {
+        "compress_min_bytes": COMPRESS_MIN_BYTES,
+        "connections": counters["connections"],
+        "turns": counters["turns"],
+        "frames": {kind: counters[f"frames:{kind}"] for kind in FRAME_TYPES},
+        "bytes_sent": sent,
+        "bytes_uncompressed": counters["bytes_uncompressed"],
+        "compressed_values": counters["compressed_values"],
+        # One full state dump per turn is the least a polling client fetches.
+        "full_state_bytes": full,
+        "reduction": 1 - sent / full if full else 0.0,
+        "serialize": stats.latency("serialize"),
+    }
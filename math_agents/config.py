@@ -0,0 +1,27 @@
+"""App-wide constants and the initial session state.
+
+Kept free of ADK imports so that the API, worksheet and artifact modules can
+use them without loading the agent framework (see ``agent`` for the agents).
+"""
+
+APP_NAME = "math_animation_app"
+USER_ID = "12345"
+SESSION_ID = "123344"
+MODEL = "gemini-2.5-flash"
+
+INITIAL_STATE = {
+    "topic": "",
+    "math_domain": "",  # the main domain
+    "math_domains": [],  # every domain the problem needs, main first; see domains.py
+    "solution": "",
+    "verification": {},
+    "verification_feedback": "",
+    "animation_story": "",
+    "blender_code": "",
+    "blender_preflight": {},
+    "edit": {},  # set when the topic is a small edit of an earlier problem; see incremental.py
+    "animate": True,
+    "lazy_artifacts": True,
+    "tenant": "",  # ledger.DEFAULT_TENANT when empty
+    "request_id": "",  # the session id when empty; see ledger.py
+}
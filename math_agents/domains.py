@@ -0,0 +1,103 @@
+"""Multi-label domain classification and the merging of several solvers' solutions.
+
+Many problems span domains: a geometry problem that needs trigonometry, a
+statistics problem that needs probability. ``DomainClassifyAgent`` names
+every domain that applies, main domain first. ``parse_domains`` turns its
+reply into labels. Labels outside ``DOMAINS`` become ``GENERAL``, which
+``SupervisorAgent`` sends to a generic solver. At most ``MAX_DOMAINS``
+labels are kept (``MATH_AGENTS_MAX_DOMAINS``, 3 by default).
+
+The supervisor runs the solver of each label at the same time (set
+``MATH_AGENTS_CONCURRENT_SOLVERS=0`` to run them one after another). Each
+solver writes its own state key, ``solution_key(domain)``. ``merge`` then
+builds the final ``solution``. It keeps every solver's steps under its
+domain's heading and ends with one answer line. The answer is the one most
+solvers reached, and the main domain's answer breaks ties. Disagreements are
+counted under ``get_stats("domains")``.
+"""
+
+import os
+import re
+from collections import Counter
+
+from math_agents.metrics import get_stats
+from math_agents.verify import extract_final_answer
+
+
+DOMAINS = ["algebra", "geometry", "calculus", "trigonometry", "probability", "statistics"]
+GENERAL = "general"
+
+MAX_DOMAINS = int(os.environ.get("MATH_AGENTS_MAX_DOMAINS", "3"))
+# Set MATH_AGENTS_CONCURRENT_SOLVERS=0 to run the solvers of a multi-domain problem one after another.
+CONCURRENT_SOLVERS = os.environ.get("MATH_AGENTS_CONCURRENT_SOLVERS", "1") != "0"
+
+_SEPARATORS_RE = re.compile(r"[,;/|\n]|\band\b|\+", re.IGNORECASE)
+
+
+def parse_domains(reply: str, limit: int = MAX_DOMAINS) -> list[str]:
+    """The domain labels in a classifier reply, main domain first, unknown labels as ``GENERAL``.
+
+    Args:
+        reply (str): The classifier's reply, e.g. "geometry, trigonometry".
+        limit (int): Labels kept at most; 0 for no limit.
+
+    Returns:
+        list[str]: Distinct labels in reply order; empty when the reply names none.
+    """
+    labels = []
+    for part in _SEPARATORS_RE.split(reply or ""):
+        label = part.strip(" \t.*`'\"[]").lower()
+        if not label:
+            continue
+        label = label if label in DOMAINS else GENERAL
+        if label not in labels:
+            labels.append(label)
+    return labels[:limit] if limit else labels
+
+
+def solution_key(domain: str) -> str:
+    """The state key the solver of ``domain`` writes its solution to."""
+    return f"{domain}_solution"
+
+
+def _normalized(answer: str) -> str:
+    return re.sub(r"\s+", "", answer).casefold()
+
+
+def merge(solutions: dict[str, str]) -> str:
+    """One solution from the solutions of several domains, given main domain first.
+
+    A single solution is returned as it is.
+    """
+    solutions = {domain: text for domain, text in solutions.items() if text and text.strip()}
+    if len(solutions) <= 1:
+        return next(iter(solutions.values()), "")
+    stats = get_stats("domains")
+    answers = {domain: extract_final_answer(text) for domain, text in solutions.items()}
+    votes = Counter(_normalized(answer) for answer in answers.values() if answer)
+    if len(votes) > 1:
+        stats.incr("disagreed")
+    # Counter keeps insertion order, so the main domain's answer wins a tie.
+    best = votes.most_common(1)[0][0] if votes else ""
+    answer = next((a for a in answers.values() if a and _normalized(a) == best), "")
+    sections = [f"{domain.capitalize()} approach:\n{text.strip()}" for domain, text in solutions.items()]
+    if answer and any("\\boxed" in text for text in solutions.values()):
+        # A boxed answer outranks answer lines (see verify.extract_final_answer).
+        answer = f"\\boxed{{{answer}}}"
+    stats.incr("merged")
+    return "\n\n".join(sections) + (f"\n\nFinal answer: {answer}" if answer else "")
+
+
+def report() -> dict:
+    """Problems classified into several domains, per label, and merges whose solvers disagreed."""
+    counters = get_stats("domains").counters
+    labels = {label: counters[f"label:{label}"] for label in [*DOMAINS, GENERAL]}
+    return {
+        "max_domains": MAX_DOMAINS,
+        "concurrent_solvers": CONCURRENT_SOLVERS,
+        "problems": counters["problems"],
+        "multi_domain": counters["multi_domain"],
+        "labels": labels,
+        "merged": counters["merged"],
+        "disagreed": counters["disagreed"],
+    }
@@ -0,0 +1,635 @@
+"""Small canonical expression trees shared by the local math engines.
+
+Expressions are immutable, hashable tuples so they can be used directly as
+memo-cache keys:
+
+    ("num", Fraction)        exact rational constant
+    ("const", "pi")          named irrational constant
+    ("var", "x")             variable
+    ("add", (t1, t2, ...))   sum, flattened and sorted
+    ("mul", (t1, t2, ...))   product, flattened and sorted, numeric factor first
+    ("pow", base, exponent)
+    ("fn", name, argument)   sin, cos, tan, exp, ln, ...
+
+All trees are built through the ``add``/``mul``/``power``/``fn`` constructors,
+which fold constants, combine like terms and powers and sort operands. Two
+inputs that differ only in spelling ("x*x", "x^2") therefore map to the same
+tree.
+"""
+
+import math
+import re
+from fractions import Fraction
+
+
+FUNCTIONS = {
+    "sin", "cos", "tan", "sec", "csc", "cot",
+    "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh",
+    "exp", "ln", "log", "abs",
+}
+FUNCTION_ALIASES = {"asin": "arcsin", "acos": "arccos", "atan": "arctan", "cosec": "csc"}
+CONSTANTS = {"pi": math.pi}
+
+ZERO = ("num", Fraction(0))
+ONE = ("num", Fraction(1))
+MINUS_ONE = ("num", Fraction(-1))
+HALF = ("num", Fraction(1, 2))
+
+
+class ParseError(ValueError):
+    """Raised when a string cannot be parsed into an expression tree."""
+
+
+# --- Constructors ---
+
+def num(value) -> tuple:
+    return ("num", Fraction(value))
+
+
+def var(name: str) -> tuple:
+    return ("var", name)
+
+
+def is_num(tree, value=None) -> bool:
+    return tree[0] == "num" and (value is None or tree[1] == value)
+
+
+def _degree(tree) -> float:
+    kind = tree[0]
+    if kind == "var":
+        return 1
+    if kind == "pow" and is_num(tree[2]):
+        return float(tree[2][1]) * _degree(tree[1])
+    if kind == "mul":
+        return sum(_degree(t) for t in tree[1])
+    if kind in ("num", "const"):
+        return 0
+    return 0.5
+
+
+def _sort_key(tree):
+    rest = split_coefficient(tree)[1]
+    return (-_degree(tree), repr(rest))
+
+
+_FACTOR_ORDER = {"num": 0, "const": 1, "var": 2, "pow": 3, "fn": 4, "add": 5}
+
+
+def _factor_key(tree):
+    return (_FACTOR_ORDER[tree[0]], repr(tree))
+
+
+def split_coefficient(tree) -> tuple[Fraction, tuple | None]:
+    """Splits ``tree`` into (numeric coefficient, remaining term or None)."""
+    if tree[0] == "num":
+        return tree[1], None
+    if tree[0] == "mul" and tree[1][0][0] == "num":
+        rest = tree[1][1:]
+        return tree[1][0][1], rest[0] if len(rest) == 1 else ("mul", rest)
+    return Fraction(1), tree
+
+
+def add(*args) -> tuple:
+    terms: dict = {}
+    constant = Fraction(0)
+    stack = list(args)
+    while stack:
+        arg = stack.pop(0)
+        if arg[0] == "add":
+            stack[0:0] = list(arg[1])
+            continue
+        coefficient, rest = split_coefficient(arg)
+        if rest is None:
+            constant += coefficient
+        else:
+            terms[rest] = terms.get(rest, Fraction(0)) + coefficient
+    out = [mul(num(c), rest) for rest, c in terms.items() if c != 0]
+    out.sort(key=_sort_key)
+    if constant != 0:
+        out.append(num(constant))
+    if not out:
+        return ZERO
+    if len(out) == 1:
+        return out[0]
+    return ("add", tuple(out))
+
+
+def mul(*args) -> tuple:
+    coefficient = Fraction(1)
+    exponents: dict = {}
+    stack = list(args)
+    while stack:
+        arg = stack.pop(0)
+        if arg[0] == "mul":
+            stack[0:0] = list(arg[1])
+            continue
+        if arg[0] == "num":
+            coefficient *= arg[1]
+            continue
+        base, exponent = (arg[1], arg[2]) if arg[0] == "pow" else (arg, ONE)
+        exponents[base] = add(exponents[base], exponent) if base in exponents else exponent
+    if coefficient == 0:
+        return ZERO
+    factors = []
+    for base, exponent in exponents.items():
+        factor = power(base, exponent)
+        if factor[0] == "num":
+            coefficient *= factor[1]
+        elif factor[0] == "mul":
+            # A numeric base raised to a power can fold into a coefficient times a residue.
+            c, rest = split_coefficient(factor)
+            coefficient *= c
+            factors.extend(rest[1] if rest[0] == "mul" else (rest,))
+        else:
+            factors.append(factor)
+    factors.sort(key=_factor_key)
+    if coefficient != 1 or not factors:
+        factors.insert(0, num(coefficient))
+    if len(factors) == 1:
+        return factors[0]
+    return ("mul", tuple(factors))
+
+
+def power(base, exponent) -> tuple:
+    if is_num(exponent, 0):
+        return ONE
+    if is_num(exponent, 1):
+        return base
+    if is_num(base, 1):
+        return ONE
+    if is_num(base, 0) and exponent[0] == "num":
+        if exponent[1] < 0:
+            raise ZeroDivisionError("0 raised to a negative power")
+        return ZERO
+    if base[0] == "num" and exponent[0] == "num" and exponent[1].denominator == 1:
+        if base[1] == 0 and exponent[1] < 0:
+            raise ZeroDivisionError("0 raised to a negative power")
+        return num(base[1] ** int(exponent[1]))
+    if base[0] == "num" and exponent[0] == "num" and base[1] > 0:
+        # Keep the fractional part of the exponent in [0, 1): 3^(-1/2) -> 3^(1/2)/3.
+        whole = exponent[1].numerator // exponent[1].denominator
+        if whole != 0:
+            return mul(num(base[1] ** whole), power(base, num(exponent[1] - whole)))
+        if base[1].denominator != 1:
+            # (p/q)^e -> p^e * q^-e so surds stay over integer bases.
+            return mul(power(num(base[1].numerator), exponent), power(num(base[1].denominator), num(-exponent[1])))
+        outside, inside = _extract_root(base[1].numerator, exponent[1].denominator)
+        if inside == 1:
+            return num(outside ** exponent[1].numerator)
+        if outside != 1:
+            # sqrt(8) -> 2*sqrt(2)
+            return mul(num(outside ** exponent[1].numerator), ("pow", num(inside), exponent))
+    if base[0] == "pow" and exponent[0] == "num" and exponent[1].denominator == 1:
+        return power(base[1], mul(base[2], exponent))
+    if base[0] == "mul" and exponent[0] == "num" and exponent[1].denominator == 1:
+        return mul(*(power(factor, exponent) for factor in base[1]))
+    if base == ("fn", "exp", ONE):
+        return fn("exp", exponent)
+    return ("pow", base, exponent)
+
+
+def _extract_root(value: int, degree: int) -> tuple[int, int]:
+    """Splits value into outside**degree * inside with small perfect powers pulled out."""
+    outside, inside, factor = 1, value, 2
+    while factor ** degree <= inside and factor < 1000:
+        while inside % (factor ** degree) == 0:
+            inside //= factor ** degree
+            outside *= factor
+        factor += 1
+    return outside, inside
+
+
+_EXACT_FN = {
+    ("sin", Fraction(0)): ZERO,
+    ("cos", Fraction(0)): ONE,
+    ("tan", Fraction(0)): ZERO,
+    ("exp", Fraction(0)): ONE,
+    ("ln", Fraction(1)): ZERO,
+    ("log", Fraction(1)): ZERO,
+    ("arcsin", Fraction(0)): ZERO,
+    ("arctan", Fraction(0)): ZERO,
+    ("sinh", Fraction(0)): ZERO,
+    ("cosh", Fraction(0)): ONE,
+    ("tanh", Fraction(0)): ZERO,
+}
+
+
+def fn(name: str, argument) -> tuple:
+    name = FUNCTION_ALIASES.get(name, name)
+    if argument[0] == "num":
+        if (name, argument[1]) in _EXACT_FN:
+            return _EXACT_FN[(name, argument[1])]
+        if name == "abs":
+            return num(abs(argument[1]))
+    if name == "ln" and argument[0] == "fn" and argument[2:] and argument[1] == "exp":
+        return argument[2]
+    return ("fn", name, argument)
+
+
+def neg(tree) -> tuple:
+    return mul(MINUS_ONE, tree)
+
+
+def div(numerator, denominator) -> tuple:
+    return mul(numerator, power(denominator, MINUS_ONE))
+
+
+def sub(a, b) -> tuple:
+    return add(a, neg(b))
+
+
+# --- Queries and transformations ---
+
+def free_vars(tree) -> frozenset:
+    kind = tree[0]
+    if kind == "var":
+        return frozenset([tree[1]])
+    if kind in ("num", "const"):
+        return frozenset()
+    if kind in ("add", "mul"):
+        return frozenset().union(*(free_vars(t) for t in tree[1]))
+    if kind == "pow":
+        return free_vars(tree[1]) | free_vars(tree[2])
+    return free_vars(tree[2])
+
+
+def depends_on(tree, name: str) -> bool:
+    return name in free_vars(tree)
+
+
+def substitute(tree, name: str, value) -> tuple:
+    """Replaces variable ``name`` by the tree ``value`` and re-canonicalizes."""
+    kind = tree[0]
+    if kind == "var":
+        return value if tree[1] == name else tree
+    if kind in ("num", "const"):
+        return tree
+    if kind == "add":
+        return add(*(substitute(t, name, value) for t in tree[1]))
+    if kind == "mul":
+        return mul(*(substitute(t, name, value) for t in tree[1]))
+    if kind == "pow":
+        return power(substitute(tree[1], name, value), substitute(tree[2], name, value))
+    return fn(tree[1], substitute(tree[2], name, value))
+
+
+def _distribute(factors) -> tuple:
+    result = [ONE]
+    for factor in factors:
+        terms = factor[1] if factor[0] == "add" else (factor,)
+        result = [mul(r, t) for r in result for t in terms]
+    return add(*result)
+
+
+def expand(tree) -> tuple:
+    """Expands products and small positive integer powers of sums."""
+    kind = tree[0]
+    if kind == "add":
+        return add(*(expand(t) for t in tree[1]))
+    if kind == "pow":
+        base = expand(tree[1])
+        exponent = tree[2]
+        if base[0] == "add" and is_num(exponent) and exponent[1].denominator == 1 and 1 < exponent[1] <= 10:
+            return _distribute([base] * int(exponent[1]))
+        return power(base, exponent)
+    if kind == "mul":
+        return _distribute([expand(factor) for factor in tree[1]])
+    return tree
+
+
+def numer_denom(tree) -> tuple[tuple, tuple]:
+    """Splits a product into (numerator, denominator) using negative exponents."""
+    factors = tree[1] if tree[0] == "mul" else (tree,)
+    top, bottom = [], []
+    for factor in factors:
+        if factor[0] == "pow" and is_num(factor[2]) and factor[2][1] < 0:
+            bottom.append(power(factor[1], num(-factor[2][1])))
+        elif factor[0] == "num" and factor[1].denominator != 1:
+            top.append(num(factor[1].numerator))
+            bottom.append(num(factor[1].denominator))
+        else:
+            top.append(factor)
+    return mul(*top), mul(*bottom)
+
+
+_FLOAT_FN = {
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "sec": lambda v: 1 / math.cos(v), "csc": lambda v: 1 / math.sin(v), "cot": lambda v: 1 / math.tan(v),
+    "arcsin": math.asin, "arccos": math.acos, "arctan": math.atan,
+    "sinh": math.sinh, "cosh": math.cosh, "tanh": math.tanh,
+    "exp": math.exp, "ln": math.log, "log": math.log10, "abs": abs,
+}
+
+
+def evaluate(tree, env: dict | None = None) -> float:
+    """Evaluates ``tree`` numerically with variables bound from ``env``.
+
+    Raises:
+        KeyError: If a variable is unbound.
+        ValueError / ZeroDivisionError / OverflowError: On domain errors.
+    """
+    env = env or {}
+    kind = tree[0]
+    if kind == "num":
+        return float(tree[1])
+    if kind == "const":
+        return CONSTANTS[tree[1]]
+    if kind == "var":
+        return float(env[tree[1]])
+    if kind == "add":
+        return math.fsum(evaluate(t, env) for t in tree[1])
+    if kind == "mul":
+        result = 1.0
+        for t in tree[1]:
+            result *= evaluate(t, env)
+        return result
+    if kind == "pow":
+        base, exponent = evaluate(tree[1], env), evaluate(tree[2], env)
+        if base == 0 and exponent < 0:
+            raise ZeroDivisionError("division by zero")
+        result = base ** exponent
+        if isinstance(result, complex):
+            raise ValueError("complex result")
+        return result
+    return _FLOAT_FN[tree[1]](evaluate(tree[2], env))
+
+
+# --- Printing ---
+
+def _fmt_num(value: Fraction) -> str:
+    return str(value.numerator) if value.denominator == 1 else f"{value.numerator}/{value.denominator}"
+
+
+def _atomic(tree) -> bool:
+    return tree[0] in ("var", "const", "fn") or (tree[0] == "num" and tree[1] >= 0 and tree[1].denominator == 1)
+
+
+def _wrap(tree) -> str:
+    text = to_str(tree)
+    return text if _atomic(tree) else f"({text})"
+
+
+def _product_str(factors: list) -> str:
+    parts = []
+    for factor in factors:
+        text = to_str(factor)
+        if factor[0] == "add" or (factor[0] == "num" and factor[1] < 0):
+            text = f"({text})"
+        parts.append(text)
+    if not parts:
+        return "1"
+    out = parts[0]
+    for prev, factor, text in zip(factors, factors[1:], parts[1:]):
+        # Use implicit multiplication after a leading integer: 2x, 3x^2, 2sin(x).
+        implicit = prev[0] == "num" and factor[0] in ("var", "fn", "const", "pow") and not text[0].isdigit()
+        out += text if implicit else "*" + text
+    return out
+
+
+def to_str(tree) -> str:
+    """Renders a tree in the caret notation the solvers use in their steps."""
+    kind = tree[0]
+    if kind == "num":
+        return _fmt_num(tree[1])
+    if kind in ("var", "const"):
+        return tree[1]
+    if kind == "add":
+        terms = list(tree[1])
+        positive = [t for t in terms if split_coefficient(t)[0] > 0]
+        if positive and split_coefficient(terms[0])[0] < 0:
+            # Lead with a positive term: "1 - x" rather than "-x + 1".
+            terms.remove(positive[0])
+            terms.insert(0, positive[0])
+        out = ""
+        for i, term in enumerate(terms):
+            coefficient, rest = split_coefficient(term)
+            negative = coefficient < 0
+            text = to_str(neg(term) if negative else term)
+            if i == 0:
+                out = f"-{text}" if negative else text
+            else:
+                out += f" - {text}" if negative else f" + {text}"
+        return out
+    if kind == "mul":
+        coefficient, rest = split_coefficient(tree)
+        if coefficient < 0:
+            return "-" + to_str(mul(num(-coefficient), rest))
+        top, bottom = numer_denom(tree)
+        top_factors = list(top[1]) if top[0] == "mul" else [top]
+        if is_num(bottom, 1):
+            if top_factors and is_num(top_factors[0], 1) and len(top_factors) > 1:
+                top_factors = top_factors[1:]
+            return _product_str(top_factors)
+        bottom_factors = list(bottom[1]) if bottom[0] == "mul" else [bottom]
+        top_text = _product_str(top_factors)
+        bottom_text = _product_str(bottom_factors)
+        if len(bottom_factors) > 1:
+            bottom_text = f"({bottom_text})"
+        return f"{top_text}/{bottom_text}"
+    if kind == "pow":
+        base, exponent = tree[1], tree[2]
+        if exponent == HALF:
+            return f"sqrt({to_str(base)})"
+        if is_num(exponent) and exponent[1] < 0:
+            positive = power(base, num(-exponent[1]))
+            return f"1/{to_str(positive) if positive[0] in ('pow', 'var', 'fn', 'const') else _wrap(positive)}"
+        return f"{_wrap(base)}^{_wrap(exponent)}"
+    name, argument = tree[1], tree[2]
+    if name == "exp":
+        return "e" if argument == ONE else f"e^{_wrap(argument)}"
+    if name == "abs":
+        return f"|{to_str(argument)}|"
+    if argument[0] == "fn" and argument[1] == "abs":
+        return f"{name}{to_str(argument)}"
+    return f"{name}({to_str(argument)})"
+
+
+def result(steps, answer: str) -> dict:
+    """The tool-style result of a local solver: the steps numbered, then the answer."""
+    lines = [f"Step {i}: {step}" for i, step in enumerate(steps, 1)]
+    lines.append(f"Answer: {answer}")
+    return {"status": "success", "steps": "\n".join(lines), "answer": answer}
+
+
+# --- Parsing ---
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_]+)|(\*\*|[-+*/^(),|]))")
+
+
+def _tokenize(text: str, variables: frozenset | None = None) -> list:
+    text = text.replace("×", "*").replace("·", "*").replace("÷", "/").replace("−", "-").replace("π", "pi")
+    text = text.replace("²", "^2").replace("³", "^3").replace("√", "sqrt")
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise ParseError(f"Unexpected character {text[pos]!r} in {text!r}")
+        number, word, op = match.groups()
+        if number:
+            tokens.append(("num", number))
+        elif word:
+            tokens.extend(_split_word(word, variables))
+        else:
+            tokens.append(("op", "^" if op == "**" else op))
+        pos = match.end()
+    return tokens
+
+
+def _split_word(word: str, variables: frozenset | None = None) -> list:
+    """Splits identifiers like 'xsin' or 'xy' into function names and single-letter variables.
+
+    With ``variables``, a letter that is neither one of them nor ``e`` is an
+    error, so a stray English word is not read as a product of variables.
+    """
+    word = word.lower() if word.lower() in FUNCTIONS | set(FUNCTION_ALIASES) | {"sqrt", "pi"} else word
+    out = []
+    while word:
+        for name in sorted(FUNCTIONS | set(FUNCTION_ALIASES) | {"sqrt"}, key=len, reverse=True):
+            if word.lower().startswith(name):
+                out.append(("fn", FUNCTION_ALIASES.get(name, name)))
+                word = word[len(name):]
+                break
+        else:
+            if word.lower().startswith("pi"):
+                out.append(("const", "pi"))
+                word = word[2:]
+            else:
+                if variables is not None and word[0] not in variables | {"e"}:
+                    raise ParseError(f"Unknown name {word!r}")
+                out.append(("var", word[0]))
+                word = word[1:]
+    return out
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        token = self.peek()
+        if value is not None and token != ("op", value):
+            raise ParseError(f"Expected {value!r}, got {token[1]!r}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        tree = self.expression()
+        if self.pos != len(self.tokens):
+            raise ParseError(f"Unexpected token {self.peek()[1]!r}")
+        return tree
+
+    def expression(self):
+        terms = [self.term()]
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.take()[1]
+            terms.append(self.term() if op == "+" else neg(self.term()))
+        return add(*terms)
+
+    def term(self):
+        factors = [self.unary()]
+        while True:
+            token = self.peek()
+            if token == ("op", "*"):
+                self.take()
+                factors.append(self.unary())
+            elif token == ("op", "/"):
+                self.take()
+                factors.append(power(self.unary(), MINUS_ONE))
+            elif token[0] in ("num", "var", "fn", "const") or token == ("op", "("):
+                # Implicit multiplication: 2x, x(x + 1), 3sin(x).
+                factors.append(self.power())
+            else:
+                return mul(*factors)
+
+    def unary(self):
+        if self.peek() == ("op", "-"):
+            self.take()
+            return neg(self.unary())
+        if self.peek() == ("op", "+"):
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.peek() == ("op", "^"):
+            self.take()
+            exponent = self.unary()
+            if base == ("var", "e"):
+                return fn("exp", exponent)
+            return power(base, exponent)
+        return base
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "num":
+            return num(Fraction(value))
+        if kind == "const":
+            return ("const", value)
+        if kind == "var":
+            return ("var", value)
+        if kind == "fn":
+            exponent = None
+            if self.peek() == ("op", "^"):
+                # sin^2(x) means (sin(x))^2.
+                self.take()
+                exponent = self.primary()
+            if self.peek() == ("op", "("):
+                self.take("(")
+                argument = self.expression()
+                self.take(")")
+            else:
+                argument = self.power()
+            tree = power(argument, HALF) if value == "sqrt" else fn(value, argument)
+            return power(tree, exponent) if exponent is not None else tree
+        if (kind, value) == ("op", "("):
+            tree = self.expression()
+            self.take(")")
+            return tree
+        if (kind, value) == ("op", "|"):
+            tree = self.expression()
+            self.take("|")
+            return fn("abs", tree)
+        raise ParseError(f"Unexpected token {value!r}")
+
+
+def variables(text: str) -> frozenset:
+    """The variable names ``parse`` reads in ``text``, including ones a zero factor would drop from the tree.
+
+    ``e`` is Euler's number, not a variable.
+
+    Raises:
+        ParseError: If the text cannot be tokenized.
+    """
+    return frozenset(value for kind, value in _tokenize(text) if kind == "var" and value != "e")
+
+
+def parse(text: str, variables: frozenset | None = None) -> tuple:
+    """Parses ``text`` into a canonical expression tree.
+
+    Args:
+        text (str): The expression.
+        variables (frozenset | None): The only variable names allowed; any name by default.
+
+    Raises:
+        ParseError: If the text is not a supported expression.
+    """
+    tokens = _tokenize(text, variables)
+    if not tokens:
+        raise ParseError("Empty expression")
+    # A lone 'e' is Euler's number, written as exp(1) so e^x and exp(x) share one form.
+    expanded = []
+    for i, token in enumerate(tokens):
+        if token == ("var", "e") and tokens[i + 1:i + 2] != [("op", "^")]:
+            expanded.extend([("fn", "exp"), ("op", "("), ("num", "1"), ("op", ")")])
+        else:
+            expanded.append(token)
+    try:
+        return _Parser(expanded).parse()
+    except (IndexError, TypeError) as e:
+        raise ParseError(str(e)) from e
@@ -0,0 +1,307 @@
+"""Closed-form geometry solver: a formula registry for 2D/3D shapes with unit handling.
+
+Handles requests such as "Area of circle with radius 3", "Volume of cube with
+side 4" or "Surface area of a cylinder with radius 2 cm and height 50 mm".
+Formulas are written in the caret notation of ``expr`` and evaluated exactly
+(9*pi stays 9pi) before a decimal approximation is added.
+"""
+
+import re
+from dataclasses import dataclass
+from fractions import Fraction
+
+from math_agents import expr as E
+
+
+@dataclass(frozen=True)
+class Formula:
+    """One closed-form formula for a quantity of a shape."""
+
+    shape: str
+    quantity: str
+    params: tuple[str, ...]
+    expression: str
+    symbol: str
+    dimension: int  # 1 = length, 2 = area, 3 = volume
+    display: str
+    label: str = ""
+
+    @property
+    def name(self) -> str:
+        return self.label or self.quantity
+
+
+FORMULAS: dict[tuple[str, str], Formula] = {}
+
+
+def register(shape: str, quantity: str, params: tuple[str, ...], expression: str, symbol: str,
+             dimension: int, display: str, label: str = "") -> None:
+    """Adds a formula to the registry, keyed by (shape, quantity)."""
+    FORMULAS[(shape, quantity)] = Formula(shape, quantity, params, expression, symbol, dimension, display, label)
+
+
+# --- 2D shapes ---
+register("circle", "area", ("r",), "pi*r^2", "A", 2, "A = πr²")
+register("circle", "perimeter", ("r",), "2*pi*r", "C", 1, "C = 2πr", label="circumference")
+register("circle", "diameter", ("r",), "2*r", "d", 1, "d = 2r")
+register("square", "area", ("s",), "s^2", "A", 2, "A = s²")
+register("square", "perimeter", ("s",), "4*s", "P", 1, "P = 4s")
+register("square", "diagonal", ("s",), "s*sqrt(2)", "d", 1, "d = s√2")
+register("rectangle", "area", ("l", "w"), "l*w", "A", 2, "A = l·w")
+register("rectangle", "perimeter", ("l", "w"), "2*(l + w)", "P", 1, "P = 2(l + w)")
+register("rectangle", "diagonal", ("l", "w"), "sqrt(l^2 + w^2)", "d", 1, "d = √(l² + w²)")
+register("triangle", "area", ("b", "h"), "b*h/2", "A", 2, "A = ½·b·h")
+register("equilateral triangle", "area", ("s",), "sqrt(3)*s^2/4", "A", 2, "A = (√3/4)s²")
+register("equilateral triangle", "perimeter", ("s",), "3*s", "P", 1, "P = 3s")
+register("right triangle", "hypotenuse", ("a", "b"), "sqrt(a^2 + b^2)", "c", 1, "c = √(a² + b²)")
+register("right triangle", "area", ("a", "b"), "a*b/2", "A", 2, "A = ½·a·b")
+register("parallelogram", "area", ("b", "h"), "b*h", "A", 2, "A = b·h")
+register("trapezoid", "area", ("a", "b", "h"), "(a + b)*h/2", "A", 2, "A = ½(a + b)·h")
+register("rhombus", "area", ("p", "q"), "p*q/2", "A", 2, "A = ½·d₁·d₂")
+register("ellipse", "area", ("a", "b"), "pi*a*b", "A", 2, "A = πab")
+register("semicircle", "area", ("r",), "pi*r^2/2", "A", 2, "A = ½πr²")
+
+# --- 3D shapes ---
+register("cube", "volume", ("s",), "s^3", "V", 3, "V = s³")
+register("cube", "surface area", ("s",), "6*s^2", "SA", 2, "SA = 6s²")
+register("cube", "diagonal", ("s",), "s*sqrt(3)", "d", 1, "d = s√3")
+register("cuboid", "volume", ("l", "w", "h"), "l*w*h", "V", 3, "V = l·w·h")
+register("cuboid", "surface area", ("l", "w", "h"), "2*(l*w + l*h + w*h)", "SA", 2, "SA = 2(lw + lh + wh)")
+register("cuboid", "diagonal", ("l", "w", "h"), "sqrt(l^2 + w^2 + h^2)", "d", 1, "d = √(l² + w² + h²)")
+register("sphere", "volume", ("r",), "4*pi*r^3/3", "V", 3, "V = (4/3)πr³")
+register("sphere", "surface area", ("r",), "4*pi*r^2", "SA", 2, "SA = 4πr²")
+register("hemisphere", "volume", ("r",), "2*pi*r^3/3", "V", 3, "V = (2/3)πr³")
+register("hemisphere", "surface area", ("r",), "3*pi*r^2", "SA", 2, "SA = 3πr²")
+register("cylinder", "volume", ("r", "h"), "pi*r^2*h", "V", 3, "V = πr²h")
+register("cylinder", "surface area", ("r", "h"), "2*pi*r*(r + h)", "SA", 2, "SA = 2πr(r + h)")
+register("cylinder", "lateral surface area", ("r", "h"), "2*pi*r*h", "LSA", 2, "LSA = 2πrh")
+register("cone", "volume", ("r", "h"), "pi*r^2*h/3", "V", 3, "V = (1/3)πr²h")
+register("cone", "surface area", ("r", "h"), "pi*r*(r + sqrt(r^2 + h^2))", "SA", 2, "SA = πr(r + √(r² + h²))")
+register("cone", "lateral surface area", ("r", "h"), "pi*r*sqrt(r^2 + h^2)", "LSA", 2, "LSA = πr√(r² + h²)")
+register("square pyramid", "volume", ("s", "h"), "s^2*h/3", "V", 3, "V = (1/3)s²h")
+
+
+SHAPE_ALIASES = {
+    "equilateral triangle": "equilateral triangle",
+    "right triangle": "right triangle", "right-angled triangle": "right triangle", "right angled triangle": "right triangle",
+    "square pyramid": "square pyramid", "pyramid": "square pyramid",
+    "rectangular prism": "cuboid", "rectangular box": "cuboid", "cuboid": "cuboid", "box": "cuboid",
+    "semicircle": "semicircle", "hemisphere": "hemisphere",
+    "circle": "circle", "square": "square", "rectangle": "rectangle", "triangle": "triangle",
+    "parallelogram": "parallelogram", "trapezoid": "trapezoid", "trapezium": "trapezoid",
+    "rhombus": "rhombus", "ellipse": "ellipse", "oval": "ellipse",
+    "cube": "cube", "sphere": "sphere", "ball": "sphere", "cylinder": "cylinder", "cone": "cone",
+}
+
+QUANTITY_ALIASES = [
+    ("lateral surface area", "lateral surface area"), ("curved surface area", "lateral surface area"),
+    ("total surface area", "surface area"), ("surface area", "surface area"),
+    ("circumference", "perimeter"), ("perimeter", "perimeter"),
+    ("hypotenuse", "hypotenuse"), ("diagonal", "diagonal"), ("diameter", "diameter"),
+    ("volume", "volume"), ("area", "area"),
+]
+
+PARAM_ALIASES = {
+    "r": ("radius",),
+    "s": ("side length", "side", "edge length", "edge"),
+    "l": ("slant height", "length"),
+    "w": ("width", "breadth"),
+    "h": ("height", "altitude", "depth"),
+    "b": ("base", "leg b", "second leg", "other leg"),
+    "a": ("leg a", "first leg", "leg", "side a", "semi-major axis", "parallel side a"),
+    "p": ("diagonal 1", "first diagonal", "diagonals"),
+    "q": ("diagonal 2", "second diagonal"),
+}
+PARAM_NAMES = {"r": "radius", "s": "side", "l": "length", "w": "width", "h": "height", "b": "base",
+               "a": "a", "p": "d₁", "q": "d₂"}
+
+# Length units relative to one metre.
+UNITS = {
+    "mm": Fraction(1, 1000), "millimeter": Fraction(1, 1000), "millimetre": Fraction(1, 1000),
+    "cm": Fraction(1, 100), "centimeter": Fraction(1, 100), "centimetre": Fraction(1, 100),
+    "m": Fraction(1), "meter": Fraction(1), "metre": Fraction(1),
+    "km": Fraction(1000), "kilometer": Fraction(1000), "kilometre": Fraction(1000),
+    "in": Fraction(254, 10000), "inch": Fraction(254, 10000), "inches": Fraction(254, 10000),
+    "ft": Fraction(3048, 10000), "foot": Fraction(3048, 10000), "feet": Fraction(3048, 10000),
+    "yd": Fraction(9144, 10000), "yard": Fraction(9144, 10000),
+    "mi": Fraction(1609344, 1000),  "mile": Fraction(1609344, 1000),
+}
+_CANONICAL_UNIT = {"millimeter": "mm", "millimetre": "mm", "centimeter": "cm", "centimetre": "cm",
+                   "meter": "m", "metre": "m", "kilometer": "km", "kilometre": "km", "inch": "in",
+                   "inches": "in", "foot": "ft", "feet": "ft", "yard": "yd", "mile": "mi"}
+_POWER_SUFFIX = {1: "", 2: "²", 3: "³"}
+
+_NUMBER = r"(\d+(?:\.\d+)?(?:/\d+)?)"
+# What follows a quantity that is given rather than asked for: "diameter is 10", "area = 4".
+_GIVEN_RE = re.compile(r"\s*(?:of|=|is|:|equal\s+to)?\s*\d")
+_UNIT_WORDS = "|".join(sorted((re.escape(u) + "s?" for u in UNITS), key=len, reverse=True))
+# "in" is only a unit when it is not introducing a target unit ("height 4 in cubic meters").
+_UNIT = r"(?:\s*(" + _UNIT_WORDS.replace("|ins?|", r"|in(?!\s+(?:square|cubic|" + _UNIT_WORDS + r")\b)|") + r")\b)?"
+_TARGET_UNIT_RE = re.compile(r"\bin\s+(?:square\s+|cubic\s+)?(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")s?\b(?:\^?[23²³])?\s*[?.]?\s*$", re.IGNORECASE)
+
+
+def _unit_name(unit: str | None) -> str | None:
+    if not unit:
+        return None
+    unit = unit.lower()
+    if unit not in UNITS and unit.endswith("s") and unit[:-1] in UNITS:
+        unit = unit[:-1]
+    return _CANONICAL_UNIT.get(unit, unit)
+
+
+def _detect_shape(text: str) -> str | None:
+    """The one shape named in ``text``; None when there is none or more than one.
+
+    Longer aliases take precedence over the ones inside them ("square pyramid"
+    over "square").
+    """
+    shapes, taken = set(), []
+    for alias in sorted(SHAPE_ALIASES, key=len, reverse=True):
+        for match in re.finditer(rf"\b{re.escape(alias)}s?\b", text):
+            if not any(match.start() < end and start < match.end() for start, end in taken):
+                taken.append(match.span())
+                shapes.add(SHAPE_ALIASES[alias])
+    return shapes.pop() if len(shapes) == 1 else None
+
+
+def _detect_quantity(text: str) -> str | None:
+    """The quantity asked for: the first one named in ``text`` that is not given a value.
+
+    "Area of a circle whose diameter is 10" asks for the area; the diameter,
+    followed by its value, is given. Longer aliases take precedence over the
+    ones inside them ("surface area" over "area").
+    """
+    matches, taken = [], []
+    for alias, quantity in QUANTITY_ALIASES:
+        for match in re.finditer(rf"\b{re.escape(alias)}\b", text):
+            if any(match.start() < end and start < match.end() for start, end in taken):
+                continue
+            taken.append(match.span())
+            if not _GIVEN_RE.match(text, match.end()):
+                matches.append((match.start(), quantity))
+    return min(matches)[1] if matches else None
+
+
+def _extract_params(text: str) -> dict[str, tuple[Fraction, str | None]]:
+    """Finds 'radius 3 cm', 'side = 4', 'r=2' style parameter values.
+
+    Longer aliases are matched first and claim their text, so "slant height 5"
+    gives the slant height and not the height.
+    """
+    values: dict[str, tuple[Fraction, str | None]] = {}
+    taken = []
+    aliases = sorted(((alias, param) for param, names in PARAM_ALIASES.items() for alias in names + (param,)),
+                     key=lambda item: len(item[0]), reverse=True)
+    for alias, param in aliases:
+        for match in re.finditer(rf"\b{re.escape(alias)}\s*(?:of|=|is|:|equal\s+to)?\s*{_NUMBER}{_UNIT}", text):
+            if any(match.start() < end and start < match.end() for start, end in taken):
+                continue
+            taken.append(match.span())
+            if param not in values:
+                values[param] = (Fraction(match.group(1)), _unit_name(match.group(2)))
+            break
+    diameter = re.search(rf"\bdiameter\s*(?:of|=|is|:)?\s*{_NUMBER}{_UNIT}", text)
+    if diameter and "r" not in values:
+        values["r"] = (Fraction(diameter.group(1)) / 2, _unit_name(diameter.group(2)))
+        values["_diameter"] = (Fraction(diameter.group(1)), _unit_name(diameter.group(2)))
+    legs = re.search(rf"\blegs?\s*(?:of|=|are|:)?\s*{_NUMBER}{_UNIT}\s*(?:and|,)\s*{_NUMBER}{_UNIT}", text)
+    if legs:
+        values["a"] = (Fraction(legs.group(1)), _unit_name(legs.group(2)))
+        values["b"] = (Fraction(legs.group(3)), _unit_name(legs.group(4) or legs.group(2)))
+    sides = re.search(rf"\bparallel\s+sides\s*(?:of|=|are|:)?\s*{_NUMBER}{_UNIT}\s*(?:and|,)\s*{_NUMBER}{_UNIT}", text)
+    if sides:
+        values["a"] = (Fraction(sides.group(1)), _unit_name(sides.group(2)))
+        values["b"] = (Fraction(sides.group(3)), _unit_name(sides.group(4) or sides.group(2)))
+    diagonals = re.search(rf"\bdiagonals\s*(?:of|=|are|:)?\s*{_NUMBER}{_UNIT}\s*(?:and|,)\s*{_NUMBER}{_UNIT}", text)
+    if diagonals:
+        values["p"] = (Fraction(diagonals.group(1)), _unit_name(diagonals.group(2)))
+        values["q"] = (Fraction(diagonals.group(3)), _unit_name(diagonals.group(4) or diagonals.group(2)))
+    return values
+
+
+def _resolve_formula(shape: str, quantity: str, values: dict) -> Formula | None:
+    formula = FORMULAS.get((shape, quantity))
+    if formula is None and shape == "triangle" and quantity == "hypotenuse":
+        formula = FORMULAS[("right triangle", "hypotenuse")]
+    if formula is None and shape == "rectangle" and "s" in values:
+        formula = FORMULAS.get(("square", quantity))
+    if formula is None:
+        return None
+    if shape == "cuboid" and "s" in values and not set(formula.params) <= set(values):
+        return FORMULAS.get(("cube", quantity))
+    if shape == "rectangle" and "l" not in values and "b" in values and "h" in values:
+        return None
+    return formula
+
+
+def _fmt_value(tree) -> str:
+    text = E.to_str(tree).replace("pi", "π")
+    if tree[0] == "num":
+        return text if tree[1].denominator == 1 else f"{text} ≈ {float(tree[1]):.6g}"
+    return f"{text} ≈ {E.evaluate(tree):.6g}"
+
+
+def solve(problem: str) -> dict | None:
+    """Solves a closed-form geometry problem locally.
+
+    Args:
+        problem (str): e.g. "Area of circle with radius 3", "Volume of cube with side 4 cm".
+
+    Returns:
+        dict | None: ``{"status", "steps", "answer"}``, or None when the problem
+        is not a single registered formula of a single shape and should go to the LLM.
+    """
+    text = problem.lower().replace("×", "x")
+    shape, quantity = _detect_shape(text), _detect_quantity(text)
+    if shape is None or quantity is None:
+        return None
+    values = _extract_params(text)
+    formula = _resolve_formula(shape, quantity, values)
+    if formula is None:
+        return None
+    if shape == "rectangle" and "l" not in values and "s" not in values and "b" in values and "w" in values:
+        values["l"] = values.pop("b")
+    if formula.params == ("b", "h") and "b" not in values and "l" in values:
+        values["b"] = values["l"]
+    if any(p not in values for p in formula.params):
+        return None
+
+    units = [values[p][1] for p in formula.params if values[p][1]]
+    target = _TARGET_UNIT_RE.search(text)
+    unit = _unit_name(target.group(1)) if target else (units[0] if units else None)
+
+    steps = [f"Identify the shape and quantity: {formula.name} of a {formula.shape}.",
+             f"Use the formula {formula.display}."]
+    substitutions = {}
+    conversions = []
+    for p in formula.params:
+        value, value_unit = values[p]
+        if unit and value_unit and value_unit != unit:
+            converted = value * UNITS[value_unit] / UNITS[unit]
+            conversions.append(f"{_fmt_num(value)} {value_unit} = {_fmt_num(converted)} {unit}")
+            value = converted
+        substitutions[p] = value
+    if conversions:
+        steps.append("Convert to a common unit: " + "; ".join(conversions) + ".")
+    if "_diameter" in values and "r" in formula.params:
+        steps.append(f"The radius is half the diameter: r = {_fmt_num(values['_diameter'][0])}/2 = {_fmt_num(values['r'][0])}.")
+
+    tree = E.parse(formula.expression)
+    substituted_text = formula.expression
+    for p, value in substitutions.items():
+        tree = E.substitute(tree, p, E.num(value))
+        substituted_text = re.sub(rf"\b{p}\b", f"({_fmt_num(value)})" if value < 0 or value.denominator != 1 else _fmt_num(value), substituted_text)
+    given = ", ".join(f"{PARAM_NAMES[p]} = {_fmt_num(substitutions[p])}{' ' + unit if unit else ''}" for p in formula.params)
+    steps.append(f"Substitute {given}: {formula.symbol} = {substituted_text.replace('*', '·').replace('pi', 'π')}.")
+    value_text = _fmt_value(tree)
+    unit_text = f" {unit}{_POWER_SUFFIX[formula.dimension]}" if unit else (" square units" if formula.dimension == 2 else " cubic units" if formula.dimension == 3 else " units")
+    steps.append(f"Simplify: {formula.symbol} = {value_text}{unit_text}.")
+
+    return E.result(steps, f"{formula.name.capitalize()} of the {formula.shape} = {value_text}{unit_text}")
+
+
+def _fmt_num(value: Fraction) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    decimal = float(value)
+    return f"{decimal:g}" if len(f"{decimal:g}") <= 8 else f"{value.numerator}/{value.denominator}"
@@ -0,0 +1,268 @@
+"""Perceptual-hash cache for repeated problem images.
+
+Every preprocessed image gets a 64-bit pHash (DCT of a 32x32 thumbnail) and a
+64-bit dHash (horizontal gradient signs). Two photos of the same page differ
+by a few bits, so the cache matches on Hamming distance rather than equality.
+
+Lookups use multi-index hashing: the pHash is split into ``CHUNKS`` 16-bit
+chunks, each with its own table. If two hashes are within distance ``r``, by
+the pigeonhole principle at least one chunk differs by at most ``r //
+CHUNKS`` bits, so probing every chunk value within that radius finds all
+candidates without scanning the whole index. Candidates are then confirmed
+on the full pHash and on the dHash.
+
+The hashes see a 32x32 thumbnail, so two photos of the same problem with one
+digit changed fall within ``MAX_DISTANCE`` of each other. A hash match is
+therefore only a candidate: it counts as a hit when the binarized ink of the
+preprocessed image (see ``ink_signature``) also agrees with the stored one.
+Preprocessing crops to the text and scales lines to a fixed height, so
+retakes of a page line up pixel for pixel up to stroke width, which
+``same_ink`` tolerates; a changed character leaves a cluster of ink that has
+no counterpart within a pixel, which it rejects.
+
+The cache holds at most ``MAX_ENTRIES`` entries
+(``MATH_AGENTS_IMAGE_CACHE_SIZE``) and evicts the least recently used. The
+hash index alone would scale to millions of entries (16 bytes each plus the
+chunk tables), but the ink cannot be reduced to a digest: a digit edit and a
+retake differ by the same few percent of ink, and only the position of the
+change tells them apart. The ink is therefore kept whole, zlib-compressed to
+about 3 KB a page, which bounds the default to 16384 entries (about 50 MB).
+"""
+
+import os
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+from math_agents.metrics import get_stats
+
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_DISTANCE = 6  # pHash bits that may differ for a near-duplicate
+MAX_DHASH_DISTANCE = 10  # confirmation threshold on the dHash
+MAX_ENTRIES = int(os.environ.get("MATH_AGENTS_IMAGE_CACHE_SIZE", "16384"))  # an entry's ink is about 3 KB
+INK_LEVEL = 128  # normalized pixels darker than this are ink
+INK_WINDOW = 32  # px, about one text line after preprocessing
+MAX_INK_CHANGE = 16  # unmatched ink pixels one window may hold; a changed digit leaves 40 or more
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (size+1) x size thumbnail."""
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """DCT hash: signs of the 8x8 lowest frequencies (minus DC) against their median."""
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def ink_signature(image: Image.Image) -> tuple[int, int, bytes]:
+    """The binarized ink of a preprocessed image: ``(height, width, zlib-compressed packed bits)``."""
+    mask = np.asarray(image.convert("L")) < INK_LEVEL
+    return mask.shape[0], mask.shape[1], zlib.compress(np.packbits(mask).tobytes(), 1)
+
+
+def _unpack(signature: tuple[int, int, bytes]) -> np.ndarray:
+    height, width, bits = signature
+    packed = np.frombuffer(zlib.decompress(bits), dtype=np.uint8)
+    return np.unpackbits(packed, count=height * width).reshape(height, width).astype(bool)
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    padded = np.pad(mask, 1)
+    out = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            out |= padded[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+    return out
+
+
+def same_ink(a: tuple[int, int, bytes] | None, b: tuple[int, int, bytes] | None) -> bool:
+    """True when two ink signatures show the same text.
+
+    Ink in either image with no ink of the other within one pixel is
+    unmatched; stroke width and sub-pixel shifts leave almost none. The
+    images differ when any ``INK_WINDOW`` square holds more than
+    ``MAX_INK_CHANGE`` unmatched pixels, or when their sizes differ by more
+    than a pixel, which means a different crop or line height.
+    """
+    if a is None or b is None or abs(a[0] - b[0]) > 1 or abs(a[1] - b[1]) > 1:
+        return False
+    height = -(-max(a[0], b[0]) // INK_WINDOW) * INK_WINDOW
+    width = -(-max(a[1], b[1]) // INK_WINDOW) * INK_WINDOW
+    masks = []
+    for signature in (a, b):
+        mask = np.zeros((height, width), dtype=bool)
+        mask[:signature[0], :signature[1]] = _unpack(signature)
+        masks.append(mask)
+    first, second = masks
+    unmatched = (first & ~_dilate(second)) | (second & ~_dilate(first))
+    windows = unmatched.reshape(height // INK_WINDOW, INK_WINDOW, width // INK_WINDOW, INK_WINDOW).sum(axis=(1, 3))
+    return int(windows.max()) <= MAX_INK_CHANGE
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _chunks(value: int) -> list[int]:
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def _neighbours(chunk: int, radius: int):
+    """Yields every chunk value within ``radius`` bit flips of ``chunk``."""
+    yield chunk
+    for r in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for p in positions:
+                flipped ^= 1 << p
+            yield flipped
+
+
+class ImageCache:
+    """Maps perceptual hashes to previously extracted results.
+
+    Args:
+        max_distance (int): Largest pHash Hamming distance counted as a match.
+        max_entries (int): Entries kept; the least recently used is evicted beyond this.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE, max_entries: int = MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._phashes = array("Q")
+        self._dhashes = array("Q")
+        self._values: list[dict | None] = []
+        self._inks: list[tuple[int, int, bytes] | None] = []
+        self._tables: list[dict[int, list[int]]] = [{} for _ in range(CHUNKS)]
+        self._recent: OrderedDict[int, None] = OrderedDict()  # live indices, least recently used first
+        self._free: list[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def _candidates(self, p: int) -> set[int]:
+        radius = self.max_distance // CHUNKS
+        found = set()
+        for table, chunk in zip(self._tables, _chunks(p)):
+            for probe in _neighbours(chunk, radius):
+                ids = table.get(probe)
+                if ids:
+                    found.update(ids)
+        return found
+
+    def nearest(self, p: int, d: int, ink: tuple[int, int, bytes] | None = None) -> tuple[int, dict] | None:
+        """Returns ``(distance, value)`` of the closest match, or None.
+
+        With ``ink`` (from ``ink_signature``), a hash match also needs the
+        same ink as the stored image; without it the hashes alone decide.
+        """
+        with self._lock:
+            matches = []
+            for i in self._candidates(p):
+                distance = hamming(p, self._phashes[i])
+                if distance <= self.max_distance and hamming(d, self._dhashes[i]) <= MAX_DHASH_DISTANCE:
+                    matches.append((distance, i, self._values[i], self._inks[i]))
+        for distance, i, value, stored_ink in sorted(matches, key=lambda match: match[0]):
+            if ink is not None and not same_ink(ink, stored_ink):
+                get_stats("image_cache").incr("ink_mismatch")
+                continue
+            with self._lock:
+                if i in self._recent:
+                    self._recent.move_to_end(i)
+            return distance, value
+        return None
+
+    def get(self, p: int, d: int, ink: tuple[int, int, bytes] | None = None) -> dict | None:
+        """Looks up a near-duplicate image, recording hit rate and lookup latency."""
+        stats = get_stats("image_cache")
+        start = time.perf_counter()
+        match = self.nearest(p, d, ink)
+        stats.observe("lookup", time.perf_counter() - start)
+        stats.incr("hit" if match else "miss")
+        return dict(match[1]) if match else None
+
+    def put(self, p: int, d: int, value: dict, ink: tuple[int, int, bytes] | None = None) -> None:
+        """Stores ``value``; an existing entry with the same hashes and ink is overwritten."""
+        with self._lock:
+            for i in self._tables[0].get(_chunks(p)[0], ()):
+                if self._phashes[i] == p and self._dhashes[i] == d and self._inks[i] == ink:
+                    self._values[i] = dict(value)
+                    self._recent.move_to_end(i)
+                    return
+            if len(self._recent) >= self.max_entries:
+                self._evict(next(iter(self._recent)))
+            if self._free:
+                index = self._free.pop()
+                self._phashes[index], self._dhashes[index] = p, d
+                self._values[index], self._inks[index] = dict(value), ink
+            else:
+                index = len(self._values)
+                self._phashes.append(p)
+                self._dhashes.append(d)
+                self._values.append(dict(value))
+                self._inks.append(ink)
+            self._recent[index] = None
+            for table, chunk in zip(self._tables, _chunks(p)):
+                table.setdefault(chunk, []).append(index)
+
+    def _evict(self, index: int) -> None:
+        for table, chunk in zip(self._tables, _chunks(self._phashes[index])):
+            ids = table[chunk]
+            ids.remove(index)
+            if not ids:
+                del table[chunk]
+        del self._recent[index]
+        self._values[index] = self._inks[index] = None
+        self._free.append(index)
+        get_stats("image_cache").incr("evictions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._phashes = array("Q")
+            self._dhashes = array("Q")
+            self._values.clear()
+            self._inks.clear()
+            self._tables = [{} for _ in range(CHUNKS)]
+            self._recent.clear()
+            self._free.clear()
+
+
+def report() -> dict:
+    """Hit rate, lookup latency, evictions and hash matches rejected on their ink."""
+    stats = get_stats("image_cache")
+    return {
+        "hits": stats.counters["hit"],
+        "misses": stats.counters["miss"],
+        "hit_rate": stats.ratio("hit", "hit", "miss"),
+        "ink_mismatches": stats.counters["ink_mismatch"],
+        "evictions": stats.counters["evictions"],
+        "lookup": stats.latency("lookup"),
+    }
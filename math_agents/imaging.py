@@ -0,0 +1,315 @@
+"""Local preprocessing for photos of math problems before they reach the model.
+
+The pipeline is:
+
+1. fix EXIF orientation so phone photos are upright;
+2. convert to grayscale;
+3. crop to the bounding box of the text plus a small margin;
+4. estimate the height of a text line from the row ink profile and downscale
+   so that lines are about ``TARGET_LINE_HEIGHT`` pixels tall, which keeps
+   text legible for the vision model while dropping most of the pixels;
+5. normalize contrast against the local background, so shadows and paper
+   texture become white and ink becomes black;
+6. encode as PNG or JPEG, whichever is smaller, and compute the perceptual
+   hashes and ink signature used by ``image_cache``.
+
+``preprocess`` is CPU bound; ``preprocess_async`` runs it in a process pool so
+the event loop serving uploads never blocks on it.
+"""
+
+import asyncio
+import io
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+from math_agents.image_cache import dhash, ink_signature, phash
+
+
+TARGET_LINE_HEIGHT = 32  # px per text line after downscaling
+MIN_LONG_EDGE = 512
+MAX_LONG_EDGE = 1600
+CROP_MARGIN = 0.03  # fraction of the cropped size kept around the content
+INK_CONTRAST = 40  # levels darker than the local background that count as ink
+ANALYSIS_LONG_EDGE = 1024  # content detection runs on a copy reduced to about this size
+BLOCK_GAP_FACTOR = 1.8  # a gap this many times the median line gap separates worksheet problems
+JPEG_QUALITY = 80
+MAX_WORKERS = 2
+
+_executor: ProcessPoolExecutor | None = None
+
+
+@dataclass
+class PreprocessedImage:
+    """A preprocessed image ready to send to the model."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_size: tuple[int, int]
+    scale: float
+    elapsed_ms: float
+    phash: int = 0
+    dhash: int = 0
+    ink: tuple[int, int, bytes] | None = None
+
+    def summary(self) -> dict:
+        return {
+            "original_bytes": self.original_bytes,
+            "uploaded_bytes": len(self.data),
+            "original_size": list(self.original_size),
+            "size": [self.width, self.height],
+            "scale": round(self.scale, 4),
+            "mime_type": self.mime_type,
+            "preprocess_ms": round(self.elapsed_ms, 3),
+            "phash": f"{self.phash:016x}",
+        }
+
+
+def _background(gray: Image.Image) -> Image.Image:
+    """Estimates the paper brightness around each pixel with a wide box blur."""
+    return gray.filter(ImageFilter.BoxBlur(max(4, max(gray.size) // 64)))
+
+
+def _inked(profile: bytes, min_mean: int) -> list[bool]:
+    return [v >= min_mean for v in profile]
+
+
+def _runs(flags: list[bool]) -> list[tuple[int, int]]:
+    """Returns (start, end) index pairs of consecutive True values."""
+    runs, start = [], None
+    for i, flag in enumerate(flags + [False]):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            runs.append((start, i))
+            start = None
+    return runs
+
+
+def _ink_mask(gray: Image.Image) -> tuple[Image.Image, int]:
+    """Returns a reduced binary ink mask (255 = ink) and its reduction factor.
+
+    A pixel is ink when it is ``INK_CONTRAST`` levels darker than its blurred
+    neighbourhood, which copes with uneven lighting.
+    """
+    factor = max(1, math.ceil(max(gray.size) / ANALYSIS_LONG_EDGE))
+    small = gray.reduce(factor) if factor > 1 else gray
+    mask = ImageChops.subtract(_background(small), small).point(lambda v: 255 if v >= INK_CONTRAST else 0)
+    return mask.filter(ImageFilter.MedianFilter(3)), factor
+
+
+def _row_runs(mask: Image.Image) -> list[tuple[int, int]]:
+    # Mean ink per row; a row counts when about 1% of it is ink.
+    return _runs(_inked(mask.resize((1, mask.height), Image.Resampling.BOX).tobytes(), 2))
+
+
+def _col_runs(mask: Image.Image) -> list[tuple[int, int]]:
+    return _runs(_inked(mask.resize((mask.width, 1), Image.Resampling.BOX).tobytes(), 2))
+
+
+def _median_height(row_runs: list[tuple[int, int]]) -> int | None:
+    heights = sorted(end - start for start, end in row_runs if end - start >= 2)
+    return heights[len(heights) // 2] if heights else None
+
+
+def find_content(gray: Image.Image) -> tuple[tuple[int, int, int, int] | None, int | None]:
+    """Locates the text on the page.
+
+    Row and column ink profiles of the reduced ink mask give the content box,
+    and the median height of the inked row runs gives the text line height.
+
+    Returns:
+        tuple: ``(box, line_height)`` in full-resolution pixels; either is None
+        when no text is found.
+    """
+    mask, factor = _ink_mask(gray)
+    row_runs, col_runs = _row_runs(mask), _col_runs(mask)
+    if not row_runs or not col_runs:
+        return None, None
+
+    box = (col_runs[0][0] * factor, row_runs[0][0] * factor,
+           min(gray.width, col_runs[-1][1] * factor), min(gray.height, row_runs[-1][1] * factor))
+    line_height = _median_height(row_runs)
+    return box, line_height * factor if line_height else None
+
+
+def find_blocks(gray: Image.Image) -> list[tuple[tuple[int, int, int, int], int | None]]:
+    """Splits the page into blocks of text separated by wider than usual gaps.
+
+    On a worksheet the gap between problems is larger than the spacing between
+    lines of one problem, so a gap over ``BLOCK_GAP_FACTOR`` times the median
+    gap (and over one line height) starts a new block. Evenly spaced lines
+    stay a single block.
+
+    Returns:
+        list: ``(box, line_height)`` per block, top to bottom, in full-resolution pixels.
+    """
+    mask, factor = _ink_mask(gray)
+    lines = [run for run in _row_runs(mask) if run[1] - run[0] >= 2]
+    if not lines:
+        return []
+    line_height = _median_height(lines)
+    gaps = sorted(b[0] - a[1] for a, b in zip(lines, lines[1:]))
+    threshold = max(gaps[len(gaps) // 2] * BLOCK_GAP_FACTOR, line_height) if gaps else 0
+
+    groups = [[lines[0]]]
+    for previous, line in zip(lines, lines[1:]):
+        if line[0] - previous[1] > threshold:
+            groups.append([])
+        groups[-1].append(line)
+
+    blocks = []
+    for group in groups:
+        top, bottom = group[0][0], group[-1][1]
+        col_runs = _col_runs(mask.crop((0, top, mask.width, bottom)))
+        if not col_runs:
+            continue
+        box = (col_runs[0][0] * factor, top * factor,
+               min(gray.width, col_runs[-1][1] * factor), min(gray.height, bottom * factor))
+        height = _median_height(group)
+        blocks.append((box, height * factor if height else None))
+    return blocks
+
+
+def crop(gray: Image.Image, box: tuple[int, int, int, int]) -> Image.Image:
+    """Crops to ``box`` plus a ``CROP_MARGIN`` border."""
+    left, top, right, bottom = box
+    pad_x = int((right - left) * CROP_MARGIN) + 2
+    pad_y = int((bottom - top) * CROP_MARGIN) + 2
+    return gray.crop((max(0, left - pad_x), max(0, top - pad_y),
+                      min(gray.width, right + pad_x), min(gray.height, bottom + pad_y)))
+
+
+def normalize_contrast(gray: Image.Image) -> Image.Image:
+    """Maps the local background to white and the darkest ink to black.
+
+    Differences below half of ``INK_CONTRAST`` are treated as paper, which
+    removes texture and noise and keeps the encoded image small.
+    """
+    ink = ImageChops.subtract(_background(gray), gray)
+    ink = ink.point(lambda v: 0 if v < INK_CONTRAST // 2 else v)
+    return ImageOps.invert(ImageOps.autocontrast(ink, cutoff=(0, 1)))
+
+
+def target_scale(gray: Image.Image, line_height: int | None) -> float:
+    """Scale factor (<= 1) giving legible lines within the long-edge bounds."""
+    long_edge = max(gray.size)
+    scale = TARGET_LINE_HEIGHT / line_height if line_height else MAX_LONG_EDGE / long_edge
+    scale = min(scale, MAX_LONG_EDGE / long_edge)
+    scale = max(scale, min(1.0, MIN_LONG_EDGE / long_edge))
+    return min(scale, 1.0)
+
+
+def _encode(image: Image.Image) -> tuple[bytes, str]:
+    """Encodes as PNG and JPEG and returns the smaller one."""
+    png = io.BytesIO()
+    image.save(png, format="PNG", optimize=True)
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    if png.tell() <= jpeg.tell():
+        return png.getvalue(), "image/png"
+    return jpeg.getvalue(), "image/jpeg"
+
+
+def _open(data: bytes) -> tuple[Image.Image, tuple[int, int]]:
+    """Decodes an upload to upright grayscale; returns it with the original size."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unreadable image: {e}") from e
+    return ImageOps.exif_transpose(image).convert("L"), image.size
+
+
+def _finish(gray: Image.Image, box, line_height: int | None, data: bytes,
+            original_size: tuple[int, int], start: float) -> PreprocessedImage:
+    """Crops, downscales, normalizes, encodes and hashes one region."""
+    if box is not None:
+        gray = crop(gray, box)
+    scale = target_scale(gray, line_height)
+    if scale < 1.0:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        gray = gray.resize(size, Image.Resampling.LANCZOS)
+    gray = normalize_contrast(gray)
+
+    encoded, mime_type = _encode(gray)
+    hashes = phash(gray), dhash(gray)
+    return PreprocessedImage(
+        data=encoded,
+        mime_type=mime_type,
+        width=gray.width,
+        height=gray.height,
+        original_bytes=len(data),
+        original_size=original_size,
+        scale=scale,
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+        phash=hashes[0],
+        dhash=hashes[1],
+        ink=ink_signature(gray),
+    )
+
+
+def preprocess(data: bytes) -> PreprocessedImage:
+    """Runs the full preprocessing pipeline on an uploaded image.
+
+    Args:
+        data (bytes): The uploaded file (any format Pillow can open).
+
+    Returns:
+        PreprocessedImage: The encoded result and size/latency figures.
+
+    Raises:
+        ValueError: If the data is not a readable image.
+    """
+    start = time.perf_counter()
+    gray, original_size = _open(data)
+    box, line_height = find_content(gray)
+    return _finish(gray, box, line_height, data, original_size, start)
+
+
+def preprocess_regions(data: bytes) -> list[PreprocessedImage]:
+    """Like ``preprocess`` but returns one image per text block (see ``find_blocks``).
+
+    Raises:
+        ValueError: If the data is not a readable image.
+    """
+    start = time.perf_counter()
+    gray, original_size = _open(data)
+    blocks = find_blocks(gray)
+    if len(blocks) <= 1:
+        box, line_height = blocks[0] if blocks else (None, None)
+        return [_finish(gray, box, line_height, data, original_size, start)]
+    return [_finish(gray, box, line_height, data, original_size, start) for box, line_height in blocks]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
+
+
+async def preprocess_async(data: bytes) -> PreprocessedImage:
+    """Runs ``preprocess`` in the worker pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), preprocess, data)
+
+
+async def preprocess_regions_async(data: bytes) -> list[PreprocessedImage]:
+    """Runs ``preprocess_regions`` in the worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), preprocess_regions, data)
+
+
+def shutdown() -> None:
+    """Stops the worker pool (called on application shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,285 @@
+"""Incremental re-solve of an edited problem, patching the earlier artifacts.
+
+Users often tweak a problem (change a number, rename a character) and send
+it again. ``detect`` compares the new topic with the one it edits, word by
+word. An edit is small when the two are at least ``EDIT_SIMILARITY`` alike
+(``MATH_AGENTS_EDIT_SIMILARITY``, 0.8 by default) and at most
+``MAX_CHANGED_WORDS`` words change (``MATH_AGENTS_EDIT_MAX_WORDS``, 8).
+
+A small edit keeps the earlier domains, so ``SupervisorAgent`` skips the
+classifier. The problem is solved again, since the answer usually changes.
+The earlier story and Blender script are kept under ``previous_key`` and
+patched instead of regenerated: ``ArtifactPatchAgent`` sends each one, with
+the changes and the new solution, to an edit agent that replies with
+search/replace blocks, and ``apply_blocks`` applies them. The reply is a
+few lines instead of the whole artifact. An unchanged topic copies the
+artifacts with no call.
+
+A patch falls back to regenerating (see ``story.StoryPipelineAgent``) when a
+block does not match, when a story that had a schema no longer parses, or
+when a script gets more pre-flight diagnostics than before (see
+``blender_preflight``). Patches, fallbacks and their latency are counted
+under ``get_stats("incremental")``.
+"""
+
+import difflib
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import AsyncGenerator
+from typing_extensions import override
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.events import Event, EventActions
+
+from math_agents import blender_preflight
+from math_agents.metrics import get_stats
+from math_agents.prompts import artifact_edit_prompt
+from math_agents.story import SCHEMA_KEY, TEMP_SCHEMA_KEY, parse_story
+
+
+logger = logging.getLogger(__name__)
+
+EDIT_SIMILARITY = float(os.environ.get("MATH_AGENTS_EDIT_SIMILARITY", "0.8"))
+MAX_CHANGED_WORDS = int(os.environ.get("MATH_AGENTS_EDIT_MAX_WORDS", "8"))
+
+ARTIFACTS = ["animation_story", "blender_code"]
+EDIT_KEY = "edit"
+# The artifact being patched, for the edit agent's instruction. Not temp:, which a state delta cannot set.
+REQUEST_KEY = "artifact_edit"
+KINDS = {"animation_story": "animation story", "blender_code": "Blender Python script"}
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_BLOCK_RE = re.compile(r"<<<<<<< SEARCH\n(.*?)\n=======\n(.*?)\n?>>>>>>> REPLACE", re.DOTALL)
+
+
+@dataclass
+class Edit:
+    """A small edit of a problem: the topic it edits and the text each change replaced."""
+
+    previous_topic: str
+    replacements: list[tuple[str, str]] = field(default_factory=list)
+    similarity: float = 1.0
+
+    def to_state(self) -> dict:
+        return {"previous_topic": self.previous_topic, "replacements": [list(r) for r in self.replacements],
+                "similarity": round(self.similarity, 3)}
+
+
+def detect(previous: str, topic: str) -> Edit | None:
+    """The edit that turns ``previous`` into ``topic``, or None when it is not a small edit."""
+    old, new = list(_WORD_RE.finditer(previous or "")), list(_WORD_RE.finditer(topic or ""))
+    if not old or not new:
+        return None
+    matcher = difflib.SequenceMatcher(None, [m.group() for m in old], [m.group() for m in new], autojunk=False)
+    replacements, changed = [], 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        changed += max(i2 - i1, j2 - j1)
+        before = previous[old[i1].start():old[i2 - 1].end()] if i2 > i1 else ""
+        after = topic[new[j1].start():new[j2 - 1].end()] if j2 > j1 else ""
+        replacements.append((before, after))
+    similarity = matcher.ratio()
+    if similarity < EDIT_SIMILARITY or changed > MAX_CHANGED_WORDS:
+        return None
+    return Edit(previous, replacements, similarity)
+
+
+def previous_key(key: str) -> str:
+    """The state key holding the earlier version of artifact ``key``."""
+    return f"previous_{key}"
+
+
+def can_patch(state) -> bool:
+    """Whether the session is a small edit with an earlier artifact still to patch."""
+    return bool(state.get(EDIT_KEY)) and any(state.get(previous_key(key)) and not state.get(key) for key in ARTIFACTS)
+
+
+def seed(previous: dict, topic: str) -> dict:
+    """Session state for solving ``topic`` that carries over what an edit of ``previous`` leaves valid.
+
+    Args:
+        previous (dict): State of the session whose problem ``topic`` edits.
+        topic (str): The edited problem.
+
+    Returns:
+        dict: Empty when ``topic`` is not a small edit. Otherwise the edit, the
+        domains and the earlier artifacts; an unchanged topic keeps the solution too.
+    """
+    stats = get_stats("incremental")
+    edit = detect(previous.get("topic") or "", topic)
+    if edit is None or not previous.get("math_domains"):
+        stats.incr("not_small")
+        return {}
+    stats.incr("edits")
+    state = {EDIT_KEY: edit.to_state(), "math_domain": previous["math_domain"],
+             "math_domains": list(previous["math_domains"])}
+    if not edit.replacements and previous.get("solution"):
+        state.update(solution=previous["solution"], verification=previous.get("verification") or {})
+    for key in ARTIFACTS:
+        # Artifacts never generated for the earlier problem are generated in full for this one.
+        if previous.get(key):
+            state[previous_key(key)] = previous[key]
+    return state
+
+
+def apply_blocks(text: str, reply: str) -> str:
+    """Applies the search/replace blocks of ``reply`` to ``text``.
+
+    Raises:
+        ValueError: If the reply has no blocks, or a block's search text does not occur exactly once.
+    """
+    blocks = _BLOCK_RE.findall(reply)
+    if not blocks:
+        if reply.strip() == "NO CHANGES":
+            return text
+        raise ValueError("the reply has no search/replace blocks")
+    for search, replace in blocks:
+        count = text.count(search)
+        if count != 1:
+            raise ValueError(f"search text found {count} times: {search[:60]!r}")
+        text = text.replace(search, replace, 1)
+    return text
+
+
+def edit_instruction(context: ReadonlyContext) -> str:
+    """Instruction provider for the edit agents: the artifact, the changes and the new solution."""
+    request = context.state.get(REQUEST_KEY) or {}
+    edit = context.state.get(EDIT_KEY) or {}
+    changes = "\n".join(f"- {before or '(nothing)'!r} -> {after or '(nothing)'!r}"
+                        for before, after in edit.get("replacements", []))
+    key = request.get("key") or ""
+    return artifact_edit_prompt(KINDS.get(key, "artifact"), context.state.get(previous_key(key)) or "",
+                                edit.get("previous_topic", ""), context.state.get("topic", ""), changes,
+                                context.state.get("solution", ""))
+
+
+def make_edit_agent(name: str, model, key: str) -> LlmAgent:
+    return LlmAgent(
+        name=name,
+        model=model,
+        instruction=edit_instruction,
+        include_contents="none",  # the artifact and the edit are in the instruction
+        output_key=f"{key}_edit",
+    )
+
+
+class ArtifactPatchAgent(BaseAgent):
+    """Patches the earlier story and Blender script of an edited problem; regenerates what cannot be patched.
+
+    ``pipeline`` (the ``StoryPipelineAgent``) regenerates what is still
+    missing. It belongs to ``SupervisorAgent``, so it is a field here rather
+    than a sub-agent.
+    """
+
+    story_edit_agent: LlmAgent
+    code_edit_agent: LlmAgent
+    pipeline: BaseAgent
+
+    def __init__(self, name: str, story_edit_agent: LlmAgent, code_edit_agent: LlmAgent, pipeline: BaseAgent):
+        super().__init__(name=name, story_edit_agent=story_edit_agent, code_edit_agent=code_edit_agent,
+                         pipeline=pipeline, sub_agents=[story_edit_agent, code_edit_agent])
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    def _validated(self, key: str, previous: str, reply: str) -> dict | None:
+        """The state delta that stores the patched artifact, or None if the patch is unusable."""
+        stats = get_stats("incremental")
+        try:
+            patched = apply_blocks(previous, reply)
+        except ValueError as e:
+            stats.incr(f"unmatched:{key}")
+            logger.warning(f"[{self.name}] Patch of {key} does not apply ({e}); regenerating.")
+            return None
+        delta = {key: patched}
+        if key == "animation_story":
+            if parse_story(patched) is None and parse_story(previous) is not None:
+                stats.incr(f"invalid:{key}")
+                logger.warning(f"[{self.name}] Patched story has no valid schema; regenerating.")
+                return None
+        else:
+            diagnostics = blender_preflight.check(patched)
+            if len(diagnostics) > len(blender_preflight.check(previous)):
+                stats.incr(f"invalid:{key}")
+                logger.warning(f"[{self.name}] Patched script has new pre-flight diagnostics; regenerating.")
+                return None
+            delta["blender_preflight"] = {"status": "clean" if not diagnostics else "flagged", "patched": True,
+                                          "diagnostics": [str(d) for d in diagnostics]}
+        return delta
+
+    @override
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        stats = get_stats("incremental")
+        state = ctx.session.state
+        edit = state.get(EDIT_KEY) or {}
+        for key, edit_agent in zip(ARTIFACTS, (self.story_edit_agent, self.code_edit_agent)):
+            if state.get(key):
+                continue
+            previous = state.get(previous_key(key)) or ""
+            if not previous:
+                break
+            if not edit.get("replacements"):
+                delta = {key: previous}
+                stats.incr(f"copied:{key}")
+            else:
+                yield self._state_event(ctx, {REQUEST_KEY: {"key": key}})
+                # Its own branch, so the code edit does not see the story edit's reply.
+                branch = f"{ctx.branch}.{edit_agent.name}" if ctx.branch else edit_agent.name
+                start = time.perf_counter()
+                async for event in edit_agent.run_async(ctx.model_copy(update={"branch": branch})):
+                    yield event
+                stats.observe(f"patch:{key}", time.perf_counter() - start)
+                delta = self._validated(key, previous, state.get(edit_agent.output_key) or "")
+                if delta is None:
+                    break
+                stats.incr(f"patched:{key}")
+            schema = parse_story(delta[key]) if key == "animation_story" else None
+            if schema is not None:
+                # Stored as StoryPipelineAgent stores it, for a regenerated script and for clients.
+                state[TEMP_SCHEMA_KEY] = schema
+                delta[SCHEMA_KEY] = schema.model_dump()
+            yield self._state_event(ctx, delta)
+        if state.get(REQUEST_KEY):
+            yield self._state_event(ctx, {REQUEST_KEY: None})
+
+        missing = [key for key in ARTIFACTS if not state.get(key)]
+        for key in missing:
+            stats.incr(f"regenerated:{key}")
+        if missing:
+            async for event in self.pipeline.run_async(ctx):
+                yield event
+
+
+def report() -> dict:
+    """Small edits detected, and per artifact the patches, copies and fallbacks to regenerating."""
+    stats = get_stats("incremental")
+    counters = stats.counters
+    per_artifact = {}
+    for key in ARTIFACTS:
+        per_artifact[key] = {
+            "patched": counters[f"patched:{key}"],
+            "copied": counters[f"copied:{key}"],
+            "unmatched": counters[f"unmatched:{key}"],
+            "invalid": counters[f"invalid:{key}"],
+            "regenerated": counters[f"regenerated:{key}"],
+            "patch": stats.latency(f"patch:{key}"),
+        }
+    return {
+        "edit_similarity": EDIT_SIMILARITY,
+        "max_changed_words": MAX_CHANGED_WORDS,
+        "edits": counters["edits"],
+        "not_small": counters["not_small"],
+        "domains_reused": counters["domains_reused"],
+        "artifacts": per_artifact,
+    }
@@ -0,0 +1,351 @@
+"""Token and cost ledger for model calls, with per-request and per-tenant budgets.
+
+Every model call is recorded with its prompt, cached and output tokens
+(thinking tokens count as output) and an estimated cost from ``PRICES``. It
+is tagged with the request, session, tenant and stage (the calling agent)
+and the model. The ledger keeps:
+
+- running totals per tenant, stage, model and request;
+- the last ``MAX_ENTRIES`` calls.
+
+Requests beyond ``MAX_REQUESTS`` and tenants beyond ``MAX_TENANTS`` are
+forgotten, least recently charged first. Tenants come from the API keys
+configured in ``api``, so the tenant limit is only a backstop.
+
+A request is one API call. Its sessions carry the id in the ``request_id``
+state key; a session without one is its own request. Sessions name their
+tenant in the ``tenant`` state key.
+
+Budgets are off unless set:
+
+- ``MATH_AGENTS_REQUEST_BUDGET_USD`` caps the spend of one request;
+- ``MATH_AGENTS_TENANT_BUDGET_USD`` caps the spend of a tenant in each
+  window of ``MATH_AGENTS_TENANT_WINDOW`` seconds (a day by default).
+
+``admit`` raises ``BudgetExceededError`` once a budget is spent. An admitted
+call holds its expected cost against the budgets until it is recorded, so
+calls made concurrently cannot all slip under the budget. The call that
+crosses the budget still completes, so a budget can be overrun by about one
+call. ``metering`` connects the ledger to the agents.
+
+Prices are USD per million tokens. Set ``MATH_AGENTS_PRICES`` to a JSON
+object of model -> ``[input, cached input, output]`` to override them. A
+model without a price is charged at the price of ``config.MODEL``.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+
+from math_agents.config import MODEL
+from math_agents.metrics import get_stats
+
+
+REQUEST_BUDGET = float(os.environ.get("MATH_AGENTS_REQUEST_BUDGET_USD", "0"))
+TENANT_BUDGET = float(os.environ.get("MATH_AGENTS_TENANT_BUDGET_USD", "0"))
+TENANT_WINDOW = float(os.environ.get("MATH_AGENTS_TENANT_WINDOW", "86400"))  # seconds
+DEFAULT_TENANT = "default"
+MAX_ENTRIES = 10000
+MAX_REQUESTS = 10000
+MAX_TENANTS = 1000
+HOLD_SECONDS = 600.0  # a hold never released, e.g. by a cancelled call, lapses after this
+
+
+@dataclass(frozen=True)
+class Price:
+    """USD per million tokens."""
+
+    input: float
+    cached: float
+    output: float
+
+
+# Paid-tier list prices for prompts up to 200k tokens.
+PRICES = {
+    "gemini-2.5-flash": Price(input=0.30, cached=0.03, output=2.50),
+    "gemini-2.5-flash-lite": Price(input=0.10, cached=0.01, output=0.40),
+    "gemini-2.5-pro": Price(input=1.25, cached=0.125, output=10.00),
+}
+PRICES.update({model: Price(*prices) for model, prices in json.loads(os.environ.get("MATH_AGENTS_PRICES", "{}")).items()})
+
+
+def price(model: str) -> Price:
+    return PRICES.get(model.removeprefix("models/")) or PRICES[MODEL]
+
+
+def cost(model: str, prompt_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    """Estimated USD cost of one call."""
+    p = price(model)
+    return ((prompt_tokens - cached_tokens) * p.input + cached_tokens * p.cached + output_tokens * p.output) / 1e6
+
+
+class BudgetExceededError(RuntimeError):
+    """A request or tenant has spent its budget."""
+
+    def __init__(self, scope: str, key: str, spent: float, budget: float):
+        super().__init__(f"The {scope} budget of {key} is spent: ${spent:.4f} of ${budget:.4f}.")
+        self.scope, self.key, self.spent, self.budget = scope, key, spent, budget
+
+
+def budget_error(error: BaseException) -> BudgetExceededError | None:
+    """The ``BudgetExceededError`` in ``error``, which may be an exception group from parallel agents."""
+    if isinstance(error, BudgetExceededError):
+        return error
+    for inner in getattr(error, "exceptions", ()):
+        if (found := budget_error(inner)) is not None:
+            return found
+    return None
+
+
+@dataclass(frozen=True)
+class Charge:
+    """Who a model call is charged to."""
+
+    request: str
+    session: str
+    tenant: str = DEFAULT_TENANT
+    stage: str = ""
+
+
+def charge_for(state, session_id: str, stage: str = "") -> Charge:
+    """The charge of a call made for a session with ``state``."""
+    return Charge(request=state.get("request_id") or session_id, session=session_id,
+                  tenant=state.get("tenant") or DEFAULT_TENANT, stage=stage)
+
+
+@dataclass(eq=False)
+class Hold:
+    """The expected cost of an admitted call, held against its budgets until the call is recorded."""
+
+    charge: Charge
+    amount: float
+    time: float
+
+
+@dataclass
+class Totals:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def add(self, prompt_tokens: int, cached_tokens: int, output_tokens: int, cost_usd: float) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost_usd
+
+
+@dataclass
+class _Request:
+    tenant: str
+    totals: Totals = field(default_factory=Totals)
+    stages: dict[str, Totals] = field(default_factory=dict)
+
+
+class Ledger:
+    """Records model calls and enforces the request and tenant budgets."""
+
+    def __init__(self, request_budget: float = REQUEST_BUDGET, tenant_budget: float = TENANT_BUDGET,
+                 tenant_window: float = TENANT_WINDOW):
+        self.request_budget, self.tenant_budget, self.tenant_window = request_budget, tenant_budget, tenant_window
+        self._lock = threading.Lock()
+        self._entries: deque[dict] = deque(maxlen=MAX_ENTRIES)
+        self._requests: OrderedDict[str, _Request] = OrderedDict()
+        self._totals: dict[str, dict[str, Totals]] = {"tenant": OrderedDict(), "stage": {}, "model": {}}
+        self._stage_requests: dict[str, int] = {}
+        # tenant -> (window start, spent in the window)
+        self._windows: dict[str, tuple[float, float]] = {}
+        # (scope, request or tenant) -> calls admitted and not yet recorded
+        self._holds: dict[tuple[str, str], set[Hold]] = {}
+        self._stats = get_stats("ledger")
+
+    def record(self, charge: Charge, model: str, prompt_tokens: int = 0, cached_tokens: int = 0,
+               output_tokens: int = 0) -> float:
+        """Records one call and returns its estimated cost."""
+        amount = cost(model, prompt_tokens, cached_tokens, output_tokens)
+        tokens = (prompt_tokens, cached_tokens, output_tokens, amount)
+        now = time.time()
+        with self._lock:
+            self._entries.append({"time": now, **asdict(charge), "model": model, "prompt_tokens": prompt_tokens,
+                                  "cached_tokens": cached_tokens, "output_tokens": output_tokens, "cost_usd": amount})
+            for kind, key in (("tenant", charge.tenant), ("stage", charge.stage), ("model", model)):
+                self._totals[kind].setdefault(key, Totals()).add(*tokens)
+            request = self._requests.get(charge.request)
+            if request is None:
+                request = self._requests[charge.request] = _Request(tenant=charge.tenant)
+                while len(self._requests) > MAX_REQUESTS:
+                    self._requests.popitem(last=False)
+            self._requests.move_to_end(charge.request)
+            request.totals.add(*tokens)
+            if charge.stage not in request.stages:
+                request.stages[charge.stage] = Totals()
+                self._stage_requests[charge.stage] = self._stage_requests.get(charge.stage, 0) + 1
+            request.stages[charge.stage].add(*tokens)
+            start, spent = self._window(charge.tenant, now)
+            self._windows[charge.tenant] = (start, spent + amount)
+            tenants = self._totals["tenant"]
+            tenants.move_to_end(charge.tenant)
+            while len(tenants) > MAX_TENANTS:
+                forgotten, _ = tenants.popitem(last=False)
+                self._windows.pop(forgotten, None)
+                self._stats.incr("forgotten_tenants")
+        self._stats.incr("calls")
+        self._stats.incr("output_tokens", output_tokens)
+        return amount
+
+    def _window(self, tenant: str, now: float) -> tuple[float, float]:
+        start, spent = self._windows.get(tenant, (now, 0.0))
+        return (now, 0.0) if now - start >= self.tenant_window else (start, spent)
+
+    def spent(self, request: str) -> float:
+        with self._lock:
+            entry = self._requests.get(request)
+            return entry.totals.cost_usd if entry else 0.0
+
+    def tenant_spent(self, tenant: str) -> float:
+        """Spend of ``tenant`` in its current budget window."""
+        with self._lock:
+            return self._window(tenant, time.time())[1]
+
+    def _held(self, scope: str, key: str, now: float) -> float:
+        holds = self._holds.get((scope, key))
+        if not holds:
+            return 0.0
+        holds.difference_update([hold for hold in holds if now - hold.time > HOLD_SECONDS])
+        return sum(hold.amount for hold in holds)
+
+    def _committed(self, scope: str, key: str, now: float) -> float:
+        """Spent and held by a request or tenant; call with the lock held."""
+        if scope == "request":
+            entry = self._requests.get(key)
+            spent = entry.totals.cost_usd if entry else 0.0
+        else:
+            spent = self._window(key, now)[1]
+        return spent + self._held(scope, key, now)
+
+    def remaining(self, charge: Charge) -> float:
+        """Budget left to ``charge``'s request and tenant, whichever is less; ``inf`` without budgets."""
+        now, left = time.time(), math.inf
+        with self._lock:
+            for scope, key, budget in self._budgets(charge):
+                left = min(left, budget - self._committed(scope, key, now))
+        return left
+
+    def _budgets(self, charge: Charge) -> list[tuple[str, str, float]]:
+        return [(scope, key, budget) for scope, key, budget in (("request", charge.request, self.request_budget),
+                                                                ("tenant", charge.tenant, self.tenant_budget))
+                if budget]
+
+    def admit(self, charge: Charge) -> Hold:
+        """Admits a call of ``charge`` and holds its expected cost until ``release``.
+
+        The expected cost is the mean cost of a call of the stage so far.
+        Calls in flight count against the budgets through their holds, so
+        concurrent calls cannot all pass the check before any is recorded.
+
+        Raises:
+            BudgetExceededError: If the request or tenant has spent or holds its whole budget.
+        """
+        now = time.time()
+        with self._lock:
+            for scope, key, budget in self._budgets(charge):
+                if (committed := self._committed(scope, key, now)) >= budget:
+                    self._stats.incr(f"refused:{scope}")
+                    raise BudgetExceededError(scope, key, committed, budget)
+            stage = self._totals["stage"].get(charge.stage)
+            hold = Hold(charge, stage.cost_usd / stage.calls if stage and stage.calls else 0.0, now)
+            for scope, key, _ in self._budgets(charge):
+                self._holds.setdefault((scope, key), set()).add(hold)
+        return hold
+
+    def release(self, hold: Hold) -> None:
+        """Releases a hold; releasing it again does nothing."""
+        with self._lock:
+            for key in (("request", hold.charge.request), ("tenant", hold.charge.tenant)):
+                holds = self._holds.get(key)
+                if holds is not None:
+                    holds.discard(hold)
+                    if not holds:
+                        del self._holds[key]
+
+    def estimate(self, stages: list[str]) -> float:
+        """Mean cost per request of ``stages``, over the requests that ran each of them."""
+        with self._lock:
+            return sum(self._totals["stage"][stage].cost_usd / self._stage_requests[stage]
+                       for stage in stages if stage in self._totals["stage"])
+
+    def request(self, request: str) -> dict | None:
+        """Totals of one request, per stage, with its recent calls."""
+        with self._lock:
+            entry = self._requests.get(request)
+            if entry is None:
+                return None
+            entries = [dict(e) for e in self._entries if e["request"] == request]
+            return {"request": request, "tenant": entry.tenant, **asdict(entry.totals),
+                    "stages": {stage: asdict(totals) for stage, totals in entry.stages.items()}, "entries": entries}
+
+    def tenant(self, tenant: str) -> dict | None:
+        """Totals of one tenant, with its spend and budget in the current window."""
+        with self._lock:
+            totals = self._totals["tenant"].get(tenant)
+            if totals is None:
+                return None
+            start, spent = self._window(tenant, time.time())
+            requests = sum(1 for entry in self._requests.values() if entry.tenant == tenant)
+        return {"tenant": tenant, **asdict(totals), "requests": requests, "window_start": start,
+                "window_spent_usd": spent, "budget_usd": self.tenant_budget or None}
+
+    def report(self) -> dict:
+        with self._lock:
+            totals = {kind: {key: asdict(t) for key, t in by_key.items()} for kind, by_key in self._totals.items()}
+            costs = sorted(entry.totals.cost_usd for entry in self._requests.values())
+        pick = lambda p: costs[min(len(costs) - 1, int(p * len(costs)))] if costs else 0.0  # noqa: E731
+        counters = self._stats.counters
+        return {
+            "budgets": {"request_usd": self.request_budget or None, "tenant_usd": self.tenant_budget or None,
+                        "tenant_window_s": self.tenant_window},
+            "calls": sum(t["calls"] for t in totals["model"].values()),
+            "cost_usd": sum(t["cost_usd"] for t in totals["model"].values()),
+            "requests": len(costs),
+            "request_cost_usd": {"mean": sum(costs) / len(costs) if costs else 0.0, "p50": pick(0.50),
+                                 "p95": pick(0.95), "max": costs[-1] if costs else 0.0},
+            "refused": {"request": counters["refused:request"], "tenant": counters["refused:tenant"]},
+            "degraded": {key.removeprefix("degraded:"): value for key, value in counters.items()
+                         if key.startswith("degraded:")},
+            "by_tenant": totals["tenant"],
+            "by_stage": totals["stage"],
+            "by_model": totals["model"],
+        }
+
+
+_ledger: Ledger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Ledger:
+    """The process-wide ledger, with the budgets configured by the environment."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger()
+        return _ledger
+
+
+def set_ledger(ledger: Ledger) -> Ledger:
+    """Replaces the process-wide ledger, e.g. to run with other budgets; returns the new one."""
+    global _ledger
+    with _ledger_lock:
+        _ledger = ledger
+    return ledger
+
+
+def report() -> dict:
+    """Calls, tokens and cost by tenant, stage and model; request cost percentiles; refusals and degradations."""
+    return get_ledger().report()
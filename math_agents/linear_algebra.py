@@ -0,0 +1,424 @@
+"""Local linear-algebra solver used before falling back to the LLM.
+
+Handles small linear systems written as text ("2x + 3y = 6 and x - y = 2")
+and matrices uploaded as ``.npy`` or CSV files. Large inputs are memory-mapped
+instead of being read into memory up front, and large results are summarized
+(with the full array written next to the input) so they never end up in
+session state.
+"""
+
+import os
+import re
+import tempfile
+
+import numpy as np
+
+
+# Results with more elements than this are summarized instead of inlined.
+MAX_INLINE_ELEMENTS = 64
+# CSV files larger than this are converted once into a memory-mapped .npy file.
+CSV_MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024
+
+OPERATION_PATTERNS = {
+    "inverse": re.compile(r"\binver(se|t)", re.IGNORECASE),
+    "determinant": re.compile(r"\bdet(erminant)?\b", re.IGNORECASE),
+    "eigen": re.compile(r"\beigen", re.IGNORECASE),
+    "rank": re.compile(r"\brank\b", re.IGNORECASE),
+}
+
+_EQUATION_SPLIT_RE = re.compile(r"\s*(?:\band\b|;|,|\n)\s*", re.IGNORECASE)
+# A signed term: a number, a variable, or a number times a variable. "*" may only follow a number.
+_TERM_RE = re.compile(
+    r"([+-]?)\s*(?:(\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?)\s*\*?)?\s*([a-zA-Z](?:_?\d+)?)?"
+)
+# Words, numbers, operators and single other characters, keeping whitespace to tell "2xy" from "if 2x".
+_TOKEN_RE = re.compile(r"\s+|[a-zA-Z]+(?:_?\d+)?|\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?|.")
+# What an equation side is made of: numbers, operators and one-letter variables such as x or x_1.
+_MATH_TOKEN_RE = re.compile(r"[a-zA-Z](?:_?\d+)?|\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?|[+\-*/]|\s+")
+# The only words allowed around the equations: asking to solve the system, nothing else to evaluate.
+QUESTION_WORDS = {
+    "solve", "find", "determine", "compute", "calculate", "what", "are", "is", "the", "a", "of", "for", "if",
+    "given", "that", "where", "when", "such", "system", "linear", "simultaneous", "equation", "equations",
+    "value", "values", "unknown", "unknowns", "variable", "variables", "all", "both", "each", "following",
+}
+_QUESTION_PUNCTUATION = set("?.:!()")
+
+
+# --- Parsing ---
+
+def detect_operation(problem: str) -> str:
+    """Returns the requested operation name for a problem statement."""
+    for operation, pattern in OPERATION_PATTERNS.items():
+        if pattern.search(problem):
+            return operation
+    return "solve"
+
+
+def _parse_side(side: str) -> tuple[dict[str, float], float] | None:
+    """Parses one side of a linear equation into variable coefficients and a constant."""
+    side = side.replace(" ", "")
+    if not side:
+        return None
+    coefficients: dict[str, float] = {}
+    constant = 0.0
+    pos = 0
+    while pos < len(side):
+        match = _TERM_RE.match(side, pos)
+        if not match or match.end() == pos:
+            return None
+        sign, number, variable = match.groups()
+        if not number and not variable:
+            return None
+        if pos and not sign:
+            # "2*3" or "xy": a product, not a sum of terms.
+            return None
+        value = 1.0
+        if number:
+            num, _, den = number.partition("/")
+            value = float(num) / float(den) if den else float(num)
+        if sign == "-":
+            value = -value
+        if variable:
+            coefficients[variable] = coefficients.get(variable, 0.0) + value
+        else:
+            constant += value
+        pos = match.end()
+    return coefficients, constant
+
+
+def _equation_sides(text: str) -> tuple[str, str, str] | None:
+    """The two sides of the equation in ``text``, cut out of the words around it, and those words.
+
+    Each side extends from the ``=`` over numbers, operators and one-letter
+    variables up to the first word. Returns None when ``text`` holds no single
+    equation, or when a word touches the equation ("2xy = 6", "xy+1 = 2"): a
+    run of letters may be a product of variables, and is not guessed at.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if tokens.count("=") != 1:
+        return None
+    equals = tokens.index("=")
+
+    def side(indices) -> list[int] | None:
+        taken = []
+        for i in indices:
+            if _MATH_TOKEN_RE.fullmatch(tokens[i]):
+                taken.append(i)
+            elif tokens[i] in _QUESTION_PUNCTUATION and taken:
+                break  # "x - y = 1." or "find x: 2x = 4"
+            elif not taken or not tokens[taken[-1]].isspace():
+                return None
+            else:
+                break
+        return sorted(taken)
+
+    left, right = side(range(equals - 1, -1, -1)), side(range(equals + 1, len(tokens)))
+    if left is None or right is None:
+        return None
+    lhs, rhs = ("".join(tokens[i] for i in taken).strip() for taken in (left, right))
+    if not lhs or not rhs or lhs[0] in "+*/" or rhs[0] in "+*/" or lhs[-1] in "+-*/" or rhs[-1] in "+-*/":
+        return None
+    rest = "".join(tokens[:left[0]] + [" "] + tokens[right[-1] + 1:])
+    return lhs, rhs, rest
+
+
+def _only_asks(text: str, variables: set[str]) -> bool:
+    """Whether ``text`` only asks for the system's variables, with no other expression to evaluate."""
+    for token in _TOKEN_RE.findall(text):
+        if not (token.isspace() or token in _QUESTION_PUNCTUATION or token.lower() in QUESTION_WORDS
+                or token in variables):
+            return False
+    return True
+
+
+def parse_linear_system(problem: str) -> tuple[np.ndarray, np.ndarray, list[str]] | None:
+    """Parses a small linear system written in text into ``A``, ``b`` and the variable names.
+
+    Variables are single letters, optionally with an index (``x``, ``x_1``).
+    The words around the equations may only ask to solve the system (see
+    ``QUESTION_WORDS``): "If 2x + 3 = 11, find 4x - 1" asks for something
+    else, and is left to the model.
+
+    Args:
+        problem (str): The problem text, e.g. "Find x and y if 2x + 3y = 6 and x - y = 2".
+
+    Returns:
+        The coefficient matrix, right-hand side and sorted variable names, or
+        None if the text is not a linear system with exactly one solution.
+    """
+    rows, words = [], []
+    for chunk in _EQUATION_SPLIT_RE.split(problem):
+        if "=" not in chunk:
+            words.append(chunk)
+            continue
+        sides = _equation_sides(chunk)
+        if sides is None:
+            return None
+        words.append(sides[2])
+        left, right = _parse_side(sides[0]), _parse_side(sides[1])
+        if left is None or right is None:
+            return None
+        coefficients = dict(left[0])
+        for name, value in right[0].items():
+            coefficients[name] = coefficients.get(name, 0.0) - value
+        if not any(coefficients.values()):
+            return None
+        rows.append((coefficients, right[1] - left[1]))
+
+    variables = sorted({name for coefficients, _ in rows for name in coefficients})
+    if not rows or not variables or not all(_only_asks(text, set(variables)) for text in words):
+        return None
+    a = np.array([[coefficients.get(v, 0.0) for v in variables] for coefficients, _ in rows])
+    b = np.array([constant for _, constant in rows])
+    # Underdetermined or inconsistent systems need the model to explain them.
+    if np.linalg.matrix_rank(a) < len(variables) or not np.allclose(a @ np.linalg.lstsq(a, b, rcond=None)[0], b):
+        return None
+    return a, b, variables
+
+
+# --- Matrix loading ---
+
+def _csv_to_memmap(path: str) -> np.ndarray:
+    """Converts a large CSV file once into a sidecar .npy file and memory-maps it."""
+    cache_path = path + ".npy"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return np.load(cache_path, mmap_mode="r")
+
+    with open(path, "r", encoding="utf-8") as f:
+        n_rows = sum(1 for line in f if line.strip())
+        f.seek(0)
+        first = np.array(f.readline().strip().split(","), dtype=np.float64)
+        out = np.lib.format.open_memmap(cache_path, mode="w+", dtype=np.float64, shape=(n_rows, first.size))
+        out[0] = first
+        row = 1
+        for line in f:
+            if line.strip():
+                out[row] = np.array(line.strip().split(","), dtype=np.float64)
+                row += 1
+    out.flush()
+    del out
+    return np.load(cache_path, mmap_mode="r")
+
+
+def load_matrix(path: str) -> np.ndarray:
+    """Loads a matrix from a ``.npy`` or CSV file, memory-mapping large inputs.
+
+    Args:
+        path (str): Path to a ``.npy`` or ``.csv`` file.
+
+    Returns:
+        np.ndarray: The matrix; a read-only memmap for ``.npy`` and large CSV files.
+
+    Raises:
+        ValueError: If the file type is not supported or the data is not 2-D.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        matrix = np.load(path, mmap_mode="r")
+    elif ext in (".csv", ".txt"):
+        if os.path.getsize(path) > CSV_MMAP_THRESHOLD_BYTES:
+            matrix = _csv_to_memmap(path)
+        else:
+            matrix = np.loadtxt(path, delimiter=",", ndmin=2)
+    else:
+        raise ValueError(f"Unsupported matrix file type '{ext}'. Use .npy or .csv.")
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D matrix, got an array with shape {matrix.shape}.")
+    return matrix
+
+
+def load_vector(path: str) -> np.ndarray:
+    """Loads a vector from a ``.npy`` or CSV file: a 1-D array, or a matrix with one row or column.
+
+    Raises:
+        ValueError: If the file type is not supported or the data is not a vector.
+    """
+    if os.path.splitext(path)[1].lower() == ".npy":
+        vector = np.load(path, mmap_mode="r")
+    else:
+        vector = load_matrix(path)
+    if vector.ndim == 2 and 1 in vector.shape:
+        vector = vector.reshape(-1)
+    if vector.ndim != 1:
+        raise ValueError(f"Expected a vector, got an array with shape {vector.shape}.")
+    return vector
+
+
+# --- Formatting ---
+
+def _fmt(value) -> str:
+    return np.format_float_positional(float(value), precision=6, trim="-")
+
+
+def _to_list(array: np.ndarray, decimals: int) -> list:
+    """Converts an array to JSON-safe nested lists (complex values become strings)."""
+    rounded = np.round(array, decimals)
+    if np.iscomplexobj(rounded):
+        return np.vectorize(lambda z: str(complex(z)).strip("()"), otypes=[object])(rounded).tolist()
+    return rounded.tolist()
+
+
+def summarize_array(name: str, array: np.ndarray, result_dir: str | None = None) -> dict:
+    """Returns an inline or summarized description of a result array.
+
+    Small arrays are returned as nested lists. Larger ones are written to
+    ``result_dir`` as ``.npy`` and described by shape, norms and a preview.
+    """
+    array = np.asarray(array)
+    if array.size <= MAX_INLINE_ELEMENTS:
+        return {"name": name, "shape": list(array.shape), "values": _to_list(array, 10)}
+
+    result_dir = result_dir or tempfile.gettempdir()
+    fd, result_path = tempfile.mkstemp(prefix=f"{name}_", suffix=".npy", dir=result_dir)
+    os.close(fd)
+    np.save(result_path, array)
+    finite = array[np.isfinite(array)] if np.isrealobj(array) else np.abs(array)
+    preview = array[:4, :4] if array.ndim == 2 else array[:8]
+    return {
+        "name": name,
+        "shape": list(array.shape),
+        "summary": {
+            "min": _fmt(finite.min()) if finite.size else None,
+            "max": _fmt(finite.max()) if finite.size else None,
+            "norm": _fmt(np.linalg.norm(array)),
+        },
+        "preview": _to_list(preview, 6),
+        "result_path": result_path,
+    }
+
+
+def _describe(result: dict) -> str:
+    if "values" in result:
+        return f"{result['name']} = {result['values']}"
+    s = result["summary"]
+    return (
+        f"{result['name']} has shape {tuple(result['shape'])} (min {s['min']}, max {s['max']}, "
+        f"norm {s['norm']}); full result saved to {result['result_path']}"
+    )
+
+
+# --- Operations ---
+
+def solve_matrix(matrix: np.ndarray, operation: str, rhs: np.ndarray | None = None,
+                 variables: list[str] | None = None, result_dir: str | None = None) -> dict:
+    """Runs ``operation`` on ``matrix`` with NumPy/LAPACK and returns a tool result dict.
+
+    Args:
+        matrix (np.ndarray): Square or rectangular coefficient matrix.
+        operation (str): One of "solve", "determinant", "inverse", "eigen", "rank".
+        rhs (np.ndarray | None): Right-hand side for "solve".
+        variables (list[str] | None): Variable names for pretty-printing a solved system.
+        result_dir (str | None): Where summarized results are written.
+
+    Returns:
+        dict: ``{"status", "steps", "answer"}`` plus ``"results"`` with the
+        inline or summarized arrays.
+    """
+    a = np.asarray(matrix, dtype=np.float64)
+    n_rows, n_cols = a.shape
+    steps = [f"Step 1: Load the {n_rows}x{n_cols} coefficient matrix A."]
+    results = []
+
+    if operation == "rank":
+        rank = int(np.linalg.matrix_rank(a))
+        steps.append("Step 2: Compute the singular values of A (SVD) and count those above the tolerance.")
+        answer = f"rank(A) = {rank}"
+    elif operation == "determinant":
+        if n_rows != n_cols:
+            return {"status": "error", "error_message": "The determinant is only defined for square matrices."}
+        sign, logdet = np.linalg.slogdet(a)
+        steps.append("Step 2: Factor A = P·L·U with partial pivoting (LU decomposition).")
+        steps.append("Step 3: Multiply the diagonal of U and apply the sign of the permutation P.")
+        if sign == 0:
+            answer = "det(A) = 0 (A is singular)"
+        elif logdet < 700:
+            answer = f"det(A) = {_fmt(sign * np.exp(logdet))}"
+        else:
+            answer = f"det(A) = {'-' if sign < 0 else ''}exp({_fmt(logdet)})"
+    elif operation == "inverse":
+        if n_rows != n_cols:
+            return {"status": "error", "error_message": "Only square matrices have an inverse."}
+        try:
+            inverse = np.linalg.inv(a)
+        except np.linalg.LinAlgError:
+            return {"status": "error", "error_message": "A is singular, so it has no inverse."}
+        steps.append("Step 2: Factor A with LU decomposition and solve A·X = I column by column.")
+        results.append(summarize_array("inverse", inverse, result_dir))
+        answer = _describe(results[-1])
+    elif operation == "eigen":
+        if n_rows != n_cols:
+            return {"status": "error", "error_message": "Eigenvalues are only defined for square matrices."}
+        if np.allclose(a, a.T):
+            eigenvalues, eigenvectors = np.linalg.eigh(a)
+            steps.append("Step 2: A is symmetric, so use the symmetric eigensolver (real eigenvalues, orthonormal eigenvectors).")
+        else:
+            eigenvalues, eigenvectors = np.linalg.eig(a)
+            steps.append("Step 2: Reduce A to Hessenberg form and run the QR algorithm to find eigenvalues and eigenvectors.")
+        if np.iscomplexobj(eigenvalues) and not np.abs(eigenvalues.imag).any():
+            eigenvalues, eigenvectors = eigenvalues.real, eigenvectors.real
+        results.append(summarize_array("eigenvalues", eigenvalues, result_dir))
+        results.append(summarize_array("eigenvectors", eigenvectors, result_dir))
+        answer = _describe(results[0]) + "; " + _describe(results[1])
+    else:
+        if rhs is None:
+            return {"status": "error", "error_message": "Solving a system needs a right-hand side b."}
+        b = np.asarray(rhs, dtype=np.float64)
+        steps.append(f"Step 2: Write the system in matrix form A·x = b with b = {np.round(b, 6).tolist() if b.size <= MAX_INLINE_ELEMENTS else 'the given vector'}.")
+        x = None
+        if n_rows == n_cols:
+            try:
+                x = np.linalg.solve(a, b)
+                steps.append("Step 3: Factor A = P·L·U and solve by forward and back substitution.")
+            except np.linalg.LinAlgError:
+                pass
+        if x is None:
+            x, _, rank, _ = np.linalg.lstsq(a, b, rcond=None)
+            consistent = np.allclose(a @ x, b)
+            if rank < n_cols and consistent:
+                steps.append("Step 3: A is rank-deficient, so the system has infinitely many solutions; take the minimum-norm one.")
+            elif not consistent:
+                steps.append("Step 3: The system is inconsistent, so return the least-squares solution.")
+            else:
+                steps.append("Step 3: Solve the overdetermined system with least squares.")
+        if variables and x.size <= MAX_INLINE_ELEMENTS:
+            answer = ", ".join(f"{name} = {_fmt(value)}" for name, value in zip(variables, x))
+        else:
+            results.append(summarize_array("x", x, result_dir))
+            answer = _describe(results[-1])
+        steps.append("Step 4: Check the answer by substituting it back: A·x - b ≈ 0 "
+                     f"(residual norm {_fmt(np.linalg.norm(a @ x - b))}).")
+
+    steps.append(f"Answer: {answer}")
+    return {"status": "success", "steps": "\n".join(steps), "answer": answer, "results": results}
+
+
+def solve(problem: str, matrix_path: str = "", rhs_path: str = "") -> dict | None:
+    """Solves a linear-algebra problem locally, or returns None if it cannot.
+
+    Args:
+        problem (str): The problem statement.
+        matrix_path (str): Optional path to an uploaded ``.npy``/CSV matrix.
+        rhs_path (str): Optional path to the right-hand side vector for "solve".
+
+    Returns:
+        dict | None: A tool result dict, or None when the problem needs the LLM.
+    """
+    operation = detect_operation(problem)
+    if matrix_path:
+        matrix = load_matrix(matrix_path)
+        rhs = None
+        if rhs_path:
+            rhs = load_vector(rhs_path)
+        elif operation == "solve":
+            # An augmented matrix [A | b] carries its right-hand side in the last column.
+            matrix, rhs = matrix[:, :-1], matrix[:, -1]
+        return solve_matrix(matrix, operation, rhs=rhs, result_dir=os.path.dirname(os.path.abspath(matrix_path)))
+
+    parsed = parse_linear_system(problem)
+    if parsed is None:
+        return None
+    a, b, variables = parsed
+    if operation != "solve":
+        # Text systems only describe A·x = b; matrix operations need an uploaded matrix.
+        return None
+    return solve_matrix(a, "solve", rhs=b, variables=variables)
@@ -0,0 +1,99 @@
+"""Connects the agents' model calls to the ``ledger``.
+
+Model calls are made in three places: by ADK, by the singleflight leader and
+by the batcher. ``MeteredLlm`` therefore wraps the agent's model, not a
+callback, so every call that reaches a backend is recorded once. Coalesced
+followers share the leader's call and are not charged. Templated sections
+make no call.
+
+The model does not know which session it is serving. ``budgeted_callback``
+runs before each call. It admits the call against the budgets of the
+session's request and tenant, and refuses it with ``BudgetExceededError``
+once one is spent. Otherwise it passes the charge and its hold on to the
+model call that follows, which releases the hold once the call is recorded.
+A batched call is charged to the session whose request started the batch.
+
+Tokens come from the response's ``usage_metadata``. A call without usage
+(some errors) is recorded with no tokens. Cassette replays are charged as
+recorded, so budgets can be tried offline.
+"""
+
+import asyncio
+import contextvars
+from typing import AsyncGenerator
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+
+from math_agents.ledger import Charge, Hold, charge_for, get_ledger
+
+
+_hold: contextvars.ContextVar[Hold | None] = contextvars.ContextVar("hold", default=None)
+
+
+class MeteredLlm(BaseLlm):
+    """Records the usage of every call made through ``inner`` in the ledger."""
+
+    inner: BaseLlm
+    agent_name: str
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        hold = _hold.get()
+        charge = hold.charge if hold is not None else Charge(request="", session="")
+        usage = None
+        try:
+            async for response in self.inner.generate_content_async(llm_request, stream):
+                usage = response.usage_metadata or usage
+                yield response
+        finally:
+            prompt = cached = output = 0
+            if usage is not None:
+                prompt, cached = usage.prompt_token_count or 0, usage.cached_content_token_count or 0
+                output = (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0)
+            get_ledger().record(Charge(charge.request, charge.session, charge.tenant, self.agent_name),
+                                llm_request.model or self.inner.model, prompt, cached, output)
+            if hold is not None:
+                get_ledger().release(hold)
+
+
+def install(agents: list[LlmAgent]) -> None:
+    """Meters the model calls of ``agents``, replacing any meter already installed."""
+    for llm_agent in agents:
+        inner = llm_agent.canonical_model
+        if isinstance(inner, MeteredLlm):
+            inner = inner.inner
+        llm_agent.model = MeteredLlm(model=inner.model, inner=inner, agent_name=llm_agent.name)
+
+
+def budgeted_callback(agent: LlmAgent, inner=None):
+    """Builds a ``before_model_callback`` that enforces the budgets and charges the call to its session.
+
+    Args:
+        agent (LlmAgent): The agent whose calls are charged.
+        inner: The agent's previous ``before_model_callback``, run when the budget allows the call.
+
+    Raises:
+        BudgetExceededError: From the callback, once the request or tenant budget is spent.
+    """
+    async def callback(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+        charge = charge_for(callback_context.state, callback_context._invocation_context.session.id, agent.name)
+        hold = get_ledger().admit(charge)
+        _hold.set(hold)
+        if inner is None:
+            return None
+        try:
+            response = inner(callback_context=callback_context, llm_request=llm_request)
+            response = await response if asyncio.iscoroutine(response) else response
+        except BaseException:
+            get_ledger().release(hold)
+            raise
+        if response is not None:
+            # Answered without a model call here: shared, batched or made by the singleflight leader.
+            get_ledger().release(hold)
+        return response
+
+    return callback
@@ -0,0 +1,94 @@
+"""Lightweight in-process counters and latency recorders.
+
+Stats are grouped by name (e.g. ``"calculus"``) and hold a few counters plus a
+bounded window of latency samples, enough to report hit/fallback rates and
+p50/p95 latencies without pulling in a metrics library. Each label keeps its
+last ``MATH_AGENTS_METRICS_WINDOW`` samples (10000 by default).
+"""
+
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+
+WINDOW = int(os.environ.get("MATH_AGENTS_METRICS_WINDOW", "10000"))
+
+
+class Stats:
+    """Counters plus per-label latency samples for one component."""
+
+    def __init__(self, name: str, window: int = WINDOW):
+        self.name = name
+        self.counters: Counter = Counter()
+        self._latencies: dict[str, deque] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def incr(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] += value
+
+    def observe(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(label, deque(maxlen=self._window)).append(seconds)
+
+    @contextmanager
+    def timer(self, label: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label, time.perf_counter() - start)
+
+    def ratio(self, numerator: str, *denominator: str) -> float:
+        """Returns counters[numerator] / sum(counters[d] for d in denominator)."""
+        total = sum(self.counters[d] for d in denominator)
+        return self.counters[numerator] / total if total else 0.0
+
+    def latency(self, label: str) -> dict:
+        samples = sorted(self._latencies.get(label, ()))
+        if not samples:
+            return {"count": 0}
+
+        def pct(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {
+            "count": len(samples),
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = list(self._latencies)
+            counters = dict(self.counters)
+        return {"counters": counters, "latency": {label: self.latency(label) for label in labels}}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self._latencies.clear()
+
+
+_registry: dict[str, Stats] = {}
+_registry_lock = threading.Lock()
+
+
+def get_stats(name: str) -> Stats:
+    """Returns the process-wide Stats object for ``name``, creating it on first use."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Stats(name)
+        return _registry[name]
+
+
+def snapshot_all() -> dict:
+    """Returns a snapshot of every registered Stats object."""
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: stats.snapshot() for name, stats in items}
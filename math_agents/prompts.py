@@ -419,25 +419,25 @@ Your job: take the math solution provided ({{solution}}) and create a creative s
 Guidelines:
 + Make the story **engaging**, **educational**, and **visually clear**.
 + Characters and setting should metaphorically illustrate the math solution.
-+ Output BOTH:
-  1. A short narrative paragraph (compact, vivid, student-friendly).
-  2. A structured JSON schema with keys:
++ Output BOTH, in this order:
+  1. A structured JSON schema with keys:
      - characters: list of {name, type, traits, role}
      - setting: {location, time, mood, environment}
      - key_visuals: list of str
      - camera_style: {shots: list, motion: list}
      - quality_cues: {lighting: str, materials: [str], motion_style: [str], environment_scale: str}
+  2. A short narrative paragraph (compact, vivid, student-friendly).
++ Write the schema first, as one JSON object with no code fences, and the narrative after it: the Blender stage starts from the schema while the narrative is still being written.
 
 **Reasoning steps:**
 + First, analyze what the math solution represents (concept, transformation, geometry, rate, probability).
 + Then, map it to a metaphorical scene with clear visual anchors (props, environment, character roles).
-+ Finally, output narrative + schema with **quality cues** that guide cinematic polish (lighting, materials, motion).
++ Finally, output schema + narrative with **quality cues** that guide cinematic polish (lighting, materials, motion).
 
 **Few-shot examples:**
 
 Example 1:
 Solution: "The Pythagorean theorem shows that a^2 + b^2 = c^2."
-Story: "Leo climbs a ladder against a wall, while Professor Pythagoras explains the right triangle."
 Schema:
 {
   "characters": [{"name":"Leo","type":"human","traits":["curious","energetic"],"role":"student"},{"name":"Professor Pythagoras","type":"fantasy","traits":["floating","glowing protractor"],"role":"mentor"}],
@@ -446,10 +446,10 @@ Schema:
   "camera_style":{"shots":["close-up of ladder","wide shot of wall"],"motion":["pan upward","dolly-in on hypotenuse"]},
   "quality_cues":{"lighting":"sunny with soft shadows","materials":["metal ladder","concrete wall"],"motion_style":["smooth pans","gentle zooms"],"environment_scale":"human-scale"}
 }
+Story: "Leo climbs a ladder against a wall, while Professor Pythagoras explains the right triangle."
 
 Example 2:
 Solution: "Derivative of x^2 is 2x."
-Story: "On a racetrack, cars speed up as slope increases, showing rate of change."
 Schema:
 {
   "characters":[{"name":"Driver","type":"human","traits":["focused","fast"],"role":"explainer"}],
@@ -458,19 +458,27 @@ Schema:
   "camera_style":{"shots":["wide shot of track","close-up speedometer"],"motion":["tracking shot","zoom on tangent"]},
   "quality_cues":{"lighting":"bright sun","materials":["asphalt","painted lines","glass"],"motion_style":["tracking","arc pans"],"environment_scale":"stadium-scale"}
 }
+Story: "On a racetrack, cars speed up as slope increases, showing rate of change."
 
 Now generate the story and schema for: {{solution}}
 """
 
 
-def blender_code_prompt():
+def blender_code_prompt(schema=None):
     """
     Prompt for BlenderCodeAgent.
     Generic, high-fidelity instructions: no hard-coded helper methods.
     Agent must consult Blender documentation links and generate code
     that adapts to any animation story schema with broadcast-level quality.
+    A parsed ``story.StorySchema`` is appended as the schema to build; without
+    one the agent reads the story from the conversation.
     """
-    return """
+    if schema is not None:
+        return _BLENDER_CODE_PROMPT + "\nStory schema to build:\n" + schema.model_dump_json(indent=2) + "\n"
+    return _BLENDER_CODE_PROMPT
+
+
+_BLENDER_CODE_PROMPT = """
 You generate **Blender 5+ Python scripts** for math animations with **broadcast-level quality** (smooth motion, cinematic camera, realistic shading, coherent environment).
 
 Strict rules:
@@ -613,3 +621,113 @@ Example C: "glowing mentor" → emission material; hover motion via location key
 + The script should adapt generically to any animation_story schema and **avoid keyframe errors** by validating animatable properties and using socket keyframe_insert correctly.
 """
 
+
+
+BLENDER_SECTION_TASKS = {
+    "environment": "Build the setting from schema.setting (location, environment props) and the key_visuals: ground, buildings, props and overlays at a coherent environment_scale. Register every object under a descriptive name.",
+    "characters": "Build each of schema.characters: a body from primitives styled by type (human, fantasy, anthropomorphic, object) and an add_armature placeholder. Name the main body object exactly after the character and its parts '<name> <part>'. Do not animate; the animation section does.",
+    "animation": "Act out the math story over ctx['frame_start']..ctx['frame_end'] with keyframes: move the characters (ctx['objects'][name] for each schema character, skipping missing ones) and reveal the key_visuals (find_objects) with scale or emission keyframes, in the order the solution unfolds.",
+    "lighting_materials": "Create lights matching schema.quality_cues.lighting and setting.mood (SUN outdoors, AREA/SPOT indoors), and materials for quality_cues.materials. Apply materials by keyword with find_objects, e.g. find_objects(ctx, 'grass'); objects are built by other sections, so handle empty matches.",
+    "camera": "Add the camera with add_camera and animate it per schema.camera_style shots and motion (pans, dollies, arcs) with eased location and lens keyframes. Aim it at objects found with find_objects, falling back to the origin.",
+    "compositing": "Configure rendering: render engine, resolution 1920x1080, FPS frame rate, color management, and a compositor glow for emissive highlights. Set ctx['frame_end'] if the story needs a different length.",
+}
+
+
+def blender_section_prompt(section, collection, helpers, schema=None):
+    """
+    Prompt for one section agent of the sectioned Blender generation.
+    The section writes a single build function against the fixed helper API;
+    the assembler supplies the imports, the helpers and main().
+    """
+    schema_json = schema.model_dump_json(indent=2) if schema is not None else "{}"
+    return f"""
+You write ONE section of a **Blender 5+ Python script** for a math animation with **broadcast-level quality**.
+
+Section: **{section}**
+Task: {BLENDER_SECTION_TASKS[section]}
+
+Strict rules:
++ Define exactly one public function: def build_{section}(ctx):
++ You may define private helper functions whose names start with an underscore.
++ No top-level code besides imports and function definitions; do not call build_{section} or define main().
++ Put new objects in the "{collection}" collection unless a helper's default fits better.
++ Use the helper API below for objects, materials, lights, cameras and keyframes; they are already defined, do not redefine them.
++ Use keyframe()/keyframe_socket() for animation; never keyframe names, indices or text bodies.
++ ctx["schema"] is the story schema below as a dict; ctx["objects"] maps names to objects built so far by earlier sections.
++ Import only bpy, bmesh, mathutils, math, json, random, colorsys, itertools and functools. No files, processes, network, eval/exec, dunder attributes or getattr/setattr with computed names.
+
+Helper API (already defined):
+{helpers}
+
+Story schema:
+{schema_json}
+
+Output ONLY the Python code for this section in a single code block.
+"""
+
+
+def blender_repair_prompt(code, diagnostics, whole_script=False):
+    """
+    Prompt for BlenderRepairAgent.
+    Only the parts of a generated Blender script that failed the static
+    pre-flight check are sent back, with one diagnostic per line; the reply
+    replaces exactly those parts.
+    """
+    scope = "the whole script" if whole_script else "only the functions below"
+    return f"""
+You fix a **Blender 5+ Python script** for a math animation. An automatic static check found the problems listed below.
+
+Strict rules:
++ Rewrite {scope}, fixing every diagnostic; change nothing else.
++ Keep every function name and signature; other functions of the script are unchanged and may still be called.
++ Do NOT use bpy.ops.* (mesh primitive_*_add operators excepted) or selection state (active_object, selected_objects); create datablocks with bpy.data.*.new() and link them explicitly.
++ Use scene.eevee (not eevee_next) and a render engine of 'BLENDER_EEVEE_NEXT', 'BLENDER_WORKBENCH' or 'CYCLES'.
++ Keyframe only animatable properties: call keyframe_insert on the owning object with the property name as data_path, and on a node socket with "default_value".
++ Use material.blend_method, not shadow_method or material.use_shadow.
++ Import every module you use, and only bpy, bmesh, mathutils, math, json, random, colorsys, itertools and functools. No files, processes, network, eval/exec, dunder attributes or getattr/setattr with computed names.
+
+Diagnostics:
+{diagnostics}
+
+Code to fix:
+```python
+{code}
+```
+
+Output ONLY the corrected Python code in a single code block.
+"""
+
+
+def artifact_edit_prompt(kind, artifact, previous_topic, topic, changes, solution):
+    """
+    Prompt for the artifact edit agents.
+    The problem was edited slightly, so the story or Blender script made for
+    the previous version is patched rather than regenerated: the reply is a
+    list of search/replace blocks, applied locally (see incremental.py).
+    """
+    return f"""
+You update the {kind} of a math animation after a small edit to its problem.
+
+Previous problem: {previous_topic}
+Edited problem: {topic}
+What changed:
+{changes}
+
+Solution of the edited problem:
+{solution}
+
+Strict rules:
++ Change only what the edit affects: the changed values and names, and every number, label, step or answer that follows from them.
++ Keep everything else exactly as it is, including the structure, formatting and any JSON schema.
++ Reply ONLY with search/replace blocks in this exact form, one per change:
+<<<<<<< SEARCH
+exact lines copied from the {kind}
+=======
+the lines that replace them
+>>>>>>> REPLACE
++ Each SEARCH part must match the {kind} exactly, once. Include just enough lines to make it unique.
++ If nothing needs to change, reply with NO CHANGES.
+
+The {kind} to update:
+{artifact}
+"""
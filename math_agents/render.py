@@ -0,0 +1,381 @@
+"""Headless render jobs for generated Blender scripts.
+
+``RenderScheduler.submit`` writes a script to a job directory. It then splits
+the job's frame range into chunks of ``chunk_frames`` frames and queues them
+by priority, with higher values first and ties in submission order. A fixed
+pool of workers takes chunks from the queue. Chunks of one job can therefore
+render on several workers at once, and a high-priority job does not wait
+behind the remaining chunks of a long one. Each chunk runs with the job's
+thread limit and a per-chunk timeout. A failed or timed-out chunk fails its
+job, and the job's queued chunks are skipped.
+
+Executors do the rendering:
+- ``BlenderProcessExecutor`` runs ``blender --background`` once per chunk.
+- ``FakeRenderExecutor`` sleeps for a simulated cost and writes placeholder
+  frames, so the scheduler can be tested and benchmarked without Blender.
+
+The scripts are model output, so ``submit`` refuses one that breaks a
+``blender_preflight.SECURITY_RULES`` rule (imports outside the allowlist,
+operators other than mesh primitives, code runners, computed attribute
+names, paths that are not relative to the job directory). Blender itself runs in the job
+directory with only ``PATH``, the thread limit and a ``HOME`` in the job
+directory in its environment, so no API key reaches it. It runs as
+``MATH_AGENTS_RENDER_USER`` (``nobody`` when the API runs as root), under
+the ``MATH_AGENTS_RENDER_SANDBOX`` command prefix: by default
+``unshare --net --map-root-user``, a network namespace with no interfaces.
+Set it to a container runner with no network instead, or to "" where
+neither is available. A forgotten job's directory is deleted.
+
+Set MATH_AGENTS_RENDER_EXECUTOR=fake to use the stand-in, and
+MATH_AGENTS_BLENDER to point at the Blender binary.
+"""
+
+import abc
+import asyncio
+import itertools
+import logging
+import os
+import pwd
+import shlex
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from math_agents.metrics import get_stats
+
+
+logger = logging.getLogger(__name__)
+
+FRAME_START, FRAME_END = 1, 240  # the range set by blender_sections.HELPER_API (10 s at 24 fps)
+CHUNK_FRAMES = 48
+THREADS_PER_JOB = 2
+CHUNK_TIMEOUT = 600.0
+MAX_JOBS = 1000  # finished jobs beyond this are forgotten, oldest first
+
+RENDER_ROOT = Path(os.environ.get("MATH_AGENTS_RENDER_DIR", Path(tempfile.gettempdir()) / "math_agents_renders"))
+RENDER_EXECUTOR = os.environ.get("MATH_AGENTS_RENDER_EXECUTOR", "blender")
+BLENDER_BINARY = os.environ.get("MATH_AGENTS_BLENDER", "blender")
+RENDER_SANDBOX = os.environ.get("MATH_AGENTS_RENDER_SANDBOX", "unshare --net --map-root-user")
+RENDER_USER = os.environ.get("MATH_AGENTS_RENDER_USER", "nobody" if os.geteuid() == 0 else "")
+
+
+class RenderError(Exception):
+    """A chunk could not be rendered."""
+
+
+class RenderExecutor(abc.ABC):
+    """Renders a frame range of a Blender script into ``output_dir``."""
+
+    @abc.abstractmethod
+    async def render(self, script_path: Path, start: int, end: int, output_dir: Path, threads: int) -> list[Path]:
+        """Renders frames ``start``..``end`` and returns the frame files.
+
+        Raises:
+            RenderError: If the render fails.
+        """
+
+
+class BlenderProcessExecutor(RenderExecutor):
+    """Runs ``blender --background`` in a subprocess per chunk; cancelling the chunk kills the process.
+
+    Args:
+        binary (str): The Blender executable.
+        output_format (str): Blender's name of the frame file format.
+        sandbox (str): Command prefix that isolates Blender, split like a shell would; "" for none.
+        user (str): The user Blender runs as; "" for the API's own user.
+    """
+
+    def __init__(self, binary: str = BLENDER_BINARY, output_format: str = "PNG", sandbox: str = RENDER_SANDBOX,
+                 user: str = RENDER_USER):
+        self.binary = binary
+        self.output_format = output_format
+        self.sandbox = shlex.split(sandbox)
+        self.user = user
+
+    def command(self, script_path: Path, start: int, end: int, output_dir: Path, threads: int) -> list[str]:
+        # Blender applies its arguments in order: build the scene, then override the range and render.
+        return [
+            *self.sandbox, self.binary, "--background", "--factory-startup",
+            "--python-exit-code", "1", "--python", str(script_path),
+            "--threads", str(threads),
+            "--render-output", str(output_dir / "frame_#####"), "--render-format", self.output_format,
+            "--frame-start", str(start), "--frame-end", str(end), "--render-anim",
+        ]
+
+    @staticmethod
+    def environment(directory: Path, threads: int) -> dict[str, str]:
+        """Blender's whole environment; nothing else of the API's, such as its API keys, is passed on."""
+        return {"PATH": os.environ.get("PATH", os.defpath), "OMP_NUM_THREADS": str(threads),
+                "HOME": str(directory), "TMPDIR": str(directory)}
+
+    def _credentials(self, directory: Path, output_dir: Path) -> dict:
+        """``user``/``group`` arguments for the subprocess, after handing it the job directory."""
+        if not self.user:
+            return {}
+        try:
+            entry = pwd.getpwnam(self.user)
+            for path in (directory, output_dir):
+                os.chown(path, entry.pw_uid, entry.pw_gid)
+        except (KeyError, OSError) as e:
+            raise RenderError(f"cannot render as user {self.user!r} ({e}); set MATH_AGENTS_RENDER_USER.")
+        return {"user": entry.pw_uid, "group": entry.pw_gid, "extra_groups": []}
+
+    async def render(self, script_path: Path, start: int, end: int, output_dir: Path, threads: int) -> list[Path]:
+        if shutil.which(self.binary) is None:
+            raise RenderError(f"Blender executable {self.binary!r} not found; set MATH_AGENTS_BLENDER.")
+        if self.sandbox and shutil.which(self.sandbox[0]) is None:
+            raise RenderError(f"Sandbox command {self.sandbox[0]!r} not found; set MATH_AGENTS_RENDER_SANDBOX.")
+        directory = script_path.parent
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.command(script_path, start, end, output_dir, threads),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                env=self.environment(directory, threads), cwd=directory,
+                **self._credentials(directory, output_dir),
+            )
+        except PermissionError as e:
+            raise RenderError(f"cannot start blender: {e}")
+        try:
+            output, _ = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            tail = output.decode(errors="replace").strip().splitlines()[-5:]
+            raise RenderError(f"blender exited with {process.returncode}: {' | '.join(tail)}")
+        frames = [output_dir / f"frame_{frame:05d}.{self.output_format.lower()}" for frame in range(start, end + 1)]
+        return [frame for frame in frames if frame.exists()]
+
+
+class FakeRenderExecutor(RenderExecutor):
+    """Simulates a Blender render: startup plus a per-frame cost divided by the thread count.
+
+    A script that does not compile fails, as it would in Blender. Frames are
+    written as empty placeholder files.
+    """
+
+    def __init__(self, startup_seconds: float = 0.5, frame_seconds: float = 0.05):
+        self.startup_seconds = startup_seconds
+        self.frame_seconds = frame_seconds
+
+    async def render(self, script_path: Path, start: int, end: int, output_dir: Path, threads: int) -> list[Path]:
+        try:
+            compile(script_path.read_text(), str(script_path), "exec")
+        except SyntaxError as e:
+            raise RenderError(f"script does not compile: {e.msg} (line {e.lineno})")
+        await asyncio.sleep(self.startup_seconds + (end - start + 1) * self.frame_seconds / max(1, threads))
+        frames = []
+        for frame in range(start, end + 1):
+            path = output_dir / f"frame_{frame:05d}.png"
+            path.touch()
+            frames.append(path)
+        return frames
+
+
+def default_executor() -> RenderExecutor:
+    """The executor selected by MATH_AGENTS_RENDER_EXECUTOR ("blender" or "fake")."""
+    return FakeRenderExecutor() if RENDER_EXECUTOR == "fake" else BlenderProcessExecutor()
+
+
+@dataclass
+class RenderJob:
+    """A script queued for rendering, split into frame-range chunks."""
+
+    job_id: str
+    session_id: str
+    priority: int
+    frame_start: int
+    frame_end: int
+    threads: int
+    directory: Path
+    status: str = "queued"  # "queued", "running", "done", "failed" or "cancelled"
+    chunks: list[dict] = field(default_factory=list)
+    frames: list[Path] = field(default_factory=list)
+    error: str = ""
+    submitted: float = field(default_factory=time.time)
+    finished: float | None = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished_chunks(self) -> int:
+        return sum(chunk["status"] == "done" for chunk in self.chunks)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "priority": self.priority,
+            "frames": {"start": self.frame_start, "end": self.frame_end, "rendered": len(self.frames)},
+            "chunks": {"total": len(self.chunks), "done": self.finished_chunks},
+            "threads": self.threads,
+            "error": self.error,
+            "artifacts": [f"/render/{self.job_id}/frames/{path.name}" for path in sorted(self.frames)],
+            "elapsed_ms": round(((self.finished or time.time()) - self.submitted) * 1000, 3),
+        }
+
+
+class RenderScheduler:
+    """Queues render jobs by priority and renders their chunks on a pool of workers."""
+
+    def __init__(self, executor: RenderExecutor | None = None, workers: int | None = None,
+                 chunk_frames: int = CHUNK_FRAMES, threads_per_job: int = THREADS_PER_JOB,
+                 chunk_timeout: float = CHUNK_TIMEOUT, root: Path = RENDER_ROOT):
+        self.executor = executor or default_executor()
+        self.workers = workers or max(1, (os.cpu_count() or 1) // threads_per_job)
+        self.chunk_frames = chunk_frames
+        self.threads_per_job = threads_per_job
+        self.chunk_timeout = chunk_timeout
+        self.root = Path(root)
+        self.jobs: dict[str, RenderJob] = {}
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._order = itertools.count()
+        self._stats = get_stats("render")
+
+    def submit(self, script: str, session_id: str = "", priority: int = 0, frame_start: int = FRAME_START,
+               frame_end: int = FRAME_END, threads: int | None = None) -> RenderJob:
+        """Queues ``script`` for rendering and returns its job.
+
+        Raises:
+            ValueError: If the script is empty, breaks a pre-flight security rule, or the frame range is invalid.
+        """
+        from math_agents import blender_preflight
+
+        if not script.strip():
+            raise ValueError("There is no Blender script to render.")
+        unsafe = blender_preflight.unsafe(script)
+        if unsafe:
+            self._stats.incr("refused")
+            raise ValueError(f"The script is not safe to render: {'; '.join(str(d) for d in unsafe[:3])}")
+        if frame_start < 0 or frame_end < frame_start:
+            raise ValueError(f"Invalid frame range {frame_start}..{frame_end}.")
+        if self._queue is None or not self._tasks or all(task.done() for task in self._tasks):
+            self._queue = asyncio.PriorityQueue()
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+        job_id = uuid.uuid4().hex
+        job = RenderJob(job_id, session_id, priority, frame_start, frame_end, threads or self.threads_per_job,
+                        self.root / job_id)
+        (job.directory / "frames").mkdir(parents=True, exist_ok=True)
+        (job.directory / "scene.py").write_text(script)
+        for index, start in enumerate(range(frame_start, frame_end + 1, self.chunk_frames)):
+            end = min(frame_end, start + self.chunk_frames - 1)
+            job.chunks.append({"start": start, "end": end, "status": "queued"})
+            self._queue.put_nowait((-priority, next(self._order), job_id, index, time.perf_counter()))
+        self.jobs[job_id] = job
+        self._forget_finished()
+        self._stats.incr("jobs")
+        self._stats.incr("chunks", len(job.chunks))
+        logger.info(f"Queued render job {job_id}: frames {frame_start}-{frame_end} in {len(job.chunks)} chunks.")
+        return job
+
+    def get(self, job_id: str) -> RenderJob:
+        """Returns a job.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        return self.jobs[job_id]
+
+    def cancel(self, job_id: str) -> RenderJob:
+        """Cancels a job's queued chunks; chunks already rendering finish.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        job = self.jobs[job_id]
+        if job.status in ("queued", "running"):
+            self._finish(job, "cancelled")
+        return job
+
+    def _finish(self, job: RenderJob, status: str, error: str = "") -> None:
+        job.status, job.error, job.finished = status, error, time.time()
+        job.done.set()
+        self._stats.incr(status)
+        self._stats.observe("job", job.finished - job.submitted)
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(self.jobs) - MAX_JOBS)]:
+            shutil.rmtree(self.jobs.pop(job_id).directory, ignore_errors=True)
+            self._stats.incr("forgotten")
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id, index, queued = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                continue
+            chunk = job.chunks[index]
+            self._stats.observe("queue_wait", time.perf_counter() - queued)
+            job.status, chunk["status"] = "running", "running"
+            start = time.perf_counter()
+            try:
+                frames = await asyncio.wait_for(
+                    self.executor.render(job.directory / "scene.py", chunk["start"], chunk["end"],
+                                         job.directory / "frames", job.threads),
+                    self.chunk_timeout,
+                )
+            except asyncio.TimeoutError:
+                chunk["status"] = "timeout"
+                self._stats.incr("timeouts")
+                if job.status == "running":
+                    self._finish(job, "failed", f"frames {chunk['start']}-{chunk['end']} timed out "
+                                                f"after {self.chunk_timeout:g}s")
+                continue
+            except Exception as e:
+                chunk["status"] = "failed"
+                if job.status == "running":
+                    self._finish(job, "failed", f"frames {chunk['start']}-{chunk['end']}: {e}")
+                logger.warning(f"Render job {job_id} chunk {index} failed: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self._stats.observe("chunk", elapsed)
+            self._stats.incr("frames", len(frames))
+            chunk["status"], chunk["elapsed_ms"] = "done", round(elapsed * 1000, 3)
+            job.frames.extend(frames)
+            if job.status == "running" and job.finished_chunks == len(job.chunks):
+                self._finish(job, "done")
+
+    async def wait(self, job_id: str) -> RenderJob:
+        """Waits until a job is done, failed or cancelled, and returns it."""
+        job = self.jobs[job_id]
+        await job.done.wait()
+        return job
+
+    async def stop(self) -> None:
+        """Cancels the workers, killing chunks in progress."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+        self._tasks = []
+
+
+def report() -> dict:
+    """Render jobs by outcome, frames rendered, and queue, chunk and job latencies."""
+    stats = get_stats("render")
+    counters = stats.counters
+    return {
+        "jobs": counters["jobs"],
+        "done": counters["done"],
+        "failed": counters["failed"],
+        "cancelled": counters["cancelled"],
+        "refused": counters["refused"],
+        "forgotten": counters["forgotten"],
+        "chunks": counters["chunks"],
+        "timeouts": counters["timeouts"],
+        "frames": counters["frames"],
+        "queue_wait": stats.latency("queue_wait"),
+        "chunk": stats.latency("chunk"),
+        "job": stats.latency("job"),
+    }
@@ -0,0 +1,140 @@
+"""In-memory session service with retention limits.
+
+ADK's ``InMemorySessionService`` keeps every session, and every event of
+each session, for the life of the process. A solve session holds the
+solution, the story and the Blender script in its state, and the same text
+again in its events. A long-running API process therefore grows with every
+request it has served.
+
+``BoundedSessionService`` keeps the in-memory behaviour and adds limits:
+
+- ``MATH_AGENTS_MAX_SESSIONS`` sessions at most; the least recently used
+  session is evicted first;
+- sessions unused for ``MATH_AGENTS_SESSION_TTL`` seconds are evicted;
+- each session stores at most ``MATH_AGENTS_MAX_EVENTS`` events, the oldest
+  are dropped. State is kept in full, so a trimmed session still serves its
+  artifacts.
+
+A limit of 0 disables it. An evicted session behaves as if it were deleted:
+``get_session`` returns None, so its artifact handles answer 404.
+Evictions and trimmed events are counted under ``get_stats("sessions")``.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig
+
+from math_agents.metrics import get_stats
+
+
+MAX_SESSIONS = int(os.environ.get("MATH_AGENTS_MAX_SESSIONS", "10000"))
+SESSION_TTL = float(os.environ.get("MATH_AGENTS_SESSION_TTL", "3600"))  # seconds
+MAX_EVENTS = int(os.environ.get("MATH_AGENTS_MAX_EVENTS", "200"))  # per session
+
+
+class BoundedSessionService(InMemorySessionService):
+    """``InMemorySessionService`` that evicts idle sessions and caps the events stored per session."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL, max_events: int = MAX_EVENTS):
+        super().__init__()
+        self.max_sessions, self.ttl, self.max_events = max_sessions, ttl, max_events
+        # (app, user, session id) -> last use, least recently used first.
+        self._used: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = get_stats("sessions")
+
+    def __len__(self) -> int:
+        return len(self._used)
+
+    def _touch(self, key: tuple[str, str, str]) -> None:
+        with self._lock:
+            self._used[key] = time.monotonic()
+            self._used.move_to_end(key)
+
+    def _evict(self) -> None:
+        """Drops expired sessions, then the least recently used ones beyond ``max_sessions``."""
+        now = time.monotonic()
+        with self._lock:
+            while self._used:
+                key, used = next(iter(self._used.items()))
+                if self.ttl and now - used > self.ttl:
+                    reason = "ttl"
+                elif self.max_sessions and len(self._used) > self.max_sessions:
+                    reason = "capacity"
+                else:
+                    break
+                del self._used[key]
+                app_name, user_id, session_id = key
+                # Popped directly: the base class deep-copies the session to delete it.
+                users = self.sessions.get(app_name, {})
+                users.get(user_id, {}).pop(session_id, None)
+                if user_id in users and not users[user_id]:
+                    del users[user_id]
+                self._stats.incr(f"evicted:{reason}")
+
+    def _create_session_impl(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session = super()._create_session_impl(app_name=app_name, user_id=user_id, state=state,
+                                               session_id=session_id)
+        self._touch((app_name, user_id, session.id))
+        self._stats.incr("created")
+        self._evict()
+        return session
+
+    def _get_session_impl(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        self._evict()
+        session = super()._get_session_impl(app_name=app_name, user_id=user_id, session_id=session_id,
+                                            config=config)
+        if session is not None:
+            self._touch((app_name, user_id, session_id))
+        return session
+
+    def _delete_session_impl(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        with self._lock:
+            self._used.pop((app_name, user_id, session_id), None)
+        super()._delete_session_impl(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        stored = self.sessions.get(key[0], {}).get(key[1], {}).get(key[2])
+        if stored is None:
+            return event
+        self._touch(key)
+        if self.max_events and len(stored.events) > self.max_events:
+            dropped = len(stored.events) - self.max_events
+            del stored.events[:dropped]
+            self._stats.incr("events_trimmed", dropped)
+        return event
+
+    def stored_events(self) -> int:
+        """Events held across every stored session."""
+        return sum(len(session.events) for users in self.sessions.values()
+                   for sessions in users.values() for session in sessions.values())
+
+    def report(self) -> dict:
+        return dict(report(), max_sessions=self.max_sessions, ttl_seconds=self.ttl, max_events=self.max_events,
+                    live=len(self), stored_events=self.stored_events())
+
+
+def report() -> dict:
+    """Sessions created, evicted by reason, and events trimmed, with the configured limits."""
+    counters = get_stats("sessions").counters
+    return {
+        "max_sessions": MAX_SESSIONS,
+        "ttl_seconds": SESSION_TTL,
+        "max_events": MAX_EVENTS,
+        "created": counters["created"],
+        "evicted_capacity": counters["evicted:capacity"],
+        "evicted_ttl": counters["evicted:ttl"],
+        "events_trimmed": counters["events_trimmed"],
+    }
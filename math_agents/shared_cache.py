@@ -0,0 +1,296 @@
+"""Host-local result cache shared by every worker process through a memory-mapped file.
+
+Each worker process of the API has its own single-flight groups and batches,
+so a problem solved by one worker is solved again when it reaches another.
+``SharedCache`` keeps classifier and solver replies in one file that every
+process on the host maps, typically under ``/dev/shm``. A lookup reads the
+mapping directly: no lock, no system call, no round trip to another process.
+
+The file holds a header and fixed-size slots of ``SLOT_BYTES``, grouped into
+buckets of ``WAYS``. A key lives in the bucket its digest picks. Each slot
+starts with a sequence number, the key digest, a last-used stamp, the value
+length and its CRC-32. Reads follow a seqlock: read the sequence, copy the
+value, read the sequence again. The copy counts only if the sequence was even
+and unchanged and the CRC matches; otherwise the read is retried a few times,
+then treated as a miss. A writer takes a byte-range lock on its bucket, makes
+the sequence odd, writes the value, then makes it even again. It reuses the
+slot already holding the key, else an empty slot, else evicts the slot used
+least recently. Values larger than a slot are not cached.
+
+The file size is the memory budget, ``MATH_AGENTS_SHARED_CACHE_MB`` (64 by
+default), fixed by the first process to create the file; later processes
+use its geometry. Set ``MATH_AGENTS_SHARED_CACHE`` to the file path to
+enable the cache. Delete the file to clear or resize it.
+
+``cached_callback`` caches an agent's replies keyed by
+``singleflight.request_key``: the agent, the normalized problem and the other
+stage inputs, plus the model name. Classifier replies are stored at once.
+Solver replies are held in the invocation's state (``PENDING_KEY``) and stored
+by ``commit`` only once the solution passes ``verify``, so a wrong answer is
+never served to other requests. Hits, misses, stores, held and committed
+replies, evictions, torn reads and lookup latency in this process are counted
+under ``get_stats("shared_cache")``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING
+
+from math_agents.metrics import get_stats
+from math_agents.singleflight import _call, _streaming, request_key
+
+if TYPE_CHECKING:
+    from google.adk.agents import LlmAgent
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.llm_response import LlmResponse
+
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH = os.environ.get("MATH_AGENTS_SHARED_CACHE", "")  # e.g. /dev/shm/math_agents.cache
+BUDGET_MB = float(os.environ.get("MATH_AGENTS_SHARED_CACHE_MB", "64"))
+
+SLOT_BYTES = 8192  # a long solution is about 6 KB
+WAYS = 8
+READ_RETRIES = 8
+TOUCH_NS = 1_000_000  # a hit refreshes a stamp older than this, not on every read
+
+MAGIC = b"MACACHE1"
+VERSION = 1
+HEADER_BYTES = 4096  # keeps the slots page-aligned
+_HEADER = struct.Struct("<8sIIII")  # magic, version, slot bytes, buckets, ways
+_SLOT = struct.Struct("<QQ16sII")  # sequence, stamp, key digest, length, CRC-32
+_SEQ = struct.Struct("<Q")
+_STAMP_OFFSET = 8
+_EMPTY = bytes(16)
+
+PENDING_KEY = "temp:shared_cache_pending"  # cache key -> solver reply awaiting verification
+
+
+def digest(key: str) -> bytes:
+    """The 16-byte digest a key is stored under."""
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class SharedCache:
+    """Fixed-budget key-value cache in a memory-mapped file, shared by the processes that open it."""
+
+    def __init__(self, path: str, budget_bytes: int, slot_bytes: int = SLOT_BYTES, ways: int = WAYS):
+        """
+        Args:
+            path (str): The cache file; created if missing.
+            budget_bytes (int): Size of a new file. An existing file keeps its size.
+            slot_bytes (int): Size of a slot in a new file, header included.
+            ways (int): Slots per bucket in a new file.
+        """
+        self.path = path
+        self._stats = get_stats("shared_cache")
+        self._lock = threading.Lock()  # byte-range locks are per process, not per thread
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            magic, version, self.slot_bytes, self.buckets, self.ways = (
+                _HEADER.unpack(header) if len(header) == _HEADER.size else (b"", 0, 0, 0, 0))
+            size = HEADER_BYTES + self.buckets * self.ways * self.slot_bytes
+            if magic != MAGIC or version != VERSION or os.fstat(self._fd).st_size != size:
+                self.slot_bytes, self.ways = slot_bytes, ways
+                self.buckets = max(1, (budget_bytes - HEADER_BYTES) // (slot_bytes * ways))
+                size = HEADER_BYTES + self.buckets * self.ways * self.slot_bytes
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)  # zero-filled: every slot empty
+                os.pwrite(self._fd, _HEADER.pack(MAGIC, VERSION, self.slot_bytes, self.buckets, self.ways), 0)
+            elif self.buckets != max(1, (budget_bytes - HEADER_BYTES) // (self.slot_bytes * self.ways)):
+                logger.info(f"Shared cache {path} keeps its size of {size >> 20} MB; delete it to resize.")
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.size = size
+        self.capacity = self.slot_bytes - _SLOT.size
+        self._map = mmap.mmap(self._fd, size)
+
+    def _bucket(self, key_digest: bytes) -> int:
+        return int.from_bytes(key_digest[:8], "little") % self.buckets
+
+    def _slot(self, bucket: int, way: int) -> int:
+        return HEADER_BYTES + (bucket * self.ways + way) * self.slot_bytes
+
+    def _read(self, key_digest: bytes) -> bytes | None:
+        buf = self._map
+        base = self._slot(self._bucket(key_digest), 0)
+        for offset in range(base, base + self.ways * self.slot_bytes, self.slot_bytes):
+            for _ in range(READ_RETRIES):
+                seq, stamp, found, length, crc = _SLOT.unpack_from(buf, offset)
+                if found != key_digest:
+                    break
+                if seq & 1:
+                    self._stats.incr("torn_reads")  # a writer is rewriting this entry
+                    os.sched_yield()
+                    continue
+                start = offset + _SLOT.size
+                value = buf[start:start + min(length, self.capacity)]
+                if _SEQ.unpack_from(buf, offset)[0] != seq or zlib.crc32(value) != crc:
+                    self._stats.incr("torn_reads")
+                    continue
+                now = time.time_ns()
+                if now - stamp > TOUCH_NS:
+                    # A hint for eviction; racing a writer at worst misdates one entry.
+                    _SEQ.pack_into(buf, offset + _STAMP_OFFSET, now)
+                return value
+            else:
+                self._stats.incr("busy")
+        return None
+
+    def get(self, key: str) -> bytes | None:
+        """The value stored under ``key``, or None. Takes no lock."""
+        start = time.perf_counter()
+        value = self._read(digest(key))
+        self._stats.observe("lookup", time.perf_counter() - start)
+        self._stats.incr("hits" if value is not None else "misses")
+        return value
+
+    def put(self, key: str, value: bytes) -> bool:
+        """Stores ``value`` under ``key``; False when it is larger than a slot."""
+        if len(value) > self.capacity:
+            self._stats.incr("too_large")
+            return False
+        key_digest = digest(key)
+        bucket = self._bucket(key_digest)
+        buf = self._map
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, bucket)
+            try:
+                chosen, oldest, evicted = None, None, False
+                for way in range(self.ways):
+                    offset = self._slot(bucket, way)
+                    _, stamp, found, _, _ = _SLOT.unpack_from(buf, offset)
+                    if found == key_digest:
+                        chosen = offset
+                        break
+                    if found == _EMPTY:
+                        chosen = offset if chosen is None else chosen
+                    elif oldest is None or stamp < oldest[0]:
+                        oldest = (stamp, offset)
+                if chosen is None:
+                    chosen, evicted = oldest[1], True
+                # An odd sequence left by a writer that died mid-write stays odd until this write ends.
+                seq = _SEQ.unpack_from(buf, chosen)[0] | 1
+                _SEQ.pack_into(buf, chosen, seq)
+                start = chosen + _SLOT.size
+                buf[start:start + len(value)] = value
+                _SLOT.pack_into(buf, chosen, seq, time.time_ns(), key_digest, len(value), zlib.crc32(value))
+                _SEQ.pack_into(buf, chosen, seq + 1)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, bucket)
+        self._stats.incr("stores")
+        if evicted:
+            self._stats.incr("evictions")
+        return True
+
+    def entries(self) -> int:
+        """Slots in use; scans every slot header."""
+        return sum(_SLOT.unpack_from(self._map, self._slot(0, 0) + i * self.slot_bytes)[2] != _EMPTY
+                   for i in range(self.buckets * self.ways))
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+_cache: SharedCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> SharedCache | None:
+    """The cache configured by the environment, or None when ``MATH_AGENTS_SHARED_CACHE`` is not set."""
+    global _cache
+    if not SHARED_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SharedCache(SHARED_CACHE_PATH, int(BUDGET_MB * (1 << 20)))
+        return _cache
+
+
+def cached_callback(agent: LlmAgent, cache: SharedCache, inner=None, verified: bool = False):
+    """Builds a ``before_model_callback`` that answers ``agent``'s calls from ``cache`` when it can.
+
+    Args:
+        agent (LlmAgent): The agent whose replies are cached.
+        cache (SharedCache): The shared cache.
+        inner: The agent's previous ``before_model_callback``, run on a miss.
+        verified (bool): Hold a new reply until ``commit`` rather than storing it at once.
+    """
+    async def callback(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+        from google.adk.models.llm_response import LlmResponse
+        from google.genai import types
+
+        topic = callback_context.state.get("topic") or ""
+        if not topic or _streaming(callback_context):
+            if inner is None:
+                return None
+            response = inner(callback_context=callback_context, llm_request=llm_request)
+            return await response if asyncio.iscoroutine(response) else response
+        key = f"{getattr(agent.canonical_model, 'model', '')}:{request_key(agent, llm_request, topic)}"
+        value = cache.get(key)
+        if value is not None:
+            return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=value.decode())]))
+        response = await _call(agent, inner, callback_context, llm_request)
+        text = "".join(part.text or "" for part in response.content.parts or []) \
+            if response is not None and response.content else ""
+        if text and response.error_code is None:
+            if verified:
+                pending = callback_context.state.get(PENDING_KEY) or {}
+                pending[key] = text
+                callback_context.state[PENDING_KEY] = pending
+                get_stats("shared_cache").incr("held")
+            else:
+                cache.put(key, text.encode())
+        return response
+
+    return callback
+
+
+def commit(state) -> int:
+    """Stores the solver replies held in ``state``, once their solution is verified; returns how many."""
+    cache = get_cache()
+    pending = state.get(PENDING_KEY) or {}
+    if cache is None or not pending:
+        return 0
+    stored = sum(cache.put(key, text.encode()) for key, text in pending.items())
+    get_stats("shared_cache").incr("committed", stored)
+    return stored
+
+
+def report() -> dict:
+    """Lookups, hit rate, stores, held and committed replies, evictions, lookup latency and the cache's fill."""
+    stats = get_stats("shared_cache")
+    counters = stats.counters
+    cache = _cache
+    return {
+        "path": SHARED_CACHE_PATH,
+        "size_mb": cache.size / (1 << 20) if cache else 0.0,
+        "slots": cache.buckets * cache.ways if cache else 0,
+        "entries": cache.entries() if cache else 0,
+        "hits": counters["hits"],
+        "misses": counters["misses"],
+        "hit_rate": stats.ratio("hits", "hits", "misses"),
+        "stores": counters["stores"],
+        "held": counters["held"],
+        "committed": counters["committed"],
+        "evictions": counters["evictions"],
+        "too_large": counters["too_large"],
+        "torn_reads": counters["torn_reads"],
+        "busy": counters["busy"],
+        "lookup": stats.latency("lookup"),
+    }
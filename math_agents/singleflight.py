@@ -0,0 +1,194 @@
+"""Single-flight coalescing of identical in-flight model calls.
+
+When many sessions submit the same problem at once, every stage
+(classification, solving, animation, Blender code) would make the same
+model call many times before any result cache could help. ``SingleFlight``
+keys each call by the agent and its normalized inputs. The first caller
+(the leader) starts the call as a shared task, and later identical callers
+await that task. Each caller returns the response from its own agent's
+``before_model_callback``, so ADK writes the result into each caller's own
+session state.
+
+Waiters await the shared task through ``asyncio.shield``. Cancelling one
+waiter (say a client disconnects) only removes that waiter. The shared call
+is cancelled when its last waiter goes away.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+import weakref
+from typing import TYPE_CHECKING
+
+from math_agents.metrics import get_stats
+
+if TYPE_CHECKING:
+    from google.adk.agents import LlmAgent
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.llm_response import LlmResponse
+
+
+logger = logging.getLogger(__name__)
+
+# Set MATH_AGENTS_SINGLEFLIGHT=0 to disable coalescing.
+SINGLEFLIGHT_ENABLED = os.environ.get("MATH_AGENTS_SINGLEFLIGHT", "1") != "0"
+
+_OPERATOR_SPACES_RE = re.compile(r"\s*([-+*/^=()<>,:;|])\s*")
+
+
+def normalize_problem(text: str) -> str:
+    """Canonical form of a problem for matching: NFKC, lower case, no spaces around operators."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = " ".join(text.split())
+    return _OPERATOR_SPACES_RE.sub(r"\1", text).rstrip(" .?!")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time and shares its result."""
+
+    def __init__(self, name: str = "singleflight"):
+        self._flights: dict[str, _Flight] = {}
+        self._stats = get_stats(name)
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, fn, label: str = ""):
+        """Returns ``await fn()``, sharing one call among concurrent callers with the same ``key``.
+
+        Args:
+            key (str): Identity of the computation.
+            fn: Zero-argument coroutine function, called only by the leader.
+            label (str): Stage name for the coalescing counters.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.get_running_loop().create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._done(k, f))
+            self._stats.incr("leader")
+            self._stats.incr(f"leader:{label}")
+        else:
+            self._stats.incr("coalesced")
+            self._stats.incr(f"coalesced:{label}")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+                self._stats.incr("cancelled")
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _done(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def report(self) -> dict:
+        return report(self._stats.name)
+
+
+# Tasks and futures belong to one event loop, so there is one SingleFlight per loop.
+_groups: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SingleFlight]" = weakref.WeakKeyDictionary()
+
+
+def get_group() -> SingleFlight:
+    loop = asyncio.get_running_loop()
+    if loop not in _groups:
+        _groups[loop] = SingleFlight()
+    return _groups[loop]
+
+
+def report(name: str = "singleflight") -> dict:
+    """Coalescing rate and the upstream calls saved, overall and per stage."""
+    counters = get_stats(name).counters
+    leaders, coalesced = counters["leader"], counters["coalesced"]
+    stages = sorted({k.split(":", 1)[1] for k in counters if ":" in k})
+    return {
+        "requests": leaders + coalesced,
+        "upstream_calls": leaders,
+        "upstream_calls_saved": coalesced,
+        "coalescing_rate": coalesced / (leaders + coalesced) if leaders + coalesced else 0.0,
+        "cancelled": counters["cancelled"],
+        "stages": {s: {"upstream_calls": counters[f"leader:{s}"], "saved": counters[f"coalesced:{s}"]}
+                   for s in stages},
+    }
+
+
+def request_key(agent: LlmAgent, llm_request: LlmRequest, topic: str = "") -> str:
+    """Key of a model call: the agent, the normalized problem and the other stage inputs.
+
+    State templating has already substituted the stage inputs (topic,
+    solution, story) into the system instruction by the time the callback runs.
+    The raw topic is cut out of the instruction and contents and keyed in its
+    normalized form, so differently typed copies of one problem coalesce.
+    """
+    digest = hashlib.sha256(agent.name.encode())
+    digest.update(normalize_problem(topic).encode())
+
+    def strip_topic(text: str) -> str:
+        return text.replace(topic, "\0") if topic else text
+
+    digest.update(normalize_problem(strip_topic(str(llm_request.config.system_instruction or ""))).encode())
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                digest.update(normalize_problem(strip_topic(part.text)).encode())
+            elif part.inline_data and part.inline_data.data:
+                digest.update(hashlib.sha256(part.inline_data.data).digest())
+    return digest.hexdigest()
+
+
+async def _call(agent: LlmAgent, inner, callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse:
+    """The leader's call: the inner callback (e.g. batching) if it answers, else the model."""
+    if inner is not None:
+        response = inner(callback_context=callback_context, llm_request=llm_request)
+        if asyncio.iscoroutine(response):
+            response = await response
+        if response:
+            return response
+    final = None
+    async for response in agent.canonical_model.generate_content_async(llm_request):
+        final = response
+    return final
+
+
+def _streaming(callback_context: CallbackContext) -> bool:
+    """Whether the call streams; a shared call returns one complete response, which would end the stream."""
+    from google.adk.agents.run_config import StreamingMode
+
+    run_config = callback_context._invocation_context.run_config
+    return run_config is not None and run_config.streaming_mode == StreamingMode.SSE
+
+
+def coalesced_callback(agent: LlmAgent, inner=None):
+    """Builds a ``before_model_callback`` that coalesces identical concurrent calls of ``agent``.
+
+    Args:
+        agent (LlmAgent): The agent whose model calls are coalesced.
+        inner: The agent's previous ``before_model_callback``, run by the leader only.
+    """
+    async def callback(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+        if not SINGLEFLIGHT_ENABLED or _streaming(callback_context):
+            if inner is None:
+                return None
+            response = inner(callback_context=callback_context, llm_request=llm_request)
+            return await response if asyncio.iscoroutine(response) else response
+        key = request_key(agent, llm_request, callback_context.state.get("topic") or "")
+        return await get_group().do(key, lambda: _call(agent, inner, callback_context, llm_request), label=agent.name)
+
+    return callback
@@ -0,0 +1,250 @@
+"""Typed animation story schema and pipelined story -> Blender generation.
+
+``AnimationAgent`` writes the JSON schema (characters, setting, key_visuals,
+camera_style, quality_cues) first and the prose story after it. The story is
+streamed, and ``SchemaStreamParser`` scans the chunks as they arrive. As soon
+as the schema object closes, it is parsed once into a ``StorySchema``.
+
+``StoryPipelineAgent`` starts ``BlenderCodeAgent`` at that point, while the
+prose is still streaming, so the two generations overlap. The parsed schema
+reaches the Blender prompt as a typed object through the temp state key
+``TEMP_SCHEMA_KEY``. It is also stored as a dict under ``story_schema`` for
+later, lazily generated Blender code (see ``artifacts``).
+
+Set MATH_AGENTS_PIPELINE=0 to start Blender generation only after the whole
+story has arrived, e.g. to measure the overlap.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncGenerator
+from typing_extensions import override
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event, EventActions
+from pydantic import BaseModel, Field, ValidationError
+
+from math_agents.metrics import get_stats
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_KEY = "story_schema"
+TEMP_SCHEMA_KEY = "temp:story_schema"  # the typed StorySchema, for the current invocation only
+
+# Blender generation overlaps the story by default; set MATH_AGENTS_PIPELINE=0 to disable.
+PIPELINE_ENABLED = os.environ.get("MATH_AGENTS_PIPELINE", "1") != "0"
+
+
+class Character(BaseModel):
+    name: str = ""
+    type: str = ""
+    traits: list[str] = Field(default_factory=list)
+    role: str = ""
+
+
+class Setting(BaseModel):
+    location: str = ""
+    time: str = ""
+    mood: str = ""
+    environment: list[str] = Field(default_factory=list)
+
+
+class CameraStyle(BaseModel):
+    shots: list[str] = Field(default_factory=list)
+    motion: list[str] = Field(default_factory=list)
+
+
+class QualityCues(BaseModel):
+    lighting: str = ""
+    materials: list[str] = Field(default_factory=list)
+    motion_style: list[str] = Field(default_factory=list)
+    environment_scale: str = ""
+
+
+class StorySchema(BaseModel):
+    """The structured part of an animation story."""
+
+    characters: list[Character] = Field(default_factory=list)
+    setting: Setting = Field(default_factory=Setting)
+    key_visuals: list[str] = Field(default_factory=list)
+    camera_style: CameraStyle = Field(default_factory=CameraStyle)
+    quality_cues: QualityCues = Field(default_factory=QualityCues)
+
+
+class SchemaStreamParser:
+    """Finds the story schema in streamed text and parses it as soon as its JSON object closes.
+
+    Objects that are not valid JSON or have none of the schema keys (e.g. a
+    ``{name, type}`` in the prose) are skipped. Each character is scanned once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.schema: StorySchema | None = None
+        self._pos = 0
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> StorySchema | None:
+        """Adds a chunk of streamed text; returns the schema once it is complete."""
+        self.text += chunk
+        if self.schema is not None:
+            return self.schema
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._start is None:
+                if c == "{":
+                    self._start, self._depth = i, 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.schema = _parse_schema(text[self._start:i + 1])
+                    self._start = None
+                    if self.schema is not None:
+                        self._pos = i + 1
+                        return self.schema
+        self._pos = len(text)
+        return None
+
+
+def _parse_schema(text: str) -> StorySchema | None:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not data.keys() & StorySchema.model_fields.keys():
+        return None
+    try:
+        return StorySchema.model_validate(data)
+    except ValidationError as e:
+        logger.warning(f"Story schema does not match StorySchema: {e}")
+        return None
+
+
+def parse_story(text: str) -> StorySchema | None:
+    """Returns the schema in a complete story text, or None."""
+    return SchemaStreamParser().feed(text)
+
+
+def schema_from_state(state) -> StorySchema | None:
+    """The story schema of a session: the typed object of this invocation, else the stored dict."""
+    schema = state.get(TEMP_SCHEMA_KEY)
+    if isinstance(schema, StorySchema):
+        return schema
+    if state.get(SCHEMA_KEY):
+        return StorySchema.model_validate(state[SCHEMA_KEY])
+    if state.get("animation_story"):
+        return parse_story(state["animation_story"])
+    return None
+
+
+_DONE = object()
+
+
+async def _pump(events: AsyncGenerator[Event, None], queue: asyncio.Queue) -> None:
+    try:
+        async for event in events:
+            await queue.put(event)
+    except Exception as e:
+        await queue.put(e)
+    finally:
+        await queue.put(_DONE)
+
+
+class StoryPipelineAgent(BaseAgent):
+    """Runs the story agent with streaming and starts the code agent once the story's schema is parsed.
+
+    A story already in session state is not regenerated; only the code agent runs.
+    """
+
+    story_agent: LlmAgent
+    code_agent: BaseAgent
+
+    def __init__(self, name: str, story_agent: LlmAgent, code_agent: BaseAgent):
+        super().__init__(name=name, story_agent=story_agent, code_agent=code_agent,
+                         sub_agents=[story_agent, code_agent])
+
+    def _schema_event(self, ctx: InvocationContext, schema: StorySchema) -> Event:
+        ctx.session.state[TEMP_SCHEMA_KEY] = schema
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={SCHEMA_KEY: schema.model_dump()}),
+        )
+
+    @override
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        stats = get_stats("pipeline")
+        state = ctx.session.state
+        if state.get(self.story_agent.output_key):
+            schema = schema_from_state(state)
+            if schema is not None and not isinstance(state.get(TEMP_SCHEMA_KEY), StorySchema):
+                yield self._schema_event(ctx, schema)
+            async for event in self.code_agent.run_async(ctx):
+                yield event
+            return
+
+        start = time.perf_counter()
+        run_config = (ctx.run_config or RunConfig()).model_copy(update={"streaming_mode": StreamingMode.SSE})
+        streaming_ctx = ctx.model_copy(update={"run_config": run_config})
+        parser = SchemaStreamParser()
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [asyncio.create_task(_pump(self.story_agent.run_async(streaming_ctx), queue))]
+        running, story_end, code_start = 1, None, None
+        try:
+            while running:
+                item = await queue.get()
+                if item is _DONE:
+                    running -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                event = item
+                if event.author == self.story_agent.name and event.content and event.content.parts:
+                    text = "".join(part.text or "" for part in event.content.parts)
+                    if event.partial:
+                        schema = parser.feed(text) if PIPELINE_ENABLED else None
+                    else:
+                        story_end = time.perf_counter()
+                        schema = parser.schema or parse_story(text)
+                    if code_start is None and (schema is not None or not event.partial):
+                        if schema is not None:
+                            yield self._schema_event(ctx, schema)
+                        else:
+                            stats.incr("no_schema")
+                            logger.warning(f"[{self.name}] No schema in the story; Blender code uses the story text.")
+                        code_start = time.perf_counter()
+                        tasks.append(asyncio.create_task(_pump(self.code_agent.run_async(ctx), queue)))
+                        running += 1
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        end = time.perf_counter()
+        if story_end is not None and code_start is not None:
+            stats.incr("pipelined" if code_start < story_end else "sequential")
+            stats.observe("story", story_end - start)
+            stats.observe("overlap", max(0.0, story_end - code_start))
+            stats.observe("end_to_end", end - start)
@@ -1,32 +1,53 @@
+from __future__ import annotations
+
 import os
 import asyncio
-from google import genai
-from google.adk.tools import FunctionTool
-from google.adk.tools import ToolContext
+import threading
+import time
+from typing import TYPE_CHECKING
 
-from google.adk.agents.invocation_context import InvocationContext
+from math_agents import calculus, geometry, linear_algebra, trigonometry
+from math_agents.metrics import get_stats
 
-from google.adk.agents import LlmAgent
-from google.adk.sessions import InMemorySessionService
-from google.adk.agents.invocation_context import InvocationContext
+if TYPE_CHECKING:
+    from google.adk.tools import ToolContext
 
-import warnings
-# Ignore all warnings
-warnings.filterwarnings("ignore")
 
-import logging
-logging.basicConfig(level=logging.ERROR)
+_client_lock = threading.Lock()
+_genai_client = None
 
-import os
-from dotenv import load_dotenv
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment. Please set it in your .env file.")
 
-logging.info("GOOGLE_API_KEY loaded: %s", os.getenv("GOOGLE_API_KEY"))
+def _client():
+    """The shared genai client, created on the first model call rather than at import.
+
+    Calls go through the cassette when recording or replay is on (see ``cassette``).
+    The tools are synchronous and cannot be cancelled, so each call is instead
+    bounded by the request deadline (see ``cancellation``).
+    """
+    global _genai_client
+    with _client_lock:
+        if _genai_client is None:
+            from math_agents import cassette
+
+            if cassette.CASSETTE_MODE == "replay":
+                # Replayed calls never reach the API.
+                _genai_client = cassette.wrap_client(None)
+                return _genai_client
+
+            from dotenv import load_dotenv
+            from google import genai
+            from google.genai import types
+
+            from math_agents.cancellation import REQUEST_TIMEOUT
+
+            load_dotenv()
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment. Please set it in your .env file.")
+            http_options = types.HttpOptions(timeout=int(REQUEST_TIMEOUT * 1000)) if REQUEST_TIMEOUT else None
+            _genai_client = cassette.wrap_client(genai.Client(api_key=api_key, http_options=http_options))
+        return _genai_client
 
-print("Libraries imported.")
 
 # @title Define the tool function to solve algebra problems and provide solution steps.
 def solve_algebra_problem(problem: str, tool_context: ToolContext) -> dict:
@@ -44,7 +65,7 @@ def solve_algebra_problem(problem: str, tool_context: ToolContext) -> dict:
     print(f"--- Tool: solve_algebra_problem called for problem: {problem} ---") # Log tool execution
 
     # make the call to genai to solve the algebra problem.
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the algebra problem '{problem}' and explain step by step",
@@ -72,6 +93,9 @@ def solve_algebra_problem(problem: str, tool_context: ToolContext) -> dict:
 def solve_geometry_problem(problem: str, tool_context: ToolContext) -> dict:
     """Solves a geometry problem and provides step-by-step solution.
 
+    Closed-form shape formulas are answered by the local engine first; the model is only called
+    when the local engine does not support the input.
+
     Args:
         problem (str): The geometry problem to solve (e.g., "Area of circle with radius 3", "Volume of cube with side 4").
 
@@ -83,8 +107,18 @@ def solve_geometry_problem(problem: str, tool_context: ToolContext) -> dict:
     """
     print(f"--- Tool: solve_geometry_problem called for problem: {problem} ---") # Log tool execution
 
-    # Mock geometry problem solving
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    stats = get_stats("geometry")
+    with stats.timer("local"):
+        local_result = geometry.solve(problem)
+    if local_result is not None:
+        stats.incr("local")
+        tool_context.state["last_geometry_problem"] = problem
+        tool_context.state["last_geometry_answer"] = local_result["steps"]
+        return local_result
+
+    stats.incr("fallback")
+    llm_start = time.perf_counter()
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the geometry problem '{problem}' and explain step by step",
@@ -95,6 +129,7 @@ def solve_geometry_problem(problem: str, tool_context: ToolContext) -> dict:
         }
     )
 
+    stats.observe("fallback", time.perf_counter() - llm_start)
     tool_context.state["last_geometry_problem"] = problem
     tool_context.state["last_geometry_answer"] = response.text
 
@@ -108,6 +143,9 @@ def solve_geometry_problem(problem: str, tool_context: ToolContext) -> dict:
 def solve_calculus_problem(problem: str, tool_context: ToolContext) -> dict:
     """Solves a calculus problem and provides step-by-step solution.
 
+    Standard derivatives, integrals and limits are solved by the local memoized
+    engine; the model is only called for inputs it does not support.
+
     Args:
         problem (str): The calculus problem to solve (e.g., "Derivative of x^2", "Integral of 2x").
 
@@ -119,7 +157,19 @@ def solve_calculus_problem(problem: str, tool_context: ToolContext) -> dict:
     """
     print(f"--- Tool: solve_calculus_problem called for problem: {problem} ---") # Log tool execution
 
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    # standard derivatives, integrals and limits are solved locally; only unsupported input reaches the model.
+    stats = get_stats("calculus")
+    with stats.timer("local"):
+        local_result = calculus.solve(problem)
+    if local_result is not None:
+        stats.incr("local")
+        tool_context.state["last_calculus_problem"] = problem
+        tool_context.state["last_calculus_answer"] = local_result["steps"]
+        return local_result
+
+    stats.incr("fallback")
+    llm_start = time.perf_counter()
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the calculus problem '{problem}' and explain step by step",
@@ -129,6 +179,7 @@ def solve_calculus_problem(problem: str, tool_context: ToolContext) -> dict:
             "top_p": 0.8,
         }
     )
+    stats.observe("fallback", time.perf_counter() - llm_start)
     tool_context.state["last_calculus_problem"] = problem
     tool_context.state["last_calculus_answer"] = response.text
 
@@ -141,6 +192,9 @@ def solve_calculus_problem(problem: str, tool_context: ToolContext) -> dict:
 def solve_trigonometry_problem(problem: str, tool_context: ToolContext) -> dict:
     """Solves a trigonometry problem and provides step-by-step solution.
 
+    Standard-angle values are answered by the local engine first; the model is only called
+    when the local engine does not support the input.
+
     Args:
         problem (str): The trigonometry problem to solve (e.g., "sin(30 degrees)", "cos(60 degrees)").
 
@@ -152,7 +206,18 @@ def solve_trigonometry_problem(problem: str, tool_context: ToolContext) -> dict:
     """
     print(f"--- Tool: solve_trigonometry_problem called for problem: {problem} ---") # Log tool execution
 
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    stats = get_stats("trigonometry")
+    with stats.timer("local"):
+        local_result = trigonometry.solve(problem)
+    if local_result is not None:
+        stats.incr("local")
+        tool_context.state["last_trigonometry_problem"] = problem
+        tool_context.state["last_trigonometry_answer"] = local_result["steps"]
+        return local_result
+
+    stats.incr("fallback")
+    llm_start = time.perf_counter()
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the trigonometry problem '{problem}' and explain step by step",
@@ -162,6 +227,7 @@ def solve_trigonometry_problem(problem: str, tool_context: ToolContext) -> dict:
             "top_p": 0.8,
         }
     )
+    stats.observe("fallback", time.perf_counter() - llm_start)
     tool_context.state["last_trigonometry_problem"] = problem
     tool_context.state["last_trigonometry_answer"] = response.text
 
@@ -172,11 +238,16 @@ def solve_trigonometry_problem(problem: str, tool_context: ToolContext) -> dict:
     
 
 
-def solve_linear_algebra_problem(problem: str, tool_context: ToolContext) -> dict:
+def solve_linear_algebra_problem(problem: str, tool_context: ToolContext, matrix_path: str = "", rhs_path: str = "") -> dict:
     """Solves a linear algebra problem and provides step-by-step solution.
 
+    Small systems written in text and uploaded matrices are solved locally with
+    NumPy/LAPACK; anything else falls back to the model.
+
     Args:
         problem (str): The linear algebra problem to solve (e.g., "Solve 2x + 3y = 6 and x - y = 2").
+        matrix_path (str): Optional path to an uploaded ``.npy``/CSV matrix (memory-mapped when large).
+        rhs_path (str): Optional path to the right-hand side vector when solving A·x = b.
 
     Returns:
         dict: A dictionary containing the solution steps and final answer.
@@ -186,10 +257,20 @@ def solve_linear_algebra_problem(problem: str, tool_context: ToolContext) -> dic
     """
     print(f"--- Tool: solve_linear_algebra_problem called for problem: {problem} ---") # Log tool execution
 
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    # try the local solver first; large results are summarized so only the summary lands in state.
+    try:
+        local_result = linear_algebra.solve(problem, matrix_path=matrix_path, rhs_path=rhs_path)
+    except (ValueError, OSError) as e:
+        return {"status": "error", "error_message": f"Sorry, I couldn't read the matrix for '{problem}': {e}"}
+    if local_result is not None:
+        tool_context.state["last_linear_algebra_problem"] = problem
+        tool_context.state["last_linear_algebra_answer"] = local_result.get("answer", local_result.get("error_message"))
+        return local_result
+
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
-        contents=f"solve the algebra problem '{problem}' and explain step by step",
+        contents=f"solve the linear algebra problem '{problem}' and explain step by step",
         config={
             "max_output_tokens": 10000,
             "temperature": 0.2,
@@ -220,7 +301,7 @@ def solve_statistics_problem(problem: str, tool_context: ToolContext) -> dict:
     """
     print(f"--- Tool: solve_statistics_problem called for problem: {problem} ---") # Log tool execution
 
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the statistics problem '{problem}' and explain step by step",
@@ -253,7 +334,7 @@ def solve_probability_problem(problem: str, tool_context: ToolContext) -> dict:
     """
     print(f"--- Tool: solve_probability_problem called for problem: {problem} ---") # Log tool execution
 
-    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    client = _client()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=f"solve the probability problem '{problem}' and explain step by step",
@@ -0,0 +1,202 @@
+"""Exact-value trigonometry with a numeric fallback for general angles.
+
+Standard angles (multiples of 30° and 45°) are answered exactly from the
+first-quadrant table using reference angles and quadrant signs, so
+"sin(30 degrees)" gives 1/2 and "tan(135°)" gives -1. Other angles are
+evaluated numerically. Simple arithmetic around trig calls
+("sin(30°) + cos(60°)") is combined with ``expr``.
+"""
+
+import math
+import re
+from fractions import Fraction
+
+from math_agents import expr as E
+
+
+# First-quadrant (sin, cos) exact values, as expressions in caret notation.
+EXACT_QUADRANT_I = {
+    0: ("0", "1"),
+    30: ("1/2", "sqrt(3)/2"),
+    45: ("sqrt(2)/2", "sqrt(2)/2"),
+    60: ("sqrt(3)/2", "1/2"),
+    90: ("1", "0"),
+}
+INVERSE_FUNCTIONS = {"arcsin": "sin", "arccos": "cos", "arctan": "tan",
+                     "asin": "sin", "acos": "cos", "atan": "tan", "sin^-1": "sin", "cos^-1": "cos", "tan^-1": "tan"}
+
+_CALL_RE = re.compile(
+    r"(?<![a-zA-Z])(?P<fn>arcsin|arccos|arctan|asin|acos|atan|sin\^-1|cos\^-1|tan\^-1|sin|cos|tan|sec|csc|cosec|cot)\s*"
+    r"(?:\(\s*(?P<arg>[^()]*(?:\([^()]*\)[^()]*)*)\s*\)|(?P<bare>[-+]?[\dπ./]+(?:\s*pi)?\s*(?:°|degrees?|deg|radians?|rad)?))",
+    re.IGNORECASE,
+)
+_PREFIX_RE = re.compile(r"^(?:find|evaluate|compute|calculate|simplify|what\s+is|the\s+value\s+of|value\s+of|\s)+", re.IGNORECASE)
+_DEGREE_RE = re.compile(r"\s*(?:°|degrees?|deg)\s*$", re.IGNORECASE)
+_RADIAN_RE = re.compile(r"\s*(?:radians?|rad)\s*$", re.IGNORECASE)
+
+
+class Undefined(Exception):
+    """Raised for values such as tan(90°) that are undefined."""
+
+
+def _exact_sin_cos(degrees: Fraction) -> tuple[tuple, tuple] | None:
+    """Returns exact (sin, cos) trees for multiples of 30° and 45°, otherwise None."""
+    if degrees.denominator != 1:
+        return None
+    angle = int(degrees) % 360
+    reference = angle % 90
+    quadrant = angle // 90
+    if reference not in EXACT_QUADRANT_I:
+        return None
+    s, c = (E.parse(v) for v in EXACT_QUADRANT_I[reference])
+    # Rotating by 90° maps (sin, cos) -> (cos, -sin).
+    for _ in range(quadrant):
+        s, c = c, E.neg(s)
+    return s, c
+
+
+def exact_value(name: str, degrees: Fraction) -> tuple | None:
+    """Returns the exact value of a trig function at a standard angle.
+
+    Raises:
+        Undefined: If the function is undefined at that angle (e.g. tan 90°).
+    """
+    pair = _exact_sin_cos(degrees)
+    if pair is None:
+        return None
+    s, c = pair
+    numerator, denominator = {
+        "sin": (s, E.ONE), "cos": (c, E.ONE), "tan": (s, c),
+        "sec": (E.ONE, c), "csc": (E.ONE, s), "cot": (c, s),
+    }[name]
+    if E.is_num(denominator, 0):
+        raise Undefined(f"{name}({_fmt_angle(degrees)}) is undefined")
+    return E.div(numerator, denominator)
+
+
+def _fmt_angle(degrees: Fraction) -> str:
+    return f"{E.to_str(E.num(degrees))}°"
+
+
+def _to_degrees(argument: str) -> tuple[Fraction | float, str]:
+    """Converts an angle argument to degrees; returns (degrees, note about the unit)."""
+    text = argument.strip()
+    if _DEGREE_RE.search(text):
+        return Fraction(E.evaluate(E.parse(_DEGREE_RE.sub("", text)))).limit_denominator(10**6), "degrees"
+    radians = bool(_RADIAN_RE.search(text))
+    text = _RADIAN_RE.sub("", text)
+    tree = E.parse(text.replace("π", "pi"))
+    if ("const", "pi") in _atoms(tree) or radians:
+        coefficient = E.div(tree, ("const", "pi"))
+        if coefficient[0] == "num":
+            return coefficient[1] * 180, "radians"
+        return math.degrees(E.evaluate(tree)), "radians"
+    value = E.evaluate(tree)
+    # Without "°" or "degrees" an angle is in radians, as in calculus: sin(1) is sin of 1 rad.
+    return Fraction(0) if value == 0 else math.degrees(value), "assumed radians"
+
+
+def _atoms(tree) -> set:
+    if tree[0] in ("add", "mul"):
+        return set().union(*(_atoms(t) for t in tree[1]))
+    if tree[0] == "pow":
+        return _atoms(tree[1]) | _atoms(tree[2])
+    if tree[0] == "fn":
+        return _atoms(tree[2])
+    return {tree}
+
+
+def _inverse(name: str, argument: str) -> tuple[str, str, str]:
+    """Returns (rendered value, step, numeric approximation) for an inverse trig call."""
+    value_tree = E.parse(argument)
+    target = E.evaluate(value_tree)
+    base = INVERSE_FUNCTIONS[name.lower()]
+    principal = {"sin": range(-90, 91, 15), "cos": range(0, 181, 15), "tan": range(-75, 76, 15)}[base]
+    for degrees in principal:
+        try:
+            exact = exact_value(base, Fraction(degrees))
+        except Undefined:
+            continue
+        if exact is not None and exact == value_tree:
+            radians = E.mul(E.num(Fraction(degrees, 180)), ("const", "pi"))
+            step = (f"{base}({degrees}°) = {E.to_str(value_tree)} and {degrees}° is in the principal range, "
+                    f"so {name}({E.to_str(value_tree)}) = {degrees}° = {E.to_str(radians).replace('pi', 'π')} rad.")
+            return f"{degrees}°", step, f"{math.radians(degrees):.6g} rad"
+    func = {"sin": math.asin, "cos": math.acos, "tan": math.atan}[base]
+    radians = func(target)
+    step = f"{E.to_str(value_tree)} is not a standard value, so evaluate numerically: {name}({E.to_str(value_tree)}) ≈ {math.degrees(radians):.6g}°."
+    return f"{math.degrees(radians):.6g}°", step, f"{radians:.6g} rad"
+
+
+def solve(problem: str) -> dict | None:
+    """Evaluates trig functions at given angles, exactly where possible.
+
+    Args:
+        problem (str): e.g. "sin(30 degrees)", "cos(60°) + sin(30°)", "tan(pi/4)", "arcsin(1/2)".
+
+    Returns:
+        dict | None: ``{"status", "steps", "answer"}``, or None for word problems
+        and identities, which go to the LLM.
+    """
+    text = _PREFIX_RE.sub("", problem.strip()).rstrip(" ?.")
+    calls = list(_CALL_RE.finditer(text))
+    if not calls:
+        return None
+
+    steps, rewritten, pos = [], [], 0
+    numeric = False
+    try:
+        for call in calls:
+            name = call["fn"].lower().replace("cosec", "csc")
+            argument = call["arg"] if call["arg"] is not None else call["bare"]
+            rewritten.append(text[pos:call.start()])
+            pos = call.end()
+            label = f"{name}({argument.strip()})"
+            if name in INVERSE_FUNCTIONS:
+                if len(calls) > 1 or text.strip() != call.group(0).strip():
+                    return None
+                value, step, approx = _inverse(name, argument)
+                steps.append(step)
+                answer = f"{label} = {value} ({approx})"
+                return E.result(steps, answer)
+            degrees, unit_note = _to_degrees(argument)
+            if unit_note == "radians" and isinstance(degrees, Fraction):
+                steps.append(f"Convert to degrees: {argument.strip()} rad × 180°/π = {_fmt_angle(degrees)}.")
+            elif unit_note == "assumed radians":
+                steps.append(f"No unit given for {argument.strip()}; treat it as radians.")
+            exact = exact_value(name, degrees) if isinstance(degrees, Fraction) else None
+            if exact is not None:
+                angle = int(degrees) % 360
+                reference = angle % 90 if (angle // 90) % 2 == 0 else 90 - angle % 90
+                if angle >= 90 or degrees < 0:
+                    steps.append(f"{_fmt_angle(degrees)} lies in quadrant {angle // 90 + 1} with reference angle {reference}°; "
+                                 f"apply the sign of {name} there.")
+                steps.append(f"Exact value: {label} = {E.to_str(exact)}.")
+                rewritten.append(f"({E.to_str(exact)})")
+            else:
+                value = getattr(math, name)(math.radians(float(degrees))) if name in ("sin", "cos", "tan") else \
+                    1 / {"sec": math.cos, "csc": math.sin, "cot": math.tan}[name](math.radians(float(degrees)))
+                numeric = True
+                steps.append(f"{label} is not a standard angle, so evaluate numerically: {label} ≈ {value:.6g}.")
+                rewritten.append(f"({value!r})")
+        rewritten.append(text[pos:])
+        expression = "".join(rewritten).strip()
+        # Anything left that is not arithmetic means this is a word problem.
+        if re.search(r"[a-zA-Z]", expression.replace("sqrt", "")):
+            return None
+        tree = E.parse(expression)
+    except Undefined as e:
+        return E.result(steps + [str(e) + " because the denominator is 0."], str(e))
+    except (E.ParseError, ValueError, ZeroDivisionError, KeyError):
+        return None
+
+    original = text.strip()
+    if numeric:
+        value = E.evaluate(tree)
+        if len(calls) > 1:
+            steps.append(f"Combine: {original} ≈ {value:.6g}.")
+        return E.result(steps, f"{original} ≈ {value:.6g}")
+    if len(calls) > 1 or expression != f"({E.to_str(tree)})":
+        steps.append(f"Combine: {original} = {E.to_str(tree)}.")
+    approx = "" if tree[0] == "num" and tree[1].denominator == 1 else f" ≈ {E.evaluate(tree):.6g}"
+    return E.result(steps, f"{original} = {E.to_str(tree)}{approx}")
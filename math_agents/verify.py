@@ -0,0 +1,427 @@
+"""Local answer verification used instead of an LLM critic loop.
+
+``verify(topic, solution)`` extracts the final answer from a solver's
+``solution`` text and checks it against the original ``topic`` without a model
+call:
+
+* equations and systems: substitute the claimed roots back in; for a
+  polynomial equation, also check that no real root is missing;
+* derivatives: compare with a central finite difference at random points;
+* indefinite integrals: differentiate the answer back (numerically) and compare
+  with the integrand; definite integrals: compare with Simpson's rule;
+* limits: evaluate the expression close to the point;
+* expressions to simplify or expand: compare both sides at random points.
+
+Each check returns "verified", "failed" or "unverifiable". Only "failed"
+triggers the single targeted re-solve in ``SupervisorAgent``.
+"""
+
+import math
+import random
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from math_agents import calculus
+from math_agents import expr as E
+from math_agents.metrics import get_stats
+
+
+SAMPLE_POINTS = 6
+REL_TOLERANCE = 1e-6
+ABS_TOLERANCE = 1e-6
+
+
+@dataclass
+class VerificationResult:
+    """Outcome of one verification check."""
+
+    status: str  # "verified", "failed" or "unverifiable"
+    method: str = ""
+    reason: str = ""
+    answer: str = ""
+    elapsed_ms: float = 0.0
+    details: dict = field(default_factory=dict)
+
+    def to_state(self) -> dict:
+        return {"status": self.status, "method": self.method, "reason": self.reason,
+                "answer": self.answer, "elapsed_ms": round(self.elapsed_ms, 3)}
+
+
+# --- Answer extraction ---
+
+_LATEX = [
+    (r"\\left|\\right|\\,|\\!|\\;|\\displaystyle", ""),
+    (r"\\cdot|\\times", "*"),
+    (r"\\div", "/"),
+    (r"\\pi", "pi"),
+    (r"\\(sin|cos|tan|sec|csc|cot|ln|log|exp|arcsin|arccos|arctan)", r"\1"),
+    (r"\\infty", "infinity"),
+    (r"\\pm", "±"),
+]
+_FRAC_RE = re.compile(r"\\[dt]?frac\{([^{}]*)\}\{([^{}]*)\}")
+_SQRT_RE = re.compile(r"\\sqrt\{([^{}]*)\}")
+_BOXED_RE = re.compile(r"\\boxed\{((?:[^{}]|\{[^{}]*\})*)\}")
+_ANSWER_LINE_RE = re.compile(
+    r"(?:final\s+answer|answer|result|(?:the\s+)?(?:limit|derivative|integral|value)\s+is)\b\s*(?:is|:)?\s*(.+)", re.IGNORECASE)
+_CONCLUSION_RE = re.compile(r"(?:therefore|thus|hence|so)\b\s*,?\s*(.+)", re.IGNORECASE)
+# Words allowed in a topic that is checked as a bare expression or equation.
+_MATH_WORDS = {"sin", "cos", "tan", "sec", "csc", "cot", "arcsin", "arccos", "arctan",
+               "ln", "log", "exp", "sqrt", "pi", "abs"}
+
+
+def normalize_math(text: str) -> str:
+    """Turns markdown/LaTeX math into the caret notation ``expr`` parses."""
+    text = text.replace("$", "").replace("**", "").replace("`", "")
+    text = re.sub(r"\\[()\[\]]", "", text)
+    for _ in range(3):
+        text = _FRAC_RE.sub(r"((\1)/(\2))", text)
+        text = _SQRT_RE.sub(r"sqrt(\1)", text)
+    for pattern, replacement in _LATEX:
+        text = re.sub(pattern, replacement, text)
+    text = text.replace("{", "(").replace("}", ")")
+    return text.strip()
+
+
+def extract_final_answer(solution: str) -> str:
+    """Returns the final-answer fragment of a step-by-step solution."""
+    boxed = _BOXED_RE.findall(solution)
+    if boxed:
+        return normalize_math(boxed[-1])
+    lines = [line.strip() for line in solution.strip().splitlines() if line.strip()]
+    for line in reversed(lines):
+        match = _ANSWER_LINE_RE.search(normalize_math(line))
+        if match:
+            return match.group(1).strip(" .")
+    for line in reversed(lines):
+        match = _CONCLUSION_RE.search(normalize_math(line))
+        if match and ("=" in match.group(1) or re.search(r"\d", match.group(1))):
+            return match.group(1).strip(" .")
+    for line in reversed(lines):
+        if "=" in line:
+            return normalize_math(line).strip(" .")
+    return normalize_math(lines[-1]) if lines else ""
+
+
+def _parse_rhs(answer: str):
+    """Parses the expression after the last '=' of an answer, dropping '+ C'."""
+    text = answer.split("=")[-1]
+    text = re.sub(r"\+\s*C\b.*$", "", text).strip(" .")
+    text = re.sub(r"\s*(?:units?|square units|cubic units)\b.*$", "", text)
+    text = text.split("≈")[0].split(",")[0].strip()
+    return E.parse(text)
+
+
+def _assignments(answer: str) -> dict[str, list[float]]:
+    """Finds 'x = 2', 'x = 2 or x = -3', 'x = ±2' style root assignments."""
+    roots: dict[str, list[float]] = {}
+    for name, value in re.findall(r"\b([a-z])\s*=\s*(±?\s*[-+]?[\w./()^*+ √-]*?)(?=\s*(?:,|;|\bor\b|\band\b|$))", answer):
+        value = value.strip().replace("√", "sqrt")
+        try:
+            if value.startswith("±"):
+                magnitude = E.evaluate(E.parse(value[1:]))
+                roots.setdefault(name, []).extend([magnitude, -magnitude])
+            else:
+                roots.setdefault(name, []).append(E.evaluate(E.parse(value)))
+        except (E.ParseError, ValueError, ZeroDivisionError, KeyError, OverflowError):
+            continue
+    return roots
+
+
+def _listed_values(answer: str) -> list[float]:
+    """The numbers listed without a variable name, as in a boxed "2, 3" or "x = 2 or 3"."""
+    values = []
+    for part in re.split(r"\s*(?:,|;|\bor\b|\band\b)\s*", answer):
+        part = part.strip(" .").replace("√", "sqrt")
+        if not part or "=" in part:
+            continue
+        try:
+            tree = E.parse(part)
+            if not E.free_vars(tree):
+                values.append(E.evaluate(tree))
+        except (E.ParseError, ValueError, ZeroDivisionError, KeyError, OverflowError):
+            continue
+    return values
+
+
+def _polynomial_coefficients(tree, name: str) -> list[float] | None:
+    """Coefficients of ``tree`` as a polynomial in ``name``, highest degree first; None if it is not one."""
+    by_degree: dict[int, float] = {}
+    expanded = E.expand(tree)
+    for term in expanded[1] if expanded[0] == "add" else (expanded,):
+        coefficient, rest = E.split_coefficient(term)
+        if rest is None:
+            degree = 0
+        elif rest == ("var", name):
+            degree = 1
+        elif rest[0] == "pow" and rest[1] == ("var", name) and E.is_num(rest[2]) \
+                and rest[2][1].denominator == 1 and rest[2][1] > 0:
+            degree = int(rest[2][1])
+        else:
+            return None
+        by_degree[degree] = by_degree.get(degree, 0.0) + float(coefficient)
+    top = max(by_degree)
+    return [by_degree.get(d, 0.0) for d in range(top, -1, -1)] if top else None
+
+
+def _distinct(values: list[float]) -> list[float]:
+    out = []
+    for value in sorted(values):
+        if not out or not math.isclose(value, out[-1], rel_tol=1e-5, abs_tol=1e-5):
+            out.append(value)
+    return out
+
+
+def _real_roots(coefficients: list[float]) -> list[float]:
+    """The distinct real roots of a polynomial; a repeated root counts once."""
+    roots = np.roots(coefficients)
+    scale = max(1.0, float(np.max(np.abs(roots)))) if roots.size else 1.0
+    return _distinct([float(r.real) for r in roots if abs(r.imag) <= 1e-6 * scale])
+
+
+# --- Numeric helpers ---
+
+def _close(a: float, b: float, scale: float = 1.0) -> bool:
+    return math.isclose(a, b, rel_tol=REL_TOLERANCE * 100, abs_tol=ABS_TOLERANCE * max(1.0, scale))
+
+
+def _rng(topic: str) -> random.Random:
+    # Seeded by the topic so a re-check of the same problem is reproducible.
+    return random.Random(zlib.crc32(topic.encode("utf-8")))
+
+
+def _sample_points(tree_a, tree_b, var: str, rng: random.Random, count: int = SAMPLE_POINTS):
+    """Yields random points where both trees evaluate to finite numbers."""
+    found = 0
+    for _ in range(count * 10):
+        x = rng.uniform(0.2, 3.0) * rng.choice((1, 1, -1))
+        try:
+            a, b = E.evaluate(tree_a, {var: x}), E.evaluate(tree_b, {var: x})
+        except (ValueError, ZeroDivisionError, OverflowError, KeyError):
+            continue
+        if math.isfinite(a) and math.isfinite(b):
+            found += 1
+            yield x, a, b
+            if found >= count:
+                return
+
+
+def _derivative_at(tree, var: str, x: float) -> float:
+    h = 1e-5 * max(1.0, abs(x))
+    return (E.evaluate(tree, {var: x + h}) - E.evaluate(tree, {var: x - h})) / (2 * h)
+
+
+def _simpson(tree, var: str, lo: float, hi: float, n: int = 2000) -> float:
+    step = (hi - lo) / n
+    total = E.evaluate(tree, {var: lo}) + E.evaluate(tree, {var: hi})
+    for i in range(1, n):
+        total += (4 if i % 2 else 2) * E.evaluate(tree, {var: lo + i * step})
+    return total * step / 3
+
+
+# --- Checks ---
+
+def _check_calculus(topic: str, answer: str, rng: random.Random) -> VerificationResult | None:
+    parsed = calculus.parse_problem(topic)
+    if parsed is None:
+        return None
+    kind, tree, var, extra = parsed
+    claimed = _parse_rhs(answer)
+    if kind == "derivative":
+        checked = 0
+        for x, _, got in _sample_points(tree, claimed, var, rng):
+            try:
+                expected = _derivative_at(tree, var, x)
+            except (ValueError, ZeroDivisionError, OverflowError):
+                continue
+            checked += 1
+            if not _close(expected, got, abs(expected)):
+                return VerificationResult("failed", "finite-difference", f"d/d{var} at {var}={x:.4g} is {expected:.6g}, answer gives {got:.6g}")
+        if not checked:
+            return None
+        return VerificationResult("verified", "finite-difference", f"matches the numerical derivative at {checked} random points")
+    if kind == "integral" and extra is None:
+        checked = 0
+        for x, _, _ in _sample_points(tree, claimed, var, rng):
+            expected, got = E.evaluate(tree, {var: x}), _derivative_at(claimed, var, x)
+            checked += 1
+            if not _close(expected, got, abs(expected)):
+                return VerificationResult("failed", "differentiate-back", f"d/d{var} of the answer at {var}={x:.4g} is {got:.6g}, integrand is {expected:.6g}")
+        if not checked:
+            return None
+        return VerificationResult("verified", "differentiate-back", "derivative of the answer matches the integrand at random points")
+    if kind == "integral":
+        lo, hi = (E.evaluate(b) for b in extra)
+        expected, got = _simpson(tree, var, lo, hi), E.evaluate(claimed)
+        if _close(expected, got, abs(expected)):
+            return VerificationResult("verified", "quadrature", f"matches Simpson's rule ({expected:.6g})")
+        return VerificationResult("failed", "quadrature", f"Simpson's rule gives {expected:.6g}, answer gives {got:.6g}")
+    point = E.evaluate(extra)
+    got = E.evaluate(claimed)
+    samples = []
+    for h in (1e-4, -1e-4, 1e-5, -1e-5):
+        try:
+            samples.append(E.evaluate(tree, {var: point + h}))
+        except (ValueError, ZeroDivisionError, OverflowError):
+            continue
+    if not samples:
+        return None
+    if all(math.isclose(s, got, rel_tol=1e-3, abs_tol=1e-3) for s in samples):
+        return VerificationResult("verified", "evaluate-near-point", f"f({var}) approaches {got:.6g} near {var}={point:.4g}")
+    return VerificationResult("failed", "evaluate-near-point", f"f({var}) near {var}={point:.4g} is about {samples[0]:.6g}, answer gives {got:.6g}")
+
+
+_EQUATION_RE = re.compile(r"([^=,;:]+?)=([^=,;]+)")
+
+
+def _is_symbolic(text: str) -> bool:
+    """True when ``text`` has no words besides function names, i.e. is not a word problem."""
+    return all(word.lower() in _MATH_WORDS for word in re.findall(r"[A-Za-z]{2,}", text))
+
+
+def _equations(topic: str) -> list[tuple]:
+    text = re.sub(r"^\s*(?:solve|find|compute)\b(?:\s+for\s+[a-z])?\s*:?", "", topic.strip(), flags=re.IGNORECASE)
+    text = re.sub(r"\s+for\s+[a-z](?:\s*(?:and|,)\s*[a-z])*\s*\.?$", "", text)
+    if not _is_symbolic(re.sub(r"\band\b", "", text)):
+        return []
+    out = []
+    for part in re.split(r"\s*(?:\band\b|;|,|\n)\s*", text):
+        match = _EQUATION_RE.fullmatch(part.strip().rstrip("."))
+        if not match:
+            continue
+        try:
+            out.append(E.sub(E.parse(match.group(1)), E.parse(match.group(2))))
+        except (E.ParseError, ZeroDivisionError):
+            return []
+    return out
+
+
+def _check_equations(topic: str, answer: str) -> VerificationResult | None:
+    residuals = _equations(topic)
+    if not residuals:
+        return None
+    roots = _assignments(answer)
+    names = set().union(*(E.free_vars(r) for r in residuals))
+    if len(names) == 1:
+        name = next(iter(names))
+        # "x = 2, 3" names the variable once; a boxed "2, 3" not at all.
+        claimed = roots.get(name, []) + _listed_values(answer)
+        if not claimed:
+            return None
+        for value in claimed:
+            for residual in residuals:
+                got = E.evaluate(residual, {name: value})
+                if not _close(got, 0.0):
+                    return VerificationResult("failed", "substitute-roots", f"{name} = {value:.6g} leaves a residual of {got:.6g}")
+        coefficients = _polynomial_coefficients(residuals[0], name) if len(residuals) == 1 else None
+        if coefficients is not None:
+            expected, found = _real_roots(coefficients), _distinct(claimed)
+            if len(found) < len(expected):
+                missing = [r for r in expected if not any(math.isclose(r, c, rel_tol=1e-5, abs_tol=1e-5) for c in found)]
+                return VerificationResult("failed", "substitute-roots",
+                                          f"the equation has {len(expected)} real roots; missing "
+                                          + ", ".join(f"{name} = {r:.6g}" for r in missing))
+            return VerificationResult("verified", "substitute-roots", f"the claimed roots are all the real roots of {name}")
+        return VerificationResult("verified", "substitute-roots", f"every claimed root of {name} satisfies the equation")
+    if not roots or not names <= set(roots):
+        return None
+    env = {name: roots[name][0] for name in names}
+    for residual in residuals:
+        got = E.evaluate(residual, env)
+        if not _close(got, 0.0):
+            return VerificationResult("failed", "substitute-roots", f"the claimed solution leaves a residual of {got:.6g}")
+    return VerificationResult("verified", "substitute-roots", "the claimed solution satisfies every equation")
+
+
+def _check_expression(topic: str, answer: str, rng: random.Random) -> VerificationResult | None:
+    """Compares 'Simplify/Expand/Solve <expr>' with the answer at random points."""
+    text = re.sub(r"^\s*(?:solve|simplify|expand|factor|factorise|factorize|evaluate|compute|calculate|what\s+is)\s*:?\s*",
+                  "", topic.strip(), flags=re.IGNORECASE)
+    text = re.split(r"\s+(?:and|then|to)\s+", text)[0].strip(" .?")
+    if "=" in text or not _is_symbolic(text):
+        return None
+    try:
+        original, claimed = E.parse(text), _parse_rhs(answer)
+    except (E.ParseError, ZeroDivisionError):
+        return None
+    names = sorted(E.free_vars(original) | E.free_vars(claimed))
+    if not E.free_vars(original) >= E.free_vars(claimed):
+        return None
+    checked = 0
+    for _ in range(SAMPLE_POINTS * 5):
+        env = {name: rng.uniform(-3.0, 3.0) for name in names}
+        try:
+            expected, got = E.evaluate(original, env), E.evaluate(claimed, env)
+        except (ValueError, ZeroDivisionError, OverflowError):
+            continue
+        checked += 1
+        if not _close(expected, got, abs(expected)):
+            point = ", ".join(f"{k}={v:.3g}" for k, v in env.items())
+            return VerificationResult("failed", "random-points", f"at {point} the problem gives {expected:.6g}, the answer {got:.6g}")
+        if checked >= SAMPLE_POINTS:
+            break
+    if not checked:
+        return None
+    return VerificationResult("verified", "random-points", f"answer equals the original expression at {checked} random points")
+
+
+def verify(topic: str, solution: str) -> VerificationResult:
+    """Checks ``solution`` against ``topic`` locally and records verification stats.
+
+    Args:
+        topic (str): The original problem statement.
+        solution (str): The solver's step-by-step solution text.
+
+    Returns:
+        VerificationResult: "verified", "failed" (worth one targeted re-solve)
+        or "unverifiable" (no local check applies; the solution is kept).
+    """
+    stats = get_stats("verification")
+    start = time.perf_counter()
+    answer = extract_final_answer(solution or "")
+    topic = normalize_math(topic)
+    result = None
+    if answer:
+        rng = _rng(topic)
+        for check in (lambda: _check_calculus(topic, answer, rng),
+                      lambda: _check_equations(topic, answer),
+                      lambda: _check_expression(topic, answer, rng)):
+            try:
+                result = check()
+            except (E.ParseError, ValueError, ZeroDivisionError, OverflowError, KeyError, RecursionError):
+                result = None
+            if result is not None:
+                break
+    if result is None:
+        result = VerificationResult("unverifiable", reason="no local check applies to this problem")
+    result.answer = answer
+    result.elapsed_ms = (time.perf_counter() - start) * 1000
+    stats.observe("check", result.elapsed_ms / 1000)
+    stats.incr(result.status)
+    return result
+
+
+def report() -> dict:
+    """Summarizes verification latency and the LLM critic calls avoided.
+
+    The planned critic/reviser loop would have made at least one critic call
+    per solution. Local checks replace all of them; the only model calls left
+    are targeted re-solves after a failed check. Each re-solve is checked
+    again, so it is subtracted from the number of solutions.
+    """
+    stats = get_stats("verification")
+    checks = sum(stats.counters[s] for s in ("verified", "failed", "unverifiable"))
+    resolves = stats.counters["resolved"]
+    solutions = checks - resolves
+    return {
+        "solutions": solutions,
+        "verified": stats.counters["verified"],
+        "failed": stats.counters["failed"],
+        "unverifiable": stats.counters["unverifiable"],
+        "re_solves": resolves,
+        "critic_calls_avoided_fraction": 1 - resolves / solutions if solutions else 0.0,
+        "latency": stats.latency("check"),
+    }
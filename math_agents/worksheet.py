@@ -0,0 +1,144 @@
+"""Worksheet mode: split a worksheet into problems and solve them concurrently.
+
+``split_text`` cuts numbered ("1.", "2)", "Q3:", "Problem 4.") or lettered
+("(a)", "b)") items out of a worksheet's text. Image worksheets are split into
+text blocks locally by ``imaging.preprocess_regions`` before transcription.
+
+``solve_worksheet`` runs each problem through ``SupervisorAgent`` in its own
+child session. All worksheets share one semaphore, so the number of problems
+in flight across requests stays under ``MAX_CONCURRENCY``. Results come back
+in worksheet order. Animation is off by default and can be enabled per item.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+import uuid
+import weakref
+from typing import TYPE_CHECKING
+
+from math_agents.config import APP_NAME, INITIAL_STATE, USER_ID
+from math_agents.metrics import get_stats
+
+if TYPE_CHECKING:
+    from google.adk.runners import Runner
+    from google.adk.sessions import BaseSessionService
+
+
+MAX_CONCURRENCY = 8
+RESULT_KEYS = ["topic", "math_domain", "math_domains", "solution", "verification", "animation_story", "blender_code",
+               "budget"]
+
+_NUMBERED_RE = re.compile(r"^[ \t]*(?:Q(?:uestion)?\s*|Problem\s+|\()?(\d{1,3})\s*[.):]\s+", re.IGNORECASE | re.MULTILINE)
+_LETTERED_RE = re.compile(r"^[ \t]*\(?([a-h])\)\s+", re.MULTILINE)
+
+# One semaphore per event loop; a semaphore cannot be shared across loops.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _semaphore_for_loop() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def bounded(coro):
+    """Awaits ``coro`` under the shared worksheet concurrency limit."""
+    async with _semaphore_for_loop():
+        return await coro
+
+
+def _sequential(matches: list[re.Match], first, step) -> list[re.Match]:
+    """Keeps markers that continue the sequence first, step(first), ...; others are part of the text."""
+    kept, expected = [], first
+    for match in matches:
+        if match.group(1).lower() == expected:
+            kept.append(match)
+            expected = step(expected)
+    return kept
+
+
+def split_text(text: str) -> list[str]:
+    """Splits worksheet text into problems; returns ``[text]`` when it has fewer than two items."""
+    markers = _sequential(list(_NUMBERED_RE.finditer(text)), "1", lambda n: str(int(n) + 1))
+    if len(markers) < 2:
+        markers = _sequential(list(_LETTERED_RE.finditer(text)), "a", lambda c: chr(ord(c) + 1))
+    if len(markers) < 2:
+        return [text.strip()] if text.strip() else []
+    bounds = [m.start() for m in markers[1:]] + [len(text)]
+    items = [text[m.end():end].strip() for m, end in zip(markers, bounds)]
+    # Text before the first item (e.g. "Solve the following:") applies to every item.
+    preamble = text[:markers[0].start()].strip()
+    return [f"{preamble} {item}" if preamble else item for item in items if item]
+
+
+async def solve_item(runner: Runner, session_service: BaseSessionService, topic: str,
+                     session_id: str, animate: bool = False, tenant: str = "", request_id: str = "") -> dict:
+    """Runs one problem through the supervisor in its own session and returns its results.
+
+    Model calls are charged to ``request_id`` of ``tenant`` (see ``ledger``).
+    """
+    from google.genai import types
+
+    start = time.perf_counter()
+    state = dict(INITIAL_STATE)
+    state.update(topic=topic, animate=animate, tenant=tenant, request_id=request_id)
+    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id, state=state)
+    content = types.Content(role="user", parts=[types.Part(text=f"Please solve: {topic}")])
+    async for _ in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+        pass
+    session = await session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    elapsed = time.perf_counter() - start
+    get_stats("worksheet").observe("item", elapsed)
+    result = {key: session.state.get(key) for key in RESULT_KEYS}
+    result.update(session_id=session_id, elapsed_ms=round(elapsed * 1000, 3))
+    return result
+
+
+async def solve_worksheet(runner: Runner, session_service: BaseSessionService, topics: list[str],
+                          animate: bool | list[bool] = False, concurrent: bool = True, tenant: str = "",
+                          worksheet_id: str | None = None) -> dict:
+    """Solves every problem of a worksheet and aggregates the results in order.
+
+    Args:
+        runner (Runner): Runner for ``SupervisorAgent``.
+        session_service (BaseSessionService): The runner's session service.
+        topics (list[str]): The problems, in worksheet order.
+        animate (bool | list[bool]): Whether to generate animations, for all items or per item.
+        concurrent (bool): Fan out under the shared limit; False runs items one by one.
+        tenant (str): The tenant charged for the model calls.
+        worksheet_id (str | None): The id of the worksheet, which is the request every item is
+            charged to; a new id by default.
+
+    Returns:
+        dict: ``{"worksheet_id", "items", "elapsed_ms"}``; a failed item has an ``error`` key.
+    """
+    stats = get_stats("worksheet")
+    start = time.perf_counter()
+    worksheet_id = worksheet_id or uuid.uuid4().hex
+    flags = animate if isinstance(animate, list) else [animate] * len(topics)
+    jobs = [solve_item(runner, session_service, topic, f"{worksheet_id}-{i}", flag, tenant, worksheet_id)
+            for i, (topic, flag) in enumerate(zip(topics, flags))]
+    if concurrent:
+        outcomes = await asyncio.gather(*(bounded(job) for job in jobs), return_exceptions=True)
+    else:
+        outcomes = []
+        for job in jobs:
+            try:
+                outcomes.append(await job)
+            except Exception as e:
+                outcomes.append(e)
+
+    items = []
+    for index, (topic, outcome) in enumerate(zip(topics, outcomes)):
+        if isinstance(outcome, BaseException):
+            stats.incr("failed")
+            outcome = {"topic": topic, "error": f"{type(outcome).__name__}: {outcome}"}
+        items.append({"index": index, **outcome})
+    elapsed = time.perf_counter() - start
+    stats.incr("items", len(topics))
+    stats.observe("concurrent" if concurrent else "sequential", elapsed)
+    return {"worksheet_id": worksheet_id, "items": items, "elapsed_ms": round(elapsed * 1000, 3)}